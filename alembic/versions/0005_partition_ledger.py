@@ -0,0 +1,225 @@
+"""monthly range partitions for ledger_entries
+
+Revision ID: 0005_partition_ledger
+Revises: 0004_trust_and_meta
+Create Date: 2025-08-25 00:00:00
+
+"""
+from __future__ import annotations
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0005_partition_ledger'
+down_revision = '0004_trust_and_meta'
+branch_labels = None
+depends_on = None
+
+
+# Creates one partition per calendar month (UTC) from `start_month` up to
+# `months_ahead` months past the current month. Idempotent; returns the number
+# of partitions created. Called by the migration and by the worker's periodic
+# `credence.tasks.ensure_ledger_partitions` task. Rows outside every monthly
+# partition land in `ledger_entries_default`; a month that already has rows
+# there keeps them (the ledger is append-only, so they cannot be moved) and
+# gets no partition of its own.
+ENSURE_PARTITIONS_FUNCTION = """
+CREATE OR REPLACE FUNCTION ensure_ledger_partitions(start_month date, months_ahead integer)
+RETURNS integer AS $$
+DECLARE
+    m date := date_trunc('month', start_month)::date;
+    stop date := (date_trunc('month', now() AT TIME ZONE 'UTC') + make_interval(months => months_ahead))::date;
+    part text;
+    lo timestamptz;
+    hi timestamptz;
+    created integer := 0;
+BEGIN
+    WHILE m <= stop LOOP
+        part := format('ledger_entries_y%sm%s', to_char(m, 'YYYY'), to_char(m, 'MM'));
+        lo := m::timestamp AT TIME ZONE 'UTC';
+        hi := (m + interval '1 month')::timestamp AT TIME ZONE 'UTC';
+        IF to_regclass(part) IS NULL
+            AND NOT EXISTS (SELECT 1 FROM ledger_entries_default WHERE created_at >= lo AND created_at < hi)
+        THEN
+            EXECUTE format('CREATE TABLE %I PARTITION OF ledger_entries FOR VALUES FROM (%L) TO (%L)', part, lo, hi);
+            created := created + 1;
+        END IF;
+        m := (m + interval '1 month')::date;
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+# Stand-in for the foreign keys a partitioned table cannot be the target of:
+# the column named by the trigger argument must be NULL or an existing ledger
+# entry id. Deferred to the end of the statement, so a multi-row insert may
+# reference rows it inserts itself. Ledger rows are never deleted in place,
+# so checking the referencing side is enough. `disputes.ledger_entry_id` has
+# no trigger: disputes stay on the home database while, with sharding, the
+# disputed entry lives on the user's shard, where a trigger cannot look.
+# DisputeService.open checks it instead (ShardRouter.locate_entry).
+CHECK_REFERENCE_FUNCTION = """
+CREATE OR REPLACE FUNCTION check_ledger_entry_reference() RETURNS trigger AS $$
+DECLARE
+    ref integer;
+BEGIN
+    EXECUTE format('SELECT ($1).%I', TG_ARGV[0]) INTO ref USING NEW;
+    IF ref IS NOT NULL AND NOT EXISTS (SELECT 1 FROM ledger_entries WHERE id = ref) THEN
+        RAISE EXCEPTION '%.% = % is not a ledger entry id', TG_TABLE_NAME, TG_ARGV[0], ref
+            USING ERRCODE = 'foreign_key_violation';
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+# (table, column) pairs checked by check_ledger_entry_reference()
+LEDGER_REFERENCES = (
+    ('ledger_entries', 'related_entry_id'),
+    ('idempotency_keys', 'ledger_entry_id'),
+    ('evidence_flags', 'ledger_entry_id'),
+)
+
+LEDGER_COLUMNS = (
+    "id, user_id, domain, action, points, evidence_ref, evidence_status, "
+    "related_entry_id, created_at, meta"
+)
+
+
+def upgrade() -> None:
+    # Foreign keys cannot target `id` alone once the primary key has to include
+    # the partition key, so references to ledger entries become plain integers.
+    op.execute(
+        """
+        ALTER TABLE disputes DROP CONSTRAINT IF EXISTS disputes_ledger_entry_id_fkey;
+        ALTER TABLE idempotency_keys DROP CONSTRAINT IF EXISTS idempotency_keys_ledger_entry_id_fkey;
+        ALTER TABLE evidence_flags DROP CONSTRAINT IF EXISTS evidence_flags_ledger_entry_id_fkey;
+        ALTER TABLE ledger_entries DROP CONSTRAINT IF EXISTS ledger_entries_related_entry_id_fkey;
+
+        ALTER TABLE ledger_entries RENAME TO ledger_entries_unpartitioned;
+        ALTER SEQUENCE ledger_entries_id_seq OWNED BY NONE;
+
+        CREATE TABLE ledger_entries (
+            id integer NOT NULL DEFAULT nextval('ledger_entries_id_seq'),
+            user_id varchar(128) NOT NULL,
+            domain varchar(64) NOT NULL,
+            action varchar(64) NOT NULL,
+            points integer NOT NULL,
+            evidence_ref varchar(512),
+            evidence_status evidence_status NOT NULL DEFAULT 'green',
+            related_entry_id integer,
+            created_at timestamptz NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            meta json,
+            PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at);
+
+        -- Back-dated or far-future rows outside the monthly partitions
+        CREATE TABLE ledger_entries_default PARTITION OF ledger_entries DEFAULT;
+        """
+    )
+    op.execute(ENSURE_PARTITIONS_FUNCTION)
+    op.execute(
+        """
+        SELECT ensure_ledger_partitions(
+            COALESCE((SELECT min(created_at) FROM ledger_entries_unpartitioned), now())::date,
+            3
+        );
+        """
+    )
+    op.execute(
+        f"""
+        INSERT INTO ledger_entries ({LEDGER_COLUMNS})
+        SELECT {LEDGER_COLUMNS} FROM ledger_entries_unpartitioned;
+
+        DROP TABLE ledger_entries_unpartitioned;
+        ALTER SEQUENCE ledger_entries_id_seq OWNED BY ledger_entries.id;
+        """
+    )
+
+    # Indexes on the partitioned parent are created on every partition,
+    # including the ones added later by ensure_ledger_partitions().
+    op.create_index('ix_ledger_user_created', 'ledger_entries', ['user_id', 'created_at'])
+    op.create_index('ix_ledger_domain_created', 'ledger_entries', ['domain', 'created_at'])
+    op.create_index('ix_ledger_created_at', 'ledger_entries', ['created_at'])
+    op.create_index('ix_ledger_related', 'ledger_entries', ['related_entry_id'])
+
+    # Row triggers on the parent are cloned to each existing and future partition.
+    op.execute(
+        """
+        CREATE TRIGGER trg_ledger_no_update
+        BEFORE UPDATE ON ledger_entries
+        FOR EACH ROW EXECUTE FUNCTION prevent_ledger_update_delete();
+
+        CREATE TRIGGER trg_ledger_no_delete
+        BEFORE DELETE ON ledger_entries
+        FOR EACH ROW EXECUTE FUNCTION prevent_ledger_update_delete();
+        """
+    )
+
+    op.execute(CHECK_REFERENCE_FUNCTION)
+    for table, column in LEDGER_REFERENCES:
+        op.execute(
+            f"""
+            CREATE CONSTRAINT TRIGGER trg_{table}_{column}_ref
+            AFTER INSERT OR UPDATE OF {column} ON {table}
+            FOR EACH ROW EXECUTE FUNCTION check_ledger_entry_reference('{column}');
+            """
+        )
+
+
+def downgrade() -> None:
+    for table, column in LEDGER_REFERENCES:
+        op.execute(f"DROP TRIGGER IF EXISTS trg_{table}_{column}_ref ON {table};")
+    op.execute("DROP FUNCTION IF EXISTS check_ledger_entry_reference();")
+    op.execute(
+        """
+        ALTER TABLE ledger_entries RENAME TO ledger_entries_partitioned;
+        ALTER SEQUENCE ledger_entries_id_seq OWNED BY NONE;
+
+        CREATE TABLE ledger_entries (
+            id integer PRIMARY KEY DEFAULT nextval('ledger_entries_id_seq'),
+            user_id varchar(128) NOT NULL,
+            domain varchar(64) NOT NULL,
+            action varchar(64) NOT NULL,
+            points integer NOT NULL,
+            evidence_ref varchar(512),
+            evidence_status evidence_status NOT NULL DEFAULT 'green',
+            related_entry_id integer REFERENCES ledger_entries (id),
+            created_at timestamptz NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            meta json
+        );
+        """
+    )
+    op.execute(
+        f"""
+        INSERT INTO ledger_entries ({LEDGER_COLUMNS})
+        SELECT {LEDGER_COLUMNS} FROM ledger_entries_partitioned ORDER BY id;
+
+        DROP TABLE ledger_entries_partitioned;
+        ALTER SEQUENCE ledger_entries_id_seq OWNED BY ledger_entries.id;
+        DROP FUNCTION IF EXISTS ensure_ledger_partitions(date, integer);
+        """
+    )
+    op.create_index('ix_ledger_user', 'ledger_entries', ['user_id'])
+    op.create_index('ix_ledger_domain', 'ledger_entries', ['domain'])
+    op.create_index('ix_ledger_created_at', 'ledger_entries', ['created_at'])
+    op.execute(
+        """
+        ALTER TABLE disputes ADD CONSTRAINT disputes_ledger_entry_id_fkey
+            FOREIGN KEY (ledger_entry_id) REFERENCES ledger_entries (id);
+        ALTER TABLE idempotency_keys ADD CONSTRAINT idempotency_keys_ledger_entry_id_fkey
+            FOREIGN KEY (ledger_entry_id) REFERENCES ledger_entries (id);
+        ALTER TABLE evidence_flags ADD CONSTRAINT evidence_flags_ledger_entry_id_fkey
+            FOREIGN KEY (ledger_entry_id) REFERENCES ledger_entries (id);
+
+        CREATE TRIGGER trg_ledger_no_update
+        BEFORE UPDATE ON ledger_entries
+        FOR EACH ROW EXECUTE FUNCTION prevent_ledger_update_delete();
+
+        CREATE TRIGGER trg_ledger_no_delete
+        BEFORE DELETE ON ledger_entries
+        FOR EACH ROW EXECUTE FUNCTION prevent_ledger_update_delete();
+        """
+    )
@@ -0,0 +1,43 @@
+"""balance checkpoints
+
+Revision ID: 0006_balance_checkpoints
+Revises: 0005_partition_ledger
+Create Date: 2025-08-26 00:00:00
+
+"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0006_balance_checkpoints'
+down_revision = '0005_partition_ledger'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'balance_checkpoints',
+        sa.Column('id', sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column('user_id', sa.String(length=128), nullable=False),
+        sa.Column('domain', sa.String(length=64), nullable=False),
+        sa.Column('balance', sa.Integer(), nullable=False),
+        sa.Column('entry_count', sa.Integer(), nullable=False),
+        sa.Column('last_entry_id', sa.Integer(), nullable=False),
+        sa.Column('checkpoint_at', sa.DateTime(timezone=True), nullable=False),
+    )
+    op.create_index(
+        'ix_balance_checkpoints_user_domain_at',
+        'balance_checkpoints',
+        ['user_id', 'domain', 'checkpoint_at'],
+    )
+    op.create_index('ix_balance_checkpoints_checkpoint_at', 'balance_checkpoints', ['checkpoint_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_balance_checkpoints_checkpoint_at', table_name='balance_checkpoints')
+    op.drop_index('ix_balance_checkpoints_user_domain_at', table_name='balance_checkpoints')
+    op.drop_table('balance_checkpoints')
@@ -0,0 +1,44 @@
+"""ledger hash chain and merkle segments
+
+Revision ID: 0007_ledger_integrity
+Revises: 0006_balance_checkpoints
+Create Date: 2025-08-27 00:00:00
+
+"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0007_ledger_integrity'
+down_revision = '0006_balance_checkpoints'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Existing rows keep NULL hashes (the table is append-only); they enter
+    # Merkle segments with a standalone hash of their content.
+    op.add_column('ledger_entries', sa.Column('prev_hash', sa.String(length=64), nullable=True))
+    op.add_column('ledger_entries', sa.Column('entry_hash', sa.String(length=64), nullable=True))
+
+    op.create_table(
+        'ledger_segments',
+        sa.Column('segment_index', sa.Integer(), primary_key=True, autoincrement=False),
+        sa.Column('first_id', sa.Integer(), nullable=False),
+        sa.Column('last_id', sa.Integer(), nullable=False),
+        sa.Column('leaf_count', sa.Integer(), nullable=False),
+        sa.Column('root', sa.String(length=64), nullable=False),
+        sa.Column('chain_hash', sa.String(length=64), nullable=False),
+        sa.Column('sealed_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.text('CURRENT_TIMESTAMP')),
+    )
+    op.create_index('ix_ledger_segments_last_id', 'ledger_segments', ['last_id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_ledger_segments_last_id', table_name='ledger_segments')
+    op.drop_table('ledger_segments')
+    op.drop_column('ledger_entries', 'entry_hash')
+    op.drop_column('ledger_entries', 'prev_hash')
@@ -0,0 +1,48 @@
+"""current verification projection
+
+Revision ID: 0008_current_verification
+Revises: 0007_ledger_integrity
+Create Date: 2025-08-28 00:00:00
+
+"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0008_current_verification'
+down_revision = '0007_ledger_integrity'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'current_verification',
+        sa.Column('user_id', sa.String(length=128), primary_key=True),
+        sa.Column('external_level', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('internal_level', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('effective_level', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.text('CURRENT_TIMESTAMP')),
+    )
+    # Backfill from history. effective_level uses the default provider's rule
+    # (max of both sources); deployments with a custom provider get it
+    # recomputed on the user's next verification change.
+    op.execute(
+        """
+        INSERT INTO current_verification (user_id, external_level, internal_level, effective_level)
+        SELECT
+            user_id,
+            COALESCE(MAX(CASE WHEN source = 'external' THEN level END), 0),
+            COALESCE(MAX(CASE WHEN source = 'internal' THEN level END), 0),
+            COALESCE(MAX(level), 0)
+        FROM verifications
+        GROUP BY user_id
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('current_verification')
@@ -0,0 +1,52 @@
+"""notify on ledger inserts for the change feed
+
+Revision ID: 0009_ledger_notify
+Revises: 0008_current_verification
+Create Date: 2025-08-29 00:00:00
+
+"""
+from __future__ import annotations
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0009_ledger_notify'
+down_revision = '0008_current_verification'
+branch_labels = None
+depends_on = None
+
+
+# The payload only carries the key; listeners read the committed row, which
+# keeps notifications far below the 8000 byte limit whatever `meta` holds.
+# Bulk loads can skip notifications with SET LOCAL credence.suppress_notify = 'on'.
+NOTIFY_FUNCTION = """
+CREATE OR REPLACE FUNCTION notify_ledger_insert() RETURNS trigger AS $$
+BEGIN
+    IF coalesce(current_setting('credence.suppress_notify', true), '') = 'on' THEN
+        RETURN NULL;
+    END IF;
+    PERFORM pg_notify(
+        'credence_ledger',
+        json_build_object('id', NEW.id, 'created_at', NEW.created_at)::text
+    );
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+
+def upgrade() -> None:
+    op.execute(NOTIFY_FUNCTION)
+    op.execute(
+        """
+        CREATE TRIGGER trg_ledger_notify
+        AFTER INSERT ON ledger_entries
+        FOR EACH ROW EXECUTE FUNCTION notify_ledger_insert();
+        """
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER IF EXISTS trg_ledger_notify ON ledger_entries;")
+    op.execute("DROP FUNCTION IF EXISTS notify_ledger_insert();")
@@ -0,0 +1,35 @@
+"""bulk import checkpoints
+
+Revision ID: 0010_import_checkpoints
+Revises: 0009_ledger_notify
+Create Date: 2025-08-30 00:00:00
+
+"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0010_import_checkpoints'
+down_revision = '0009_ledger_notify'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # One row per loaded chunk, written in the same transaction as its COPY
+    op.create_table(
+        'import_checkpoints',
+        sa.Column('import_id', sa.String(length=128), nullable=False),
+        sa.Column('chunk_index', sa.Integer(), nullable=False),
+        sa.Column('chunk_size', sa.Integer(), nullable=False),
+        sa.Column('rows', sa.Integer(), nullable=False),
+        sa.Column('completed_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.text('CURRENT_TIMESTAMP')),
+        sa.PrimaryKeyConstraint('import_id', 'chunk_index'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('import_checkpoints')
@@ -0,0 +1,51 @@
+"""hourly and daily karma rollups
+
+Revision ID: 0011_karma_rollups
+Revises: 0010_import_checkpoints
+Create Date: 2025-08-31 00:00:00
+
+"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0011_karma_rollups'
+down_revision = '0010_import_checkpoints'
+branch_labels = None
+depends_on = None
+
+ROLLUP_TABLES = ('karma_rollup_hourly', 'karma_rollup_daily')
+
+
+def upgrade() -> None:
+    for table in ROLLUP_TABLES:
+        op.create_table(
+            table,
+            sa.Column('bucket', sa.DateTime(timezone=True), nullable=False),
+            sa.Column('user_id', sa.String(length=128), nullable=False),
+            sa.Column('domain', sa.String(length=64), nullable=False),
+            sa.Column('points', sa.BigInteger(), nullable=False, server_default='0'),
+            sa.Column('positive_points', sa.BigInteger(), nullable=False, server_default='0'),
+            sa.Column('negative_points', sa.BigInteger(), nullable=False, server_default='0'),
+            sa.Column('entry_count', sa.Integer(), nullable=False, server_default='0'),
+            sa.PrimaryKeyConstraint('bucket', 'user_id', 'domain'),
+        )
+        op.create_index(f'ix_{table}_user_bucket', table, ['user_id', 'bucket'])
+        op.create_index(f'ix_{table}_domain_bucket', table, ['domain', 'bucket'])
+    # Entries with created_at <= rolled_up_to are included in the rollups
+    op.create_table(
+        'rollup_watermarks',
+        sa.Column('name', sa.String(length=64), primary_key=True),
+        sa.Column('rolled_up_to', sa.DateTime(timezone=True), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('rollup_watermarks')
+    for table in ROLLUP_TABLES:
+        op.drop_index(f'ix_{table}_domain_bucket', table_name=table)
+        op.drop_index(f'ix_{table}_user_bucket', table_name=table)
+        op.drop_table(table)
@@ -0,0 +1,37 @@
+"""quantile sketches of trust and karma distributions
+
+Revision ID: 0012_distribution_sketches
+Revises: 0011_karma_rollups
+Create Date: 2025-09-01 00:00:00
+
+"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0012_distribution_sketches'
+down_revision = '0011_karma_rollups'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # One serialized KLL sketch (a few KB) per metric, domain ('_all' for the
+    # overall score) and UTC day, whatever the number of users
+    op.create_table(
+        'distribution_sketches',
+        sa.Column('metric', sa.String(length=32), nullable=False),
+        sa.Column('domain', sa.String(length=64), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('value_count', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.Column('sketch', sa.LargeBinary(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.text('now()')),
+        sa.PrimaryKeyConstraint('metric', 'domain', 'day'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('distribution_sketches')
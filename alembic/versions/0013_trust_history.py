@@ -0,0 +1,31 @@
+"""index trust snapshots for change-only writes and history reads
+
+Revision ID: 0013_trust_history
+Revises: 0012_distribution_sketches
+Create Date: 2025-09-02 00:00:00
+
+"""
+from __future__ import annotations
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0013_trust_history'
+down_revision = '0012_distribution_sketches'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Serves the latest-snapshot lookup done before every write, history range
+    # scans and compaction; the single-column user index becomes redundant
+    op.create_index(
+        'ix_trust_scores_user_domain_computed', 'trust_scores', ['user_id', 'domain', 'computed_at']
+    )
+    op.drop_index('ix_trust_scores_user', table_name='trust_scores')
+
+
+def downgrade() -> None:
+    op.create_index('ix_trust_scores_user', 'trust_scores', ['user_id'])
+    op.drop_index('ix_trust_scores_user_domain_computed', table_name='trust_scores')
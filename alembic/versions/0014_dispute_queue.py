@@ -0,0 +1,49 @@
+"""dispute claim leases and listing indexes
+
+Revision ID: 0014_dispute_queue
+Revises: 0013_trust_history
+Create Date: 2025-09-03 00:00:00
+
+"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0014_dispute_queue'
+down_revision = '0013_trust_history'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('disputes', sa.Column('claimed_by', sa.String(length=128), nullable=True))
+    op.add_column('disputes', sa.Column('claim_expires_at', sa.DateTime(timezone=True), nullable=True))
+    # Claim queue: only open disputes, oldest first; stays small however many
+    # disputes have been closed
+    op.create_index(
+        'ix_disputes_open_queue',
+        'disputes',
+        ['created_at', 'id'],
+        postgresql_where=sa.text("status = 'open'"),
+        sqlite_where=sa.text("status = 'open'"),
+    )
+    # Keyset listing (newest first) per filter; (status, id) replaces the status index
+    op.create_index('ix_disputes_status_id', 'disputes', ['status', 'id'])
+    op.create_index('ix_disputes_opened_by_id', 'disputes', ['opened_by', 'id'])
+    op.create_index('ix_disputes_entry_id', 'disputes', ['ledger_entry_id', 'id'])
+    op.create_index('ix_disputes_claimed_by_id', 'disputes', ['claimed_by', 'id'])
+    op.drop_index('ix_disputes_status', table_name='disputes')
+
+
+def downgrade() -> None:
+    op.create_index('ix_disputes_status', 'disputes', ['status'])
+    op.drop_index('ix_disputes_claimed_by_id', table_name='disputes')
+    op.drop_index('ix_disputes_entry_id', table_name='disputes')
+    op.drop_index('ix_disputes_opened_by_id', table_name='disputes')
+    op.drop_index('ix_disputes_status_id', table_name='disputes')
+    op.drop_index('ix_disputes_open_queue', table_name='disputes')
+    op.drop_column('disputes', 'claim_expires_at')
+    op.drop_column('disputes', 'claimed_by')
@@ -0,0 +1,32 @@
+"""pending evidence status for deferred validation
+
+Revision ID: 0015_evidence_pending
+Revises: 0014_dispute_queue
+Create Date: 2025-09-04 00:00:00
+
+"""
+from __future__ import annotations
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0015_evidence_pending'
+down_revision = '0014_dispute_queue'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    # A new enum value cannot be used in the transaction that adds it
+    with op.get_context().autocommit_block():
+        op.execute("ALTER TYPE evidence_status ADD VALUE IF NOT EXISTS 'pending'")
+    # Pending entries are found through entry_evidence_status (0016), not a
+    # ledger index
+
+
+def downgrade() -> None:
+    # Enum values cannot be dropped
+    pass
@@ -0,0 +1,77 @@
+"""current evidence status projection
+
+Revision ID: 0016_entry_evidence_status
+Revises: 0015_evidence_pending
+Create Date: 2025-09-05 00:00:00
+
+"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '0016_entry_evidence_status'
+down_revision = '0015_evidence_pending'
+branch_labels = None
+depends_on = None
+
+
+# Latest flag per entry, else the status the entry was written with; entries
+# that are green and never flagged have no row
+BACKFILL = """
+INSERT INTO entry_evidence_status
+    (ledger_entry_id, user_id, domain, points, status, entry_created_at, updated_at)
+SELECT e.id, e.user_id, e.domain, e.points, coalesce(f.status, e.evidence_status),
+       e.created_at, coalesce(f.created_at, e.created_at)
+FROM ledger_entries e
+LEFT JOIN (
+    SELECT DISTINCT ON (ledger_entry_id) ledger_entry_id, status, created_at
+    FROM evidence_flags
+    ORDER BY ledger_entry_id, created_at DESC, id DESC
+) f ON f.ledger_entry_id = e.id
+WHERE e.evidence_status <> 'green' OR f.ledger_entry_id IS NOT NULL;
+"""
+
+# Reversal and decay entries follow the status of their original
+BACKFILL_DERIVED = """
+INSERT INTO entry_evidence_status
+    (ledger_entry_id, user_id, domain, points, status, entry_created_at, updated_at)
+SELECT d.id, d.user_id, d.domain, d.points, o.status, d.created_at, o.updated_at
+FROM ledger_entries d
+JOIN entry_evidence_status o ON o.ledger_entry_id = d.related_entry_id
+WHERE o.status <> 'green'
+ON CONFLICT (ledger_entry_id) DO UPDATE SET status = EXCLUDED.status, updated_at = EXCLUDED.updated_at;
+"""
+
+
+def upgrade() -> None:
+    is_pg = op.get_bind().dialect.name == 'postgresql'
+    status_type = (
+        postgresql.ENUM('green', 'yellow', 'red', 'pending', name='evidence_status', create_type=False)
+        if is_pg
+        else sa.Enum('green', 'yellow', 'red', 'pending', name='evidence_status')
+    )
+    op.create_table(
+        'entry_evidence_status',
+        sa.Column('ledger_entry_id', sa.Integer(), primary_key=True, autoincrement=False),
+        sa.Column('user_id', sa.String(length=128), nullable=False),
+        sa.Column('domain', sa.String(length=64), nullable=False),
+        sa.Column('points', sa.Integer(), nullable=False),
+        sa.Column('status', status_type, nullable=False),
+        sa.Column('entry_created_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.text('CURRENT_TIMESTAMP')),
+    )
+    op.create_index('ix_entry_evidence_user_status', 'entry_evidence_status', ['user_id', 'status', 'ledger_entry_id'])
+    op.create_index('ix_entry_evidence_status', 'entry_evidence_status', ['status', 'ledger_entry_id'])
+    if is_pg:
+        op.execute(BACKFILL)
+        op.execute(BACKFILL_DERIVED)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_entry_evidence_status', table_name='entry_evidence_status')
+    op.drop_index('ix_entry_evidence_user_status', table_name='entry_evidence_status')
+    op.drop_table('entry_evidence_status')
@@ -0,0 +1,75 @@
+"""let resharding move ledger entries between databases
+
+Revision ID: 0017_reshard_delete
+Revises: 0016_entry_evidence_status
+Create Date: 2025-09-08 00:00:00
+
+"""
+from __future__ import annotations
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0017_reshard_delete'
+down_revision = '0016_entry_evidence_status'
+branch_labels = None
+depends_on = None
+
+
+# `credence reshard` deletes a user's entries from the old shard after copying
+# them, inside a transaction that sets credence.reshard = 'on'. Any session can
+# set that, so the delete is also limited to members of the credence_reshard
+# role: grant it to the account that runs resharding, not to the app's.
+# Updates stay forbidden, and so does every other delete.
+RESHARD_ROLE = """
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_roles WHERE rolname = 'credence_reshard') THEN
+        CREATE ROLE credence_reshard NOLOGIN;
+    END IF;
+EXCEPTION WHEN insufficient_privilege THEN
+    RAISE NOTICE 'cannot create role credence_reshard; create it to allow resharding';
+END;
+$$;
+"""
+
+RESHARD_FUNCTION = """
+CREATE OR REPLACE FUNCTION prevent_ledger_update_delete() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' AND coalesce(current_setting('credence.reshard', true), '') = 'on' THEN
+        IF EXISTS (SELECT 1 FROM pg_roles WHERE rolname = 'credence_reshard') THEN
+            IF pg_has_role(session_user, 'credence_reshard', 'MEMBER') THEN
+                RETURN OLD;
+            END IF;
+        END IF;
+        RAISE EXCEPTION 'ledger_entries is append-only: resharding needs membership in credence_reshard';
+    END IF;
+    RAISE EXCEPTION 'ledger_entries is append-only';
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+APPEND_ONLY_FUNCTION = """
+CREATE OR REPLACE FUNCTION prevent_ledger_update_delete() RETURNS trigger AS $$
+BEGIN
+    RAISE EXCEPTION 'ledger_entries is append-only';
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute(RESHARD_ROLE)
+    op.execute(RESHARD_FUNCTION)
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    # The role may have been granted; it is left for the operator to drop
+    op.execute(APPEND_ONLY_FUNCTION)
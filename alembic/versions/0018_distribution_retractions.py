@@ -0,0 +1,28 @@
+"""retracted values of distribution sketches
+
+Revision ID: 0018_distribution_retractions
+Revises: 0017_reshard_delete
+Create Date: 2025-09-09 00:00:00
+
+"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0018_distribution_retractions'
+down_revision = '0017_reshard_delete'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Previous values of users whose trust or balance changed since the last
+    # rebuild; subtracted from `sketch` so each user is counted once
+    op.add_column('distribution_sketches', sa.Column('retracted', sa.LargeBinary(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('distribution_sketches', 'retracted')
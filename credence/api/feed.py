@@ -0,0 +1,276 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session, sessionmaker
+
+from ..config import Settings
+from ..db import LedgerEntry, create_session_factory
+from .serialization import LEDGER_ENTRY_COLUMNS, LEDGER_ENTRY_FIELDS
+
+NOTIFY_CHANNEL = "credence_ledger"
+# Events a subscriber may fall behind by before it is disconnected; clients
+# reconnect with Last-Event-ID and catch up from the database
+SUBSCRIBER_QUEUE_SIZE = 1000
+POLL_INTERVAL_SECONDS = 1.0
+RECONNECT_DELAY_SECONDS = 2.0
+# The listener waits this long for a notification before checking whether it
+# was stopped; notifications arriving within the batch window share one query
+LISTEN_TIMEOUT_SECONDS = 1.0
+NOTIFY_BATCH_SECONDS = 0.05
+# Ids are allocated at INSERT but become visible at COMMIT, so an entry can
+# appear after a higher id; polling and resumes look back this far for them
+LATE_COMMIT_WINDOW = timedelta(seconds=10)
+
+
+@dataclass(eq=False)
+class Subscription:
+	user_id: Optional[str]
+	domain: Optional[str]
+	loop: asyncio.AbstractEventLoop
+	queue: "asyncio.Queue[Optional[Dict[str, Any]]]" = field(
+		default_factory=lambda: asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+	)
+	dropped: bool = False
+
+	def matches(self, entry: Dict[str, Any]) -> bool:
+		return (self.user_id is None or entry["user_id"] == self.user_id) and (
+			self.domain is None or entry["domain"] == self.domain
+		)
+
+	def offer(self, entry: Dict[str, Any]) -> None:
+		# Runs on the event loop thread
+		if self.dropped:
+			return
+		try:
+			self.queue.put_nowait(entry)
+		except asyncio.QueueFull:
+			self.dropped = True
+			while not self.queue.empty():
+				self.queue.get_nowait()
+			self.queue.put_nowait(None)
+
+
+def fetch_entries(
+	session: Session,
+	after_id: int,
+	user_id: Optional[str] = None,
+	domain: Optional[str] = None,
+	limit: int = 500,
+) -> List[Dict[str, Any]]:
+	"""Entries with id > `after_id` in id order, as LedgerEntryOut-shaped dicts."""
+	stmt = select(*LEDGER_ENTRY_COLUMNS).where(LedgerEntry.id > after_id)
+	if user_id is not None:
+		stmt = stmt.where(LedgerEntry.user_id == user_id)
+	if domain is not None:
+		stmt = stmt.where(LedgerEntry.domain == domain)
+	rows = session.execute(stmt.order_by(LedgerEntry.id.asc()).limit(limit)).all()
+	return [dict(zip(LEDGER_ENTRY_FIELDS, row)) for row in rows]
+
+
+def fetch_late_entries(
+	session: Session,
+	after_id: int,
+	user_id: Optional[str] = None,
+	domain: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+	"""Entries up to `after_id` created within LATE_COMMIT_WINDOW before it.
+
+	A client resuming after `after_id` may have missed these if they committed
+	after it; replaying them can repeat events, which clients drop by id.
+	"""
+	anchor = session.execute(select(LedgerEntry.created_at).where(LedgerEntry.id == after_id)).scalar()
+	if anchor is None:
+		return []
+	stmt = select(*LEDGER_ENTRY_COLUMNS).where(
+		LedgerEntry.id < after_id, LedgerEntry.created_at >= anchor - LATE_COMMIT_WINDOW
+	)
+	if user_id is not None:
+		stmt = stmt.where(LedgerEntry.user_id == user_id)
+	if domain is not None:
+		stmt = stmt.where(LedgerEntry.domain == domain)
+	rows = session.execute(stmt.order_by(LedgerEntry.id.asc())).all()
+	return [dict(zip(LEDGER_ENTRY_FIELDS, row)) for row in rows]
+
+
+@dataclass
+class LedgerFeed:
+	"""One database listener per process, fanned out to any number of subscribers.
+
+	On PostgreSQL a single connection LISTENs on `credence_ledger` (see
+	migration 0009) and reads each notified row once; elsewhere the same thread
+	polls for new ids. Nothing is read while there are no subscribers, which
+	only hold an in-memory queue.
+	"""
+
+	settings: Settings
+	session_factory: sessionmaker[Session]
+	# Database listened to (a shard); default `database_url`
+	url: Optional[str] = None
+	_subscribers: Set[Subscription] = field(default_factory=set)
+	_lock: threading.Lock = field(default_factory=threading.Lock)
+	_thread: Optional[threading.Thread] = None
+	_stop: threading.Event = field(default_factory=threading.Event)
+
+	def subscribe(self, user_id: Optional[str], domain: Optional[str]) -> Subscription:
+		sub = Subscription(user_id=user_id, domain=domain, loop=asyncio.get_running_loop())
+		with self._lock:
+			self._subscribers.add(sub)
+			if self._thread is None:
+				self._stop.clear()
+				self._thread = threading.Thread(target=self._run, name="ledger-feed", daemon=True)
+				self._thread.start()
+		return sub
+
+	def unsubscribe(self, sub: Subscription) -> None:
+		with self._lock:
+			self._subscribers.discard(sub)
+
+	def stop(self, timeout: float = LISTEN_TIMEOUT_SECONDS + RECONNECT_DELAY_SECONDS) -> None:
+		"""Stop the listener thread; the next subscriber starts a new one."""
+		with self._lock:
+			thread, self._thread = self._thread, None
+		self._stop.set()
+		if thread is not None:
+			thread.join(timeout)
+
+	def publish(self, entries: Sequence[Dict[str, Any]]) -> None:
+		with self._lock:
+			subscribers = list(self._subscribers)
+		for entry in entries:
+			for sub in subscribers:
+				if sub.matches(entry):
+					sub.loop.call_soon_threadsafe(sub.offer, entry)
+
+	def _has_subscribers(self) -> bool:
+		with self._lock:
+			return bool(self._subscribers)
+
+	def _run(self) -> None:
+		dialect = self.session_factory.kw["bind"].dialect.name
+		while not self._stop.is_set():
+			try:
+				if dialect == "postgresql":
+					self._listen()
+				else:
+					self._poll()
+			except Exception:
+				# Connection lost: reconnect; clients resume via Last-Event-ID
+				self._stop.wait(RECONNECT_DELAY_SECONDS)
+
+	def _listen(self) -> None:
+		import psycopg
+
+		dsn = make_url(self.url or self.settings.database_url).set(drivername="postgresql").render_as_string(hide_password=False)
+		with psycopg.connect(dsn, autocommit=True) as conn:
+			conn.execute(f"LISTEN {NOTIFY_CHANNEL}")
+			while not self._stop.is_set():
+				# Wait for one notification, then take whatever follows within the batch window
+				notifies = list(conn.notifies(timeout=LISTEN_TIMEOUT_SECONDS, stop_after=1))
+				if not notifies:
+					continue
+				notifies.extend(conn.notifies(timeout=NOTIFY_BATCH_SECONDS))
+				if not self._has_subscribers():
+					continue
+				keys = []
+				for notify in notifies:
+					payload = json.loads(notify.payload)
+					keys.append((int(payload["id"]), datetime.fromisoformat(payload["created_at"])))
+				self.publish(self._load(keys))
+
+	def _load(self, keys: Sequence[Tuple[int, datetime]]) -> List[Dict[str, Any]]:
+		session = self.session_factory()
+		try:
+			# created_at bounds the lookup to the partition holding the row
+			stmt = (
+				select(*LEDGER_ENTRY_COLUMNS)
+				.where(LedgerEntry.id.in_([k[0] for k in keys]))
+				.where(LedgerEntry.created_at >= min(k[1] for k in keys))
+				.order_by(LedgerEntry.id.asc())
+			)
+			return [dict(zip(LEDGER_ENTRY_FIELDS, row)) for row in session.execute(stmt).all()]
+		finally:
+			session.close()
+
+	def _poll(self) -> None:
+		last_id: Optional[int] = None
+		# Ids published within LATE_COMMIT_WINDOW, so late commits are found once
+		recent: Dict[int, datetime] = {}
+		while not self._stop.wait(POLL_INTERVAL_SECONDS):
+			if not self._has_subscribers():
+				# Subscribers catch up on their own; start from the tip again later
+				last_id = None
+				continue
+			session = self.session_factory()
+			try:
+				since = datetime.now(timezone.utc) - LATE_COMMIT_WINDOW
+				if last_id is None:
+					# Start at the tip; entries already visible are not news
+					last_id = int(session.execute(select(func.coalesce(func.max(LedgerEntry.id), 0))).scalar_one())
+					recent = {
+						i: _utc(at)
+						for i, at in session.execute(
+							select(LedgerEntry.id, LedgerEntry.created_at).where(LedgerEntry.created_at >= since)
+						)
+					}
+					continue
+				late_ids = session.execute(
+					select(LedgerEntry.id).where(LedgerEntry.id <= last_id, LedgerEntry.created_at >= since)
+				).scalars()
+				missed = [i for i in late_ids if i not in recent]
+				entries = self._load_ids(session, missed) + fetch_entries(session, last_id)
+			finally:
+				session.close()
+			for entry in entries:
+				recent[entry["id"]] = _utc(entry["created_at"])
+				last_id = max(last_id, entry["id"])
+			recent = {i: at for i, at in recent.items() if at >= since}
+			if entries:
+				self.publish(entries)
+
+	@staticmethod
+	def _load_ids(session: Session, ids: Sequence[int]) -> List[Dict[str, Any]]:
+		if not ids:
+			return []
+		stmt = select(*LEDGER_ENTRY_COLUMNS).where(LedgerEntry.id.in_(ids)).order_by(LedgerEntry.id.asc())
+		return [dict(zip(LEDGER_ENTRY_FIELDS, row)) for row in session.execute(stmt).all()]
+
+
+def _utc(ts: datetime) -> datetime:
+	# SQLite hands back naive datetimes, stored as UTC
+	return ts if ts.tzinfo is not None else ts.replace(tzinfo=timezone.utc)
+
+
+_feeds: Dict[str, LedgerFeed] = {}
+_feed_lock = threading.Lock()
+
+
+def get_ledger_feed(settings: Settings, url: Optional[str] = None) -> LedgerFeed:
+	"""The process-wide feed of a database (default: the home database).
+
+	Its listener thread starts with the first subscriber.
+	"""
+	url = url or settings.database_url
+	feed = _feeds.get(url)
+	if feed is None:
+		with _feed_lock:
+			feed = _feeds.get(url)
+			if feed is None:
+				feed = _feeds[url] = LedgerFeed(settings=settings, session_factory=create_session_factory(settings, url=url), url=url)
+	return feed
+
+
+def stop_ledger_feeds() -> None:
+	"""Stop every feed's listener thread (app shutdown)."""
+	with _feed_lock:
+		feeds = list(_feeds.values())
+	for feed in feeds:
+		feed.stop()
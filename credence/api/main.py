@@ -1,69 +1,59 @@
 from __future__ import annotations
 
-from fastapi import Depends, FastAPI
-from prometheus_fastapi_instrumentator import Instrumentator
-from ..rate_limit import limiter
-from slowapi.errors import RateLimitExceeded
-from slowapi.middleware import SlowAPIMiddleware
-from fastapi.responses import PlainTextResponse
-
-from ..config import Settings
-from ..db import create_session_factory, get_session
-from ..schemas import (
-    AwardRequest,
-    ReverseRequest,
-    FlagEvidenceRequest,
-    LedgerEntryOut,
-    BalanceResponse,
-    FlagEvidenceResponse,
-    VerificationSetRequest,
-    TrustResponse,
-    LeaderboardItem,
-    LeaderboardResponse,
-    LedgerPageResponse,
-    DisputeOpenRequest,
-    DisputeResolveRequest,
-    DisputeOut,
-)
-from .routers import karma as karma_router
-from .routers import trust as trust_router
-from .routers import leaderboard as leaderboard_router
-from .routers import verification as verification_router
-from .routers import balances as balances_router
-from .routers import disputes as disputes_router
-from .routers import ledger as ledger_router
-from .routers import stats as stats_router
-
-
-def get_settings() -> Settings:
+from typing import TYPE_CHECKING, Any, AsyncIterator
+
+if TYPE_CHECKING:
+	from fastapi import FastAPI
+
+	from ..config import Settings
+
+
+def get_settings() -> "Settings":
+	from ..config import Settings
+
 	return Settings.from_env_and_file()
 
 
-def make_app() -> FastAPI:
+def make_app() -> "FastAPI":
+	# Framework, instrumentation and router imports live here so that importing
+	# this module stays cheap for CLI tools and for process start-up.
+	from contextlib import asynccontextmanager
+
+	from fastapi import FastAPI
+	from fastapi.responses import PlainTextResponse
+	from prometheus_fastapi_instrumentator import Instrumentator
+
+	from ..rate_limit import RateLimitExceeded
+	from .routers import karma as karma_router
+	from .routers import trust as trust_router
+	from .routers import leaderboard as leaderboard_router
+	from .routers import verification as verification_router
+	from .routers import balances as balances_router
+	from .routers import disputes as disputes_router
+	from .routers import ledger as ledger_router
+	from .routers import stats as stats_router
+	from .routers import analytics as analytics_router
+	from .routers import evidence as evidence_router
+
 	settings = get_settings()
-	app = FastAPI(title="Credence API", openapi_url="/v1/openapi.json")
 
-	# Ensure pydantic models are fully built for OpenAPI generation
-	try:
-		AwardRequest.model_rebuild()
-		ReverseRequest.model_rebuild()
-		FlagEvidenceRequest.model_rebuild()
-		LedgerEntryOut.model_rebuild()
-		BalanceResponse.model_rebuild()
-		FlagEvidenceResponse.model_rebuild()
-		VerificationSetRequest.model_rebuild()
-		TrustResponse.model_rebuild()
-		LeaderboardItem.model_rebuild()
-		LeaderboardResponse.model_rebuild()
-		LedgerPageResponse.model_rebuild()
-		DisputeOpenRequest.model_rebuild()
-		DisputeResolveRequest.model_rebuild()
-		DisputeOut.model_rebuild()
-	except Exception:
-		pass
+	@asynccontextmanager
+	async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+		# Embedded profile: schema, in-memory rank index and task runner live in this process
+		if settings.embedded:
+			from .. import embedded
+
+			embedded.start(settings)
+		try:
+			yield
+		finally:
+			from .feed import stop_ledger_feeds
 
-	# Prepare DB
-	session_factory = create_session_factory(settings)
+			stop_ledger_feeds()
+			if settings.embedded:
+				embedded.stop()
+
+	app = FastAPI(title="Credence API", openapi_url="/v1/openapi.json", lifespan=lifespan)
 
 	# Optional OpenTelemetry tracing
 	try:
@@ -71,7 +61,6 @@ def make_app() -> FastAPI:
 		from opentelemetry.instrumentation.sqlalchemy import SQLAlchemyInstrumentor  # type: ignore[import-not-found]
 		FastAPIInstrumentor().instrument_app(app)
 		try:
-			from sqlalchemy import create_engine as _create_engine  # noqa: F401
 			SQLAlchemyInstrumentor().instrument()
 		except Exception:
 			pass
@@ -86,18 +75,28 @@ def make_app() -> FastAPI:
 	def version() -> dict[str, str]:
 		return {"version": "0.1.0"}
 
-	# Example dependency usage
-	# Routers
 	# Instrument metrics
 	Instrumentator().instrument(app).expose(app, endpoint="/metrics")
 
-	# Rate limiter
-	app.state.limiter = limiter
-	app.add_middleware(SlowAPIMiddleware)
-
+	# SQL statements per request: metrics always, response headers in debug mode
+	from ..query_stats import observe_query_stats, track_queries
+
+	@app.middleware("http")
+	async def count_queries(request, call_next):  # type: ignore[no-untyped-def]
+		with track_queries() as stats:
+			response = await call_next(request)
+		observe_query_stats(route_label(request), stats)
+		if settings.debug_query_headers:
+			response.headers["X-Credence-Query-Count"] = str(stats.count)
+			response.headers["X-Credence-Query-Time-Ms"] = f"{stats.seconds * 1000:.1f}"
+			response.headers["X-Credence-Query-Max-Repeats"] = str(stats.max_repeats)
+		return response
+
+	# Rate limiter (per-route dependencies, see credence.rate_limit)
 	@app.exception_handler(RateLimitExceeded)
 	def ratelimit_handler(request, exc):  # type: ignore[no-untyped-def]
-		return PlainTextResponse("Too Many Requests", status_code=429)
+		retry_after = str(max(1, int(exc.retry_after + 0.999)))
+		return PlainTextResponse("Too Many Requests", status_code=429, headers={"Retry-After": retry_after})
 
 	# Versioned API
 	app.include_router(karma_router.router, prefix="/v1")
@@ -108,10 +107,42 @@ def make_app() -> FastAPI:
 	app.include_router(disputes_router.router, prefix="/v1")
 	app.include_router(ledger_router.router, prefix="/v1")
 	app.include_router(stats_router.router, prefix="/v1")
+	app.include_router(analytics_router.router, prefix="/v1")
+	app.include_router(evidence_router.router, prefix="/v1")
 
-	return app
+	# Sampling profiler (admin only); not mounted at all unless enabled
+	if settings.profiling_enabled:
+		from .routers import debug as debug_router
 
+		app.include_router(debug_router.router, prefix="/v1")
+		app.middleware("http")(debug_router.profile_request_middleware)
+		debug_router.profile_sync_endpoints(app)
 
-app = make_app()
+	return app
 
 
+def route_label(request: Any) -> str:
+	"""`METHOD /template` of the matched route, e.g. "GET /v1/trust/{user_id}".
+
+	Depending on the FastAPI version the matched route of an included router
+	carries the router's own path, without the include prefix; the prefix is
+	then recovered from the request path.
+	"""
+	route = request.scope.get("route")
+	if route is None:
+		return "unmatched"
+	path = request.scope["path"]
+	for i, char in enumerate(path):
+		if char == "/" and route.path_regex.match(path[i:]):
+			return f"{request.method} {path[:i]}{route.path}"
+	return f"{request.method} {route.path}"
+
+
+def __getattr__(name: str) -> Any:
+	# `app` is built on first access (uvicorn's "credence.api.main:app" lookup)
+	# instead of at import time; later lookups hit the module global directly.
+	if name == "app":
+		app = make_app()
+		globals()["app"] = app
+		return app
+	raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
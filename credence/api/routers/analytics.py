@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+
+from ...deps import get_read_session_dep, get_settings, scatter_reads, user_session
+from ...services.distributions import METRICS, DistributionService, percentile_of
+from ...services.rollups import RollupService
+from ..serialization import ORJSONResponse
+
+router = APIRouter(prefix="/analytics", tags=["analytics"])
+
+# Bound the response size: at most this many buckets per request
+MAX_BUCKETS = {"hour": 24 * 31, "day": 366 * 2}
+DEFAULT_QUANTILES = [0.5, 0.75, 0.9, 0.95, 0.99]
+MAX_QUANTILES = 101
+
+
+@router.get("/timeseries")
+def timeseries(
+	user_id: str | None = None,
+	domain: str | None = None,
+	granularity: str = "day",
+	start: datetime | None = None,
+	end: datetime | None = None,
+	session: Session = Depends(get_read_session_dep),
+):
+	"""Karma over time from the hourly/daily rollups.
+
+	Buckets are UTC; `complete_until` is the rollup watermark, after which
+	the last bucket may still grow.
+
+	Args:
+		user_id: Optional user filter (all users when omitted).
+		domain: Optional domain filter.
+		granularity: 'hour' or 'day'.
+		start: Window start (default: 30 days, or 48 hours, before `end`).
+		end: Window end, exclusive (default: now).
+	"""
+	if granularity not in MAX_BUCKETS:
+		raise HTTPException(status_code=400, detail="granularity must be 'hour' or 'day'")
+	step = timedelta(days=1) if granularity == "day" else timedelta(hours=1)
+	end = end or datetime.now(timezone.utc)
+	start = start or end - (30 * step if granularity == "day" else 48 * step)
+	if start >= end:
+		raise HTTPException(status_code=400, detail="start must be before end")
+	if (end - start) / step > MAX_BUCKETS[granularity]:
+		raise HTTPException(status_code=400, detail=f"at most {MAX_BUCKETS[granularity]} {granularity} buckets per request")
+
+	def series(s: Session) -> Tuple[Optional[datetime], List[Dict[str, Any]]]:
+		service = RollupService(session=s)
+		return service.watermark(), service.timeseries(granularity, start, end, user_id=user_id, domain=domain)
+
+	settings = get_settings()
+	if user_id is not None:
+		with user_session(settings, session, user_id) as user_db:
+			parts = [series(user_db)]
+	else:
+		parts = scatter_reads(settings, session, series)
+	watermarks = [watermark for watermark, _ in parts]
+	return ORJSONResponse(
+		{
+			"user_id": user_id,
+			"domain": domain,
+			"granularity": granularity,
+			# Each shard rolls up on its own; the slowest bounds what is complete
+			"complete_until": None if None in watermarks else min(watermarks),
+			"buckets": _merge_buckets([buckets for _, buckets in parts]),
+		}
+	)
+
+
+def _merge_buckets(parts: List[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+	if len(parts) == 1:
+		return parts[0]
+	merged: Dict[datetime, Dict[str, Any]] = {}
+	for buckets in parts:
+		for item in buckets:
+			total = merged.get(item["bucket"])
+			if total is None:
+				merged[item["bucket"]] = dict(item)
+			else:
+				for field in ("points", "positive_points", "negative_points", "entry_count"):
+					total[field] += item[field]
+	return [merged[bucket] for bucket in sorted(merged)]
+
+
+@router.get("/percentiles")
+def percentiles(
+	metric: str = "trust",
+	domain: str | None = None,
+	q: List[float] = Query(default=DEFAULT_QUANTILES),
+	value: float | None = None,
+	day: date | None = None,
+	session: Session = Depends(get_read_session_dep),
+):
+	"""Approximate quantiles of trust or karma balance across users.
+
+	Read from the stored KLL sketch (rank error under 1%), never from the
+	raw scores; pass `q=0&q=0.05&...&q=1` for chart points.
+
+	Args:
+		metric: 'trust' or 'karma' (balance).
+		domain: Optional domain (overall scores when omitted).
+		q: Quantiles in [0, 1] (repeatable).
+		value: Optional value whose percentile is returned as well.
+		day: UTC day of the distribution (default: the latest).
+	"""
+	if metric not in METRICS:
+		raise HTTPException(status_code=400, detail=f"metric must be one of {', '.join(METRICS)}")
+	if not q or len(q) > MAX_QUANTILES or any(not 0.0 <= x <= 1.0 for x in q):
+		raise HTTPException(status_code=400, detail=f"q must be 1-{MAX_QUANTILES} values in [0, 1]")
+	sketch = DistributionService(session=session).latest(metric, domain, day)
+	values = sketch.quantiles(q) if sketch is not None else [None for _ in q]
+	return ORJSONResponse(
+		{
+			"metric": metric,
+			"domain": domain,
+			"count": sketch.n if sketch is not None else 0,
+			"quantiles": [{"q": x, "value": v} for x, v in zip(q, values)],
+			"value": value,
+			"percentile": percentile_of(sketch, value) if value is not None else None,
+		}
+	)
@@ -1,18 +1,29 @@
 from __future__ import annotations
 
-from fastapi import APIRouter, Depends
+from datetime import datetime
+
+from fastapi import APIRouter, Depends, Request
 from sqlalchemy.orm import Session
 
 from ...cache import RedisCache, balance_cache_key
-from ...deps import get_session_dep, get_settings
+from ...deps import get_read_session_dep, get_settings, user_session, wants_fresh_read
 from ...db import compute_balance
 from ...schemas import BalanceResponse
+from ...services.checkpoints import CheckpointService
+from ...services.evidence_status import EvidenceStatusService
 
 router = APIRouter(prefix="/balances", tags=["balances"])
 
 
 @router.get("/{user_id}", response_model=BalanceResponse)
-def get_balance(user_id: str, domain: str | None = None, session: Session = Depends(get_session_dep)) -> BalanceResponse:
+def get_balance(
+	request: Request,
+	user_id: str,
+	domain: str | None = None,
+	as_of: datetime | None = None,
+	exclude_red: bool | None = None,
+	session: Session = Depends(get_read_session_dep),
+) -> BalanceResponse:
 	"""Get a user's karma balance, optionally scoped to a domain.
 
 	Uses Redis cache with a short TTL; invalidated when new entries are added.
@@ -20,24 +31,43 @@ def get_balance(user_id: str, domain: str | None = None, session: Session = Depe
 	Args:
 		user_id: Subject user id.
 		domain: Optional domain.
+		as_of: Optional instant for a historical balance, answered from the
+			nearest balance checkpoint plus the entries since (not cached).
+		exclude_red: Leave out entries whose current evidence status is red;
+			defaults to the `exclude_red_evidence` setting. Only the
+			configured policy is cached.
 
 	Returns:
-		BalanceResponse with the current balance.
+		BalanceResponse with the current (or historical) balance.
 	"""
 	settings = get_settings()
-	cache = RedisCache.from_settings(settings)
-	ck = balance_cache_key(user_id, domain)
-	cached = cache.get(ck)
-	if cached is not None:
-		try:
-			value = int(cached)
-			return BalanceResponse(user_id=user_id, domain=domain, balance=value)
-		except ValueError:
-			pass
+	if exclude_red is None:
+		exclude_red = settings.exclude_red_evidence
+	with user_session(settings, session, user_id) as session:
+		evidence = EvidenceStatusService(session=session)
 
-	value = compute_balance(session, user_id, domain)
-	# cache for 15s to avoid thrash, invalidate on new ledger writes in service
-	cache.set(ck, str(value), ttl_seconds=15)
-	return BalanceResponse(user_id=user_id, domain=domain, balance=value)
+		if as_of is not None:
+			value = CheckpointService(session=session).balance_as_of(user_id, domain, as_of)
+			if exclude_red:
+				value -= evidence.red_points(user_id, domain, as_of)
+			return BalanceResponse(user_id=user_id, domain=domain, balance=value)
 
+		cacheable = exclude_red == settings.exclude_red_evidence
+		cache = RedisCache.from_settings(settings)
+		ck = balance_cache_key(user_id, domain)
+		# Clients reading their own writes skip the cache
+		cached = None if wants_fresh_read(request) or not cacheable else cache.get(ck)
+		if cached is not None:
+			try:
+				value = int(cached)
+				return BalanceResponse(user_id=user_id, domain=domain, balance=value)
+			except ValueError:
+				pass
 
+		value = compute_balance(session, user_id, domain)
+		if exclude_red:
+			value -= evidence.red_points(user_id, domain)
+		if cacheable:
+			# cache for 15s to avoid thrash, invalidate on new ledger writes and flags in service
+			cache.set(ck, str(value), ttl_seconds=15)
+		return BalanceResponse(user_id=user_id, domain=domain, balance=value)
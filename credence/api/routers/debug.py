@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import asyncio
+import functools
+import threading
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Optional
+
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, Query, Request
+from fastapi.responses import PlainTextResponse, Response
+from fastapi.routing import APIRoute
+
+from ...deps import get_settings, require_admin, resolve_user_id
+from ...profiling import PROFILE_FORMATS, SamplingProfiler
+from ..serialization import ORJSONResponse
+
+# Only included by make_app when `profiling_enabled` is set
+router = APIRouter(prefix="/debug", tags=["debug"])
+
+PROFILE_HEADER = "x-credence-profile"
+
+# Profiler of the request being handled; the context is copied into the
+# thread-pool worker that runs a sync endpoint, which then joins the sampling
+_request_profiler: ContextVar[Optional[SamplingProfiler]] = ContextVar("credence_request_profiler", default=None)
+
+
+def _profile_response(profiler: SamplingProfiler, fmt: str, name: str) -> Response:
+	if fmt == "speedscope":
+		return ORJSONResponse(profiler.speedscope(name))
+	return PlainTextResponse(profiler.collapsed())
+
+
+@router.get("/profile")
+async def profile_window(
+	seconds: float = Query(default=5.0, gt=0),
+	format: str = Query(default="collapsed"),
+	interval_ms: float = Query(default=5.0, ge=1.0, le=100.0),
+	_: str = Depends(require_admin),
+) -> Response:
+	"""Sample every thread of this API worker process for `seconds`.
+
+	Only the process serving this call is profiled; with several workers,
+	repeat the call or profile a single request with the `X-Credence-Profile`
+	header instead.
+	"""
+	if format not in PROFILE_FORMATS:
+		raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(PROFILE_FORMATS)}")
+	settings = get_settings()
+	if seconds > settings.profile_max_seconds:
+		raise HTTPException(status_code=400, detail=f"seconds must be <= {settings.profile_max_seconds}")
+	profiler = SamplingProfiler(interval=interval_ms / 1000.0).start()
+	try:
+		await asyncio.sleep(seconds)
+	finally:
+		profiler.stop()
+	return _profile_response(profiler, format, name=f"window-{seconds:g}s")
+
+
+async def profile_request_middleware(
+	request: Request, call_next: Callable[[Request], Awaitable[Response]]
+) -> Response:
+	"""Profile one request when an admin sends `X-Credence-Profile: collapsed|speedscope`.
+
+	The profile replaces the response body; the original status code is kept
+	in `X-Credence-Profiled-Status`. Requests without the header only pay for
+	the header lookup.
+	"""
+	fmt = request.headers.get(PROFILE_HEADER)
+	if not fmt:
+		return await call_next(request)
+	settings = get_settings()
+	if fmt not in PROFILE_FORMATS or resolve_user_id(request, settings) not in settings.admin_user_ids:
+		return await call_next(request)
+	# Only this request's threads: the event loop and, via `profile_sync_endpoints`,
+	# the worker running a sync endpoint; other requests are left out
+	profiler = SamplingProfiler(thread_ids=[threading.get_ident()]).start()
+	token = _request_profiler.set(profiler)
+	try:
+		response = await call_next(request)
+		# Drain the body so streaming endpoints are profiled end to end
+		async for _ in response.body_iterator:  # type: ignore[attr-defined]
+			pass
+	finally:
+		_request_profiler.reset(token)
+		profiler.stop()
+	result = _profile_response(profiler, fmt, name=f"{request.method} {request.url.path}")
+	result.headers["X-Credence-Profiled-Status"] = str(response.status_code)
+	return result
+
+
+def profile_sync_endpoints(app: FastAPI) -> None:
+	"""Make sync endpoints add their worker thread to the request's profiler.
+
+	Call before the app serves requests. Routes of included routers are
+	wrapped too, whether FastAPI copied them into the app or keeps them on
+	the included router.
+	"""
+	pending = list(app.routes)
+	while pending:
+		route = pending.pop()
+		included = getattr(route, "original_router", None)
+		if included is not None:
+			pending.extend(included.routes)
+		elif isinstance(route, APIRoute) and not asyncio.iscoroutinefunction(route.endpoint):
+			if not getattr(route.endpoint, "_credence_sampled", False):
+				route.endpoint = _sampled(route.endpoint)
+			if not getattr(route.dependant.call, "_credence_sampled", False):
+				route.dependant.call = _sampled(route.dependant.call)
+
+
+def _sampled(endpoint: Callable[..., Any]) -> Callable[..., Any]:
+	@functools.wraps(endpoint)
+	def run(*args: Any, **kwargs: Any) -> Any:
+		profiler = _request_profiler.get()
+		if profiler is None:
+			return endpoint(*args, **kwargs)
+		with profiler.sampling_current_thread():
+			return endpoint(*args, **kwargs)
+
+	run._credence_sampled = True  # type: ignore[attr-defined]
+	return run
@@ -1,34 +1,118 @@
-from fastapi import APIRouter, Depends, HTTPException, Request, Body
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, Body
 from sqlalchemy.orm import Session
 
-from ...deps import AuthAdapter, get_auth_adapter, get_session_dep, get_settings
-from ...schemas import DisputeOpenRequest, DisputeOut, DisputeResolveRequest
-from ...services.disputes import DisputeService
-from ...rate_limit import limiter
+from ...deps import (
+	AuthAdapter,
+	get_auth_adapter,
+	get_read_session_dep,
+	get_session_dep,
+	get_settings,
+	set_consistency_token,
+	shard_router,
+)
+from ...schemas import (
+	DisputeClaimRequest,
+	DisputeListResponse,
+	DisputeOpenRequest,
+	DisputeOut,
+	DisputeReleaseRequest,
+	DisputeResolveRequest,
+)
+from ...services.disputes import DisputeClaimedError, DisputeService
+from ...rate_limit import rate_limit
 
 router = APIRouter(prefix="/disputes", tags=["disputes"])
 
+MAX_PAGE_SIZE = 200
 
-@router.post("/open", response_model=DisputeOut)
-@limiter.limit("30/minute")
+
+@router.get("/", response_model=DisputeListResponse)
+def list_disputes(
+	status: str | None = None,
+	opened_by: str | None = None,
+	ledger_entry_id: int | None = None,
+	claimed_by: str | None = None,
+	before_id: int | None = None,
+	limit: int = 50,
+	session: Session = Depends(get_read_session_dep),
+):
+	"""List disputes newest first, filtered by status, opener, ledger entry or claimant.
+
+	Keyset-paginated: pass `next_cursor` back as `before_id`.
+	"""
+	if not 1 <= limit <= MAX_PAGE_SIZE:
+		raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_PAGE_SIZE}")
+	try:
+		service = DisputeService(session=session, settings=get_settings())
+		items = service.list_disputes(
+			status=status,
+			opened_by=opened_by,
+			ledger_entry_id=ledger_entry_id,
+			claimed_by=claimed_by,
+			before_id=before_id,
+			limit=limit,
+		)
+	except ValueError as e:
+		raise HTTPException(status_code=400, detail=str(e))
+	next_cursor = items[-1].id if len(items) == limit else None
+	return DisputeListResponse(items=[DisputeOut.model_validate(d) for d in items], next_cursor=next_cursor)
+
+
+@router.post("/claim", response_model=list[DisputeOut], dependencies=[Depends(rate_limit("disputes.claim", "120/minute"))])
+def claim_disputes(
+	response: Response,
+	req: DisputeClaimRequest | None = Body(default=None),
+	session: Session = Depends(get_session_dep),
+	auth: AuthAdapter = Depends(get_auth_adapter),
+):
+	"""Lease the next open disputes to the caller (empty when the queue is drained)."""
+	req = req or DisputeClaimRequest()
+	service = DisputeService(session=session, settings=get_settings())
+	claimed = service.claim(auth.get_user_id(), limit=req.limit, lease_seconds=req.lease_seconds)
+	set_consistency_token(response, session)
+	return claimed
+
+
+@router.post("/release", response_model=DisputeOut, dependencies=[Depends(rate_limit("disputes.release", "120/minute"))])
+def release_dispute(
+	response: Response,
+	req: DisputeReleaseRequest = Body(...),
+	session: Session = Depends(get_session_dep),
+	auth: AuthAdapter = Depends(get_auth_adapter),
+):
+	try:
+		service = DisputeService(session=session, settings=get_settings())
+		d = service.release(req.dispute_id, auth.get_user_id())
+		set_consistency_token(response, session)
+		return d
+	except DisputeClaimedError as e:
+		raise HTTPException(status_code=409, detail=str(e))
+	except ValueError as e:
+		raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.post("/open", response_model=DisputeOut, dependencies=[Depends(rate_limit("disputes.open", "30/minute"))])
 def open_dispute(
 	request: Request,
+	response: Response,
 	req: DisputeOpenRequest = Body(...),
 	session: Session = Depends(get_session_dep),
 	auth: AuthAdapter = Depends(get_auth_adapter),
 ):
 	try:
-		service = DisputeService(session=session, settings=get_settings())
+		settings = get_settings()
+		service = DisputeService(session=session, settings=settings, shards=shard_router(settings))
 		d = service.open(ledger_entry_id=req.ledger_entry_id, opened_by=auth.get_user_id(), reason=req.reason)
+		set_consistency_token(response, session)
 		return d
 	except ValueError as e:
 		raise HTTPException(status_code=400, detail=str(e))
 
 
-@router.post("/resolve", response_model=DisputeOut)
-@limiter.limit("30/minute")
+@router.post("/resolve", response_model=DisputeOut, dependencies=[Depends(rate_limit("disputes.resolve", "30/minute"))])
 def resolve_dispute(
 	request: Request,
+	response: Response,
 	req: DisputeResolveRequest = Body(...),
 	session: Session = Depends(get_session_dep),
 	auth: AuthAdapter = Depends(get_auth_adapter),
@@ -36,7 +120,10 @@ def resolve_dispute(
 	try:
 		service = DisputeService(session=session, settings=get_settings())
 		d = service.resolve(dispute_id=req.dispute_id, resolved_by=auth.get_user_id(), resolution=req.resolution, note=req.note)
+		set_consistency_token(response, session)
 		return d
+	except DisputeClaimedError as e:
+		raise HTTPException(status_code=409, detail=str(e))
 	except ValueError as e:
 		raise HTTPException(status_code=400, detail=str(e))
 
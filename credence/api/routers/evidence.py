@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import heapq
+import itertools
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+
+from ...db import EntryEvidenceStatus, EvidenceStatusEnum
+from ...deps import entry_session, get_read_session_dep, get_settings, scatter_reads, user_session
+from ...schemas import EntryEvidenceStatusOut, FlaggedEntriesResponse
+from ...services.evidence_status import EvidenceStatusService
+
+router = APIRouter(prefix="/evidence", tags=["evidence"])
+
+MAX_PAGE_SIZE = 200
+
+
+@router.get("/flagged", response_model=FlaggedEntriesResponse)
+def list_flagged(
+	status: str | None = None,
+	user_id: str | None = None,
+	domain: str | None = None,
+	before_id: int | None = None,
+	limit: int = 50,
+	session: Session = Depends(get_read_session_dep),
+):
+	"""List entries whose current evidence status is not green, newest first.
+
+	Served from the `entry_evidence_status` projection, so the cost does not
+	grow with the flag history. Keyset-paginated: pass `next_cursor` back as
+	`before_id`.
+
+	Args:
+		status: Optional status (yellow, red or pending); default any non-green.
+		user_id: Optional subject user id.
+		domain: Optional domain.
+	"""
+	if not 1 <= limit <= MAX_PAGE_SIZE:
+		raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_PAGE_SIZE}")
+	try:
+		wanted = EvidenceStatusEnum(status) if status is not None else None
+	except ValueError:
+		raise HTTPException(status_code=400, detail=f"Invalid status: {status}")
+
+	def page(s: Session) -> List[EntryEvidenceStatus]:
+		return EvidenceStatusService(session=s).list_flagged(
+			status=wanted, user_id=user_id, domain=domain, before_id=before_id, limit=limit
+		)
+
+	settings = get_settings()
+	if user_id is not None:
+		with user_session(settings, session, user_id) as user_db:
+			items = page(user_db)
+	else:
+		# Each shard's page is ordered by entry id; the first `limit` of the merge is the page
+		merged = heapq.merge(*scatter_reads(settings, session, page), key=lambda i: i.ledger_entry_id, reverse=True)
+		items = list(itertools.islice(merged, limit))
+	next_cursor = items[-1].ledger_entry_id if len(items) == limit else None
+	return FlaggedEntriesResponse(items=[EntryEvidenceStatusOut.model_validate(i) for i in items], next_cursor=next_cursor)
+
+
+@router.get("/{entry_id}", response_model=EntryEvidenceStatusOut)
+def get_entry_status(entry_id: int, session: Session = Depends(get_read_session_dep)):
+	"""Current evidence status of one entry; 404 for entries that are green and never flagged."""
+	with entry_session(get_settings(), session, entry_id) as session:
+		current = EvidenceStatusService(session=session).current(entry_id)
+	if current is None:
+		raise HTTPException(status_code=404, detail="Entry has no evidence status record")
+	return EntryEvidenceStatusOut.model_validate(current)
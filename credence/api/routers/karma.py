@@ -1,19 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException, Header, Request, Body
+from fastapi import APIRouter, Depends, HTTPException, Header, Request, Response, Body
 from typing import Annotated
 from sqlalchemy.orm import Session
 
-from ...deps import AuthAdapter, get_auth_adapter, get_session_dep, get_settings
+from ...deps import AuthAdapter, entry_session, get_auth_adapter, get_session_dep, get_settings, set_consistency_token, user_session
 from ...schemas import AwardRequest, FlagEvidenceRequest, LedgerEntryOut, ReverseRequest, FlagEvidenceResponse
 from ...services.karma import KarmaService
-from ...rate_limit import limiter
+from ...rate_limit import enforce_action_limit, rate_limit
 
 router = APIRouter(prefix="/karma", tags=["karma"])
 
 
-@router.post("/award", response_model=LedgerEntryOut)
-@limiter.limit("120/minute")
+@router.post("/award", response_model=LedgerEntryOut, dependencies=[Depends(rate_limit("karma.award", "120/minute"))])
 def award(
 	request: Request,
+	response: Response,
 	req: Annotated[AwardRequest, Body(...)],
 	session: Session = Depends(get_session_dep),
 	auth: AuthAdapter = Depends(get_auth_adapter),
@@ -33,25 +33,30 @@ def award(
 	Raises:
 		HTTPException: on validation errors, permission errors, or limits exceeded.
 	"""
+	settings = get_settings()
+	user_id = auth.get_user_id()
+	enforce_action_limit(settings, user_id, req.domain, req.action)
 	try:
-		service = KarmaService(session=session, settings=get_settings())
-		entry = service.award(
-			user_id=auth.get_user_id(),
-			domain=req.domain,
-			action=req.action,
-			evidence_ref=req.evidence_ref,
-			idempotency_key=idempotency_key,
-			meta=req.meta,
-		)
+		with user_session(settings, session, user_id) as session:
+			service = KarmaService(session=session, settings=settings)
+			entry = service.award(
+				user_id=user_id,
+				domain=req.domain,
+				action=req.action,
+				evidence_ref=req.evidence_ref,
+				idempotency_key=idempotency_key,
+				meta=req.meta,
+			)
+			set_consistency_token(response, session)
 		return entry
 	except (ValueError, PermissionError) as e:
 		raise HTTPException(status_code=400, detail=str(e))
 
 
-@router.post("/reverse", response_model=LedgerEntryOut)
-@limiter.limit("60/minute")
+@router.post("/reverse", response_model=LedgerEntryOut, dependencies=[Depends(rate_limit("karma.reverse", "60/minute"))])
 def reverse(
 	request: Request,
+	response: Response,
 	req: Annotated[ReverseRequest, Body(...)],
 	session: Session = Depends(get_session_dep),
 	auth: AuthAdapter = Depends(get_auth_adapter),
@@ -64,18 +69,22 @@ def reverse(
 	Returns:
 		The reversal ledger entry.
 	"""
+	settings = get_settings()
+	user_id = auth.get_user_id()
 	try:
-		service = KarmaService(session=session, settings=get_settings())
-		entry = service.reverse(user_id=auth.get_user_id(), original_entry_id=req.entry_id)
+		with user_session(settings, session, user_id) as session:
+			service = KarmaService(session=session, settings=settings)
+			entry = service.reverse(user_id=user_id, original_entry_id=req.entry_id)
+			set_consistency_token(response, session)
 		return entry
 	except (ValueError, PermissionError) as e:
 		raise HTTPException(status_code=400, detail=str(e))
 
 
-@router.post("/flag", response_model=FlagEvidenceResponse)
-@limiter.limit("60/minute")
+@router.post("/flag", response_model=FlagEvidenceResponse, dependencies=[Depends(rate_limit("karma.flag", "60/minute"))])
 def flag(
 	request: Request,
+	response: Response,
 	req: Annotated[FlagEvidenceRequest, Body(...)],
 	session: Session = Depends(get_session_dep),
 ):
@@ -87,9 +96,12 @@ def flag(
 	Returns:
 		A record describing the evidence flag event.
 	"""
+	settings = get_settings()
 	try:
-		service = KarmaService(session=session, settings=get_settings())
-		flag = service.flag_evidence(entry_id=req.entry_id, status=req.status)
+		with entry_session(settings, session, req.entry_id) as session:
+			service = KarmaService(session=session, settings=settings)
+			flag = service.flag_evidence(entry_id=req.entry_id, status=req.status)
+			set_consistency_token(response, session)
 		return FlagEvidenceResponse(id=flag.id, ledger_entry_id=flag.ledger_entry_id, status=flag.status, created_at=flag.created_at)
 	except ValueError as e:
 		raise HTTPException(status_code=400, detail=str(e))
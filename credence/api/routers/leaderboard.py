@@ -1,84 +1,167 @@
 from __future__ import annotations
 
+import base64
+import heapq
+import itertools
+import json
 from datetime import datetime, timedelta, timezone
-from typing import Iterable, List, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 
-from fastapi import APIRouter, Depends
-from sqlalchemy import and_, func
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import func, select
 from sqlalchemy.orm import Session
 
-from ...deps import get_session_dep, get_settings
-from ...db import LedgerEntry, TrustScore
+from ...cache import RedisCache
+from ...deps import get_read_session_dep, get_settings, scatter_reads
+from ...db import TrustScore
 from ...plugins import load_symbol
-from ...schemas import LeaderboardItem, LeaderboardResponse
+from ...services.rank_index import MAX_WINDOW_DAYS, RankIndex
+from ...services.rollups import RollupService
+from ..serialization import ORJSONResponse
 
 router = APIRouter(prefix="/leaderboard", tags=["leaderboard"])
 
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+
+def _encode_cursor(value: List[Any]) -> str:
+	return base64.urlsafe_b64encode(json.dumps(value, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> List[Any]:
+	try:
+		value = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+	except ValueError:
+		raise HTTPException(status_code=400, detail="Invalid cursor")
+	keyset = isinstance(value, list) and len(value) == 3 and value[0] == "k" and isinstance(value[1], int) and isinstance(value[2], str)
+	offset = isinstance(value, list) and len(value) == 2 and value[0] == "o" and isinstance(value[1], int) and value[1] >= 0
+	if not (keyset or offset):
+		raise HTTPException(status_code=400, detail="Invalid cursor")
+	return value
+
+
+def _top_k(strategy: Any, rows: List[Tuple[str, int]], k: int) -> List[Tuple[str, int]]:
+	top_k = getattr(strategy, "top_k", None)
+	if top_k is not None:
+		return top_k(rows, k)
+	# Strategies written before `top_k` existed
+	return strategy.rank(rows)[:k]
+
 
 @router.get("/")
 def leaderboard(
 	domain: str | None = None,
 	since_days: int | None = None,
 	mode: str | None = None,
-	session: Session = Depends(get_session_dep),
+	limit: int = DEFAULT_LIMIT,
+	cursor: str | None = None,
+	session: Session = Depends(get_read_session_dep),
 ):
-	"""Return leaderboard items.
+	"""Return leaderboard items, one page at a time.
+
+	With the default strategy and mode the order and limit are applied in
+	SQL; otherwise the strategy selects the top items with `top_k`.
 
 	Args:
 		domain: Optional domain filter.
 		since_days: Restrict to points gained within the last N days.
 		mode: Ranking mode: None (sum of points), 'trust_weighted', or 'recency_weighted'.
+		limit: Items per page (1-1000).
+		cursor: `next_cursor` from the previous page.
 
 	Returns:
-		LeaderboardResponse containing ranked items.
+		LeaderboardResponse containing ranked items and `next_cursor` (None on the last page).
 	"""
+	if not 1 <= limit <= MAX_LIMIT:
+		raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_LIMIT}")
 	settings = get_settings()
 	strategy_cls = load_symbol(settings.plugins.leaderboard_strategy)
 	strategy = strategy_cls()  # type: ignore[call-arg]
+	by_points = bool(getattr(strategy, "orders_by_points", False))
+	position = _decode_cursor(cursor) if cursor is not None else ["k", None, None] if by_points else ["o", 0]
+	if (position[0] == "k") != by_points:
+		raise HTTPException(status_code=400, detail="Invalid cursor")
+	after: Optional[Tuple[int, str]] = (position[1], position[2]) if position[0] == "k" and position[2] is not None else None
 
-	q = session.query(LedgerEntry.user_id, func.coalesce(func.sum(LedgerEntry.points), 0))
-	if domain is not None:
-		q = q.filter(LedgerEntry.domain == domain)
-	if since_days is not None:
-		start = datetime.now(timezone.utc) - timedelta(days=since_days)
-		q = q.filter(LedgerEntry.created_at >= start)
-	q = q.group_by(LedgerEntry.user_id)
-
-	rows: List[Tuple[str, int]] = [(user_id, int(total)) for user_id, total in q.all()]
-
-	if mode == "trust_weighted":
-		trust_by_user = {
-			user_id: float(
-				session.query(func.coalesce(func.max(TrustScore.trust), 0.0))
-				.filter(TrustScore.user_id == user_id)
-				.scalar() or 0.0
-			)
-			for user_id, _ in rows
-		}
-		weighted: List[Tuple[str, int]] = []
-		for user_id, pts in rows:
-			trust = trust_by_user.get(user_id, 0.0)
-			weighted.append((user_id, int(round(pts * (1.0 + trust)))))
-		items_sorted = strategy.rank(weighted)
-	elif mode == "recency_weighted":
-		# Weight by last 7d points added to total
-		start_recent = datetime.now(timezone.utc) - timedelta(days=7)
-		q_recent = session.query(LedgerEntry.user_id, func.coalesce(func.sum(LedgerEntry.points), 0))
-		if domain is not None:
-			q_recent = q_recent.filter(LedgerEntry.domain == domain)
-		q_recent = q_recent.filter(LedgerEntry.created_at >= start_recent).group_by(LedgerEntry.user_id)
-		recent_map = {u: int(p) for u, p in q_recent.all()}
-		weighted = []
-		for user_id, pts in rows:
-			weighted.append((user_id, pts + recent_map.get(user_id, 0)))
-		items_sorted = strategy.rank(weighted)
+	start = datetime.now(timezone.utc) - timedelta(days=since_days) if since_days is not None else None
+	in_sql = mode is None and by_points
+
+	def shard_rows(s: Session) -> List[Tuple[str, int]]:
+		# Sums come from the hourly/daily rollups plus the not yet rolled-up tail
+		rollups = RollupService(session=s)
+		if in_sql:
+			# One extra row tells whether there is a next page
+			return rollups.top_points(limit + 1, start, domain, after=after)
+		rows: List[Tuple[str, int]] = list(rollups.window_points(start, domain).items())
+		if mode == "trust_weighted":
+			# Highest trust snapshot per user, in one grouped query
+			trust_by_user: Dict[str, float] = {
+				user_id: float(trust or 0.0)
+				for user_id, trust in s.execute(
+					select(TrustScore.user_id, func.max(TrustScore.trust)).group_by(TrustScore.user_id)
+				).all()
+			}
+			rows = [(user_id, int(round(pts * (1.0 + trust_by_user.get(user_id, 0.0))))) for user_id, pts in rows]
+		elif mode == "recency_weighted":
+			# Weight by last 7d points added to total
+			start_recent = datetime.now(timezone.utc) - timedelta(days=7)
+			recent_map = rollups.window_points(start_recent, domain)
+			rows = [(user_id, pts + recent_map.get(user_id, 0)) for user_id, pts in rows]
+		return rows
+
+	# A user's points all live on one shard, so per-shard results merge exactly
+	parts = scatter_reads(settings, session, shard_rows)
+	if in_sql:
+		items = list(itertools.islice(heapq.merge(*parts, key=lambda r: (-r[1], r[0])), limit + 1))
 	else:
-		items_sorted = strategy.rank(rows)
+		rows = [row for part in parts for row in part]
+		if after is not None:
+			rows = [(u, p) for u, p in rows if p < after[0] or (p == after[0] and u > after[1])]
+		offset = int(position[1]) if position[0] == "o" else 0
+		items = _top_k(strategy, rows, offset + limit + 1)[offset:]
 
-	return LeaderboardResponse(
-		domain=domain,
-		since_days=since_days,
-		items=[LeaderboardItem(user_id=u, points=p) for u, p in items_sorted],
+	next_cursor = None
+	if len(items) > limit:
+		items = items[:limit]
+		last_user, last_points = items[-1]
+		next_cursor = _encode_cursor(["k", last_points, last_user] if by_points else ["o", int(position[1]) + limit])
+
+	# Same shape as LeaderboardResponse, encoded without building a model per row
+	return ORJSONResponse(
+		{
+			"domain": domain,
+			"since_days": since_days,
+			"items": [{"user_id": u, "points": p} for u, p in items],
+			"next_cursor": next_cursor,
+		}
 	)
 
 
+@router.get("/rank/{user_id}")
+def rank(
+	user_id: str,
+	domain: str | None = None,
+	since_days: int | None = None,
+	neighbors: int = 5,
+):
+	"""Return a user's rank, points, percentile and nearby users.
+
+	Served from the Redis rank index (O(log n) per lookup), not from the
+	database.
+
+	Args:
+		user_id: Subject user id.
+		domain: Optional domain filter.
+		since_days: Restrict to points gained in the last N UTC days, today included.
+		neighbors: Users returned above and below (at most 50 each).
+	"""
+	if since_days is not None and not 1 <= since_days <= MAX_WINDOW_DAYS:
+		raise HTTPException(status_code=400, detail=f"since_days must be between 1 and {MAX_WINDOW_DAYS}")
+	if not 0 <= neighbors <= 50:
+		raise HTTPException(status_code=400, detail="neighbors must be between 0 and 50")
+	index = RankIndex(client=RedisCache.from_settings(get_settings()).client)
+	found = index.lookup(user_id, domain=domain, since_days=since_days, neighbors=neighbors)
+	if found is None:
+		raise HTTPException(status_code=404, detail="User has no points in this leaderboard")
+	return ORJSONResponse({"user_id": user_id, "domain": domain, "since_days": since_days, **found})
@@ -1,61 +1,34 @@
 from __future__ import annotations
 
-from fastapi import APIRouter, Depends
+import asyncio
+import heapq
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Optional
+
+import orjson
+from fastapi import APIRouter, Depends, Header, HTTPException, Request
 from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import func, select
 from sqlalchemy.orm import Session
 
-from ...deps import get_session_dep
+from ...deps import entry_session, get_read_session_dep, get_settings, scatter_reads, shard_router, user_session
 from ...db import LedgerEntry
-from ...schemas import LedgerEntryOut, LedgerPageResponse
+from ...schemas import LedgerPageResponse, LedgerProofResponse, MerklePathStep
+from ...services.integrity import IntegrityService
+from ..feed import LATE_COMMIT_WINDOW, fetch_entries, fetch_late_entries, get_ledger_feed
+from ..serialization import LEDGER_ENTRY_COLUMNS, LEDGER_ENTRY_FIELDS, ORJSONResponse, rows_to_dicts
 
 
 router = APIRouter(prefix="/ledger", tags=["ledger"])
 
 
-@router.get("/{user_id}", response_model=LedgerPageResponse)
-def list_ledger(
-	user_id: str,
-	domain: str | None = None,
-	page: int = 1,
-	page_size: int = 50,
-	session: Session = Depends(get_session_dep),
-):
-	"""Paginated ledger history for a user, newest first.
-
-	Args:
-		user_id: Subject user id.
-		domain: Optional domain filter.
-		page: 1-based page index.
-		page_size: Items per page (max 200).
-	"""
-	page = max(1, page)
-	page_size = min(max(1, page_size), 200)
-	q = session.query(LedgerEntry).filter(LedgerEntry.user_id == user_id)
-	if domain is not None:
-		q = q.filter(LedgerEntry.domain == domain)
-	total = q.count()
-	items = (
-		q.order_by(LedgerEntry.created_at.desc())
-		.offset((page - 1) * page_size)
-		.limit(page_size)
-		.all()
-	)
-	return LedgerPageResponse(
-		user_id=user_id,
-		domain=domain,
-		page=page,
-		page_size=page_size,
-		total=total,
-		items=[LedgerEntryOut.model_validate(i) for i in items],
-	)
-
-
 @router.get("/export")
 def export_ledger(
 	user_id: str | None = None,
 	domain: str | None = None,
 	format: str = "json",
-	session: Session = Depends(get_session_dep),
+	session: Session = Depends(get_read_session_dep),
 ):
 	"""Export ledger data as JSON or CSV.
 
@@ -64,12 +37,23 @@ def export_ledger(
 		domain: Optional domain filter.
 		format: 'json' or 'csv'.
 	"""
-	q = session.query(LedgerEntry)
-	if user_id is not None:
-		q = q.filter(LedgerEntry.user_id == user_id)
+	settings = get_settings()
+	stmt = select(*LEDGER_ENTRY_COLUMNS)
 	if domain is not None:
-		q = q.filter(LedgerEntry.domain == domain)
-	rows = q.order_by(LedgerEntry.created_at.desc()).all()
+		stmt = stmt.where(LedgerEntry.domain == domain)
+	stmt = stmt.order_by(LedgerEntry.created_at.desc())
+	if user_id is not None:
+		with user_session(settings, session, user_id) as user_db:
+			rows = user_db.execute(stmt.where(LedgerEntry.user_id == user_id)).all()
+	else:
+		# Every shard returns its rows newest first; merge them in that order
+		rows = list(
+			heapq.merge(
+				*scatter_reads(settings, session, lambda s: s.execute(stmt).all()),
+				key=lambda r: r.created_at,
+				reverse=True,
+			)
+		)
 	if format == "csv":
 		import csv
 		import io
@@ -89,7 +73,7 @@ def export_ledger(
 					r.action,
 					r.points,
 					r.evidence_ref or "",
-					r.evidence_status,
+					r.evidence_status.value,
 					r.related_entry_id or "",
 					r.created_at.isoformat(),
 				])
@@ -99,6 +83,191 @@ def export_ledger(
 
 		return StreamingResponse(generate(), media_type="text/csv", headers={"Content-Disposition": "attachment; filename=ledger.csv"})
 	# default json
-	return [LedgerEntryOut.model_validate(r).model_dump() for r in rows]
+	return ORJSONResponse(rows_to_dicts(LEDGER_ENTRY_FIELDS, rows))
+
+
+STREAM_KEEPALIVE_SECONDS = 15.0
+STREAM_CATCHUP_BATCH = 500
+
+
+def _sse(entry: Dict[str, Any]) -> bytes:
+	data = orjson.dumps(entry, option=orjson.OPT_UTC_Z)
+	return b"id: %d\nevent: ledger.entry\ndata: %s\n\n" % (entry["id"], data)
+
+
+@router.get("/stream")
+async def stream_ledger(
+	request: Request,
+	user_id: str | None = None,
+	domain: str | None = None,
+	after_id: int | None = None,
+	last_event_id: Optional[str] = Header(default=None),
+):
+	"""Server-sent events for new ledger entries, optionally filtered.
+
+	Each event's `id` is the entry id; reconnecting with `Last-Event-ID` (or
+	`after_id`) first replays entries after that id from the database, then
+	continues live. Entries that committed late, with ids just below the resume
+	point, are replayed too, so a resumed stream can repeat a few events:
+	clients should skip ids they have already seen. Live events come from one shared listener per process
+	(per shard when sharded, where `user_id` is required).
+
+	Args:
+		user_id: Optional user filter.
+		domain: Optional domain filter.
+		after_id: Resume after this entry id; `Last-Event-ID` takes precedence.
+	"""
+	if last_event_id:
+		try:
+			after_id = int(last_event_id)
+		except ValueError:
+			raise HTTPException(status_code=400, detail="Invalid Last-Event-ID")
+	settings = get_settings()
+	shards = shard_router(settings)
+	if shards.sharded and user_id is None:
+		# Entry ids only increase within a shard, so a resumable feed is per shard
+		raise HTTPException(status_code=400, detail="user_id is required when the ledger is sharded")
+	feed = get_ledger_feed(settings, shards.urls[shards.shard_for_user(user_id)] if shards.sharded else None)
+	session_factory = feed.session_factory
+
+	def catch_up(after: int) -> list[Dict[str, Any]]:
+		session = session_factory()
+		try:
+			return fetch_entries(session, after, user_id=user_id, domain=domain, limit=STREAM_CATCHUP_BATCH)
+		finally:
+			session.close()
+
+	def late(after: int) -> list[Dict[str, Any]]:
+		session = session_factory()
+		try:
+			return fetch_late_entries(session, after, user_id=user_id, domain=domain)
+		finally:
+			session.close()
+
+	async def events() -> AsyncIterator[bytes]:
+		last = after_id
+		# Ids sent so far that a late-commit replay could return again
+		sent: Dict[int, datetime] = {}
+		# Bulk replay happens before subscribing so the live queue cannot overflow
+		if last is not None:
+			while True:
+				batch = await run_in_threadpool(catch_up, last)
+				for entry in batch:
+					sent[entry["id"]] = entry["created_at"]
+					yield _sse(entry)
+				if batch:
+					last = batch[-1]["id"]
+					horizon = max(sent.values()) - 2 * LATE_COMMIT_WINDOW
+					sent = {i: at for i, at in sent.items() if at >= horizon}
+				if len(batch) < STREAM_CATCHUP_BATCH:
+					break
+		sub = feed.subscribe(user_id, domain)
+		try:
+			# Close the gap between the replay and the subscription, and replay
+			# entries that committed late, below the resume point or during the
+			# replay (see LATE_COMMIT_WINDOW); entries already sent are skipped
+			if after_id is not None and last is not None:
+				for anchor in sorted({after_id, last}):
+					for entry in await run_in_threadpool(late, anchor):
+						if entry["id"] not in sent:
+							sent[entry["id"]] = entry["created_at"]
+							yield _sse(entry)
+				for entry in await run_in_threadpool(catch_up, last):
+					if entry["id"] not in sent:
+						sent[entry["id"]] = entry["created_at"]
+						yield _sse(entry)
+			while not await request.is_disconnected():
+				try:
+					entry = await asyncio.wait_for(sub.queue.get(), timeout=STREAM_KEEPALIVE_SECONDS)
+				except asyncio.TimeoutError:
+					yield b": keepalive\n\n"
+					continue
+				if entry is None:
+					# Fell too far behind; the client resumes with Last-Event-ID
+					break
+				if entry["id"] in sent:
+					continue
+				yield _sse(entry)
+		finally:
+			feed.unsubscribe(sub)
+
+	return StreamingResponse(
+		events(),
+		media_type="text/event-stream",
+		headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+	)
+
+
+@router.get("/{user_id}", response_model=LedgerPageResponse)
+def list_ledger(
+	user_id: str,
+	domain: str | None = None,
+	page: int = 1,
+	page_size: int = 50,
+	session: Session = Depends(get_read_session_dep),
+):
+	"""Paginated ledger history for a user, newest first.
+
+	Rows are encoded straight from Core result tuples; the response still
+	follows `LedgerPageResponse`.
+
+	Args:
+		user_id: Subject user id.
+		domain: Optional domain filter.
+		page: 1-based page index.
+		page_size: Items per page (max 200).
+	"""
+	page = max(1, page)
+	page_size = min(max(1, page_size), 200)
+	criteria = [LedgerEntry.user_id == user_id]
+	if domain is not None:
+		criteria.append(LedgerEntry.domain == domain)
+	with user_session(get_settings(), session, user_id) as session:
+		total = session.execute(select(func.count(LedgerEntry.id)).where(*criteria)).scalar_one()
+		rows = session.execute(
+			select(*LEDGER_ENTRY_COLUMNS)
+			.where(*criteria)
+			.order_by(LedgerEntry.created_at.desc())
+			.offset((page - 1) * page_size)
+			.limit(page_size)
+		).all()
+	return ORJSONResponse(
+		{
+			"user_id": user_id,
+			"domain": domain,
+			"page": page,
+			"page_size": page_size,
+			"total": int(total),
+			"items": rows_to_dicts(LEDGER_ENTRY_FIELDS, rows),
+		}
+	)
+
 
+@router.get("/entries/{entry_id}/proof", response_model=LedgerProofResponse)
+def entry_proof(entry_id: int, session: Session = Depends(get_read_session_dep)):
+	"""Merkle inclusion proof for a ledger entry.
 
+	The path has O(log n) steps from the entry's leaf hash to the root of the
+	sealed segment containing it; `chain_hash` links that root to every earlier
+	segment. Entries become provable once their segment has been sealed.
+
+	Args:
+		entry_id: Ledger entry id.
+	"""
+	settings = get_settings()
+	try:
+		with entry_session(settings, session, entry_id) as session:
+			service = IntegrityService(session=session, segment_size=settings.ledger_segment_size)
+			proof = service.inclusion_proof(entry_id)
+	except ValueError as e:
+		raise HTTPException(status_code=400, detail=str(e))
+	return LedgerProofResponse(
+		entry_id=proof.entry_id,
+		entry_hash=proof.entry_hash,
+		segment_index=proof.segment_index,
+		leaf_index=proof.leaf_index,
+		leaf_count=proof.leaf_count,
+		segment_root=proof.segment_root,
+		chain_hash=proof.chain_hash,
+		path=[MerklePathStep(hash=h, position=side) for h, side in proof.path],
+	)
@@ -1,36 +1,53 @@
 from __future__ import annotations
 
+from typing import Dict
+
 from fastapi import APIRouter, Depends
-from sqlalchemy import func
+from sqlalchemy import case, func
 from sqlalchemy.orm import Session
 
-from ...deps import get_session_dep
-from ...db import LedgerEntry, Dispute, Verification
+from ...deps import get_read_session_dep, get_settings, scatter_reads
+from ...db import CurrentVerification, LedgerEntry, Dispute
 
 
 router = APIRouter(prefix="/stats", tags=["stats"])
 
 
 @router.get("/")
-def get_stats(session: Session = Depends(get_session_dep)):
+def get_stats(session: Session = Depends(get_read_session_dep)):
 	"""Basic service statistics for dashboards.
 
 	Returns counts of users, verified users, open disputes, total entries,
 	and aggregate positive/negative karma sums.
 	"""
-	users = session.query(func.count(func.distinct(LedgerEntry.user_id))).scalar() or 0
+	settings = get_settings()
+
+	def shard_counts(s: Session) -> Dict[str, int]:
+		# Users never span shards, so every count sums across them
+		verified = (
+			s.query(func.count(CurrentVerification.user_id))
+			.filter((CurrentVerification.external_level > 0) | (CurrentVerification.internal_level > 0))
+			.scalar()
+		)
+		return {
+			"total_users": int(s.query(func.count(func.distinct(LedgerEntry.user_id))).scalar() or 0),
+			"verified_users": int(verified or 0),
+			"ledger_entries": int(s.query(func.count(LedgerEntry.id)).scalar() or 0),
+			"karma_positive_sum": int(
+				s.query(func.coalesce(func.sum(case((LedgerEntry.points > 0, LedgerEntry.points), else_=0)), 0)).scalar() or 0
+			),
+			"karma_negative_sum": int(
+				s.query(func.coalesce(func.sum(case((LedgerEntry.points < 0, LedgerEntry.points), else_=0)), 0)).scalar() or 0
+			),
+		}
+
+	parts = scatter_reads(settings, session, shard_counts)
 	disputes_open = session.query(func.count(Dispute.id)).filter(Dispute.status == 'open').scalar() or 0
-	total_entries = session.query(func.count(LedgerEntry.id)).scalar() or 0
-	pos = session.query(func.coalesce(func.sum(func.case((LedgerEntry.points > 0, LedgerEntry.points), else_=0)), 0)).scalar() or 0
-	neg = session.query(func.coalesce(func.sum(func.case((LedgerEntry.points < 0, LedgerEntry.points), else_=0)), 0)).scalar() or 0
-	verified_users = session.query(func.count(func.distinct(Verification.user_id))).filter(Verification.level > 0).scalar() or 0
 	return {
-		"total_users": int(users),
-		"verified_users": int(verified_users),
+		"total_users": sum(p["total_users"] for p in parts),
+		"verified_users": sum(p["verified_users"] for p in parts),
 		"disputes_open": int(disputes_open),
-		"ledger_entries": int(total_entries),
-		"karma_positive_sum": int(pos),
-		"karma_negative_sum": int(neg),
+		"ledger_entries": sum(p["ledger_entries"] for p in parts),
+		"karma_positive_sum": sum(p["karma_positive_sum"] for p in parts),
+		"karma_negative_sum": sum(p["karma_negative_sum"] for p in parts),
 	}
-
-
@@ -1,19 +1,34 @@
 from __future__ import annotations
 
-from fastapi import APIRouter, Depends, Request
+from datetime import datetime, timedelta, timezone
+
+from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.orm import Session
 
-from ...deps import get_session_dep, get_settings
+from ...deps import get_read_session_dep, get_settings, user_session, wants_fresh_read
 from ...schemas import TrustResponse
+from ...services.distributions import cached_sketch, percentile_of
 from ...services.trust import TrustService
+from ...services.trust_history import TrustHistoryService
 from ...cache import RedisCache, trust_cache_key
-from ...worker import recompute_trust_task
+from ...tasks import enqueue
+from ..serialization import ORJSONResponse
 
 router = APIRouter(prefix="/trust", tags=["trust"])
 
+# Chart points per history response
+DEFAULT_HISTORY_POINTS = 200
+MAX_HISTORY_POINTS = 1000
+
 
 @router.get("/{user_id}", response_model=TrustResponse)
-def get_trust(user_id: str, domain: str | None = None, session: Session = Depends(get_session_dep)) -> TrustResponse:
+def get_trust(
+	request: Request,
+	user_id: str,
+	domain: str | None = None,
+	as_of: datetime | None = None,
+	session: Session = Depends(get_read_session_dep),
+) -> TrustResponse:
 	"""Get the user's trust score, balance, and verification level.
 
 	Tries Redis cache first; on cache miss, computes via plugin formula,
@@ -22,29 +37,86 @@ def get_trust(user_id: str, domain: str | None = None, session: Session = Depend
 	Args:
 		user_id: Subject user id.
 		domain: Optional domain to scope trust (defaults to all).
+		as_of: Optional instant for historical trust; bypasses the cache and
+			the background snapshot.
 
 	Returns:
-		TrustResponse with trust, karma_balance, and verification_level.
+		TrustResponse with trust, karma_balance, verification_level and the
+		approximate percentile of trust within the domain.
 	"""
 	settings = get_settings()
-	cache = RedisCache.from_settings(settings)
-	ck = trust_cache_key(user_id, domain)
-	cached = cache.get(ck)
-	if cached is not None:
-		try:
-			trust_value = float(cached)
-			service = TrustService(session=session, settings=settings)
-			# Still compute balance and verification for full response
-			trust_calc, balance, verification = service.compute_trust(user_id, domain)
-			return TrustResponse(user_id=user_id, trust=trust_value, karma_balance=balance, verification_level=verification)
-		except ValueError:
-			pass
-
-	service = TrustService(session=session, settings=settings)
-	trust, balance, verification = service.compute_trust(user_id, domain)
-	cache.set(ck, str(trust), ttl_seconds=60)
-	# Enqueue persistence via worker
-	recompute_trust_task.delay(user_id, domain)
-	return TrustResponse(user_id=user_id, trust=trust, karma_balance=balance, verification_level=verification)
+	# Balance and verification live on the user's shard; sketches on the home database
+	with user_session(settings, session, user_id) as user_db:
+		if as_of is not None:
+			service = TrustService(session=user_db, settings=settings)
+			trust, balance, verification = service.compute_trust(user_id, domain, as_of=as_of)
+			# Ranked against the distribution stored for that day
+			percentile = percentile_of(cached_sketch(session, "trust", domain, as_of.date()), trust)
+			return TrustResponse(
+				user_id=user_id, trust=trust, karma_balance=balance, verification_level=verification, percentile=percentile
+			)
+
+		cache = RedisCache.from_settings(settings)
+		ck = trust_cache_key(user_id, domain)
+		# Clients reading their own writes skip the cache
+		cached = None if wants_fresh_read(request) else cache.get(ck)
+		if cached is not None:
+			try:
+				trust_value = float(cached)
+				service = TrustService(session=user_db, settings=settings)
+				# Still compute balance and verification for full response
+				trust_calc, balance, verification = service.compute_trust(user_id, domain)
+				percentile = percentile_of(cached_sketch(session, "trust", domain), trust_value)
+				return TrustResponse(
+					user_id=user_id,
+					trust=trust_value,
+					karma_balance=balance,
+					verification_level=verification,
+					percentile=percentile,
+				)
+			except ValueError:
+				pass
+
+		service = TrustService(session=user_db, settings=settings)
+		trust, balance, verification = service.compute_trust(user_id, domain)
+		cache.set(ck, str(trust), ttl_seconds=60)
+		# Enqueue persistence via worker
+		enqueue("credence.tasks.recompute_trust", user_id, domain)
+		percentile = percentile_of(cached_sketch(session, "trust", domain), trust)
+		return TrustResponse(
+			user_id=user_id, trust=trust, karma_balance=balance, verification_level=verification, percentile=percentile
+		)
+
 
+@router.get("/{user_id}/history")
+def get_trust_history(
+	user_id: str,
+	domain: str | None = None,
+	start: datetime | None = None,
+	end: datetime | None = None,
+	points: int = DEFAULT_HISTORY_POINTS,
+	session: Session = Depends(get_read_session_dep),
+):
+	"""Trust over time, downsampled in SQL to at most `points` buckets.
 
+	Each item is the last snapshot of its bucket with the bucket's minimum
+	and maximum trust. Snapshots are only stored when trust changed, and
+	older ones are thinned to hourly and then daily values, so a bucket with
+	no item means no change.
+
+	Args:
+		user_id: Subject user id.
+		domain: Optional domain (overall trust when omitted).
+		start: Window start (default: 30 days before `end`).
+		end: Window end, exclusive (default: now).
+		points: Maximum number of items (1-1000).
+	"""
+	if not 1 <= points <= MAX_HISTORY_POINTS:
+		raise HTTPException(status_code=400, detail=f"points must be between 1 and {MAX_HISTORY_POINTS}")
+	end = end or datetime.now(timezone.utc)
+	start = start or end - timedelta(days=30)
+	if start >= end:
+		raise HTTPException(status_code=400, detail="start must be before end")
+	with user_session(get_settings(), session, user_id) as user_db:
+		items = TrustHistoryService(session=user_db).history(user_id, domain, start, end, points)
+	return ORJSONResponse({"user_id": user_id, "domain": domain, "start": start, "end": end, "items": items})
@@ -1,9 +1,9 @@
 from __future__ import annotations
 
-from fastapi import APIRouter, Depends, HTTPException, Body
+from fastapi import APIRouter, Depends, HTTPException, Body, Response
 from sqlalchemy.orm import Session
 
-from ...deps import get_session_dep
+from ...deps import get_session_dep, get_settings, set_consistency_token, user_session
 from ...schemas import VerificationSetRequest
 from ...services.verification import VerificationService
 
@@ -11,10 +11,17 @@ router = APIRouter(prefix="/verification", tags=["verification"])
 
 
 @router.post("/set")
-def set_verification(req: VerificationSetRequest = Body(...), session: Session = Depends(get_session_dep)):
+def set_verification(
+	response: Response,
+	req: VerificationSetRequest = Body(...),
+	session: Session = Depends(get_session_dep),
+):
+	settings = get_settings()
 	try:
-		service = VerificationService(session=session)
-		v = service.set_level(user_id=req.user_id, source=req.source, level=req.level)
+		with user_session(settings, session, req.user_id) as session:
+			service = VerificationService(session=session, settings=settings)
+			v = service.set_level(user_id=req.user_id, source=req.source, level=req.level)
+			set_consistency_token(response, session)
 		return {"id": v.id, "user_id": v.user_id, "source": v.source, "level": v.level}
 	except ValueError as e:
 		raise HTTPException(status_code=400, detail=str(e))
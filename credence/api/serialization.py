@@ -0,0 +1,34 @@
+from __future__ import annotations
+
+from typing import Any, Iterable, List, Sequence
+
+import orjson
+from fastapi.responses import Response
+
+from ..db import LedgerEntry
+from ..schemas import LedgerEntryOut
+
+# Matches Pydantic's JSON output for the same values (UTC datetimes as "Z")
+_ORJSON_OPTIONS = orjson.OPT_UTC_Z
+
+# Column order mirrors LedgerEntryOut so the encoded rows have the documented shape
+LEDGER_ENTRY_FIELDS: tuple[str, ...] = tuple(LedgerEntryOut.model_fields)
+LEDGER_ENTRY_COLUMNS = tuple(getattr(LedgerEntry, name) for name in LEDGER_ENTRY_FIELDS)
+
+
+class ORJSONResponse(Response):
+	"""JSON response rendered with orjson.
+
+	Endpoints that return it directly skip FastAPI's `response_model`
+	validation and serialization; the declared model still drives OpenAPI.
+	"""
+
+	media_type = "application/json"
+
+	def render(self, content: Any) -> bytes:
+		return orjson.dumps(content, option=_ORJSON_OPTIONS)
+
+
+def rows_to_dicts(fields: Sequence[str], rows: Iterable[Sequence[Any]]) -> List[dict[str, Any]]:
+	"""Zip Core result tuples with their field names, with no ORM or model layer."""
+	return [dict(zip(fields, row)) for row in rows]
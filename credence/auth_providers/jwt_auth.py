@@ -1,66 +1,234 @@
 from __future__ import annotations
 
+import hashlib
+import threading
 import time
-from dataclasses import dataclass
-from typing import Any, Dict, Optional
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 import requests
 from fastapi import Header, HTTPException
-from jose import jwt
+from jose import jwk, jwt
+from jose.exceptions import ExpiredSignatureError, JWTClaimsError, JWTError
 
 from ..config import Settings
 
+DEFAULT_ALGORITHM = "RS256"
+
+
+def _fetch_jwks(url: str) -> Dict[str, Any]:
+	resp = requests.get(url, timeout=5)
+	resp.raise_for_status()
+	return resp.json()
+
 
 @dataclass
 class JWKSCache:
+	"""JWKS keys pre-parsed into key objects and indexed by `kid`.
+
+	Fresh for `_ttl_seconds`. After that the cached keys keep being served for up
+	to `_max_stale_seconds` while a single background thread refreshes them, so
+	requests never wait on the identity provider for a routine refresh. Only a
+	cold cache, a fully expired cache or an unknown `kid` (key rotation) fetch
+	inline. `fetch` can be swapped for a local JWKS stand-in.
+	"""
+
 	url: str
 	_ttl_seconds: int = 300
+	_max_stale_seconds: int = 3600
+	_min_refetch_seconds: float = 30.0
+	fetch: Callable[[str], Dict[str, Any]] = _fetch_jwks
 	_cached: Optional[Dict[str, Any]] = None
 	_cached_at: float = 0.0
+	_keys: Dict[Optional[str], Tuple[Any, str]] = field(default_factory=dict)
+	_lock: threading.Lock = field(default_factory=threading.Lock)
+	_refreshing: bool = False
 
 	def get(self) -> Dict[str, Any]:
-		"""Return cached JWKS or fetch from remote if stale."""
-		now = time.time()
-		if self._cached and now - self._cached_at < self._ttl_seconds:
-			return self._cached
-		resp = requests.get(self.url, timeout=5)
-		resp.raise_for_status()
-		self._cached = resp.json()
-		self._cached_at = now
+		"""Return the raw JWKS document, fetching it if missing or expired."""
+		self._ensure_fresh()
+		assert self._cached is not None
 		return self._cached
 
+	def get_key(self, kid: Optional[str]) -> Tuple[Any, str]:
+		"""Return (key object, algorithm) for `kid`."""
+		self._ensure_fresh()
+		found = self._lookup(kid)
+		if found is None and time.monotonic() - self._cached_at >= self._min_refetch_seconds:
+			# Unknown kid: the provider may have rotated keys
+			self.refresh()
+			found = self._lookup(kid)
+		if found is None:
+			raise KeyError(f"No JWKS key for kid {kid!r}")
+		return found
+
+	def get_keys(self, kid: Optional[str], alg: Optional[str]) -> List[Tuple[Any, str]]:
+		"""Keys to try for a token header: the key for `kid`, or every key for `alg` without one.
+
+		Kid-less tokens refetch the JWKS (at most every `_min_refetch_seconds`)
+		only when no cached key has their algorithm.
+		"""
+		if kid is not None:
+			return [self.get_key(kid)]
+		self._ensure_fresh()
+		found = self._for_alg(alg)
+		if not found and time.monotonic() - self._cached_at >= self._min_refetch_seconds:
+			self.refresh()
+			found = self._for_alg(alg)
+		if not found:
+			raise KeyError(f"No JWKS key for alg {alg!r}")
+		return found
+
+	def refresh(self) -> None:
+		"""Fetch the JWKS and rebuild the key index."""
+		document = self.fetch(self.url)
+		keys: Dict[Optional[str], Tuple[Any, str]] = {}
+		for key_data in document.get("keys", []):
+			alg = key_data.get("alg", DEFAULT_ALGORITHM)
+			try:
+				keys[key_data.get("kid")] = (jwk.construct(key_data, algorithm=alg), alg)
+			except Exception:
+				# Skip key types we cannot use rather than failing the whole set
+				continue
+		with self._lock:
+			self._cached = document
+			self._keys = keys
+			self._cached_at = time.monotonic()
+
+	def _lookup(self, kid: Optional[str]) -> Optional[Tuple[Any, str]]:
+		keys = self._keys
+		if kid is None and len(keys) == 1:
+			return next(iter(keys.values()))
+		return keys.get(kid)
+
+	def _for_alg(self, alg: Optional[str]) -> List[Tuple[Any, str]]:
+		return [(key, key_alg) for key, key_alg in self._keys.values() if alg is None or key_alg == alg]
+
+	def _ensure_fresh(self) -> None:
+		age = time.monotonic() - self._cached_at
+		if self._cached is None or age >= self._max_stale_seconds:
+			self.refresh()
+		elif age >= self._ttl_seconds:
+			self._refresh_in_background()
+
+	def _refresh_in_background(self) -> None:
+		with self._lock:
+			if self._refreshing:
+				return
+			self._refreshing = True
+
+		def run() -> None:
+			try:
+				self.refresh()
+			except Exception:
+				# Keep serving the stale keys; the next stale read retries
+				pass
+			finally:
+				with self._lock:
+					self._refreshing = False
+
+		threading.Thread(target=run, name="jwks-refresh", daemon=True).start()
+
+
+@dataclass
+class VerifiedTokenCache:
+	"""Bounded LRU of verified tokens (by SHA-256) -> (subject, exp).
+
+	Entries are only returned before their `exp`, so a cached token is never
+	accepted for longer than the token itself is valid.
+	"""
+
+	max_size: int = 10_000
+	_entries: "OrderedDict[str, Tuple[str, float]]" = field(default_factory=OrderedDict)
+	_lock: threading.Lock = field(default_factory=threading.Lock)
+
+	@staticmethod
+	def _key(token: str) -> str:
+		return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+	def get(self, token: str) -> Optional[str]:
+		key = self._key(token)
+		with self._lock:
+			entry = self._entries.get(key)
+			if entry is None:
+				return None
+			subject, exp = entry
+			if exp <= time.time():
+				del self._entries[key]
+				return None
+			self._entries.move_to_end(key)
+			return subject
+
+	def put(self, token: str, subject: str, exp: float) -> None:
+		key = self._key(token)
+		with self._lock:
+			self._entries[key] = (subject, exp)
+			self._entries.move_to_end(key)
+			while len(self._entries) > self.max_size:
+				self._entries.popitem(last=False)
+
 
 @dataclass
 class JwtAuthProvider:
 	settings: Settings
 	jwks_cache: JWKSCache
+	token_cache: VerifiedTokenCache = field(default_factory=VerifiedTokenCache)
 
 	@classmethod
 	def from_settings(cls, settings: Settings) -> "JwtAuthProvider":
 		"""Construct provider from settings; requires `jwks_url`."""
 		if not settings.jwks_url:
 			raise RuntimeError("jwks_url is required for JwtAuthProvider")
-		return cls(settings=settings, jwks_cache=JWKSCache(url=settings.jwks_url))
+		return cls(
+			settings=settings,
+			jwks_cache=JWKSCache(url=settings.jwks_url, _ttl_seconds=settings.jwks_ttl_seconds),
+			token_cache=VerifiedTokenCache(max_size=settings.jwt_token_cache_size),
+		)
 
 	def get_user_id(self, authorization: Optional[str] = Header(default=None)) -> str:
-		"""Parse and verify a Bearer JWT and return the subject (sub)."""
+		"""Parse and verify a Bearer JWT and return the subject (sub).
+
+		The signature is verified once per token; repeat requests with the same
+		token are answered from the verified-token cache until it expires.
+		"""
 		if not authorization or not authorization.lower().startswith("bearer "):
 			raise HTTPException(status_code=401, detail="Missing or invalid Authorization header")
 		token = authorization.split(" ", 1)[1]
-		jwks = self.jwks_cache.get()
+		cached = self.token_cache.get(token)
+		if cached is not None:
+			return cached
 		try:
-			claims = jwt.decode(
-				token,
-				jwks,  # jose accepts JWKS dict
-				options={"verify_aud": bool(self.settings.jwt_audience)},
-				audience=self.settings.jwt_audience,
-				issuer=self.settings.jwt_issuer,
-			)
+			header = jwt.get_unverified_header(token)
+			claims = self._decode(token, self.jwks_cache.get_keys(header.get("kid"), header.get("alg")))
 		except Exception as exc:  # jose.JWSError and friends
 			raise HTTPException(status_code=401, detail=f"JWT verification failed: {exc}")
-		user_id = str(claims.get("sub"))
-		if not user_id:
+		sub = claims.get("sub")
+		if not sub:
 			raise HTTPException(status_code=401, detail="JWT missing sub claim")
+		user_id = str(sub)
+		exp = claims.get("exp")
+		if isinstance(exp, (int, float)):
+			self.token_cache.put(token, user_id, float(exp))
 		return user_id
 
-
+	def _decode(self, token: str, keys: List[Tuple[Any, str]]) -> Dict[str, Any]:
+		"""Claims of `token` verified with the first of `keys` its signature matches."""
+		failure: Optional[Exception] = None
+		for key, alg in keys:
+			try:
+				return jwt.decode(
+					token,
+					key,
+					algorithms=[alg],
+					options={"verify_aud": bool(self.settings.jwt_audience)},
+					audience=self.settings.jwt_audience,
+					issuer=self.settings.jwt_issuer,
+				)
+			except (ExpiredSignatureError, JWTClaimsError):
+				# The signature matched: the claims are wrong whichever key is tried
+				raise
+			except JWTError as exc:
+				failure = exc
+		assert failure is not None
+		raise failure
@@ -1,7 +1,8 @@
 from __future__ import annotations
 
+import hashlib
 from dataclasses import dataclass
-from typing import Optional
+from typing import Optional, cast
 
 import redis
 
@@ -14,13 +15,21 @@ class RedisCache:
 
 	@classmethod
 	def from_settings(cls, settings: Settings) -> "RedisCache":
-		"""Create a Redis client from configuration."""
+		"""Create a Redis client from configuration (the in-process store in embedded mode)."""
+		if settings.embedded:
+			from .embedded import local_redis
+
+			return cls(client=cast(redis.Redis, local_redis()))
 		client = redis.Redis.from_url(settings.redis_url, decode_responses=True)
 		return cls(client=client)
 
 	def get(self, key: str) -> Optional[str]:
 		"""Get a string value or None if missing."""
+		# Imported here so the cache does not pull in prometheus_client on import
+		from .metrics import record_cache_lookup
+
 		value = self.client.get(key)
+		record_cache_lookup(key, value is not None)
 		return value if value is not None else None
 
 	def set(self, key: str, value: str, ttl_seconds: int | None = None) -> None:
@@ -46,3 +55,11 @@ def trust_cache_key(user_id: str, domain: str | None = None) -> str:
 	return f"trust:{user_id}:{domain or '_all'}"
 
 
+def verification_cache_key(user_id: str) -> str:
+	"""Cache key for a user's effective verification level."""
+	return f"verification:{user_id}"
+
+
+def evidence_cache_key(evidence_ref: str) -> str:
+	"""Cache key for an evidence validation result (refs can be long URLs, so hashed)."""
+	return f"evidence:{hashlib.sha256(evidence_ref.encode()).hexdigest()}"
@@ -0,0 +1,12 @@
+"""Celery configuration module, loaded by `credence.worker` on first use of `app.conf`."""
+from __future__ import annotations
+
+from .config import Settings
+from .worker import celery_config
+
+_config = celery_config(Settings.from_env_and_file())
+
+broker_url = _config["broker_url"]
+result_backend = _config["result_backend"]
+task_routes = _config["task_routes"]
+beat_schedule = _config["beat_schedule"]
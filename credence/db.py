@@ -1,27 +1,46 @@
 from __future__ import annotations
 
-from datetime import datetime, timezone
+from datetime import date, datetime, timezone
 from enum import Enum as PyEnum
-from typing import Generator, Optional
+from typing import Any, Generator, List, Optional
 
-from sqlalchemy import DateTime, Enum, ForeignKey, Integer, String, JSON, Float, create_engine, func
+from sqlalchemy import BigInteger, Date, DateTime, Enum, Index, Integer, LargeBinary, String, JSON, Float, create_engine, event, func, text
 from sqlalchemy.orm import DeclarativeBase, Mapped, Session, mapped_column, relationship, sessionmaker
 
 from .config import Settings
+from .query_stats import install_query_counter
 
 
 class Base(DeclarativeBase):
 	pass
 
 
+def _enum_values(enum: Any) -> List[str]:
+	# The migrations create the enum types with the lowercase values, not the
+	# member names SQLAlchemy would store by default
+	return [member.value for member in enum]
+
+
 class EvidenceStatusEnum(str, PyEnum):
 	GREEN = "green"
 	YELLOW = "yellow"
 	RED = "red"
+	# Written when validation is deferred; the outcome is recorded as an EvidenceFlag
+	PENDING = "pending"
 
 
 class LedgerEntry(Base):
+	"""Append-only ledger row.
+
+	On PostgreSQL the table is range-partitioned by month on `created_at`
+	(migration `0005_partition_ledger`); filter on `created_at` wherever a
+	query is naturally time-bounded so the planner can prune partitions.
+	"""
+
 	__tablename__ = "ledger_entries"
+	# SQLite then keeps the highest id ever used (in sqlite_sequence), so ids
+	# of entries resharding moved away are not handed out again
+	__table_args__ = {"sqlite_autoincrement": True}
 
 	id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
 	user_id: Mapped[str] = mapped_column(String(128), index=True)
@@ -30,14 +49,21 @@ class LedgerEntry(Base):
 	points: Mapped[int] = mapped_column(Integer)
 	evidence_ref: Mapped[Optional[str]] = mapped_column(String(512), nullable=True)
 	evidence_status: Mapped[EvidenceStatusEnum] = mapped_column(
-		Enum(EvidenceStatusEnum, name="evidence_status"), default=EvidenceStatusEnum.GREEN
+		Enum(EvidenceStatusEnum, name="evidence_status", values_callable=_enum_values), default=EvidenceStatusEnum.GREEN
 	)
-	related_entry_id: Mapped[Optional[int]] = mapped_column(Integer, ForeignKey("ledger_entries.id"), nullable=True)
+	# No foreign keys can target the partitioned ledger: references to entries
+	# are checked by the trg_*_ref triggers of migration 0005 instead
+	related_entry_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
 	# Optional metadata (geo, context, client info)
 	meta: Mapped[Optional[dict]] = mapped_column(JSON, nullable=True)
 	created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), index=True)
+	# Per-user hash chain (see credence.integrity); NULL for rows written before chaining
+	prev_hash: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
+	entry_hash: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
 
-	related_entry: Mapped[Optional["LedgerEntry"]] = relationship(remote_side=[id])
+	related_entry: Mapped[Optional["LedgerEntry"]] = relationship(
+		primaryjoin="foreign(LedgerEntry.related_entry_id) == LedgerEntry.id", remote_side=[id]
+	)
 
 
 class Verification(Base):
@@ -50,6 +76,24 @@ class Verification(Base):
 	created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
 
 
+class CurrentVerification(Base):
+	"""Projection of the highest verification level per source for a user.
+
+	Maintained by `VerificationService.set_level` so that trust lookups never
+	scan the `verifications` history.
+	"""
+
+	__tablename__ = "current_verification"
+
+	user_id: Mapped[str] = mapped_column(String(128), primary_key=True)
+	external_level: Mapped[int] = mapped_column(Integer, default=0)
+	internal_level: Mapped[int] = mapped_column(Integer, default=0)
+	effective_level: Mapped[int] = mapped_column(Integer, default=0)
+	updated_at: Mapped[datetime] = mapped_column(
+		DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc)
+	)
+
+
 class DisputeStatusEnum(str, PyEnum):
 	OPEN = "open"
 	RESOLVED = "resolved"
@@ -58,18 +102,36 @@ class DisputeStatusEnum(str, PyEnum):
 
 class Dispute(Base):
 	__tablename__ = "disputes"
+	__table_args__ = (
+		Index(
+			"ix_disputes_open_queue",
+			"created_at",
+			"id",
+			postgresql_where=text("status = 'open'"),
+			sqlite_where=text("status = 'open'"),
+		),
+		Index("ix_disputes_status_id", "status", "id"),
+		Index("ix_disputes_opened_by_id", "opened_by", "id"),
+		Index("ix_disputes_entry_id", "ledger_entry_id", "id"),
+		Index("ix_disputes_claimed_by_id", "claimed_by", "id"),
+	)
 
 	id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
-	ledger_entry_id: Mapped[int] = mapped_column(Integer, ForeignKey("ledger_entries.id"))
+	# Checked by DisputeService.open: with sharding the entry lives on another
+	# database (see migration 0005)
+	ledger_entry_id: Mapped[int] = mapped_column(Integer)
 	opened_by: Mapped[str] = mapped_column(String(128))
 	reason: Mapped[str] = mapped_column(String(512))
 	status: Mapped[DisputeStatusEnum] = mapped_column(
-		Enum(DisputeStatusEnum, name="dispute_status"), default=DisputeStatusEnum.OPEN, index=True
+		Enum(DisputeStatusEnum, name="dispute_status", values_callable=_enum_values), default=DisputeStatusEnum.OPEN
 	)
 	resolution_note: Mapped[Optional[str]] = mapped_column(String(1024), nullable=True)
 	resolved_by: Mapped[Optional[str]] = mapped_column(String(128), nullable=True)
 	resolved_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
 	created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), index=True)
+	# Moderator holding the dispute from the claim queue, until the lease expires
+	claimed_by: Mapped[Optional[str]] = mapped_column(String(128), nullable=True)
+	claim_expires_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
 
 
 class IdempotencyKey(Base):
@@ -80,15 +142,21 @@ class IdempotencyKey(Base):
 	user_id: Mapped[str] = mapped_column(String(128), index=True)
 	domain: Mapped[str] = mapped_column(String(64))
 	action: Mapped[str] = mapped_column(String(64))
-	ledger_entry_id: Mapped[Optional[int]] = mapped_column(Integer, ForeignKey("ledger_entries.id"), nullable=True)
+	# Checked by trg_idempotency_keys_ledger_entry_id_ref (migration 0005)
+	ledger_entry_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
 	created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
 
 
 class TrustScore(Base):
 	__tablename__ = "trust_scores"
+	__table_args__ = (
+		# Latest snapshot per (user, domain) and history range scans
+		Index("ix_trust_scores_user_domain_computed", "user_id", "domain", "computed_at"),
+	)
 
 	id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
-	user_id: Mapped[str] = mapped_column(String(128), index=True)
+	# Covered by ix_trust_scores_user_domain_computed (0013 dropped the single-column index)
+	user_id: Mapped[str] = mapped_column(String(128))
 	domain: Mapped[Optional[str]] = mapped_column(String(64), nullable=True, index=True)
 	trust: Mapped[float] = mapped_column(Float)
 	karma_balance: Mapped[int] = mapped_column(Integer)
@@ -100,17 +168,226 @@ class EvidenceFlag(Base):
 	__tablename__ = "evidence_flags"
 
 	id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
-	ledger_entry_id: Mapped[int] = mapped_column(Integer, ForeignKey("ledger_entries.id"))
-	status: Mapped[EvidenceStatusEnum] = mapped_column(Enum(EvidenceStatusEnum, name="evidence_status"))
+	# Checked by trg_evidence_flags_ledger_entry_id_ref (migration 0005)
+	ledger_entry_id: Mapped[int] = mapped_column(Integer)
+	status: Mapped[EvidenceStatusEnum] = mapped_column(Enum(EvidenceStatusEnum, name="evidence_status", values_callable=_enum_values))
 	created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), index=True)
 
 
-def create_session_factory(settings: Settings) -> sessionmaker[Session]:
-	engine = create_engine(settings.database_url, future=True)
+class EntryEvidenceStatus(Base):
+	"""Current evidence status of a ledger entry: its latest flag, else the status it was written with.
+
+	Only entries that are not green or have been flagged have a row, so
+	"red entries of user X" and red point totals are index lookups.
+	"""
+
+	__tablename__ = "entry_evidence_status"
+	__table_args__ = (
+		Index("ix_entry_evidence_user_status", "user_id", "status", "ledger_entry_id"),
+		Index("ix_entry_evidence_status", "status", "ledger_entry_id"),
+	)
+
+	ledger_entry_id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)
+	user_id: Mapped[str] = mapped_column(String(128))
+	domain: Mapped[str] = mapped_column(String(64))
+	points: Mapped[int] = mapped_column(Integer)
+	status: Mapped[EvidenceStatusEnum] = mapped_column(Enum(EvidenceStatusEnum, name="evidence_status", values_callable=_enum_values))
+	entry_created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+	updated_at: Mapped[datetime] = mapped_column(
+		DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc)
+	)
+
+
+class BalanceCheckpoint(Base):
+	"""Running balance of one (user, domain) covering entries up to `checkpoint_at`."""
+
+	__tablename__ = "balance_checkpoints"
+	__table_args__ = (Index("ix_balance_checkpoints_user_domain_at", "user_id", "domain", "checkpoint_at"),)
+
+	id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+	user_id: Mapped[str] = mapped_column(String(128))
+	domain: Mapped[str] = mapped_column(String(64))
+	balance: Mapped[int] = mapped_column(Integer)
+	entry_count: Mapped[int] = mapped_column(Integer)
+	last_entry_id: Mapped[int] = mapped_column(Integer)
+	checkpoint_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), index=True)
+
+
+class LedgerSegment(Base):
+	"""Sealed Merkle root over the ledger ids `[first_id, last_id]`."""
+
+	__tablename__ = "ledger_segments"
+
+	segment_index: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)
+	first_id: Mapped[int] = mapped_column(Integer)
+	last_id: Mapped[int] = mapped_column(Integer)
+	leaf_count: Mapped[int] = mapped_column(Integer)
+	root: Mapped[str] = mapped_column(String(64))
+	chain_hash: Mapped[str] = mapped_column(String(64))
+	sealed_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+
+
+class ImportCheckpoint(Base):
+	"""A chunk of a bulk import that has been loaded (see credence.services.bulk_import)."""
+
+	__tablename__ = "import_checkpoints"
+
+	import_id: Mapped[str] = mapped_column(String(128), primary_key=True)
+	chunk_index: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)
+	chunk_size: Mapped[int] = mapped_column(Integer)
+	rows: Mapped[int] = mapped_column(Integer)
+	completed_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+
+
+class _KarmaRollup:
+	"""Sum of ledger points per (bucket, user, domain); see credence.services.rollups."""
+
+	bucket: Mapped[datetime] = mapped_column(DateTime(timezone=True), primary_key=True)
+	user_id: Mapped[str] = mapped_column(String(128), primary_key=True)
+	domain: Mapped[str] = mapped_column(String(64), primary_key=True)
+	points: Mapped[int] = mapped_column(BigInteger, default=0)
+	positive_points: Mapped[int] = mapped_column(BigInteger, default=0)
+	negative_points: Mapped[int] = mapped_column(BigInteger, default=0)
+	entry_count: Mapped[int] = mapped_column(Integer, default=0)
+
+
+class KarmaRollupHourly(_KarmaRollup, Base):
+	__tablename__ = "karma_rollup_hourly"
+	__table_args__ = (
+		Index("ix_karma_rollup_hourly_user_bucket", "user_id", "bucket"),
+		Index("ix_karma_rollup_hourly_domain_bucket", "domain", "bucket"),
+	)
+
+
+class KarmaRollupDaily(_KarmaRollup, Base):
+	__tablename__ = "karma_rollup_daily"
+	__table_args__ = (
+		Index("ix_karma_rollup_daily_user_bucket", "user_id", "bucket"),
+		Index("ix_karma_rollup_daily_domain_bucket", "domain", "bucket"),
+	)
+
+
+class RollupWatermark(Base):
+	"""Rows with a timestamp `<= rolled_up_to` have been folded into the rollup (or compaction) `name`."""
+
+	__tablename__ = "rollup_watermarks"
+
+	name: Mapped[str] = mapped_column(String(64), primary_key=True)
+	rolled_up_to: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+
+
+class DistributionSketch(Base):
+	"""Serialized KLL sketch of a metric's values for one domain and UTC day (see credence.services.distributions)."""
+
+	__tablename__ = "distribution_sketches"
+
+	metric: Mapped[str] = mapped_column(String(32), primary_key=True)
+	# '_all' for the overall (domain-less) trust and balance
+	domain: Mapped[str] = mapped_column(String(64), primary_key=True)
+	day: Mapped[date] = mapped_column(Date, primary_key=True)
+	value_count: Mapped[int] = mapped_column(BigInteger, default=0)
+	sketch: Mapped[bytes] = mapped_column(LargeBinary)
+	# Previous values of users whose value changed since the last rebuild
+	retracted: Mapped[Optional[bytes]] = mapped_column(LargeBinary, nullable=True)
+	updated_at: Mapped[datetime] = mapped_column(
+		DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc)
+	)
+
+
+# Applied to every new SQLite connection: WAL lets readers run alongside the
+# single writer; NORMAL sync is durable across application crashes under WAL
+SQLITE_PRAGMAS = (
+	"PRAGMA journal_mode=WAL",
+	"PRAGMA synchronous=NORMAL",
+	"PRAGMA temp_store=MEMORY",
+	"PRAGMA cache_size=-65536",
+	"PRAGMA mmap_size=268435456",
+)
+
+
+def create_session_factory(settings: Settings, url: Optional[str] = None) -> sessionmaker[Session]:
+	"""New engine and session factory for `url` (default: the primary `database_url`)."""
+	url = url or settings.database_url
+	engine = create_engine(url, future=True)
+	install_query_counter(engine)
+	if engine.dialect.name == "sqlite":
+		install_sqlite_pragmas(engine, settings.sqlite_busy_timeout_ms)
+		if url in settings.shard_database_urls:
+			install_sqlite_id_stripe(engine, settings.shard_database_urls.index(url), len(settings.shard_database_urls))
 	# Schema is managed via Alembic migrations
 	return sessionmaker(bind=engine, class_=Session, expire_on_commit=False, future=True)
 
 
+def install_sqlite_pragmas(engine: Any, busy_timeout_ms: int) -> None:
+	@event.listens_for(engine, "connect")
+	def _set_pragmas(dbapi_connection: Any, _: Any) -> None:
+		cursor = dbapi_connection.cursor()
+		try:
+			for pragma in SQLITE_PRAGMAS:
+				cursor.execute(pragma)
+			cursor.execute(f"PRAGMA busy_timeout={int(busy_timeout_ms)}")
+		finally:
+			cursor.close()
+
+	@event.listens_for(engine, "begin")
+	def _begin_immediate(connection: Any) -> None:
+		# Otherwise the sqlite3 module opens a deferred transaction itself,
+		# before the first write (see `sqlite_begin_immediate`)
+		if connection.get_execution_options().get("sqlite_begin_immediate"):
+			connection.exec_driver_sql("BEGIN IMMEDIATE")
+
+
+def install_sqlite_id_stripe(engine: Any, index: int, count: int) -> None:
+	"""Hand out ledger ids `index + 1 + k * count` on SQLite shard `index` of `count`.
+
+	The SQLite counterpart of `credence.sharding.configure_sequences`, which
+	stripes PostgreSQL sequences: ids stay unique across shards, so an entry
+	id alone names the shard holding it.
+	"""
+
+	@event.listens_for(engine, "connect")
+	def _set_stripe(_: Any, connection_record: Any) -> None:
+		connection_record.info["ledger_id_stripe"] = (index, count)
+
+
+@event.listens_for(LedgerEntry, "before_insert")
+def _assign_striped_id(_: Any, connection: Any, entry: LedgerEntry) -> None:
+	stripe = connection.info.get("ledger_id_stripe")
+	if stripe is None or entry.id is not None:
+		return
+	index, count = stripe
+	if not connection.info.get("ledger_id_sequence"):
+		# Databases created before ledger_entries used AUTOINCREMENT have no sqlite_sequence
+		connection.info["ledger_id_sequence"] = bool(
+			connection.execute(text("SELECT count(*) FROM sqlite_master WHERE name = 'sqlite_sequence'")).scalar_one()
+		)
+	highest_sql = "SELECT coalesce(max(id), 0) FROM ledger_entries"
+	if connection.info["ledger_id_sequence"]:
+		highest_sql = f"SELECT max(({highest_sql}), coalesce((SELECT seq FROM sqlite_sequence WHERE name = 'ledger_entries'), 0))"
+	# Entries of the same flush are inserted after all of them get their ids
+	highest = max(connection.execute(text(highest_sql)).scalar_one(), connection.info.get("ledger_id_last", 0))
+	entry.id = highest + 1 + (index + 1 - (highest + 1)) % count
+	connection.info["ledger_id_last"] = entry.id
+
+
+def sqlite_begin_immediate(session: Session) -> None:
+	"""Hold SQLite's database write lock from here to the end of the transaction.
+
+	Stands in for PostgreSQL advisory locks around read-then-append
+	sequences; other writers wait up to `sqlite_busy_timeout_ms` for it.
+	The sqlite3 module only opens a transaction at the first write, so one
+	that has written holds the lock already; otherwise the session's reads
+	so far ran outside any transaction, and it starts a new one with
+	`BEGIN IMMEDIATE` (from the engine's `begin` event).
+	"""
+	session.flush()
+	if session.in_transaction():
+		if session.connection().connection.driver_connection.in_transaction:
+			return
+		session.commit()
+	session.connection(execution_options={"sqlite_begin_immediate": True})
+
+
 def get_session(session_factory: sessionmaker[Session]) -> Generator[Session, None, None]:
 	session = session_factory()
 	try:
@@ -124,6 +401,21 @@ def compute_balance(session: Session, user_id: str, domain: Optional[str] = None
 	query = query.filter(LedgerEntry.user_id == user_id)
 	if domain is not None:
 		query = query.filter(LedgerEntry.domain == domain)
-	return int(query.scalar_one())
-
-
+	return int(query.scalar())
+
+
+def ensure_ledger_partitions(session: Session, months_ahead: int = 3, start: Optional[datetime] = None) -> int:
+	"""Create monthly ledger partitions up to `months_ahead` months from now.
+
+	`start` extends the range back to older months (bulk imports of history).
+	Returns the number of partitions created; a no-op on databases other than
+	PostgreSQL, where the ledger is a plain table.
+	"""
+	if session.get_bind().dialect.name != "postgresql":
+		return 0
+	created = session.execute(
+		text("SELECT ensure_ledger_partitions(CAST(:start AS date), :months_ahead)"),
+		{"start": (start or datetime.now(timezone.utc)).date(), "months_ahead": months_ahead},
+	).scalar_one()
+	session.commit()
+	return int(created)
@@ -1,32 +1,164 @@
 from __future__ import annotations
 
+import inspect
+import itertools
+import threading
+from contextlib import contextmanager
 from dataclasses import dataclass
-from typing import Callable, Generator
+from typing import Any, Callable, Dict, Generator, Iterator, List, Optional, Tuple, TypeVar
 
-from fastapi import Depends
+from fastapi import Depends, HTTPException, Request, Response
+from sqlalchemy import text
 from sqlalchemy.orm import Session, sessionmaker
 
 from .config import Settings
 from .db import get_session
 from .plugins import load_symbol
+from .sharding import ShardRouter
+
+T = TypeVar("T")
 
 
 def get_settings() -> Settings:
 	return Settings.from_env_and_file()
 
 
-def get_session_dep(
-	session_factory: sessionmaker[Session] = Depends(
-		lambda settings=Depends(get_settings): __get_session_factory(settings)
-	)
-) -> Generator[Session, None, None]:
-	yield from get_session(session_factory)
+# Response header carrying the primary's WAL position after a write; sending it
+# back on a read guarantees the read sees that write
+CONSISTENCY_HEADER = "X-Credence-Consistency"
+
+_session_factories: Dict[str, sessionmaker[Session]] = {}
+_session_factories_lock = threading.Lock()
+_replica_turn = itertools.count()
+_shard_routers: Dict[Tuple[str, ...], ShardRouter] = {}
 
 
-def __get_session_factory(settings: Settings) -> sessionmaker[Session]:
+def session_factory_for(settings: Settings, url: Optional[str] = None) -> sessionmaker[Session]:
+	"""Process-wide session factory (one engine and pool) per database URL."""
 	from .db import create_session_factory
 
-	return create_session_factory(settings)
+	url = url or settings.database_url
+	factory = _session_factories.get(url)
+	if factory is None:
+		with _session_factories_lock:
+			factory = _session_factories.get(url)
+			if factory is None:
+				factory = create_session_factory(settings, url=url)
+				_session_factories[url] = factory
+	return factory
+
+
+def shard_router(settings: Settings) -> ShardRouter:
+	"""Process-wide shard router for the configured shards, sharing `session_factory_for` pools."""
+	key = (settings.database_url, *settings.shard_database_urls)
+	shards = _shard_routers.get(key)
+	if shards is None:
+		with _session_factories_lock:
+			shards = _shard_routers.get(key)
+			if shards is None:
+				shards = ShardRouter.from_settings(settings, factory_for=lambda url: session_factory_for(settings, url))
+				_shard_routers[key] = shards
+	return shards
+
+
+@contextmanager
+def user_session(settings: Settings, session: Session, user_id: str) -> Iterator[Session]:
+	"""`session` when unsharded; otherwise a session on the shard owning `user_id`."""
+	shards = shard_router(settings)
+	if not shards.sharded:
+		yield session
+		return
+	routed = shards.factory_for_user(user_id)()
+	try:
+		yield routed
+	finally:
+		routed.close()
+
+
+@contextmanager
+def entry_session(settings: Settings, session: Session, entry_id: int) -> Iterator[Session]:
+	"""`session` when unsharded; otherwise a session on the shard holding ledger entry `entry_id`.
+
+	Unknown entries get `session` too, so the caller reports them missing.
+	"""
+	shards = shard_router(settings)
+	index = shards.locate_entry(entry_id) if shards.sharded else None
+	if index is None:
+		yield session
+		return
+	routed = shards.factory(index)()
+	try:
+		yield routed
+	finally:
+		routed.close()
+
+
+def scatter_reads(settings: Settings, session: Session, fn: Callable[[Session], T]) -> List[T]:
+	"""`[fn(session)]` when unsharded; otherwise `fn` on every shard, in shard order."""
+	shards = shard_router(settings)
+	if not shards.sharded:
+		return [fn(session)]
+	return shards.scatter(fn)
+
+
+def get_session_dep(settings: Settings = Depends(get_settings)) -> Generator[Session, None, None]:
+	"""Session on the primary; used by every endpoint that writes."""
+	yield from get_session(session_factory_for(settings))
+
+
+def replica_urls(settings: Settings) -> List[str]:
+	urls = list(settings.read_database_urls)
+	if settings.read_database_url and settings.read_database_url not in urls:
+		urls.insert(0, settings.read_database_url)
+	return urls
+
+
+def _replica_has_replayed(session: Session, token: str) -> bool:
+	try:
+		replayed = session.execute(
+			text("SELECT pg_last_wal_replay_lsn() >= CAST(:lsn AS pg_lsn)"), {"lsn": token}
+		).scalar()
+	except Exception:
+		session.rollback()
+		return False
+	return bool(replayed)
+
+
+def get_read_session_dep(request: Request, settings: Settings = Depends(get_settings)) -> Generator[Session, None, None]:
+	"""Session for read-only endpoints: a replica (round robin) when configured.
+
+	A request carrying `X-Credence-Consistency` from an earlier write is served
+	by a replica only once that replica has replayed the write; otherwise it
+	goes to the primary.
+	"""
+	urls = replica_urls(settings)
+	if not urls:
+		yield from get_session(session_factory_for(settings))
+		return
+	session = session_factory_for(settings, urls[next(_replica_turn) % len(urls)])()
+	token = request.headers.get(CONSISTENCY_HEADER)
+	if token and not _replica_has_replayed(session, token):
+		session.close()
+		session = session_factory_for(settings)()
+	try:
+		yield session
+	finally:
+		session.close()
+
+
+def set_consistency_token(response: Response, session: Session) -> None:
+	"""Attach the primary's current WAL position to a write response (PostgreSQL only)."""
+	if session.get_bind().dialect.name != "postgresql":
+		return
+	lsn = session.execute(text("SELECT pg_current_wal_lsn()::text")).scalar()
+	session.commit()
+	if lsn:
+		response.headers[CONSISTENCY_HEADER] = str(lsn)
+
+
+def wants_fresh_read(request: Request) -> bool:
+	"""True when the client asked to see its own writes; such reads skip caches."""
+	return CONSISTENCY_HEADER in request.headers
 
 
 @dataclass
@@ -34,9 +166,55 @@ class AuthAdapter:
 	get_user_id: Callable[..., str]
 
 
-def get_auth_adapter(settings: Settings = Depends(get_settings)) -> AuthAdapter:
-	provider_cls = load_symbol(settings.plugins.auth_provider)
-	provider = provider_cls()  # type: ignore[call-arg]
-	return AuthAdapter(get_user_id=provider.get_user_id)
+_auth_providers: Dict[str, Any] = {}
+_auth_providers_lock = threading.Lock()
+
+
+def get_auth_provider(settings: Settings) -> Any:
+	"""Process-wide instance of the configured auth provider.
+
+	Providers exposing `from_settings` are built with it; one instance is kept
+	per provider path so per-provider caches survive across requests.
+	"""
+	path = settings.plugins.auth_provider
+	provider = _auth_providers.get(path)
+	if provider is None:
+		with _auth_providers_lock:
+			provider = _auth_providers.get(path)
+			if provider is None:
+				provider_cls = load_symbol(path)
+				if hasattr(provider_cls, "from_settings"):
+					provider = provider_cls.from_settings(settings)
+				else:
+					provider = provider_cls()  # type: ignore[call-arg]
+				_auth_providers[path] = provider
+	return provider
+
+
+def _call_provider(provider: Any, request: Request) -> str:
+	# Provider parameters are header dependencies (`x_user_id`, `authorization`);
+	# fill them from the request the way FastAPI would (underscores -> hyphens).
+	params = inspect.signature(provider.get_user_id).parameters
+	kwargs = {name: request.headers.get(name.replace("_", "-")) for name in params}
+	return str(provider.get_user_id(**kwargs))
+
+
+def resolve_user_id(request: Request, settings: Settings) -> Optional[str]:
+	"""Authenticated user id for the request, or None when unauthenticated."""
+	try:
+		return _call_provider(get_auth_provider(settings), request)
+	except HTTPException:
+		return None
+
+
+def get_auth_adapter(request: Request, settings: Settings = Depends(get_settings)) -> AuthAdapter:
+	provider = get_auth_provider(settings)
+	return AuthAdapter(get_user_id=lambda: _call_provider(provider, request))
 
 
+def require_admin(request: Request, settings: Settings = Depends(get_settings)) -> str:
+	"""Authenticated user id, if it is listed in `admin_user_ids`; 403 otherwise."""
+	user_id = _call_provider(get_auth_provider(settings), request)
+	if user_id not in settings.admin_user_ids:
+		raise HTTPException(status_code=403, detail="Admin access required")
+	return user_id
@@ -0,0 +1,422 @@
+"""Embedded single-process profile: SQLite, an in-process cache and task runner.
+
+With `embedded = true` (CREDENCE_EMBEDDED) Credence needs no Postgres, Redis
+or Celery broker:
+
+- `database_url` is a SQLite file in WAL mode (pragmas in
+  `credence.db.SQLITE_PRAGMAS`). `start` creates the schema, with triggers
+  keeping `ledger_entries` append-only as on PostgreSQL.
+- `RedisCache`, the leaderboard rank index and evidence result caching use
+  `LocalRedis`, one in-memory store per process. The rank index is rebuilt
+  from the database at start; rate limits use per-process buckets.
+- `credence.tasks.enqueue` hands tasks to `LocalTaskRunner`, which runs them
+  on a thread pool through Celery's local `apply` (task metrics, query stats
+  and profiling behave as on a worker) and fires the beat schedule itself.
+
+Everything lives in one process, so run the API with a single worker.
+"""
+
+from __future__ import annotations
+
+import fnmatch
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import redis
+
+from .config import Settings
+
+# SQLite counterpart of migration 0003's trigger function
+SQLITE_APPEND_ONLY_TRIGGERS = (
+	"""
+	CREATE TRIGGER IF NOT EXISTS trg_ledger_no_update
+	BEFORE UPDATE ON ledger_entries
+	BEGIN
+		SELECT RAISE(ABORT, 'ledger_entries is append-only');
+	END
+	""",
+	"""
+	CREATE TRIGGER IF NOT EXISTS trg_ledger_no_delete
+	BEFORE DELETE ON ledger_entries
+	BEGIN
+		SELECT RAISE(ABORT, 'ledger_entries is append-only');
+	END
+	""",
+)
+
+
+class _SortedSet:
+	"""Scores by member plus `(score, member)` pairs kept in Redis order."""
+
+	def __init__(self) -> None:
+		self.scores: Dict[str, float] = {}
+		self.order: List[Tuple[float, str]] = []
+
+	def incr(self, member: str, amount: float) -> float:
+		old = self.scores.get(member)
+		if old is not None:
+			del self.order[bisect_left(self.order, (old, member))]
+		score = (old or 0.0) + amount
+		self.scores[member] = score
+		insort(self.order, (score, member))
+		return score
+
+	def remove(self, member: str) -> None:
+		del self.order[bisect_left(self.order, (self.scores.pop(member), member))]
+
+	def rev_rank(self, member: str) -> Optional[int]:
+		score = self.scores.get(member)
+		if score is None:
+			return None
+		return len(self.order) - 1 - bisect_left(self.order, (score, member))
+
+	def count(self, low: float, high: float) -> int:
+		return bisect_right(self.order, high, key=lambda pair: pair[0]) - bisect_left(
+			self.order, low, key=lambda pair: pair[0]
+		)
+
+	def rev_range(self, start: int, end: int) -> List[Tuple[str, float]]:
+		n = len(self.order)
+		start, end = start + n if start < 0 else start, end + n if end < 0 else end
+		start, end = max(0, start), min(n - 1, end)
+		if start > end:
+			return []
+		return [(member, score) for score, member in reversed(self.order[n - 1 - end : n - start])]
+
+
+class _Pipeline:
+	"""Queues commands and runs them under the store's lock on `execute`."""
+
+	def __init__(self, client: "LocalRedis") -> None:
+		self._client = client
+		self._commands: List[Tuple[Any, Tuple[Any, ...], Dict[str, Any]]] = []
+
+	def __getattr__(self, name: str) -> Any:
+		method = getattr(self._client, name)
+
+		def queue(*args: Any, **kwargs: Any) -> "_Pipeline":
+			self._commands.append((method, args, kwargs))
+			return self
+
+		return queue
+
+	def execute(self) -> List[Any]:
+		with self._client._lock:
+			results = [method(*args, **kwargs) for method, args, kwargs in self._commands]
+		self._commands = []
+		return results
+
+
+class LocalRedis:
+	"""In-process stand-in for the part of `redis.Redis` Credence uses.
+
+	Strings and sorted sets with expiry, behind one lock; values come back
+	as `str` like a client with `decode_responses=True`. Expired keys are
+	dropped when next touched.
+	"""
+
+	def __init__(self) -> None:
+		self._data: Dict[str, Any] = {}
+		self._expires: Dict[str, float] = {}
+		self._lock = threading.RLock()
+
+	def _live(self, key: str) -> Any:
+		expires = self._expires.get(key)
+		if expires is not None and expires <= time.time():
+			self._data.pop(key, None)
+			del self._expires[key]
+		return self._data.get(key)
+
+	def _zset(self, key: str, create: bool = False) -> Optional[_SortedSet]:
+		value = self._live(key)
+		if value is None and create:
+			value = self._data[key] = _SortedSet()
+		if value is not None and not isinstance(value, _SortedSet):
+			raise redis.ResponseError("WRONGTYPE Operation against a key holding the wrong kind of value")
+		return value
+
+	def get(self, key: str) -> Optional[str]:
+		with self._lock:
+			value = self._live(key)
+			return value if isinstance(value, str) else None
+
+	def mget(self, keys: Sequence[str]) -> List[Optional[str]]:
+		with self._lock:
+			return [self.get(key) for key in keys]
+
+	def set(self, key: str, value: Any, ex: Optional[int] = None, nx: bool = False) -> Optional[bool]:
+		with self._lock:
+			if nx and self._live(key) is not None:
+				return None
+			self._data[key] = str(value)
+			self._expires.pop(key, None)
+			if ex is not None:
+				self._expires[key] = time.time() + ex
+			return True
+
+	def setex(self, key: str, seconds: int, value: Any) -> bool:
+		return self.set(key, value, ex=seconds)
+
+	def delete(self, *keys: str) -> int:
+		with self._lock:
+			removed = 0
+			for key in keys:
+				removed += self._live(key) is not None
+				self._data.pop(key, None)
+				self._expires.pop(key, None)
+			return removed
+
+	def exists(self, *keys: str) -> int:
+		with self._lock:
+			return sum(self._live(key) is not None for key in keys)
+
+	def expire(self, key: str, seconds: int) -> bool:
+		with self._lock:
+			if self._live(key) is None:
+				return False
+			self._expires[key] = time.time() + seconds
+			return True
+
+	def expireat(self, key: str, when: datetime | int) -> bool:
+		with self._lock:
+			if self._live(key) is None:
+				return False
+			self._expires[key] = when.timestamp() if isinstance(when, datetime) else float(when)
+			return True
+
+	def rename(self, src: str, dst: str) -> bool:
+		with self._lock:
+			value = self._live(src)
+			if value is None:
+				raise redis.ResponseError("no such key")
+			self.delete(dst)
+			self._data[dst] = self._data.pop(src)
+			if src in self._expires:
+				self._expires[dst] = self._expires.pop(src)
+			return True
+
+	def scan_iter(self, match: Optional[str] = None, count: Optional[int] = None) -> Iterator[str]:
+		with self._lock:
+			keys = [key for key in list(self._data) if self._live(key) is not None]
+		for key in keys:
+			if match is None or fnmatch.fnmatchcase(key, match):
+				yield key
+
+	def zincrby(self, key: str, amount: float, member: str) -> float:
+		with self._lock:
+			return self._zset(key, create=True).incr(member, float(amount))  # type: ignore[union-attr]
+
+	def zscore(self, key: str, member: str) -> Optional[float]:
+		with self._lock:
+			zset = self._zset(key)
+			return zset.scores.get(member) if zset is not None else None
+
+	def zrevrank(self, key: str, member: str) -> Optional[int]:
+		with self._lock:
+			zset = self._zset(key)
+			return zset.rev_rank(member) if zset is not None else None
+
+	def zcard(self, key: str) -> int:
+		with self._lock:
+			zset = self._zset(key)
+			return len(zset.scores) if zset is not None else 0
+
+	def zcount(self, key: str, low: Any, high: Any) -> int:
+		with self._lock:
+			zset = self._zset(key)
+			return zset.count(float(low), float(high)) if zset is not None else 0
+
+	def zrevrange(self, key: str, start: int, end: int, withscores: bool = False) -> List[Any]:
+		with self._lock:
+			zset = self._zset(key)
+			items = zset.rev_range(start, end) if zset is not None else []
+			return items if withscores else [member for member, _ in items]
+
+	def zunionstore(self, dest: str, keys: Sequence[str] | Dict[str, float]) -> int:
+		with self._lock:
+			union = _SortedSet()
+			weights = keys if isinstance(keys, dict) else dict.fromkeys(keys, 1.0)
+			for key, weight in weights.items():
+				zset = self._zset(key)
+				for member, score in (zset.scores.items() if zset is not None else ()):
+					union.incr(member, score * weight)
+			self.delete(dest)
+			# Like Redis, an empty union leaves no key behind
+			if union.scores:
+				self._data[dest] = union
+			return len(union.scores)
+
+	def zremrangebyscore(self, key: str, low: Any, high: Any) -> int:
+		with self._lock:
+			zset = self._zset(key)
+			if zset is None:
+				return 0
+			members = [member for member, score in zset.scores.items() if float(low) <= score <= float(high)]
+			for member in members:
+				zset.remove(member)
+			if not zset.scores:
+				self.delete(key)
+			return len(members)
+
+	def pipeline(self, transaction: bool = True) -> _Pipeline:
+		return _Pipeline(self)
+
+	def flushall(self) -> bool:
+		with self._lock:
+			self._data.clear()
+			self._expires.clear()
+			return True
+
+	def close(self) -> None:
+		pass
+
+
+_local_redis = LocalRedis()
+
+
+def local_redis() -> LocalRedis:
+	"""The process-wide in-memory store shared by every cache user."""
+	return _local_redis
+
+
+@dataclass
+class LocalTaskRunner:
+	workers: int = 4
+	# Celery beat entries ({"task": name, "schedule": seconds}) fired in-process
+	schedule: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+	_pool: Optional[ThreadPoolExecutor] = field(default=None, repr=False)
+	_stop: threading.Event = field(default_factory=threading.Event, repr=False)
+	_timer: Optional[threading.Thread] = field(default=None, repr=False)
+
+	"""Run Credence tasks on a thread pool in this process instead of a Celery worker.
+
+	Tasks go through `Task.apply`, so worker signals fire as usual and no
+	broker is involved. Queued tasks do not survive the process, which the
+	periodic sweeps (pending evidence, rollups, checkpoints) make up for.
+	"""
+
+	def start(self) -> "LocalTaskRunner":
+		self._pool = ThreadPoolExecutor(max_workers=max(1, self.workers), thread_name_prefix="credence-task")
+		if self.schedule:
+			self._timer = threading.Thread(target=self._fire_schedule, name="credence-beat", daemon=True)
+			self._timer.start()
+		return self
+
+	def submit(self, name: str, args: Sequence[Any], headers: Dict[str, Any]) -> Future[Any]:
+		if self._pool is None:
+			raise RuntimeError("task runner is not started")
+		return self._pool.submit(self._run, name, tuple(args), headers)
+
+	def stop(self, wait: bool = True) -> None:
+		"""Stop the schedule and, with `wait`, finish the tasks already queued."""
+		self._stop.set()
+		if self._pool is not None:
+			self._pool.shutdown(wait=wait)
+
+	def _run(self, name: str, args: Tuple[Any, ...], headers: Dict[str, Any]) -> Any:
+		from .worker import celery_app
+
+		# Failures are recorded like a worker's (credence_task_seconds state) and logged by Celery
+		return celery_app.tasks[name].apply(args=args, headers=headers)
+
+	def _fire_schedule(self) -> None:
+		# Like beat, every entry runs once at start and then every `schedule` seconds
+		due = {name: time.monotonic() for name in self.schedule}
+		while not self._stop.is_set():
+			name = min(due, key=due.__getitem__)
+			if self._stop.wait(max(0.0, due[name] - time.monotonic())):
+				return
+			entry = self.schedule[name]
+			try:
+				self.submit(entry["task"], (), {"enqueued_at": time.time()})
+			except RuntimeError:
+				# The pool shut down between the wait and the submit
+				return
+			due[name] = time.monotonic() + float(entry["schedule"])
+
+
+_runner: Optional[LocalTaskRunner] = None
+_runner_checked = False
+_runner_lock = threading.Lock()
+
+
+def task_runner() -> Optional[LocalTaskRunner]:
+	"""The running task runner in embedded mode, else None.
+
+	Started by `start`; a process that never called it (a CLI command, a
+	script) gets one on first use when its settings say embedded.
+	"""
+	global _runner, _runner_checked
+	if not _runner_checked:
+		with _runner_lock:
+			if not _runner_checked:
+				settings = Settings.from_env_and_file()
+				if settings.embedded:
+					_runner = LocalTaskRunner(workers=settings.embedded_task_workers).start()
+				_runner_checked = True
+	return _runner
+
+
+def init_database(settings: Settings) -> None:
+	"""Create the schema and the append-only triggers on the SQLite `database_url`; idempotent.
+
+	Embedded databases are not migrated with Alembic (the migrations are
+	PostgreSQL-specific), so the schema comes from the models.
+	"""
+	from sqlalchemy import text
+
+	from .db import Base, create_session_factory
+	from .services.rank_index import RankIndex
+	from .sharding import ShardRouter
+
+	factory = create_session_factory(settings)
+	engine = factory.kw["bind"]
+	try:
+		if engine.dialect.name != "sqlite":
+			raise ValueError("embedded mode needs a SQLite database_url, e.g. sqlite:///./credence.db")
+		Base.metadata.create_all(engine)
+		with engine.begin() as conn:
+			for trigger in SQLITE_APPEND_ONLY_TRIGGERS:
+				conn.execute(text(trigger))
+	finally:
+		engine.dispose()
+	shards = ShardRouter.from_settings(settings)
+	try:
+		# The in-memory rank index starts empty in every process
+		RankIndex(client=local_redis()).rebuild(shards)  # type: ignore[arg-type]
+	finally:
+		shards.dispose()
+
+
+def start(settings: Settings) -> LocalTaskRunner:
+	"""Prepare the database and start the task runner with the beat schedule."""
+	global _runner, _runner_checked
+	from .worker import celery_config
+
+	init_database(settings)
+	with _runner_lock:
+		if _runner is not None:
+			_runner.stop()
+		_runner = LocalTaskRunner(
+			workers=settings.embedded_task_workers,
+			schedule=celery_config(settings)["beat_schedule"],
+		).start()
+		_runner_checked = True
+	return _runner
+
+
+def stop() -> None:
+	"""Finish queued tasks and release the task runner and worker resources."""
+	global _runner, _runner_checked
+	from .worker import _shutdown_worker_process
+
+	with _runner_lock:
+		if _runner is not None:
+			_runner.stop()
+		_runner, _runner_checked = None, False
+	_shutdown_worker_process()
@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import hashlib
+import json
+from datetime import datetime, timezone
+from enum import Enum
+from typing import Any, List, Optional, Sequence, Tuple
+
+# Hash preceding the first entry of every user's chain.
+GENESIS_HASH = "0" * 64
+
+_LEAF_PREFIX = b"\x00"
+_NODE_PREFIX = b"\x01"
+
+
+def _sha256(*parts: bytes) -> str:
+	h = hashlib.sha256()
+	for part in parts:
+		h.update(part)
+	return h.hexdigest()
+
+
+def _utc_iso(value: datetime) -> str:
+	if value.tzinfo is None:
+		value = value.replace(tzinfo=timezone.utc)
+	return value.astimezone(timezone.utc).isoformat()
+
+
+def canonical_entry(entry: Any) -> bytes:
+	"""Canonical byte encoding of the immutable fields of a ledger entry.
+
+	Accepts an ORM `LedgerEntry` or any row exposing the same attributes. The
+	id is deliberately excluded: it is not known until after the INSERT, and
+	order is already captured by the chain.
+	"""
+	status = entry.evidence_status
+	payload = {
+		"user_id": entry.user_id,
+		"domain": entry.domain,
+		"action": entry.action,
+		"points": int(entry.points),
+		"evidence_ref": entry.evidence_ref,
+		"evidence_status": status.value if isinstance(status, Enum) else status,
+		"related_entry_id": entry.related_entry_id,
+		"meta": entry.meta,
+		"created_at": _utc_iso(entry.created_at),
+	}
+	return json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str).encode("utf-8")
+
+
+def entry_digest(prev_hash: Optional[str], entry: Any) -> str:
+	"""Chained hash of an entry: sha256(prev_hash || canonical_entry)."""
+	return _sha256((prev_hash or GENESIS_HASH).encode("ascii"), canonical_entry(entry))
+
+
+def leaf_hash(entry: Any) -> str:
+	"""Merkle leaf for an entry; rows written before chaining hash standalone."""
+	return entry.entry_hash or entry_digest(None, entry)
+
+
+def _leaf_node(leaf: str) -> bytes:
+	return bytes.fromhex(_sha256(_LEAF_PREFIX, bytes.fromhex(leaf)))
+
+
+def _parent(left: bytes, right: bytes) -> bytes:
+	return hashlib.sha256(_NODE_PREFIX + left + right).digest()
+
+
+def _levels(leaves: Sequence[str]) -> List[List[bytes]]:
+	level = [_leaf_node(leaf) for leaf in leaves]
+	levels = [level]
+	while len(level) > 1:
+		nxt = [_parent(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+		if len(level) % 2:
+			# odd node is promoted unchanged rather than duplicated
+			nxt.append(level[-1])
+		level = nxt
+		levels.append(level)
+	return levels
+
+
+def merkle_root(leaves: Sequence[str]) -> str:
+	"""Merkle root (hex) over hex leaf hashes, in order."""
+	if not leaves:
+		return _sha256(b"")
+	return _levels(leaves)[-1][0].hex()
+
+
+def merkle_proof(leaves: Sequence[str], index: int) -> List[Tuple[str, str]]:
+	"""Audit path for `leaves[index]` as (sibling_hash, side) pairs, leaf to root.
+
+	`side` is "left" or "right": the position of the sibling relative to the
+	running hash.
+	"""
+	if not 0 <= index < len(leaves):
+		raise ValueError("Leaf index out of range")
+	path: List[Tuple[str, str]] = []
+	for level in _levels(leaves)[:-1]:
+		sibling = index ^ 1
+		if sibling < len(level):
+			path.append((level[sibling].hex(), "left" if sibling < index else "right"))
+		index //= 2
+	return path
+
+
+def verify_proof(leaf: str, path: Sequence[Tuple[str, str]], root: str) -> bool:
+	"""Check an audit path produced by `merkle_proof` against a root."""
+	node = _leaf_node(leaf)
+	for sibling_hex, side in path:
+		sibling = bytes.fromhex(sibling_hex)
+		node = _parent(sibling, node) if side == "left" else _parent(node, sibling)
+	return node.hex() == root
+
+
+def segment_chain_hash(prev_chain_hash: Optional[str], root: str) -> str:
+	"""Link a segment root to the previous segment so roots cannot be reordered."""
+	return _sha256((prev_chain_hash or GENESIS_HASH).encode("ascii"), root.encode("ascii"))
@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, Tuple
+
+from prometheus_client import Counter, Histogram
+
+# Buckets tuned for in-process stages: most are sub-millisecond to tens of ms
+_STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+_QUEUE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+STAGE_SECONDS = Histogram(
+	"credence_stage_seconds",
+	"Time spent in one stage of a service call or task",
+	["component", "stage"],
+	buckets=_STAGE_BUCKETS,
+)
+STAGE_CALLS = Counter(
+	"credence_stage_calls_total",
+	"Stage executions, including those folded into a single accumulated observation",
+	["component", "stage"],
+)
+PLUGIN_SECONDS = Histogram(
+	"credence_plugin_seconds",
+	"Time spent in plugin method calls",
+	["plugin", "method"],
+	buckets=_STAGE_BUCKETS,
+)
+CACHE_REQUESTS = Counter(
+	"credence_cache_requests_total",
+	"Cache lookups by key family and result (hit/miss)",
+	["family", "result"],
+)
+TASK_QUEUE_SECONDS = Histogram(
+	"credence_task_queue_seconds",
+	"Delay between enqueueing a task and a worker starting it",
+	["task"],
+	buckets=_QUEUE_BUCKETS,
+)
+TASK_SECONDS = Histogram(
+	"credence_task_seconds",
+	"Task run time in the worker",
+	["task", "state"],
+	buckets=_QUEUE_BUCKETS,
+)
+
+RANK_INDEX_ERRORS = Counter(
+	"credence_rank_index_errors_total",
+	"Ledger entries missing from the rank index after a Redis error (repair: credence rebuild-rank-index)",
+)
+
+DB_QUERIES = Histogram(
+	"credence_db_queries",
+	"SQL statements per request or task",
+	["scope"],
+	buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100, 200, 500),
+)
+DB_QUERY_SECONDS = Histogram(
+	"credence_db_query_seconds",
+	"Total SQL time per request or task",
+	["scope"],
+	buckets=_STAGE_BUCKETS,
+)
+DB_REPEATED_QUERIES = Counter(
+	"credence_db_repeated_queries_total",
+	"Requests or tasks that ran one statement shape repeatedly (likely N+1)",
+	["scope"],
+)
+
+
+@contextmanager
+def stage(component: str, name: str) -> Iterator[None]:
+	"""Time one stage of a service call, e.g. `with stage("karma.award", "insert")`."""
+	start = time.perf_counter()
+	try:
+		yield
+	finally:
+		STAGE_SECONDS.labels(component, name).observe(time.perf_counter() - start)
+		STAGE_CALLS.labels(component, name).inc()
+
+
+def cache_key_family(key: str) -> str:
+	"""Family of a cache key: its first `:`-separated part ("trust", "balance", ...)."""
+	return key.split(":", 1)[0]
+
+
+def record_cache_lookup(key: str, hit: bool) -> None:
+	CACHE_REQUESTS.labels(cache_key_family(key), "hit" if hit else "miss").inc()
+
+
+@dataclass
+class StageAccumulator:
+	"""Low-overhead timing for hot loops.
+
+	Per-iteration timings are summed locally and reported as one histogram
+	observation per stage (plus the number of iterations) on `flush()`, instead
+	of one labelled observation per iteration.
+	"""
+
+	component: str
+	_totals: Dict[str, Tuple[float, int]] = field(default_factory=dict)
+
+	@contextmanager
+	def time(self, name: str) -> Iterator[None]:
+		start = time.perf_counter()
+		try:
+			yield
+		finally:
+			total, count = self._totals.get(name, (0.0, 0))
+			self._totals[name] = (total + time.perf_counter() - start, count + 1)
+
+	def flush(self) -> None:
+		for name, (total, count) in self._totals.items():
+			STAGE_SECONDS.labels(self.component, name).observe(total)
+			STAGE_CALLS.labels(self.component, name).inc(count)
+		self._totals.clear()
+
+
+class InstrumentedPlugin:
+	"""Proxy timing every public method call of a plugin instance by plugin path."""
+
+	def __init__(self, path: str, target: Any) -> None:
+		self._path = path
+		self._target = target
+
+	def __getattr__(self, name: str) -> Any:
+		attr = getattr(self._target, name)
+		if name.startswith("_") or not callable(attr):
+			return attr
+		histogram = PLUGIN_SECONDS.labels(self._path, name)
+
+		def timed(*args: Any, **kwargs: Any) -> Any:
+			start = time.perf_counter()
+			try:
+				return attr(*args, **kwargs)
+			finally:
+				histogram.observe(time.perf_counter() - start)
+
+		return timed
+
+
+def instrument_plugin(path: str, plugin: Any) -> Any:
+	return InstrumentedPlugin(path, plugin)
+
+
+def unwrap_plugin(plugin: Any) -> Any:
+	"""The plugin without its timing proxy, for calls timed by a `StageAccumulator`."""
+	return plugin._target if isinstance(plugin, InstrumentedPlugin) else plugin
@@ -1,7 +1,12 @@
 from __future__ import annotations
 
+from dataclasses import dataclass
+from functools import cached_property
 from importlib import import_module
-from typing import Any
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+	from ..config import Settings
 
 
 def load_symbol(path: str) -> Any:
@@ -13,3 +18,40 @@ def load_symbol(path: str) -> Any:
 	return getattr(module, symbol_name)
 
 
+def _instantiate(path: str) -> Any:
+	from ..metrics import instrument_plugin
+
+	cls = load_symbol(path)
+	return instrument_plugin(path, cls())  # type: ignore[call-arg]
+
+
+@dataclass
+class PluginRegistry:
+	"""Configured plugin instances, each resolved on first use and then reused.
+
+	Long-lived processes (the Celery worker) keep one registry per process so
+	plugins are not re-imported and re-instantiated for every task. Plugin
+	method calls are timed per plugin path (`credence_plugin_seconds`).
+	"""
+
+	settings: "Settings"
+
+	@cached_property
+	def trust_formula(self) -> Any:
+		return _instantiate(self.settings.plugins.trust_formula)
+
+	@cached_property
+	def evidence_validator(self) -> Any:
+		return _instantiate(self.settings.plugins.evidence_validator)
+
+	@cached_property
+	def verification_provider(self) -> Any:
+		return _instantiate(self.settings.plugins.verification_provider)
+
+	@cached_property
+	def decay_policy(self) -> Any:
+		return _instantiate(self.settings.plugins.decay_policy)
+
+	@cached_property
+	def leaderboard_strategy(self) -> Any:
+		return _instantiate(self.settings.plugins.leaderboard_strategy)
@@ -3,9 +3,11 @@ from __future__ import annotations
 from dataclasses import dataclass
 from typing import Optional
 
+from ..protocols import EvidenceValidator
+
 
 @dataclass
-class DefaultEvidenceValidator:
+class DefaultEvidenceValidator(EvidenceValidator):
 	def validate(self, evidence_ref: str | None) -> str:
 		"""Simple heuristic evidence validator.
 
@@ -3,10 +3,13 @@ from __future__ import annotations
 from dataclasses import dataclass
 from typing import Iterable, List, Tuple
 
+from ..protocols import LeaderboardStrategy
 
-@dataclass
-class DefaultLeaderboardStrategy:
-	def rank(self, user_points: Iterable[Tuple[str, int]]) -> List[Tuple[str, int]]:
-		return sorted(user_points, key=lambda x: x[1], reverse=True)
 
+@dataclass
+class DefaultLeaderboardStrategy(LeaderboardStrategy):
+	# Plain points order: the leaderboard endpoint sorts and limits in SQL
+	orders_by_points = True
 
+	def rank(self, user_points: Iterable[Tuple[str, int]]) -> List[Tuple[str, int]]:
+		return sorted(user_points, key=lambda x: (-x[1], x[0]))
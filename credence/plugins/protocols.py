@@ -1,6 +1,7 @@
 from __future__ import annotations
 
-from typing import Iterable, List, Protocol, Tuple
+import heapq
+from typing import Iterable, List, Optional, Protocol, Sequence, Tuple
 
 
 class TrustFormula(Protocol):
@@ -10,6 +11,14 @@ class TrustFormula(Protocol):
 class EvidenceValidator(Protocol):
 	def validate(self, evidence_ref: str | None) -> str: ...
 
+	def validate_many(self, evidence_refs: Sequence[Optional[str]]) -> List[str]:
+		"""Statuses for many refs, in order; used by deferred validation.
+
+		The default calls `validate` per ref; validators that fetch URLs or call
+		a classifier override it to batch or parallelize the checks.
+		"""
+		return [self.validate(ref) for ref in evidence_refs]
+
 
 class VerificationProvider(Protocol):
 	def effective_level(self, external_level: int, internal_level: int) -> int: ...
@@ -20,8 +29,20 @@ class DecayPolicy(Protocol):
 
 
 class LeaderboardStrategy(Protocol):
+	# True when `rank` orders by points descending, ties by user id: callers may
+	# then push ORDER BY ... LIMIT into SQL instead of calling the strategy
+	orders_by_points: bool = False
+
 	def rank(self, user_points: Iterable[Tuple[str, int]]) -> List[Tuple[str, int]]: ...
 
+	def top_k(self, user_points: Iterable[Tuple[str, int]], k: int) -> List[Tuple[str, int]]:
+		"""The first `k` items of `rank(user_points)`.
+
+		The default keeps a k-sized heap ordered by points (O(n log k));
+		strategies with a different order override it.
+		"""
+		return heapq.nsmallest(k, user_points, key=lambda x: (-x[1], x[0]))
+
 
 class AuthProvider(Protocol):
 	def get_user_id(self, *args, **kwargs) -> str: ...
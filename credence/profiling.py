@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from types import FrameType
+from typing import Any, Dict, Iterator, List, Optional
+
+PROFILE_FORMATS = ("collapsed", "speedscope")
+
+# Leaf functions of threads that are parked, not doing work
+_IDLE_LEAVES = {
+	("threading.py", "wait"),
+	("selectors.py", "select"),
+	("queue.py", "get"),
+	("base_events.py", "_run_once"),
+}
+
+
+def _frame_label(frame: FrameType) -> str:
+	code = frame.f_code
+	return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _is_idle(frame: FrameType) -> bool:
+	code = frame.f_code
+	return (os.path.basename(code.co_filename), code.co_name) in _IDLE_LEAVES
+
+
+@dataclass
+class SamplingProfiler:
+	"""Wall-clock sampling profiler built on `sys._current_frames()`.
+
+	A daemon thread snapshots the stacks of the target threads (all other
+	threads when `thread_ids` is None) every `interval` seconds and counts
+	collapsed stacks. Nothing runs while the profiler is stopped, and the
+	profiled code is never instrumented.
+	"""
+
+	interval: float = 0.005
+	thread_ids: Optional[List[int]] = None
+	include_idle: bool = False
+	samples: "Counter[str]" = field(default_factory=Counter)
+	started_at: float = 0.0
+	duration: float = 0.0
+	_stop: threading.Event = field(default_factory=threading.Event)
+	_thread: Optional[threading.Thread] = None
+
+	def start(self) -> "SamplingProfiler":
+		self._stop.clear()
+		self.started_at = time.perf_counter()
+		self._thread = threading.Thread(target=self._run, name="credence-profiler", daemon=True)
+		self._thread.start()
+		return self
+
+	def stop(self) -> "SamplingProfiler":
+		self._stop.set()
+		if self._thread is not None:
+			self._thread.join()
+			self._thread = None
+		self.duration = time.perf_counter() - self.started_at
+		return self
+
+	@contextmanager
+	def sampling_current_thread(self) -> Iterator[None]:
+		"""Add the calling thread to `thread_ids` for the duration of the block."""
+		if self.thread_ids is None:
+			yield
+			return
+		ident = threading.get_ident()
+		self.thread_ids.append(ident)
+		try:
+			yield
+		finally:
+			self.thread_ids.remove(ident)
+
+	def __enter__(self) -> "SamplingProfiler":
+		return self.start()
+
+	def __exit__(self, *exc: Any) -> None:
+		self.stop()
+
+	def _run(self) -> None:
+		own = threading.get_ident()
+		while not self._stop.wait(self.interval):
+			for thread_id, frame in sys._current_frames().items():
+				if thread_id == own or (self.thread_ids is not None and thread_id not in self.thread_ids):
+					continue
+				if not self.include_idle and _is_idle(frame):
+					continue
+				stack: List[str] = []
+				current: Optional[FrameType] = frame
+				while current is not None:
+					stack.append(_frame_label(current))
+					current = current.f_back
+				self.samples[";".join(reversed(stack))] += 1
+
+	def collapsed(self) -> str:
+		"""Brendan Gregg's collapsed format (`a;b;c count`), for flamegraph tools."""
+		return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+	def speedscope(self, name: str = "credence") -> Dict[str, Any]:
+		"""A speedscope "sampled" profile; weights are in seconds."""
+		frames: List[Dict[str, str]] = []
+		index: Dict[str, int] = {}
+		samples: List[List[int]] = []
+		weights: List[float] = []
+		for stack, count in self.samples.items():
+			ids = []
+			for label in stack.split(";"):
+				if label not in index:
+					index[label] = len(frames)
+					frames.append({"name": label})
+				ids.append(index[label])
+			samples.append(ids)
+			weights.append(count * self.interval)
+		return {
+			"$schema": "https://www.speedscope.app/file-format-schema.json",
+			"name": name,
+			"activeProfileIndex": 0,
+			"exporter": "credence",
+			"shared": {"frames": frames},
+			"profiles": [
+				{
+					"type": "sampled",
+					"name": name,
+					"unit": "seconds",
+					"startValue": 0,
+					"endValue": sum(weights),
+					"samples": samples,
+					"weights": weights,
+				}
+			],
+		}
+
+	def render(self, fmt: str, name: str = "credence") -> str:
+		if fmt == "speedscope":
+			import json
+
+			return json.dumps(self.speedscope(name))
+		return self.collapsed()
+
+
+def write_profile(profiler: SamplingProfiler, directory: str, name: str, fmt: str) -> str:
+	"""Write a finished profile to `directory`; returns the file path."""
+	os.makedirs(directory, exist_ok=True)
+	suffix = "speedscope.json" if fmt == "speedscope" else "collapsed.txt"
+	path = os.path.join(directory, f"{name}-{int(time.time())}.{suffix}")
+	with open(path, "w", encoding="utf-8") as fh:
+		fh.write(profiler.render(fmt, name=name))
+	return path
@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# A statement shape seen this many times in one request/task is reported as a
+# likely N+1 (a query issued once per row of an earlier result)
+REPEAT_THRESHOLD = 3
+
+_NUMBER = re.compile(r"\b\d+\b")
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_WHITESPACE = re.compile(r"\s+")
+_PARAM_LIST = re.compile(r"\((?:\s*(?:\?|%\([^)]*\)s|:\w+|\$\d+)\s*,?)+\)")
+
+
+def statement_shape(statement: str) -> str:
+	"""Statement text with literals and bound-parameter lists collapsed."""
+	shape = _STRING.sub("?", statement)
+	shape = _NUMBER.sub("?", shape)
+	shape = _PARAM_LIST.sub("(...)", shape)
+	return _WHITESPACE.sub(" ", shape).strip()
+
+
+@dataclass
+class QueryStats:
+	"""Statements executed within one request or task."""
+
+	count: int = 0
+	seconds: float = 0.0
+	shapes: "Counter[str]" = field(default_factory=Counter)
+
+	def record(self, statement: str, elapsed: float) -> None:
+		self.count += 1
+		self.seconds += elapsed
+		self.shapes[statement_shape(statement)] += 1
+
+	def merge(self, other: "QueryStats") -> None:
+		self.count += other.count
+		self.seconds += other.seconds
+		self.shapes.update(other.shapes)
+
+	def repeated(self, threshold: int = REPEAT_THRESHOLD) -> List[Tuple[str, int]]:
+		"""Statement shapes executed at least `threshold` times, most frequent first."""
+		return [(shape, n) for shape, n in self.shapes.most_common() if n >= threshold]
+
+	@property
+	def max_repeats(self) -> int:
+		most = self.shapes.most_common(1)
+		return most[0][1] if most else 0
+
+
+_current: ContextVar[Optional[QueryStats]] = ContextVar("credence_query_stats", default=None)
+# Called with (scope, stats) for every finished request/task, e.g. by test fixtures
+_listeners: List[Callable[[str, QueryStats], None]] = []
+
+
+def current_query_stats() -> Optional[QueryStats]:
+	return _current.get()
+
+
+def start_query_stats() -> Tuple[QueryStats, Token[Optional[QueryStats]]]:
+	"""Start counting in the current context; pass the token to `stop_query_stats`."""
+	stats = QueryStats()
+	return stats, _current.set(stats)
+
+
+def stop_query_stats(token: Token[Optional[QueryStats]]) -> None:
+	_current.reset(token)
+
+
+@contextmanager
+def track_queries() -> Iterator[QueryStats]:
+	"""Count statements run in this context (and threads it is copied into)."""
+	stats, token = start_query_stats()
+	try:
+		yield stats
+	finally:
+		stop_query_stats(token)
+
+
+def _before_cursor_execute(conn: Any, cursor: Any, statement: str, parameters: Any, context: Any, executemany: bool) -> None:
+	if _current.get() is not None:
+		conn.info.setdefault("credence_query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn: Any, cursor: Any, statement: str, parameters: Any, context: Any, executemany: bool) -> None:
+	stats = _current.get()
+	starts = conn.info.get("credence_query_start")
+	if stats is None or not starts:
+		return
+	stats.record(statement, time.perf_counter() - starts.pop())
+
+
+def install_query_counter(engine: Engine) -> None:
+	"""Attach the statement counter to `engine` (idempotent).
+
+	Statements outside `track_queries()` cost one context variable lookup.
+	"""
+	if event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+		return
+	event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+	event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+@contextmanager
+def listen_query_stats(listener: Callable[[str, QueryStats], None]) -> Iterator[None]:
+	"""Pass the stats of every request/task finishing in the block to `listener`.
+
+	Unlike `track_queries`, this sees requests served on other threads, such
+	as an app driven by a test client.
+	"""
+	_listeners.append(listener)
+	try:
+		yield
+	finally:
+		_listeners.remove(listener)
+
+
+def observe_query_stats(scope: str, stats: QueryStats) -> None:
+	"""Report a finished request/task to the `credence_db_*` metrics."""
+	from .metrics import DB_QUERIES, DB_QUERY_SECONDS, DB_REPEATED_QUERIES
+
+	for listener in list(_listeners):
+		listener(scope, stats)
+
+	DB_QUERIES.labels(scope).observe(stats.count)
+	DB_QUERY_SECONDS.labels(scope).observe(stats.seconds)
+	if stats.repeated():
+		DB_REPEATED_QUERIES.labels(scope).inc()
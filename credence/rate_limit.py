@@ -1,10 +1,181 @@
 from __future__ import annotations
 
-from slowapi import Limiter
-from slowapi.util import get_remote_address
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Optional, Tuple
 
+import redis
+from fastapi import Depends, Request
 
-# Shared limiter for routers to import and use decorators
-limiter = Limiter(key_func=get_remote_address)
+from .config import Settings
+from .deps import get_settings, resolve_user_id
 
+_PERIODS = {"second": 1.0, "minute": 60.0, "hour": 3600.0, "day": 86400.0}
 
+# One round trip: refill from elapsed server time, try to take `cost` tokens.
+# Server time (not the caller's clock) keeps every API replica consistent.
+_TOKEN_BUCKET_LUA = """
+local capacity = tonumber(ARGV[1])
+local refill_per_sec = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * refill_per_sec)
+local allowed = 0
+if tokens >= cost then
+	tokens = tokens - cost
+	allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / refill_per_sec * 1000))
+return {allowed, tostring(tokens)}
+"""
+
+
+class RateLimitExceeded(Exception):
+	"""Raised when a token bucket is empty; `retry_after` is in seconds."""
+
+	def __init__(self, retry_after: float) -> None:
+		super().__init__("Too Many Requests")
+		self.retry_after = retry_after
+
+
+def parse_rate(rate: str) -> Tuple[int, float]:
+	"""Parse a limit like '120/minute' into (capacity, tokens refilled per second)."""
+	try:
+		amount_str, period = rate.split("/", 1)
+		amount = int(amount_str.strip())
+		seconds = _PERIODS[period.strip().lower().rstrip("s")]
+	except (ValueError, KeyError):
+		raise ValueError(f"Invalid rate limit: {rate!r}")
+	if amount <= 0:
+		raise ValueError(f"Invalid rate limit: {rate!r}")
+	return amount, amount / seconds
+
+
+@dataclass
+class LocalTokenBuckets:
+	"""In-process token buckets used while Redis is unavailable or slow.
+
+	Limits are then enforced per process instead of globally; the number of
+	tracked keys is bounded and least recently used buckets are dropped.
+	"""
+
+	max_keys: int = 10_000
+	_buckets: "OrderedDict[str, Tuple[float, float]]" = field(default_factory=OrderedDict)
+	_lock: threading.Lock = field(default_factory=threading.Lock)
+
+	def take(self, key: str, capacity: int, refill_per_sec: float, cost: float = 1.0) -> Tuple[bool, float]:
+		now = time.monotonic()
+		with self._lock:
+			tokens, ts = self._buckets.pop(key, (float(capacity), now))
+			tokens = min(float(capacity), tokens + max(0.0, now - ts) * refill_per_sec)
+			allowed = tokens >= cost
+			if allowed:
+				tokens -= cost
+			self._buckets[key] = (tokens, now)
+			while len(self._buckets) > self.max_keys:
+				self._buckets.popitem(last=False)
+		return allowed, tokens
+
+
+@dataclass
+class TokenBucketLimiter:
+	"""Distributed token-bucket limiter: one atomic Lua call per check.
+
+	After a Redis error or timeout, checks go to `LocalTokenBuckets` for
+	`fallback_seconds` before Redis is tried again, so a slow Redis adds at most
+	one timeout per window instead of one per request. Without a client
+	(embedded mode, a single process) every check is local.
+	"""
+
+	client: Optional[redis.Redis]
+	prefix: str = "ratelimit"
+	fallback_seconds: float = 5.0
+	local: LocalTokenBuckets = field(default_factory=LocalTokenBuckets)
+	_redis_down_until: float = 0.0
+
+	def __post_init__(self) -> None:
+		self._script = self.client.register_script(_TOKEN_BUCKET_LUA) if self.client is not None else None
+
+	@classmethod
+	def from_settings(cls, settings: Settings) -> "TokenBucketLimiter":
+		if settings.embedded:
+			return cls(client=None)
+		timeout = settings.rate_limit_redis_timeout_ms / 1000.0
+		client = redis.Redis.from_url(
+			settings.redis_url,
+			decode_responses=True,
+			socket_timeout=timeout,
+			socket_connect_timeout=timeout,
+		)
+		return cls(client=client)
+
+	def hit(self, key: str, rate: str, cost: float = 1.0) -> None:
+		"""Take `cost` tokens from the bucket for `key` or raise RateLimitExceeded."""
+		capacity, refill_per_sec = parse_rate(rate)
+		allowed, tokens = self._take(f"{self.prefix}:{key}", capacity, refill_per_sec, cost)
+		if not allowed:
+			raise RateLimitExceeded(retry_after=max(0.0, (cost - tokens) / refill_per_sec))
+
+	def _take(self, key: str, capacity: int, refill_per_sec: float, cost: float) -> Tuple[bool, float]:
+		if self._script is not None and time.monotonic() >= self._redis_down_until:
+			try:
+				allowed, tokens = self._script(keys=[key], args=[capacity, refill_per_sec, cost])
+				return bool(int(allowed)), float(tokens)
+			except redis.RedisError:
+				self._redis_down_until = time.monotonic() + self.fallback_seconds
+		return self.local.take(key, capacity, refill_per_sec, cost)
+
+
+_limiters: Dict[str, TokenBucketLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(settings: Settings) -> TokenBucketLimiter:
+	"""Process-wide limiter (and Redis pool) for the configured Redis URL."""
+	key = "embedded" if settings.embedded else settings.redis_url
+	limiter = _limiters.get(key)
+	if limiter is None:
+		with _limiters_lock:
+			limiter = _limiters.get(key)
+			if limiter is None:
+				limiter = TokenBucketLimiter.from_settings(settings)
+				_limiters[key] = limiter
+	return limiter
+
+
+def _identity(request: Request, settings: Settings) -> str:
+	user_id = resolve_user_id(request, settings)
+	if user_id is not None:
+		return f"user:{user_id}"
+	client = request.client.host if request.client else "unknown"
+	return f"ip:{client}"
+
+
+def rate_limit(route: str, default: Optional[str] = None) -> Callable[..., None]:
+	"""Dependency enforcing the limit configured for `route`.
+
+	The rate comes from `rate_limits.<route>` in the config, else `default`,
+	else `rate_limit_default`. Buckets are keyed by the authenticated user id,
+	falling back to the client address for anonymous calls.
+	"""
+
+	def dependency(request: Request, settings: Settings = Depends(get_settings)) -> None:
+		rate = settings.rate_limits.get(route) or default or settings.rate_limit_default
+		get_limiter(settings).hit(f"route:{route}:{_identity(request, settings)}", rate)
+
+	return dependency
+
+
+def enforce_action_limit(settings: Settings, user_id: str, domain: str, action: str) -> None:
+	"""Apply the optional per domain/action `rate_limit` from the domain config."""
+	cfg = settings.domains.get(domain, {}).get(action)
+	if cfg is None or not cfg.rate_limit:
+		return
+	get_limiter(settings).hit(f"action:{domain}:{action}:user:{user_id}", cfg.rate_limit)
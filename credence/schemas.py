@@ -61,6 +61,9 @@ class TrustResponse(BaseModel):
 	trust: float
 	karma_balance: int
 	verification_level: int
+	# Share (0-100) of users in the domain with trust <= this one, from the
+	# distribution sketch; None until a sketch exists
+	percentile: Optional[float] = None
 
 
 class LeaderboardItem(BaseModel):
@@ -72,6 +75,24 @@ class LeaderboardResponse(BaseModel):
 	domain: Optional[str] = None
 	since_days: Optional[int] = None
 	items: list[LeaderboardItem]
+	# Pass back as `cursor` for the next page; None on the last page
+	next_cursor: Optional[str] = None
+
+
+class MerklePathStep(BaseModel):
+	hash: str
+	position: Literal["left", "right"]
+
+
+class LedgerProofResponse(BaseModel):
+	entry_id: int
+	entry_hash: str
+	segment_index: int
+	leaf_index: int
+	leaf_count: int
+	segment_root: str
+	chain_hash: str
+	path: list[MerklePathStep]
 
 
 class LedgerPageResponse(BaseModel):
@@ -94,6 +115,15 @@ class DisputeResolveRequest(BaseModel):
 	note: Optional[str] = None
 
 
+class DisputeClaimRequest(BaseModel):
+	limit: int = Field(default=10, ge=1, le=100)
+	lease_seconds: int = Field(default=300, ge=30, le=3600)
+
+
+class DisputeReleaseRequest(BaseModel):
+	dispute_id: int
+
+
 class DisputeOut(BaseModel):
 	id: int
 	ledger_entry_id: int
@@ -104,7 +134,33 @@ class DisputeOut(BaseModel):
 	resolved_by: Optional[str]
 	resolved_at: Optional[datetime]
 	created_at: datetime
+	claimed_by: Optional[str] = None
+	claim_expires_at: Optional[datetime] = None
 
 	model_config = ConfigDict(from_attributes=True)
 
 
+class DisputeListResponse(BaseModel):
+	items: list[DisputeOut]
+	# Pass back as `before_id` for the next page; None on the last page
+	next_cursor: Optional[int] = None
+
+
+class EntryEvidenceStatusOut(BaseModel):
+	ledger_entry_id: int
+	user_id: str
+	domain: str
+	points: int
+	status: str
+	entry_created_at: datetime
+	updated_at: datetime
+
+	model_config = ConfigDict(from_attributes=True)
+
+
+class FlaggedEntriesResponse(BaseModel):
+	items: list[EntryEvidenceStatusOut]
+	# Pass back as `before_id` for the next page; None on the last page
+	next_cursor: Optional[int] = None
+
+
@@ -0,0 +1,361 @@
+from __future__ import annotations
+
+import csv
+import io
+import json
+from contextlib import contextmanager
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, TextIO, Tuple, Union
+
+from sqlalchemy import insert, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session, sessionmaker
+
+from ..cache import RedisCache, balance_cache_key, trust_cache_key
+from ..config import Settings
+from ..db import EvidenceStatusEnum, ImportCheckpoint, LedgerEntry, create_session_factory, ensure_ledger_partitions
+from ..sharding import ShardRouter
+from ..tasks import enqueue
+from .checkpoints import CheckpointService
+from .evidence_status import EvidenceStatusService
+from .integrity import SEAL_LOCK_SQL
+from .rank_index import RankIndex
+from .rollups import RollupService
+
+# Columns loaded by COPY, in order. Imported rows are not hash-chained
+# (prev_hash/entry_hash stay NULL); they are covered once their id range is
+# sealed into a Merkle segment.
+COPY_COLUMNS = ("user_id", "domain", "action", "points", "evidence_ref", "evidence_status", "meta", "created_at")
+_COPY_SQL = f"COPY ledger_entries ({', '.join(COPY_COLUMNS)}) FROM STDIN"
+_STATUSES = {s.value for s in EvidenceStatusEnum}
+# Back-dated rows are the point of an import; rows too far in the future would
+# have no partition to land in
+_MAX_FUTURE = timedelta(days=31)
+# Users per cache invalidation / trust recompute task after an import
+_REBUILD_BATCH = 1000
+
+
+class ImportRecordError(ValueError):
+	pass
+
+
+def iter_records(stream: TextIO, fmt: str) -> Iterator[Union[Dict[str, Any], ImportRecordError]]:
+	"""Yield raw records from CSV (with a header row) or NDJSON, one per input row.
+
+	A malformed NDJSON line is yielded as an `ImportRecordError`, so it is
+	rejected like any invalid record and keeps its place in the chunking.
+	"""
+	if fmt == "csv":
+		yield from csv.DictReader(stream)
+	elif fmt == "ndjson":
+		for line_no, line in enumerate(stream, start=1):
+			line = line.strip()
+			if not line:
+				continue
+			try:
+				record = json.loads(line)
+			except ValueError:
+				yield ImportRecordError(f"line {line_no}: invalid JSON")
+				continue
+			if not isinstance(record, dict):
+				yield ImportRecordError(f"line {line_no}: not a JSON object")
+				continue
+			yield record
+	else:
+		raise ValueError(f"Unsupported import format: {fmt}")
+
+
+def validate_record(settings: Settings, record: Dict[str, Any], now: datetime) -> Tuple[Any, ...]:
+	"""Check one record against the domain config; returns a row in COPY_COLUMNS order."""
+	user_id = str(record.get("user_id") or "").strip()
+	domain = str(record.get("domain") or "").strip()
+	action = str(record.get("action") or "").strip()
+	if not user_id or len(user_id) > 128:
+		raise ImportRecordError("user_id is required (max 128 characters)")
+	try:
+		cfg = settings.domains[domain][action]
+	except KeyError:
+		raise ImportRecordError(f"Unknown domain/action: {domain}/{action}")
+	raw_points = record.get("points")
+	try:
+		points = cfg.points if raw_points in (None, "") else int(raw_points)
+	except (TypeError, ValueError):
+		raise ImportRecordError(f"Invalid points: {raw_points!r}")
+	evidence_ref = record.get("evidence_ref") or None
+	if cfg.requires_evidence and not evidence_ref:
+		raise ImportRecordError("Evidence is required for this action")
+	if evidence_ref is not None and len(str(evidence_ref)) > 512:
+		raise ImportRecordError("evidence_ref is longer than 512 characters")
+	status = str(record.get("evidence_status") or EvidenceStatusEnum.GREEN.value).lower()
+	if status not in _STATUSES:
+		raise ImportRecordError(f"Invalid evidence_status: {status!r}")
+	meta = record.get("meta")
+	if isinstance(meta, str):
+		try:
+			meta = json.loads(meta) if meta else None
+		except ValueError:
+			raise ImportRecordError("meta is not valid JSON")
+	raw_created = record.get("created_at")
+	if not raw_created:
+		raise ImportRecordError("created_at is required")
+	try:
+		created_at = datetime.fromisoformat(str(raw_created).replace("Z", "+00:00"))
+	except ValueError:
+		raise ImportRecordError(f"Invalid created_at: {raw_created!r}")
+	if created_at.tzinfo is None:
+		created_at = created_at.replace(tzinfo=timezone.utc)
+	if created_at > now + _MAX_FUTURE:
+		raise ImportRecordError("created_at is in the future")
+	return (
+		user_id,
+		domain,
+		action,
+		points,
+		None if evidence_ref is None else str(evidence_ref),
+		status,
+		None if meta is None else json.dumps(meta, separators=(",", ":")),
+		created_at,
+	)
+
+
+_worker_factory: Optional[sessionmaker[Session]] = None
+
+
+def _init_worker() -> None:
+	global _worker_factory
+	_worker_factory = create_session_factory(Settings.from_env_and_file())
+
+
+def load_chunk(session: Session, import_id: str, chunk_index: int, chunk_size: int, rows: List[Tuple[Any, ...]]) -> int:
+	"""Load one chunk and record it in `import_checkpoints`, in one transaction.
+
+	Returns the rows loaded, or 0 when the chunk was already loaded by an
+	earlier (or concurrent) run.
+	"""
+	try:
+		if session.get_bind().dialect.name == "postgresql":
+			claimed = session.execute(
+				pg_insert(ImportCheckpoint)
+				.values(import_id=import_id, chunk_index=chunk_index, chunk_size=chunk_size, rows=len(rows))
+				.on_conflict_do_nothing()
+				.returning(ImportCheckpoint.chunk_index)
+			).first()
+			if claimed is None:
+				session.rollback()
+				return 0
+			# Bulk rows would flood the change feed; subscribers catch up by id
+			session.execute(text("SET LOCAL credence.suppress_notify = 'on'"))
+			raw = session.connection().connection.driver_connection
+			with raw.cursor() as cur:  # type: ignore[union-attr]
+				with cur.copy(_COPY_SQL) as copy:
+					for row in rows:
+						copy.write_row(row)
+		else:
+			if session.get(ImportCheckpoint, (import_id, chunk_index)) is not None:
+				return 0
+			session.add(ImportCheckpoint(import_id=import_id, chunk_index=chunk_index, chunk_size=chunk_size, rows=len(rows)))
+			records = [dict(zip(COPY_COLUMNS, row)) for row in rows]
+			for record in records:
+				record["meta"] = None if record["meta"] is None else json.loads(record["meta"])
+			session.execute(insert(LedgerEntry), records)
+		session.commit()
+		return len(rows)
+	except Exception:
+		session.rollback()
+		raise
+
+
+def _load_chunk_in_worker(args: Tuple[str, int, int, List[Tuple[Any, ...]]]) -> int:
+	assert _worker_factory is not None
+	session = _worker_factory()
+	try:
+		return load_chunk(session, *args)
+	finally:
+		session.close()
+
+
+@dataclass
+class ImportResult:
+	loaded: int = 0
+	skipped_chunks: int = 0
+	rejected: int = 0
+	user_ids: Set[str] = field(default_factory=set)
+	# Input lines that could not be parsed into a record at all
+	errors: List[str] = field(default_factory=list)
+
+
+@dataclass
+class BulkImporter:
+	"""Stream, validate and COPY ledger rows in fixed-size chunks across processes.
+
+	Chunk `i` always covers input rows `[i * chunk_size, (i + 1) * chunk_size)`,
+	so re-running with the same `import_id` and `chunk_size` skips every chunk
+	recorded in `import_checkpoints` and loads the rest exactly once.
+	"""
+
+	settings: Settings
+	import_id: str
+	chunk_size: int = 10_000
+	workers: int = 4
+	rejects: Optional[TextIO] = None
+	max_rejects: Optional[int] = None
+
+	def run(self, records: Iterable[Union[Dict[str, Any], ImportRecordError]]) -> ImportResult:
+		result = ImportResult()
+		session = create_session_factory(self.settings)()
+		try:
+			with self._seal_lock(session):
+				self._load(session, records, result)
+		finally:
+			session.close()
+		return result
+
+	def _load(
+		self, session: Session, records: Iterable[Union[Dict[str, Any], ImportRecordError]], result: ImportResult
+	) -> None:
+		done = self._completed_chunks(session)
+		partitions_from: Optional[datetime] = None
+		in_flight: Set[Future[int]] = set()
+		with ProcessPoolExecutor(max_workers=max(1, self.workers), initializer=_init_worker) as pool:
+			for chunk_index, chunk in self._chunks(records):
+				rows = self._validate(chunk_index, chunk, result)
+				if chunk_index in done:
+					result.skipped_chunks += 1
+					continue
+				if not rows:
+					continue
+				oldest = min(row[-1] for row in rows)
+				if partitions_from is None or oldest < partitions_from:
+					# Partitions are created here, in one process, before any COPY needs them
+					ensure_ledger_partitions(session, start=oldest)
+					partitions_from = oldest.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+				if len(in_flight) >= self.workers * 2:
+					finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+					result.loaded += sum(f.result() for f in finished)
+				in_flight.add(pool.submit(_load_chunk_in_worker, (self.import_id, chunk_index, self.chunk_size, rows)))
+			for future in in_flight:
+				result.loaded += future.result()
+
+	@contextmanager
+	def _seal_lock(self, session: Session) -> Iterator[None]:
+		"""Keep segments from being sealed until every chunk has committed.
+
+		Chunks commit out of id order and their rows are back-dated, so a seal
+		running mid-import could close an id range that still has rows in
+		flight. The lock is held on a connection of its own for the whole run.
+		"""
+		bind = session.get_bind()
+		if bind.dialect.name != "postgresql":
+			yield
+			return
+		with bind.connect() as conn:
+			conn.execute(text(f"SELECT pg_advisory_lock({SEAL_LOCK_SQL})"))
+			conn.commit()
+			try:
+				yield
+			finally:
+				conn.execute(text(f"SELECT pg_advisory_unlock({SEAL_LOCK_SQL})"))
+				conn.commit()
+
+	def rebuild_derived(self, user_ids: Iterable[str]) -> None:
+		"""Refresh everything derived from the ledger once, after the load.
+
+		Balance checkpoints of the imported users are recomputed at the existing
+		run cutoffs; karma rollups, the rank index and the evidence status
+		projection are rebuilt set-based, cached balances and trust for the
+		imported users are dropped, and their trust is recomputed in batches by
+		the worker.
+		"""
+		users = sorted(user_ids)
+		cache = RedisCache.from_settings(self.settings)
+		session = create_session_factory(self.settings)()
+		try:
+			CheckpointService(session=session).rebuild(users)
+			RollupService(session=session).rebuild()
+			EvidenceStatusService(session=session).rebuild()
+		finally:
+			session.close()
+		# Imported rows stay on the home database until `credence reshard` moves them
+		shards = ShardRouter(
+			urls=list(dict.fromkeys([*self.settings.shard_database_urls, self.settings.database_url])),
+			factory_for=lambda url: create_session_factory(self.settings, url=url),
+		)
+		try:
+			RankIndex(client=cache.client).rebuild(shards)
+		finally:
+			shards.dispose()
+		domains: List[Optional[str]] = [None, *self.settings.domains]
+		for i in range(0, len(users), _REBUILD_BATCH):
+			batch = users[i : i + _REBUILD_BATCH]
+			cache.delete(
+				*[balance_cache_key(u, d) for u in batch for d in domains],
+				*[trust_cache_key(u, d) for u in batch for d in domains],
+			)
+			enqueue("credence.tasks.recompute_trust_batch", batch)
+
+	def _completed_chunks(self, session: Session) -> Set[int]:
+		rows = session.execute(
+			select(ImportCheckpoint.chunk_index, ImportCheckpoint.chunk_size).where(
+				ImportCheckpoint.import_id == self.import_id
+			)
+		).all()
+		sizes = {size for _, size in rows}
+		if sizes and sizes != {self.chunk_size}:
+			raise ValueError(
+				f"Import {self.import_id} was started with chunk size {sizes.pop()}; resume with the same --chunk-size"
+			)
+		return {index for index, _ in rows}
+
+	def _chunks(
+		self, records: Iterable[Union[Dict[str, Any], ImportRecordError]]
+	) -> Iterator[Tuple[int, List[Union[Dict[str, Any], ImportRecordError]]]]:
+		chunk: List[Union[Dict[str, Any], ImportRecordError]] = []
+		index = 0
+		for record in records:
+			chunk.append(record)
+			if len(chunk) >= self.chunk_size:
+				yield index, chunk
+				index += 1
+				chunk = []
+		if chunk:
+			yield index, chunk
+
+	def _validate(
+		self, chunk_index: int, chunk: List[Union[Dict[str, Any], ImportRecordError]], result: ImportResult
+	) -> List[Tuple[Any, ...]]:
+		# Skipped (already loaded) chunks are validated too: their users still
+		# need derived data rebuilt, and rejects are reported consistently
+		now = datetime.now(timezone.utc)
+		rows: List[Tuple[Any, ...]] = []
+		for offset, record in enumerate(chunk):
+			try:
+				if isinstance(record, ImportRecordError):
+					result.errors.append(str(record))
+					raise record
+				row = validate_record(self.settings, record, now)
+			except ImportRecordError as exc:
+				result.rejected += 1
+				if self.rejects is not None:
+					bad = None if isinstance(record, ImportRecordError) else record
+					self.rejects.write(json.dumps({"row": chunk_index * self.chunk_size + offset + 1, "error": str(exc), "record": bad}, default=str) + "\n")
+				if self.max_rejects is not None and result.rejected > self.max_rejects:
+					raise ImportRecordError(f"More than {self.max_rejects} rejected rows; aborting")
+				continue
+			rows.append(row)
+			result.user_ids.add(row[0])
+		return rows
+
+
+def open_input(path: str) -> TextIO:
+	"""Open an import file; `.gz` files are decompressed on the fly, `-` is stdin."""
+	import sys
+
+	if path == "-":
+		return io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8", newline="")
+	if path.endswith(".gz"):
+		import gzip
+
+		return gzip.open(path, "rt", encoding="utf-8", newline="")
+	return open(path, "r", encoding="utf-8", newline="")
@@ -0,0 +1,255 @@
+from __future__ import annotations
+
+from bisect import bisect_left
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import and_, case, func, insert, or_, select
+from sqlalchemy.orm import Session
+
+from ..db import BalanceCheckpoint, LedgerEntry
+
+# Entries younger than this are left for the next run so that rows still being
+# committed when a checkpoint is taken are not skipped.
+CHECKPOINT_LAG = timedelta(minutes=1)
+# Rows committed later than the lag (but within this) are picked up by the
+# next runs, which re-check the checkpoints of this trailing window
+CHECKPOINT_OVERLAP = timedelta(hours=1)
+_USER_BATCH = 500
+
+
+@dataclass
+class CheckpointService:
+	session: Session
+
+	"""Write and read per-(user, domain) balance checkpoints.
+
+	A checkpoint covers every entry with `created_at <= checkpoint_at`, so a
+	balance as of any instant is the nearest earlier checkpoint plus the entries
+	created between the two.
+	"""
+
+	def write_checkpoints(self, cutoff: Optional[datetime] = None) -> int:
+		"""Checkpoint every (user, domain) with entries since the previous run.
+
+		Each run re-scans entries back to the last run older than
+		CHECKPOINT_OVERLAP, so an entry committed up to that long after its
+		`created_at` still counts: checkpoints the previous runs wrote without
+		it are corrected in place. Returns the number of checkpoint rows
+		written or corrected.
+		"""
+		cutoff = cutoff or datetime.now(timezone.utc) - CHECKPOINT_LAG
+		watermark = self.session.query(func.max(BalanceCheckpoint.checkpoint_at)).scalar()
+		if watermark is not None and _utc(watermark) >= cutoff:
+			return 0
+		base = None
+		if watermark is not None:
+			base = self.session.query(func.max(BalanceCheckpoint.checkpoint_at)).filter(
+				BalanceCheckpoint.checkpoint_at <= _utc(watermark) - CHECKPOINT_OVERLAP
+			).scalar()
+
+		# Checkpoints re-checked by this run, and the run cutoffs they were taken at
+		recent_q = self.session.query(BalanceCheckpoint)
+		if base is not None:
+			recent_q = recent_q.filter(BalanceCheckpoint.checkpoint_at > base)
+		recent = {(cp.user_id, cp.domain, _utc(cp.checkpoint_at)): cp for cp in recent_q}
+		boundaries = sorted({at for _, _, at in recent} | {cutoff})
+
+		bucket = case(*[(LedgerEntry.created_at <= at, i) for i, at in enumerate(boundaries)])
+		q = self.session.query(
+			LedgerEntry.user_id,
+			LedgerEntry.domain,
+			bucket,
+			func.coalesce(func.sum(LedgerEntry.points), 0),
+			func.count(LedgerEntry.id),
+			func.max(LedgerEntry.id),
+		).filter(LedgerEntry.created_at <= cutoff)
+		if base is not None:
+			q = q.filter(LedgerEntry.created_at > base)
+		deltas = {
+			(user_id, domain, int(i)): (int(points), int(count), int(last_id))
+			for user_id, domain, i, points, count, last_id in q.group_by(LedgerEntry.user_id, LedgerEntry.domain, bucket)
+		}
+		pairs = sorted({(user_id, domain) for user_id, domain, _ in deltas} | {(u, d) for u, d, _ in recent})
+		if not pairs:
+			return 0
+
+		anchors = (
+			self._latest_checkpoints(sorted({user_id for user_id, _ in pairs}), at_or_before=base)
+			if base is not None
+			else {}
+		)
+		written = 0
+		for user_id, domain in pairs:
+			anchor = anchors.get((user_id, domain))
+			balance, count, last_id = (anchor.balance, anchor.entry_count, anchor.last_entry_id) if anchor else (0, 0, 0)
+			for i, at in enumerate(boundaries):
+				points_i, count_i, last_i = deltas.get((user_id, domain, i), (0, 0, 0))
+				balance, count, last_id = balance + points_i, count + count_i, max(last_id, last_i)
+				cp = recent.get((user_id, domain, at))
+				if cp is None and count_i:
+					# Late entries are checkpointed at the run they belong to, so
+					# everything up to a boundary is covered once it leaves the window
+					self.session.add(
+						BalanceCheckpoint(
+							user_id=user_id,
+							domain=domain,
+							balance=balance,
+							entry_count=count,
+							last_entry_id=last_id,
+							checkpoint_at=at,
+						)
+					)
+					written += 1
+				elif cp is not None and (cp.balance, cp.entry_count) != (balance, count):
+					cp.balance, cp.entry_count, cp.last_entry_id = balance, count, last_id
+					written += 1
+		self.session.commit()
+		return written
+
+	def rebuild(self, user_ids: Iterable[str]) -> int:
+		"""Recompute the checkpoints of `user_ids` at the existing run cutoffs.
+
+		Used after back-dated writes (bulk imports), which incremental
+		checkpointing cannot see. Other users' checkpoints are left alone, and
+		the rebuilt users get a checkpoint at every earlier run they had entries
+		in, as if those runs had seen the imported rows; entries newer than the
+		last run are left to the next one. Returns the number of checkpoint
+		rows written.
+		"""
+		boundaries = [
+			_utc(at)
+			for at, in self.session.query(BalanceCheckpoint.checkpoint_at)
+			.distinct()
+			.order_by(BalanceCheckpoint.checkpoint_at)
+		]
+		if not boundaries:
+			# Nothing checkpointed yet: the next run covers every entry
+			return 0
+		users = sorted(set(user_ids))
+		written = 0
+		for i in range(0, len(users), _USER_BATCH):
+			batch = users[i : i + _USER_BATCH]
+			self.session.query(BalanceCheckpoint).filter(BalanceCheckpoint.user_id.in_(batch)).delete(
+				synchronize_session=False
+			)
+			deltas: Dict[Tuple[str, str], Dict[int, Tuple[int, int, int]]] = {}
+			rows = self.session.execute(
+				select(LedgerEntry.user_id, LedgerEntry.domain, LedgerEntry.created_at, LedgerEntry.points, LedgerEntry.id)
+				.where(LedgerEntry.user_id.in_(batch), LedgerEntry.created_at <= boundaries[-1])
+				.execution_options(yield_per=10_000)
+			)
+			for user_id, domain, created_at, points, entry_id in rows:
+				# The first run whose cutoff covers the entry
+				run = bisect_left(boundaries, _utc(created_at))
+				pair = deltas.setdefault((user_id, domain), {})
+				total, count, last_id = pair.get(run, (0, 0, 0))
+				pair[run] = (total + points, count + 1, max(last_id, entry_id))
+			checkpoints = []
+			for (user_id, domain), runs in deltas.items():
+				balance, count, last_id = 0, 0, 0
+				for run in sorted(runs):
+					points_i, count_i, last_i = runs[run]
+					balance, count, last_id = balance + points_i, count + count_i, max(last_id, last_i)
+					checkpoints.append(
+						{
+							"user_id": user_id,
+							"domain": domain,
+							"balance": balance,
+							"entry_count": count,
+							"last_entry_id": last_id,
+							"checkpoint_at": boundaries[run],
+						}
+					)
+			if checkpoints:
+				self.session.execute(insert(BalanceCheckpoint), checkpoints)
+			self.session.commit()
+			written += len(checkpoints)
+		return written
+
+	def balance_as_of(self, user_id: str, domain: Optional[str], as_of: datetime) -> int:
+		"""Balance of a user (optionally within a domain) at instant `as_of`."""
+		checkpoints = self._checkpoints_before(user_id, domain, as_of)
+		total = sum(cp.balance for cp in checkpoints.values())
+
+		q = self.session.query(func.coalesce(func.sum(LedgerEntry.points), 0)).filter(
+			LedgerEntry.user_id == user_id,
+			LedgerEntry.created_at <= as_of,
+		)
+		if domain is not None:
+			q = q.filter(LedgerEntry.domain == domain)
+		if checkpoints:
+			# Only entries after each domain's checkpoint, plus domains never checkpointed
+			q = q.filter(
+				or_(
+					*[
+						and_(LedgerEntry.domain == d, LedgerEntry.created_at > cp.checkpoint_at)
+						for d, cp in checkpoints.items()
+					],
+					LedgerEntry.domain.notin_(list(checkpoints)),
+				)
+			)
+		return total + int(q.scalar())
+
+	def _checkpoints_before(
+		self, user_id: str, domain: Optional[str], as_of: datetime
+	) -> Dict[str, BalanceCheckpoint]:
+		latest = self.session.query(
+			BalanceCheckpoint.domain.label("domain"),
+			func.max(BalanceCheckpoint.checkpoint_at).label("checkpoint_at"),
+		).filter(BalanceCheckpoint.user_id == user_id, BalanceCheckpoint.checkpoint_at <= as_of)
+		if domain is not None:
+			latest = latest.filter(BalanceCheckpoint.domain == domain)
+		latest_sq = latest.group_by(BalanceCheckpoint.domain).subquery()
+		rows = (
+			self.session.query(BalanceCheckpoint)
+			.join(
+				latest_sq,
+				and_(
+					BalanceCheckpoint.domain == latest_sq.c.domain,
+					BalanceCheckpoint.checkpoint_at == latest_sq.c.checkpoint_at,
+				),
+			)
+			.filter(BalanceCheckpoint.user_id == user_id)
+			.all()
+		)
+		return {cp.domain: cp for cp in rows}
+
+	def _latest_checkpoints(
+		self, user_ids: List[str], at_or_before: Optional[datetime] = None
+	) -> Dict[Tuple[str, str], BalanceCheckpoint]:
+		result: Dict[Tuple[str, str], BalanceCheckpoint] = {}
+		for i in range(0, len(user_ids), _USER_BATCH):
+			batch = user_ids[i : i + _USER_BATCH]
+			latest = self.session.query(
+				BalanceCheckpoint.user_id.label("user_id"),
+				BalanceCheckpoint.domain.label("domain"),
+				func.max(BalanceCheckpoint.checkpoint_at).label("checkpoint_at"),
+			).filter(BalanceCheckpoint.user_id.in_(batch))
+			if at_or_before is not None:
+				latest = latest.filter(BalanceCheckpoint.checkpoint_at <= at_or_before)
+			latest_sq = (
+				latest.group_by(BalanceCheckpoint.user_id, BalanceCheckpoint.domain)
+				.subquery()
+			)
+			rows = (
+				self.session.query(BalanceCheckpoint)
+				.join(
+					latest_sq,
+					and_(
+						BalanceCheckpoint.user_id == latest_sq.c.user_id,
+						BalanceCheckpoint.domain == latest_sq.c.domain,
+						BalanceCheckpoint.checkpoint_at == latest_sq.c.checkpoint_at,
+					),
+				)
+				.all()
+			)
+			for cp in rows:
+				result[(cp.user_id, cp.domain)] = cp
+		return result
+
+
+def _utc(ts: datetime) -> datetime:
+	# SQLite hands back naive datetimes, stored as UTC
+	return ts if ts.tzinfo is not None else ts.replace(tzinfo=timezone.utc)
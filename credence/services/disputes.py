@@ -1,24 +1,47 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
 
+from sqlalchemy import or_, select, update
 from sqlalchemy.orm import Session
 
 from ..db import Dispute, DisputeStatusEnum, LedgerEntry
 from ..config import Settings
+from ..metrics import stage
+from ..sharding import ShardRouter
 from . import WebhookClient
-from . import WebhookClient
+
+DEFAULT_LEASE_SECONDS = 300
+MAX_CLAIM = 100
+
+
+class DisputeClaimedError(ValueError):
+	"""The dispute is leased to another moderator."""
 
 
 @dataclass
 class DisputeService:
 	session: Session
 	settings: Settings
+	# Set when sharded: disputes stay on the home database, entries live on shards
+	shards: Optional[ShardRouter] = None
+
+	"""Open, claim, list and resolve disputes.
+
+	Moderators take work with `claim`, which leases the oldest unclaimed
+	open disputes using `FOR UPDATE SKIP LOCKED`: concurrent claims never
+	wait on each other nor hand out the same dispute twice.
+	"""
 
 	def open(self, ledger_entry_id: int, opened_by: str, reason: str) -> Dispute:
-		entry = self.session.get(LedgerEntry, ledger_entry_id)
-		if entry is None:
+		with stage("disputes.open", "entry_lookup"):
+			if self.shards is not None and self.shards.sharded:
+				found = self.shards.locate_entry(ledger_entry_id) is not None
+			else:
+				found = self.session.get(LedgerEntry, ledger_entry_id) is not None
+		if not found:
 			raise ValueError("Ledger entry not found")
 		d = Dispute(
 			ledger_entry_id=ledger_entry_id,
@@ -26,42 +49,130 @@ class DisputeService:
 			reason=reason,
 			status=DisputeStatusEnum.OPEN,
 		)
-		self.session.add(d)
-		self.session.commit()
-		self.session.refresh(d)
-		WebhookClient(settings=self.settings).send_event(
-			"dispute.opened",
-			{
-				"id": d.id,
-				"ledger_entry_id": d.ledger_entry_id,
-				"opened_by": d.opened_by,
-				"reason": d.reason,
-				"created_at": d.created_at.isoformat(),
-			},
+		with stage("disputes.open", "insert"):
+			self.session.add(d)
+			self.session.commit()
+			self.session.refresh(d)
+		with stage("disputes.open", "webhook"):
+			WebhookClient(settings=self.settings).send_event(
+				"dispute.opened",
+				{
+					"id": d.id,
+					"ledger_entry_id": d.ledger_entry_id,
+					"opened_by": d.opened_by,
+					"reason": d.reason,
+					"created_at": d.created_at.isoformat(),
+				},
+			)
+		return d
+
+	def claim(self, moderator: str, limit: int = 10, lease_seconds: int = DEFAULT_LEASE_SECONDS) -> List[Dispute]:
+		"""Lease up to `limit` of the oldest open disputes that nobody holds.
+
+		Expired leases are claimable again; claiming is one UPDATE over rows
+		picked with `FOR UPDATE SKIP LOCKED` from the open-queue index.
+		"""
+		now = datetime.now(timezone.utc)
+		picked = (
+			select(Dispute.id)
+			.where(
+				Dispute.status == DisputeStatusEnum.OPEN,
+				or_(Dispute.claim_expires_at.is_(None), Dispute.claim_expires_at < now),
+			)
+			.order_by(Dispute.created_at.asc(), Dispute.id.asc())
+			.limit(min(limit, MAX_CLAIM))
+			.with_for_update(skip_locked=True)
 		)
+		with stage("disputes.claim", "update"):
+			claimed = list(
+				self.session.scalars(
+					update(Dispute)
+					.where(Dispute.id.in_(picked.scalar_subquery()))
+					.values(claimed_by=moderator, claim_expires_at=now + timedelta(seconds=lease_seconds))
+					.returning(Dispute),
+					execution_options={"synchronize_session": False},
+				)
+			)
+			self.session.commit()
+		return sorted(claimed, key=lambda d: (d.created_at, d.id))
+
+	def release(self, dispute_id: int, moderator: str) -> Dispute:
+		"""Give a claimed dispute back to the queue before its lease expires."""
+		d = self._locked(dispute_id)
+		if d.claimed_by != moderator:
+			raise DisputeClaimedError("Dispute is not claimed by you")
+		d.claimed_by = None
+		d.claim_expires_at = None
+		self.session.commit()
 		return d
 
+	def list_disputes(
+		self,
+		status: Optional[str] = None,
+		opened_by: Optional[str] = None,
+		ledger_entry_id: Optional[int] = None,
+		claimed_by: Optional[str] = None,
+		before_id: Optional[int] = None,
+		limit: int = 50,
+	) -> List[Dispute]:
+		"""Disputes matching every given filter, newest first, `limit` per page.
+
+		Pages are keyset-paginated on id (`before_id` is the last id of the
+		previous page), so every page is an index range scan.
+		"""
+		stmt = select(Dispute)
+		if status is not None:
+			try:
+				stmt = stmt.where(Dispute.status == DisputeStatusEnum(status))
+			except ValueError:
+				raise ValueError(f"Invalid status: {status}")
+		if opened_by is not None:
+			stmt = stmt.where(Dispute.opened_by == opened_by)
+		if ledger_entry_id is not None:
+			stmt = stmt.where(Dispute.ledger_entry_id == ledger_entry_id)
+		if claimed_by is not None:
+			stmt = stmt.where(Dispute.claimed_by == claimed_by)
+		if before_id is not None:
+			stmt = stmt.where(Dispute.id < before_id)
+		with stage("disputes.list", "select"):
+			return list(self.session.scalars(stmt.order_by(Dispute.id.desc()).limit(limit)))
+
 	def resolve(self, dispute_id: int, resolved_by: str, resolution: str, note: str | None) -> Dispute:
-		d = self.session.get(Dispute, dispute_id)
-		if d is None:
-			raise ValueError("Dispute not found")
 		if resolution not in {DisputeStatusEnum.RESOLVED.value, DisputeStatusEnum.REJECTED.value}:
 			raise ValueError("Invalid resolution")
+		with stage("disputes.resolve", "lookup"):
+			d = self._locked(dispute_id)
+		if d.status != DisputeStatusEnum.OPEN:
+			raise ValueError("Dispute is already closed")
+		now = datetime.now(timezone.utc)
+		expires = d.claim_expires_at
+		if expires is not None and expires.tzinfo is None:
+			# SQLite returns naive UTC datetimes
+			expires = expires.replace(tzinfo=timezone.utc)
+		if d.claimed_by not in (None, resolved_by) and expires is not None and expires > now:
+			raise DisputeClaimedError("Dispute is claimed by another moderator")
 		d.status = DisputeStatusEnum(resolution)
 		d.resolution_note = note
 		d.resolved_by = resolved_by
-		d.resolved_at = datetime.now(timezone.utc)
-		self.session.commit()
-		self.session.refresh(d)
-		WebhookClient(settings=self.settings).send_event(
-			"dispute.resolved",
-			{
-				"id": d.id,
-				"status": d.status,
-				"resolved_by": d.resolved_by,
-				"resolved_at": d.resolved_at.isoformat() if d.resolved_at else None,
-			},
-		)
+		d.resolved_at = now
+		with stage("disputes.resolve", "update"):
+			# Every changed column was set above; no refresh needed
+			self.session.commit()
+		with stage("disputes.resolve", "webhook"):
+			WebhookClient(settings=self.settings).send_event(
+				"dispute.resolved",
+				{
+					"id": d.id,
+					"status": d.status,
+					"resolved_by": d.resolved_by,
+					"resolved_at": d.resolved_at.isoformat() if d.resolved_at else None,
+				},
+			)
 		return d
 
-
+	def _locked(self, dispute_id: int) -> Dispute:
+		# Row lock: resolving, releasing and claiming the same dispute serialize
+		d = self.session.execute(select(Dispute).where(Dispute.id == dispute_id).with_for_update()).scalar_one_or_none()
+		if d is None:
+			raise ValueError("Dispute not found")
+		return d
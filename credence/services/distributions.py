@@ -0,0 +1,241 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Optional, Sequence, Tuple
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+
+from ..db import DistributionSketch, TrustScore
+from ..sketches import KLLSketch, NetSketch
+
+METRICS = ("trust", "karma")
+# Domain key of the overall (domain-less) trust and balance
+ALL_DOMAINS = "_all"
+# Buffered values are merged into the stored sketches at most this often per process
+FLUSH_INTERVAL_SECONDS = 30.0
+# Parsed sketches served by `cached_sketch` are at most this old
+READ_CACHE_TTL_SECONDS = 60.0
+# Distinct (metric, domain, day) sketches `cached_sketch` keeps per process
+READ_CACHE_MAX_ENTRIES = 256
+_REBUILD_BATCH = 5000
+
+SketchKey = Tuple[str, str]
+
+
+def domain_key(domain: Optional[str]) -> str:
+	return domain if domain is not None else ALL_DOMAINS
+
+
+def _today() -> date:
+	return datetime.now(timezone.utc).date()
+
+
+class SketchBuffer:
+	"""Per-process value changes recorded since the last flush, one per user.
+
+	Trust recomputes add to it without touching the database. A change
+	carries the user's previous value, which the stored sketch already
+	counts; a user changed several times before a flush keeps the first
+	previous value and the latest value. `drain` hands the changes to
+	`DistributionService.merge`, so each stored row is locked once per flush
+	instead of once per value.
+	"""
+
+	def __init__(self, flush_interval: float = FLUSH_INTERVAL_SECONDS) -> None:
+		self.flush_interval = flush_interval
+		self._values: Dict[SketchKey, Dict[str, Tuple[float, Optional[float]]]] = {}
+		self._lock = threading.Lock()
+		self._last_flush = time.monotonic()
+
+	def add(self, metric: str, domain: Optional[str], user_id: str, value: float, previous: Optional[float] = None) -> None:
+		"""Record `value` for the user, replacing `previous` (None for a user not counted yet)."""
+		key = (metric, domain_key(domain))
+		with self._lock:
+			by_user = self._values.setdefault(key, {})
+			if user_id in by_user:
+				previous = by_user[user_id][1]
+			by_user[user_id] = (value, previous)
+
+	def due(self) -> bool:
+		return bool(self._values) and time.monotonic() - self._last_flush >= self.flush_interval
+
+	def drain(self) -> Dict[SketchKey, NetSketch]:
+		with self._lock:
+			values, self._values = self._values, {}
+			self._last_flush = time.monotonic()
+		sketches: Dict[SketchKey, NetSketch] = {}
+		for key, by_user in values.items():
+			sketch = sketches[key] = NetSketch()
+			for value, previous in by_user.values():
+				sketch.update(value, previous)
+		return sketches
+
+
+@dataclass
+class DistributionService:
+	session: Session
+
+	"""Persist and read per-(metric, domain) quantile sketches, one row per UTC day.
+
+	A day's row is seeded once, from the previous day's row or from the
+	population rebuilt by `rebuild` (the latest trust snapshot of every
+	user), and then absorbs the flushed changes: each one retracts the
+	user's previous value and adds the new one, so every user is counted
+	once. Each row holds two sketches (values added and retracted) of a few
+	hundred values each, whatever the number of users.
+	"""
+
+	def merge(self, sketches: Dict[SketchKey, NetSketch], day: Optional[date] = None) -> int:
+		"""Merge changes into the rows for `day` (default today); returns rows written."""
+		day = day or _today()
+		for (metric, domain), sketch in sorted(sketches.items()):
+			row = self._locked_row(metric, domain, day)
+			stored = _stored(row.sketch, row.retracted)
+			stored.merge(sketch)
+			row.sketch = stored.added.to_bytes()
+			row.retracted = stored.retracted.to_bytes()
+			row.value_count = stored.n
+		self.session.commit()
+		return len(sketches)
+
+	def rebuild(self, day: Optional[date] = None, sources: Optional[Sequence[Session]] = None) -> int:
+		"""Replace the rows for `day` with the latest snapshot of every (user, domain).
+
+		Streams `trust_scores` in batches, from `sources` (the shards) when
+		given; memory stays bounded by the sketch size. Returns the number of
+		snapshots read.
+		"""
+		day = day or _today()
+		latest = (
+			select(
+				TrustScore.domain,
+				TrustScore.trust,
+				TrustScore.karma_balance,
+				func.row_number()
+				.over(
+					partition_by=(TrustScore.user_id, TrustScore.domain),
+					order_by=(TrustScore.computed_at.desc(), TrustScore.id.desc()),
+				)
+				.label("rn"),
+			)
+		).subquery()
+		stmt = select(latest.c.domain, latest.c.trust, latest.c.karma_balance).where(latest.c.rn == 1)
+		sketches: Dict[SketchKey, KLLSketch] = {}
+		read = 0
+		for source in sources or [self.session]:
+			result = source.execute(stmt.execution_options(yield_per=_REBUILD_BATCH))
+			for domain, trust, balance in result:
+				key = domain_key(domain)
+				for metric, value in (("trust", trust), ("karma", balance)):
+					sketch = sketches.get((metric, key))
+					if sketch is None:
+						sketch = sketches[(metric, key)] = KLLSketch()
+					sketch.update(value)
+				read += 1
+			result.close()
+		# Rows are replaced under their lock, so a concurrent flush lands either
+		# before (and is superseded) or after the rebuilt population
+		for (metric, domain), sketch in sorted(sketches.items()):
+			row = self._locked_row(metric, domain, day, seed=False)
+			row.sketch = sketch.to_bytes()
+			row.retracted = None
+			row.value_count = sketch.n
+		stale = delete(DistributionSketch).where(DistributionSketch.day == day)
+		for metric, domain in sketches:
+			stale = stale.where(~((DistributionSketch.metric == metric) & (DistributionSketch.domain == domain)))
+		self.session.execute(stale)
+		self.session.commit()
+		return read
+
+	def prune(self, keep_days: int) -> int:
+		"""Delete rows older than `keep_days` days."""
+		cutoff = _today() - timedelta(days=keep_days)
+		deleted = self.session.execute(delete(DistributionSketch).where(DistributionSketch.day < cutoff)).rowcount
+		self.session.commit()
+		return int(deleted or 0)
+
+	def latest(self, metric: str, domain: Optional[str] = None, day: Optional[date] = None) -> Optional[NetSketch]:
+		"""The sketch of the most recent day on or before `day` (default today)."""
+		row = self.session.execute(
+			select(DistributionSketch.sketch, DistributionSketch.retracted)
+			.where(
+				DistributionSketch.metric == metric,
+				DistributionSketch.domain == domain_key(domain),
+				DistributionSketch.day <= (day or _today()),
+			)
+			.order_by(DistributionSketch.day.desc())
+			.limit(1)
+		).first()
+		return _stored(row[0], row[1]) if row is not None else None
+
+	def _locked_row(self, metric: str, domain: str, day: date, seed: bool = True) -> DistributionSketch:
+		# Rows are read-modify-write: create the row if missing, then lock it so
+		# concurrent flushes from several worker processes do not overwrite each other
+		locked = (
+			select(DistributionSketch)
+			.where(DistributionSketch.metric == metric, DistributionSketch.domain == domain, DistributionSketch.day == day)
+			.with_for_update()
+		)
+		row = self.session.execute(locked).scalar_one_or_none()
+		if row is not None:
+			return row
+		# A new day starts from the previous day's population rather than from
+		# the few users recomputed since midnight
+		previous = self.latest(metric, domain, day - timedelta(days=1)) if seed else None
+		initial = previous if previous is not None else NetSketch()
+		dialect = self.session.get_bind().dialect.name
+		if dialect == "postgresql":
+			from sqlalchemy.dialects.postgresql import insert
+		else:
+			from sqlalchemy.dialects.sqlite import insert
+		self.session.execute(
+			insert(DistributionSketch)
+			.values(
+				metric=metric,
+				domain=domain,
+				day=day,
+				value_count=initial.n,
+				sketch=initial.added.to_bytes(),
+				retracted=initial.retracted.to_bytes(),
+			)
+			.on_conflict_do_nothing()
+		)
+		return self.session.execute(locked).scalar_one()
+
+
+def _stored(sketch: bytes, retracted: Optional[bytes]) -> NetSketch:
+	added = KLLSketch.from_bytes(sketch)
+	return NetSketch(added, KLLSketch.from_bytes(retracted)) if retracted is not None else NetSketch(added)
+
+
+_read_cache: "OrderedDict[Tuple[str, str, date], Tuple[float, Optional[NetSketch]]]" = OrderedDict()
+_read_cache_lock = threading.Lock()
+
+
+def cached_sketch(session: Session, metric: str, domain: Optional[str] = None, day: Optional[date] = None) -> Optional[NetSketch]:
+	"""`DistributionService.latest`, cached per process for READ_CACHE_TTL_SECONDS."""
+	key = (metric, domain_key(domain), day or _today())
+	now = time.monotonic()
+	with _read_cache_lock:
+		hit = _read_cache.get(key)
+	if hit is not None and now - hit[0] < READ_CACHE_TTL_SECONDS:
+		return hit[1]
+	sketch = DistributionService(session=session).latest(metric, domain, key[2])
+	with _read_cache_lock:
+		_read_cache[key] = (now, sketch)
+		_read_cache.move_to_end(key)
+		while len(_read_cache) > READ_CACHE_MAX_ENTRIES:
+			_read_cache.popitem(last=False)
+	return sketch
+
+
+def percentile_of(sketch: Optional[NetSketch], value: float) -> Optional[float]:
+	"""Percentage (0-100) of recorded values <= `value`; None without data."""
+	if sketch is None or sketch.n == 0:
+		return None
+	return round(100.0 * sketch.rank(value), 2)
@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from ..cache import RedisCache, evidence_cache_key
+from ..config import Settings
+from ..db import EntryEvidenceStatus, EvidenceFlag, EvidenceStatusEnum, LedgerEntry, sqlite_begin_immediate
+from ..metrics import record_cache_lookup, stage
+from .evidence_status import EvidenceStatusService
+
+# Pending entries with no outcome and no attempt for this long are re-queued by
+# the sweep (their task was lost); newer ones are most likely still queued
+SWEEP_AFTER = timedelta(minutes=5)
+# Pending entries older than this are left alone
+SWEEP_HORIZON = timedelta(days=7)
+
+
+@dataclass
+class EvidenceValidationService:
+	settings: Settings
+	cache: RedisCache
+	validator: Any
+
+	"""Validate evidence refs through a Redis result cache.
+
+	The same ref (a URL, a document id) is checked once per
+	`evidence_cache_ttl_seconds` whatever the number of entries citing it.
+	Deferred validation records each outcome as an `EvidenceFlag` and in
+	`entry_evidence_status`.
+	"""
+
+	def cached(self, evidence_ref: str) -> Optional[str]:
+		return self.cache.get(evidence_cache_key(evidence_ref))
+
+	def validate(self, evidence_ref: Optional[str]) -> str:
+		"""Status of one ref: cached, or validated now and cached."""
+		if evidence_ref is None:
+			return self.validator.validate(None)
+		status = self.cached(evidence_ref)
+		if status is None:
+			status = self.validator.validate(evidence_ref)
+			self.cache.set(evidence_cache_key(evidence_ref), status, ttl_seconds=self.settings.evidence_cache_ttl_seconds)
+		return status
+
+	def validate_many(self, evidence_refs: Sequence[Optional[str]]) -> Dict[Optional[str], str]:
+		"""Status per distinct ref; cache misses go to the validator in one batch."""
+		refs = list(dict.fromkeys(evidence_refs))
+		keyed = [ref for ref in refs if ref is not None]
+		found = self.cache.client.mget([evidence_cache_key(ref) for ref in keyed]) if keyed else []
+		statuses: Dict[Optional[str], str] = {}
+		for ref, status in zip(keyed, found):
+			record_cache_lookup("evidence", status is not None)
+			if status is not None:
+				statuses[ref] = status
+		misses = [ref for ref in refs if ref not in statuses]
+		if misses:
+			# Validators only need `validate`; `validate_many` is an optional batch path
+			batch = getattr(self.validator, "validate_many", None)
+			with stage("evidence.validate_many", "validator"):
+				results = batch(misses) if batch is not None else [self.validator.validate(ref) for ref in misses]
+			pipe = self.cache.client.pipeline(transaction=False)
+			for ref, status in zip(misses, results):
+				statuses[ref] = status
+				if ref is not None:
+					pipe.setex(evidence_cache_key(ref), self.settings.evidence_cache_ttl_seconds, status)
+			pipe.execute()
+		return statuses
+
+	def complete(self, session: Session, entry_ids: Sequence[int]) -> List[Tuple[str, str, str]]:
+		"""Validate pending entries and record each outcome as an EvidenceFlag.
+
+		Only entries whose current status is still pending are validated
+		(flagged ones were settled by a moderator), and they are re-checked
+		under a row lock before writing: the same entries may be in a re-queued
+		task too, and each gets one flag. Returns `(user_id, domain, status)`
+		per entry settled.
+		"""
+		with stage("evidence.complete", "load"):
+			entries = session.scalars(
+				select(LedgerEntry)
+				.join(EntryEvidenceStatus, EntryEvidenceStatus.ledger_entry_id == LedgerEntry.id)
+				.where(
+					LedgerEntry.id.in_(list(entry_ids)),
+					EntryEvidenceStatus.status == EvidenceStatusEnum.PENDING,
+				)
+			).all()
+		if not entries:
+			return []
+		statuses = self.validate_many([e.evidence_ref for e in entries])
+		with stage("evidence.complete", "insert"):
+			if session.get_bind().dialect.name == "sqlite":
+				sqlite_begin_immediate(session)
+			still_pending = set(
+				session.scalars(
+					select(EntryEvidenceStatus.ledger_entry_id)
+					.where(
+						EntryEvidenceStatus.ledger_entry_id.in_([e.id for e in entries]),
+						EntryEvidenceStatus.status == EvidenceStatusEnum.PENDING,
+					)
+					.with_for_update()
+				)
+			)
+			entries = [e for e in entries if e.id in still_pending]
+			session.add_all(
+				EvidenceFlag(ledger_entry_id=e.id, status=EvidenceStatusEnum(statuses[e.evidence_ref])) for e in entries
+			)
+			projection = EvidenceStatusService(session=session)
+			for status in set(statuses[e.evidence_ref] for e in entries):
+				# Reversals/decay of an entry written while it was pending follow its outcome
+				projection.flag_many(
+					[e for e in entries if statuses[e.evidence_ref] == status], EvidenceStatusEnum(status)
+				)
+			session.commit()
+		return [(e.user_id, e.domain, statuses[e.evidence_ref]) for e in entries]
+
+	def stale_pending(self, session: Session, limit: int) -> List[int]:
+		"""Claim pending entries with no outcome and no attempt for SWEEP_AFTER.
+
+		`updated_at` doubles as the attempt timestamp: claimed rows get a fresh
+		one, so later sweeps leave them to the re-queued task for another
+		SWEEP_AFTER. Rows a concurrent sweep is claiming are skipped. Commits;
+		returns the claimed entry ids.
+		"""
+		now = datetime.now(timezone.utc)
+		ids = list(
+			session.scalars(
+				select(EntryEvidenceStatus.ledger_entry_id)
+				.where(
+					EntryEvidenceStatus.status == EvidenceStatusEnum.PENDING,
+					EntryEvidenceStatus.updated_at < now - SWEEP_AFTER,
+					EntryEvidenceStatus.entry_created_at >= now - SWEEP_HORIZON,
+				)
+				.order_by(EntryEvidenceStatus.ledger_entry_id.asc())
+				.limit(limit)
+				.with_for_update(skip_locked=True)
+			)
+		)
+		if ids:
+			session.execute(
+				update(EntryEvidenceStatus).where(EntryEvidenceStatus.ledger_entry_id.in_(ids)).values(updated_at=now)
+			)
+		session.commit()
+		return ids
@@ -0,0 +1,182 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+
+from ..db import EntryEvidenceStatus, EvidenceFlag, EvidenceStatusEnum, LedgerEntry
+
+_REBUILD_BATCH = 5000
+
+
+@dataclass
+class EvidenceStatusService:
+	session: Session
+
+	"""Maintain and query `entry_evidence_status`, the current status per ledger entry.
+
+	A row exists for every entry written with a non-green status or flagged
+	since; writers call `record` in the transaction that changes the status
+	and commit themselves. Reversal and decay entries follow the status of
+	the entry they derive from, so excluding red entries nets out.
+	"""
+
+	def record(self, entry: LedgerEntry, status: Optional[EvidenceStatusEnum] = None) -> None:
+		"""Set the current status of `entry` (default: the status it was written with)."""
+		self.record_many([entry], status)
+
+	def record_many(self, entries: Iterable[LedgerEntry], status: Optional[EvidenceStatusEnum] = None) -> None:
+		now = datetime.now(timezone.utc)
+		rows = [
+			{
+				"ledger_entry_id": e.id,
+				"user_id": e.user_id,
+				"domain": e.domain,
+				"points": e.points,
+				"status": EvidenceStatusEnum(status or e.evidence_status),
+				"entry_created_at": e.created_at,
+				"updated_at": now,
+			}
+			for e in entries
+		]
+		if not rows:
+			return
+		stmt = self._insert().values(rows)
+		self.session.execute(
+			stmt.on_conflict_do_update(
+				index_elements=[EntryEvidenceStatus.ledger_entry_id],
+				set_={"status": stmt.excluded.status, "updated_at": stmt.excluded.updated_at},
+			)
+		)
+
+	def flag(self, entry: LedgerEntry, status: EvidenceStatusEnum) -> None:
+		"""Set the status of `entry` and of the reversal/decay entries derived from it."""
+		self.flag_many([entry], status)
+
+	def flag_many(self, entries: List[LedgerEntry], status: EvidenceStatusEnum) -> None:
+		"""`flag` for many entries, with one lookup of their derived entries."""
+		if not entries:
+			return
+		derived = self.session.scalars(
+			select(LedgerEntry).where(
+				LedgerEntry.related_entry_id.in_([e.id for e in entries]),
+				# Derived entries are always newer than their original
+				LedgerEntry.created_at >= min(e.created_at for e in entries),
+			)
+		).all()
+		self.record_many([*entries, *derived], status)
+
+	def record_derived(self, entry: LedgerEntry) -> None:
+		"""Record a reversal/decay entry under its original's current status, if not green."""
+		if entry.related_entry_id is None:
+			return
+		current = self.session.get(EntryEvidenceStatus, entry.related_entry_id)
+		status = current.status if current is not None else EvidenceStatusEnum(entry.evidence_status)
+		if status is not EvidenceStatusEnum.GREEN:
+			self.record(entry, status)
+
+	def current(self, entry_id: int) -> Optional[EntryEvidenceStatus]:
+		return self.session.get(EntryEvidenceStatus, entry_id)
+
+	def list_flagged(
+		self,
+		status: Optional[EvidenceStatusEnum] = None,
+		user_id: Optional[str] = None,
+		domain: Optional[str] = None,
+		before_id: Optional[int] = None,
+		limit: int = 50,
+	) -> List[EntryEvidenceStatus]:
+		"""Entries with a non-green current status, newest first (keyset on entry id)."""
+		q = select(EntryEvidenceStatus)
+		if status is not None:
+			q = q.where(EntryEvidenceStatus.status == status)
+		else:
+			q = q.where(EntryEvidenceStatus.status != EvidenceStatusEnum.GREEN)
+		if user_id is not None:
+			q = q.where(EntryEvidenceStatus.user_id == user_id)
+		if domain is not None:
+			q = q.where(EntryEvidenceStatus.domain == domain)
+		if before_id is not None:
+			q = q.where(EntryEvidenceStatus.ledger_entry_id < before_id)
+		q = q.order_by(EntryEvidenceStatus.ledger_entry_id.desc()).limit(limit)
+		return list(self.session.scalars(q))
+
+	def red_points(self, user_id: str, domain: Optional[str] = None, as_of: Optional[datetime] = None) -> int:
+		"""Sum of points of the user's entries whose current status is red.
+
+		With `as_of`, only entries written up to that instant count; the status
+		is still the current one, not the one at `as_of`.
+		"""
+		q = select(func.coalesce(func.sum(EntryEvidenceStatus.points), 0)).where(
+			EntryEvidenceStatus.user_id == user_id,
+			EntryEvidenceStatus.status == EvidenceStatusEnum.RED,
+		)
+		if domain is not None:
+			q = q.where(EntryEvidenceStatus.domain == domain)
+		if as_of is not None:
+			q = q.where(EntryEvidenceStatus.entry_created_at <= as_of)
+		return int(self.session.execute(q).scalar_one())
+
+	def rebuild(self) -> int:
+		"""Recompute the projection from the ledger and the flag history.
+
+		Entries take their latest flag, else their written status; reversal and
+		decay entries then take their original's. Streams the ledger in
+		batches; returns the number of rows written.
+		"""
+		self.session.execute(delete(EntryEvidenceStatus))
+		latest_flag = (
+			select(
+				EvidenceFlag.ledger_entry_id,
+				EvidenceFlag.status,
+				func.row_number()
+				.over(
+					partition_by=EvidenceFlag.ledger_entry_id,
+					order_by=(EvidenceFlag.created_at.desc(), EvidenceFlag.id.desc()),
+				)
+				.label("rn"),
+			)
+		).subquery()
+		flags = select(latest_flag.c.ledger_entry_id, latest_flag.c.status).where(latest_flag.c.rn == 1).subquery()
+		stmt = (
+			select(LedgerEntry, flags.c.status)
+			.outerjoin(flags, flags.c.ledger_entry_id == LedgerEntry.id)
+			.where((LedgerEntry.evidence_status != EvidenceStatusEnum.GREEN) | flags.c.status.is_not(None))
+			.order_by(LedgerEntry.id.asc())
+		)
+		written = self._record_batches(stmt)
+		# Derived entries follow their original
+		originals = (
+			select(EntryEvidenceStatus.ledger_entry_id, EntryEvidenceStatus.status)
+			.where(EntryEvidenceStatus.status != EvidenceStatusEnum.GREEN)
+			.subquery()
+		)
+		derived = select(LedgerEntry, originals.c.status).join(
+			originals, originals.c.ledger_entry_id == LedgerEntry.related_entry_id
+		)
+		self._record_batches(derived)
+		self.session.commit()
+		return written
+
+	def _record_batches(self, stmt: Any) -> int:
+		# One upsert per (batch, status) rather than per entry
+		read = 0
+		for rows in self.session.execute(stmt.execution_options(yield_per=_REBUILD_BATCH)).partitions():
+			by_status: Dict[Optional[EvidenceStatusEnum], List[LedgerEntry]] = {}
+			for entry, status in rows:
+				by_status.setdefault(status, []).append(entry)
+			for status, entries in by_status.items():
+				self.record_many(entries, status)
+			read += len(rows)
+		return read
+
+	def _insert(self) -> Any:
+		dialect = self.session.get_bind().dialect.name
+		if dialect == "postgresql":
+			from sqlalchemy.dialects.postgresql import insert
+		else:
+			from sqlalchemy.dialects.sqlite import insert
+		return insert(EntryEvidenceStatus)
@@ -0,0 +1,297 @@
+from __future__ import annotations
+
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import func, text
+from sqlalchemy.orm import Session, sessionmaker
+
+from ..config import Settings
+from ..db import LedgerEntry, LedgerSegment, create_session_factory, sqlite_begin_immediate
+from ..integrity import (
+	entry_digest,
+	leaf_hash,
+	merkle_proof,
+	merkle_root,
+	segment_chain_hash,
+)
+
+# Entries younger than this are not sealed yet, so that rows whose ids were
+# allocated but not committed when a segment is built are not left out.
+SEAL_LAG = timedelta(minutes=1)
+# Held by bulk imports for their whole run: imported rows are back-dated, so
+# SEAL_LAG does not keep their id range open while parallel chunks commit
+SEAL_LOCK_SQL = "hashtext('credence.seal')"
+_RESEAL_BATCH = 100
+
+_HASHED_COLUMNS = (
+	LedgerEntry.id,
+	LedgerEntry.user_id,
+	LedgerEntry.domain,
+	LedgerEntry.action,
+	LedgerEntry.points,
+	LedgerEntry.evidence_ref,
+	LedgerEntry.evidence_status,
+	LedgerEntry.related_entry_id,
+	LedgerEntry.meta,
+	LedgerEntry.created_at,
+	LedgerEntry.prev_hash,
+	LedgerEntry.entry_hash,
+)
+
+
+@dataclass
+class InclusionProof:
+	entry_id: int
+	entry_hash: str
+	segment_index: int
+	leaf_index: int
+	leaf_count: int
+	segment_root: str
+	chain_hash: str
+	path: List[Tuple[str, str]]
+
+
+@dataclass
+class IntegrityService:
+	session: Session
+	segment_size: int = 1024
+
+	"""Hash-chain ledger appends and seal Merkle segments for inclusion proofs."""
+
+	def chain(self, entry: LedgerEntry) -> LedgerEntry:
+		"""Stamp a new entry with `prev_hash`/`entry_hash` before it is added.
+
+		Each user has their own chain. On PostgreSQL a transaction-scoped
+		advisory lock serializes appends to the same chain until the caller
+		commits; other users are not affected. SQLite has a single writer, so
+		there the database write lock is taken instead. Links follow id order:
+		ids are allocated at the insert, under the lock, whereas `created_at`
+		comes from the writer's clock, which can lag another host's.
+		"""
+		dialect = self.session.get_bind().dialect.name
+		if dialect == "postgresql":
+			self.session.execute(
+				text("SELECT pg_advisory_xact_lock(hashtextextended(:user_id, 0))"),
+				{"user_id": entry.user_id},
+			)
+		elif dialect == "sqlite":
+			sqlite_begin_immediate(self.session)
+		if entry.created_at is None:
+			entry.created_at = datetime.now(timezone.utc)
+		prev_hash = (
+			self.session.query(LedgerEntry.entry_hash)
+			.filter(LedgerEntry.user_id == entry.user_id, LedgerEntry.entry_hash.isnot(None))
+			.order_by(LedgerEntry.id.desc())
+			.limit(1)
+			.scalar()
+		)
+		entry.prev_hash = prev_hash
+		entry.entry_hash = entry_digest(prev_hash, entry)
+		return entry
+
+	def seal_segments(self, max_segments: int = 100) -> int:
+		"""Seal consecutive id ranges of `segment_size` entries into Merkle roots.
+
+		Only ranges entirely older than `SEAL_LAG` are sealed, and nothing is
+		sealed while a bulk import holds the seal lock. Returns the number of
+		segments written.
+		"""
+		if self.session.get_bind().dialect.name == "postgresql":
+			# Ids allocated after this check are above `settled_max`, so releasing
+			# the lock at the first segment's commit does not matter
+			if not self.session.execute(text(f"SELECT pg_try_advisory_xact_lock({SEAL_LOCK_SQL})")).scalar():
+				return 0
+		last = self.session.query(LedgerSegment).order_by(LedgerSegment.segment_index.desc()).first()
+		next_index = last.segment_index + 1 if last else 0
+		first_id = last.last_id + 1 if last else 1
+		prev_chain = last.chain_hash if last else None
+		settled_max = (
+			self.session.query(func.max(LedgerEntry.id))
+			.filter(LedgerEntry.created_at <= datetime.now(timezone.utc) - SEAL_LAG)
+			.scalar()
+		)
+		sealed = 0
+		while sealed < max_segments:
+			last_id = first_id + self.segment_size - 1
+			if settled_max is None or settled_max <= last_id:
+				break
+			leaves = [leaf_hash(row) for row in self._segment_rows(first_id, last_id)]
+			root = merkle_root(leaves)
+			chain_hash = segment_chain_hash(prev_chain, root)
+			self.session.add(
+				LedgerSegment(
+					segment_index=next_index,
+					first_id=first_id,
+					last_id=last_id,
+					leaf_count=len(leaves),
+					root=root,
+					chain_hash=chain_hash,
+				)
+			)
+			self.session.commit()
+			sealed += 1
+			next_index += 1
+			first_id = last_id + 1
+			prev_chain = chain_hash
+		return sealed
+
+	def reseal(self, from_id: int) -> int:
+		"""Seal again every segment from the one holding entry `from_id` on.
+
+		For entries added or removed below the sealed range, which only
+		resharding does (entries move between databases with their ids). Later
+		segments chain to the replaced ones, so they are replaced too, and
+		proofs handed out for them stop verifying. Returns the number of
+		segments sealed.
+		"""
+		if self.session.get_bind().dialect.name == "postgresql":
+			self.session.execute(text(f"SELECT pg_advisory_xact_lock({SEAL_LOCK_SQL})"))
+		self.session.query(LedgerSegment).filter(LedgerSegment.last_id >= from_id).delete(synchronize_session=False)
+		self.session.commit()
+		sealed = 0
+		while True:
+			batch = self.seal_segments(max_segments=_RESEAL_BATCH)
+			sealed += batch
+			if batch < _RESEAL_BATCH:
+				return sealed
+
+	def inclusion_proof(self, entry_id: int) -> InclusionProof:
+		"""Merkle audit path from an entry to its sealed segment root."""
+		segment = (
+			self.session.query(LedgerSegment)
+			.filter(LedgerSegment.first_id <= entry_id, LedgerSegment.last_id >= entry_id)
+			.one_or_none()
+		)
+		if segment is None:
+			if self.session.get(LedgerEntry, entry_id) is None:
+				raise ValueError("Ledger entry not found")
+			raise ValueError("Ledger entry is not sealed into a segment yet")
+		ids, leaves = self._segment_leaves(segment.first_id, segment.last_id)
+		if entry_id not in ids:
+			raise ValueError("Ledger entry not found")
+		index = ids.index(entry_id)
+		return InclusionProof(
+			entry_id=entry_id,
+			entry_hash=leaves[index],
+			segment_index=segment.segment_index,
+			leaf_index=index,
+			leaf_count=len(leaves),
+			segment_root=segment.root,
+			chain_hash=segment.chain_hash,
+			path=merkle_proof(leaves, index),
+		)
+
+	def verify_segment(self, segment_index: int, prev_chain_hash: Optional[str]) -> List[str]:
+		"""Recompute one sealed segment from the ledger; returns problems found."""
+		segment = self.session.get(LedgerSegment, segment_index)
+		if segment is None:
+			return [f"segment {segment_index}: missing"]
+		problems: List[str] = []
+		rows = self._segment_rows(segment.first_id, segment.last_id)
+		for row in rows:
+			if row.entry_hash is not None and entry_digest(row.prev_hash, row) != row.entry_hash:
+				problems.append(f"segment {segment_index}: entry {row.id} hash mismatch")
+		problems.extend(self._chain_problems(segment_index, rows))
+		root = merkle_root([leaf_hash(row) for row in rows])
+		if root != segment.root or len(rows) != segment.leaf_count:
+			problems.append(f"segment {segment_index}: root mismatch")
+		if segment_chain_hash(prev_chain_hash, segment.root) != segment.chain_hash:
+			problems.append(f"segment {segment_index}: chain hash mismatch")
+		return problems
+
+	def _chain_problems(self, segment_index: int, rows: Sequence[Any]) -> List[str]:
+		"""Check each chained row links to the previous entry of its user's chain.
+
+		Segment rows come in id order, which is chain order; the first link of
+		each user is checked against the predecessor read from the ledger,
+		which may sit in an earlier segment.
+		"""
+		problems: List[str] = []
+		by_user: Dict[str, List[Any]] = {}
+		for row in rows:
+			if row.entry_hash is not None:
+				by_user.setdefault(row.user_id, []).append(row)
+		for user_id, chain in by_user.items():
+			expected = (
+				self.session.query(LedgerEntry.entry_hash)
+				.filter(LedgerEntry.user_id == user_id, LedgerEntry.entry_hash.isnot(None), LedgerEntry.id < chain[0].id)
+				.order_by(LedgerEntry.id.desc())
+				.limit(1)
+				.scalar()
+			)
+			for row in chain:
+				if row.prev_hash != expected:
+					problems.append(f"segment {segment_index}: entry {row.id} prev_hash does not link to its chain")
+				expected = row.entry_hash
+		return problems
+
+	def _segment_leaves(self, first_id: int, last_id: int) -> Tuple[List[int], List[str]]:
+		"""Ids and leaf hashes of a segment; only pre-chaining rows are read in full."""
+		rows = (
+			self.session.query(LedgerEntry.id, LedgerEntry.entry_hash)
+			.filter(LedgerEntry.id >= first_id, LedgerEntry.id <= last_id)
+			.order_by(LedgerEntry.id.asc())
+			.all()
+		)
+		unchained = [row.id for row in rows if row.entry_hash is None]
+		legacy: Dict[int, str] = {}
+		for i in range(0, len(unchained), 500):
+			batch = (
+				self.session.query(*_HASHED_COLUMNS).filter(LedgerEntry.id.in_(unchained[i : i + 500])).all()
+			)
+			legacy.update((row.id, leaf_hash(row)) for row in batch)
+		return [row.id for row in rows], [row.entry_hash or legacy[row.id] for row in rows]
+
+	def _segment_rows(self, first_id: int, last_id: int) -> Sequence[Any]:
+		return (
+			self.session.query(*_HASHED_COLUMNS)
+			.filter(LedgerEntry.id >= first_id, LedgerEntry.id <= last_id)
+			.order_by(LedgerEntry.id.asc())
+			.all()
+		)
+
+
+_verifier_factory: Optional[sessionmaker[Session]] = None
+
+
+def _init_verifier(url: Optional[str] = None) -> None:
+	global _verifier_factory
+	_verifier_factory = create_session_factory(Settings.from_env_and_file(), url=url)
+
+
+def _verify_one(args: Tuple[int, Optional[str]]) -> List[str]:
+	assert _verifier_factory is not None
+	session = _verifier_factory()
+	try:
+		return IntegrityService(session=session).verify_segment(*args)
+	finally:
+		session.close()
+
+
+def verify_ledger(settings: Settings, workers: int = 4, url: Optional[str] = None) -> Tuple[int, List[str]]:
+	"""Verify every sealed segment, `workers` segments at a time in parallel.
+
+	Segments are independent given the previous segment's stored chain hash, so
+	they are checked in separate processes. `url` selects a shard (each shard
+	seals its own chain). Returns (segments_checked, problems).
+	"""
+	session = create_session_factory(settings, url=url)()
+	try:
+		chain = session.query(LedgerSegment.segment_index, LedgerSegment.chain_hash).order_by(
+			LedgerSegment.segment_index.asc()
+		).all()
+	finally:
+		session.close()
+	jobs: List[Tuple[int, Optional[str]]] = []
+	prev: Optional[str] = None
+	for index, chain_hash in chain:
+		jobs.append((index, prev))
+		prev = chain_hash
+	problems: List[str] = []
+	with ProcessPoolExecutor(max_workers=max(1, workers), initializer=_init_verifier, initargs=(url,)) as pool:
+		for found in pool.map(_verify_one, jobs, chunksize=16):
+			problems.extend(found)
+	return len(jobs), problems
@@ -10,9 +10,15 @@ from sqlalchemy.orm import Session
 from ..config import DomainActionConfig, Settings
 from ..db import EvidenceStatusEnum, IdempotencyKey, LedgerEntry, EvidenceFlag
 from ..plugins import load_symbol
-from ..cache import RedisCache, balance_cache_key
+from ..cache import RedisCache, balance_cache_key, trust_cache_key
+from ..metrics import instrument_plugin, stage
 from . import WebhookClient
-from ..worker import recompute_trust_task
+from .evidence import EvidenceValidationService
+from .evidence_status import EvidenceStatusService
+from .integrity import IntegrityService
+from .rank_index import RankIndex
+from ..sharding import user_shard
+from ..tasks import enqueue
 
 
 @dataclass
@@ -42,9 +48,20 @@ class KarmaService:
 		if cfg.requires_evidence and not evidence_ref:
 			raise ValueError("Evidence is required for this action")
 
-		validator_cls = load_symbol(self.settings.plugins.evidence_validator)
-		validator = validator_cls()  # type: ignore[call-arg]
-		evidence_status = validator.validate(evidence_ref)
+		validator_path = self.settings.plugins.evidence_validator
+		validator = instrument_plugin(validator_path, load_symbol(validator_path)())  # type: ignore[call-arg]
+		evidence = EvidenceValidationService(
+			settings=self.settings, cache=RedisCache.from_settings(self.settings), validator=validator
+		)
+		deferred = False
+		with stage("karma.award", "validate_evidence"):
+			if self.settings.evidence_validation_mode == "async" and evidence_ref is not None:
+				# Only cached results are used inline; the rest is validated by the worker
+				cached = evidence.cached(evidence_ref)
+				deferred = cached is None
+				evidence_status = EvidenceStatusEnum.PENDING.value if deferred else cached
+			else:
+				evidence_status = evidence.validate(evidence_ref)
 
 		if cfg.max_per_day is not None:
 			start = datetime.now(timezone.utc) - timedelta(days=1)
@@ -59,16 +76,19 @@ class KarmaService:
 					)
 				)
 			)
-			if int(count_q.scalar_one()) >= cfg.max_per_day:
+			with stage("karma.award", "daily_limit"):
+				count = int(count_q.scalar())
+			if count >= cfg.max_per_day:
 				raise ValueError("Daily limit reached for this action")
 
 		# idempotency
 		if idempotency_key:
-			existing = (
-				self.session.query(IdempotencyKey)
-				.filter(IdempotencyKey.key == idempotency_key)
-				.one_or_none()
-			)
+			with stage("karma.award", "idempotency_lookup"):
+				existing = (
+					self.session.query(IdempotencyKey)
+					.filter(IdempotencyKey.key == idempotency_key)
+					.one_or_none()
+				)
 			if existing and existing.ledger_entry_id:
 				entry_existing = self.session.get(LedgerEntry, existing.ledger_entry_id)
 				if entry_existing:
@@ -83,9 +103,16 @@ class KarmaService:
 			evidence_status=evidence_status,
 			meta=meta,
 		)
-		self.session.add(entry)
-		self.session.commit()
-		self.session.refresh(entry)
+		with stage("karma.award", "chain"):
+			IntegrityService(session=self.session).chain(entry)
+		with stage("karma.award", "insert"):
+			self.session.add(entry)
+			if EvidenceStatusEnum(evidence_status) is not EvidenceStatusEnum.GREEN:
+				# Same transaction as the entry: the projection never misses one
+				self.session.flush()
+				EvidenceStatusService(session=self.session).record(entry)
+			self.session.commit()
+			self.session.refresh(entry)
 
 		# upsert idempotency key -> ledger id
 		if idempotency_key:
@@ -96,32 +123,42 @@ class KarmaService:
 				action=action,
 				ledger_entry_id=entry.id,
 			)
-			self.session.add(idem)
-			self.session.commit()
+			with stage("karma.award", "idempotency_store"):
+				self.session.add(idem)
+				self.session.commit()
 
 		# invalidate cached balances
-		cache = RedisCache.from_settings(self.settings)
-		cache.delete(
-			balance_cache_key(user_id, None),
-			balance_cache_key(user_id, domain),
-		)
+		with stage("karma.award", "cache_invalidate"):
+			cache = evidence.cache
+			cache.delete(
+				balance_cache_key(user_id, None),
+				balance_cache_key(user_id, domain),
+			)
+
+		# keep the rank index current
+		with stage("karma.award", "rank_index"):
+			RankIndex(client=cache.client).record(user_id, domain, entry.points, entry.created_at)
 
-		# async recompute trust
-		recompute_trust_task.delay(user_id)
+		# async recompute trust (and evidence validation when deferred)
+		with stage("karma.award", "enqueue"):
+			enqueue("credence.tasks.recompute_trust", user_id)
+			if deferred:
+				enqueue("credence.tasks.validate_evidence", [entry.id], user_shard(self.settings, user_id))
 
 		# webhook
-		WebhookClient(settings=self.settings).send_event(
-			"ledger.entry.created",
-			{
-				"id": entry.id,
-				"user_id": entry.user_id,
-				"domain": entry.domain,
-				"action": entry.action,
-				"points": entry.points,
-				"evidence_ref": entry.evidence_ref,
-				"created_at": entry.created_at.isoformat(),
-			},
-		)
+		with stage("karma.award", "webhook"):
+			WebhookClient(settings=self.settings).send_event(
+				"ledger.entry.created",
+				{
+					"id": entry.id,
+					"user_id": entry.user_id,
+					"domain": entry.domain,
+					"action": entry.action,
+					"points": entry.points,
+					"evidence_ref": entry.evidence_ref,
+					"created_at": entry.created_at.isoformat(),
+				},
+			)
 		return entry
 
 	def reverse(self, user_id: str, original_entry_id: int) -> LedgerEntry:
@@ -141,26 +178,40 @@ class KarmaService:
 			evidence_ref=orig.evidence_ref,
 			evidence_status=orig.evidence_status,
 		)
-		self.session.add(reversal)
-		self.session.commit()
-		self.session.refresh(reversal)
-
-		WebhookClient(settings=self.settings).send_event(
-			"ledger.entry.reversed",
-			{
-				"id": reversal.id,
-				"user_id": reversal.user_id,
-				"domain": reversal.domain,
-				"action": reversal.action,
-				"points": reversal.points,
-				"related_entry_id": reversal.related_entry_id,
-				"created_at": reversal.created_at.isoformat(),
-			},
-		)
+		with stage("karma.reverse", "chain"):
+			IntegrityService(session=self.session).chain(reversal)
+		with stage("karma.reverse", "insert"):
+			self.session.add(reversal)
+			self.session.flush()
+			EvidenceStatusService(session=self.session).record_derived(reversal)
+			self.session.commit()
+			self.session.refresh(reversal)
+
+		with stage("karma.reverse", "rank_index"):
+			cache = RedisCache.from_settings(self.settings)
+			RankIndex(client=cache.client).record(user_id, reversal.domain, reversal.points, reversal.created_at)
+
+		with stage("karma.reverse", "webhook"):
+			WebhookClient(settings=self.settings).send_event(
+				"ledger.entry.reversed",
+				{
+					"id": reversal.id,
+					"user_id": reversal.user_id,
+					"domain": reversal.domain,
+					"action": reversal.action,
+					"points": reversal.points,
+					"related_entry_id": reversal.related_entry_id,
+					"created_at": reversal.created_at.isoformat(),
+				},
+			)
 		return reversal
 
 	def flag_evidence(self, entry_id: int, status: str) -> EvidenceFlag:
-		"""Record an append-only evidence flag event for an entry."""
+		"""Record an append-only evidence flag event for an entry.
+
+		The entry's current status (and that of its reversal/decay entries) is
+		updated in `entry_evidence_status` in the same transaction.
+		"""
 		if status not in {EvidenceStatusEnum.YELLOW, EvidenceStatusEnum.RED}:
 			raise ValueError("Invalid flag status")
 		entry = self.session.get(LedgerEntry, entry_id)
@@ -168,18 +219,32 @@ class KarmaService:
 			raise ValueError("Entry not found")
 		# Append-only flag record (do not update ledger_entries to keep append-only contract)
 		flag = EvidenceFlag(ledger_entry_id=entry.id, status=status)
-		self.session.add(flag)
-		self.session.commit()
-		self.session.refresh(flag)
-		WebhookClient(settings=self.settings).send_event(
-			"ledger.evidence.flagged",
-			{
-				"id": flag.id,
-				"ledger_entry_id": flag.ledger_entry_id,
-				"status": flag.status,
-				"created_at": flag.created_at.isoformat(),
-			},
-		)
+		with stage("karma.flag", "insert"):
+			self.session.add(flag)
+			EvidenceStatusService(session=self.session).flag(entry, EvidenceStatusEnum(status))
+			self.session.commit()
+			self.session.refresh(flag)
+
+		# Balances and trust may exclude red entries
+		with stage("karma.flag", "cache_invalidate"):
+			RedisCache.from_settings(self.settings).delete(
+				balance_cache_key(entry.user_id, None),
+				balance_cache_key(entry.user_id, entry.domain),
+				trust_cache_key(entry.user_id, None),
+				trust_cache_key(entry.user_id, entry.domain),
+			)
+		with stage("karma.flag", "enqueue"):
+			enqueue("credence.tasks.recompute_trust", entry.user_id)
+		with stage("karma.flag", "webhook"):
+			WebhookClient(settings=self.settings).send_event(
+				"ledger.evidence.flagged",
+				{
+					"id": flag.id,
+					"ledger_entry_id": flag.ledger_entry_id,
+					"status": flag.status,
+					"created_at": flag.created_at.isoformat(),
+				},
+			)
 		return flag
 
 
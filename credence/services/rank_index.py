@@ -0,0 +1,272 @@
+from __future__ import annotations
+
+import logging
+import uuid
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Any, Dict, Iterable, Optional
+
+import redis
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from ..db import KarmaRollupDaily, LedgerEntry
+from ..metrics import RANK_INDEX_ERRORS
+from ..sharding import ShardRouter
+from .rollups import RollupService
+
+# Windows are whole UTC days counting today; daily buckets older than this expire
+MAX_WINDOW_DAYS = 90
+# Windows kept current by every write; others are unions of daily buckets
+ROLLING_WINDOWS = (7, 30, 90)
+# Unions backing other windows are recomputed at most this often, by one
+# process at a time; the previous union is served meanwhile
+WINDOW_TTL_SECONDS = 60
+WINDOW_STALE_SECONDS = 600
+KEY_PREFIX = "rank"
+_ALL_DOMAINS = "_all"
+_BATCH = 5000
+
+logger = logging.getLogger(__name__)
+
+
+def _domain_key(domain: Optional[str]) -> str:
+	return domain if domain is not None else _ALL_DOMAINS
+
+
+def _utc_day(ts: datetime) -> date:
+	# SQLite hands back naive datetimes, stored as UTC
+	return (ts if ts.tzinfo is None else ts.astimezone(timezone.utc)).date()
+
+
+def _today() -> date:
+	return datetime.now(timezone.utc).date()
+
+
+def _oldest_day() -> date:
+	return _today() - timedelta(days=MAX_WINDOW_DAYS)
+
+
+def _midnight(day: date) -> datetime:
+	return datetime.combine(day, time.min, timezone.utc)
+
+
+@dataclass
+class RankIndex:
+	"""Order-statistic index of karma per user in Redis sorted sets.
+
+	Per domain (and `_all`) there is one all-time set, one set per UTC day
+	and one set per `ROLLING_WINDOWS` length and day; every ledger write
+	increments each of them its entry falls in. Rank, score and neighbors are
+	O(log n) lookups. A rolling window is carried over to the next day once,
+	at the day's first lookup, by subtracting the day that left it from the
+	previous day's window; `since_days=1` is the day's own set, and other
+	lengths are served from a union of daily sets, cached for
+	WINDOW_TTL_SECONDS.
+	"""
+
+	client: redis.Redis
+	prefix: str = KEY_PREFIX
+
+	def all_time_key(self, domain: Optional[str]) -> str:
+		return f"{self.prefix}:{_domain_key(domain)}:all"
+
+	def day_key(self, domain: Optional[str], day: date) -> str:
+		return f"{self.prefix}:{_domain_key(domain)}:day:{day.isoformat()}"
+
+	def window_key(self, domain: Optional[str], since_days: int) -> str:
+		return f"{self.prefix}:{_domain_key(domain)}:win:{since_days}"
+
+	def rolling_key(self, domain: Optional[str], since_days: int, day: date) -> str:
+		"""The `since_days` window ending on `day`."""
+		return f"{self.prefix}:{_domain_key(domain)}:roll:{since_days}:{day.isoformat()}"
+
+	def record(self, user_id: str, domain: str, points: int, created_at: datetime) -> bool:
+		"""Add one ledger entry's points to the user's all-time and daily scores.
+
+		Called once the entry is committed, so a Redis error does not fail the
+		write: it is logged and counted in `credence_rank_index_errors_total`
+		(`credence rebuild-rank-index` repairs the drift), and False returned.
+		"""
+		try:
+			self.record_many([(user_id, domain, points, created_at)])
+		except redis.RedisError:
+			RANK_INDEX_ERRORS.inc()
+			logger.warning("rank index not updated for %s (%s)", user_id, domain, exc_info=True)
+			return False
+		return True
+
+	def record_many(self, entries: Iterable[Any]) -> None:
+		"""Like `record` for many `(user_id, domain, points, created_at)` tuples, pipelined."""
+		today = _today()
+		oldest = _oldest_day()
+		pipe = self.client.pipeline(transaction=False)
+		for i, (user_id, domain, points, created_at) in enumerate(entries, 1):
+			day = _utc_day(created_at)
+			for d in (domain, None):
+				pipe.zincrby(self.all_time_key(d), points, user_id)
+				if day > oldest:
+					self._add_to_day(pipe, d, day, user_id, points)
+				for since_days in ROLLING_WINDOWS:
+					if day > today - timedelta(days=since_days):
+						key = self.rolling_key(d, since_days, today)
+						pipe.zincrby(key, points, user_id)
+						# Tomorrow's window is carried over from it
+						pipe.expireat(key, _midnight(today + timedelta(days=2)))
+			if i % _BATCH == 0:
+				pipe.execute()
+		pipe.execute()
+
+	def lookup(
+		self, user_id: str, domain: Optional[str] = None, since_days: Optional[int] = None, neighbors: int = 5
+	) -> Optional[Dict[str, Any]]:
+		"""Rank (1 = most points), score, percentile and neighbors; None if the user has no score."""
+		key = self.all_time_key(domain) if since_days is None else self._window(domain, since_days)
+		pipe = self.client.pipeline(transaction=False)
+		pipe.zscore(key, user_id)
+		pipe.zrevrank(key, user_id)
+		pipe.zcard(key)
+		score, position, total = pipe.execute()
+		if score is None or position is None:
+			return None
+		pipe = self.client.pipeline(transaction=False)
+		pipe.zcount(key, "-inf", score)
+		pipe.zrevrange(key, max(0, position - neighbors), position + neighbors, withscores=True)
+		at_or_below, around = pipe.execute()
+		start = max(0, position - neighbors)
+		ranked = [
+			{"rank": start + i + 1, "user_id": member, "points": int(points)} for i, (member, points) in enumerate(around)
+		]
+		return {
+			"rank": position + 1,
+			"points": int(score),
+			"total": int(total),
+			"percentile": round(100.0 * at_or_below / total, 2) if total else None,
+			"above": [item for item in ranked if item["rank"] <= position],
+			"below": [item for item in ranked if item["rank"] > position + 1],
+		}
+
+	def rebuild(self, shards: ShardRouter) -> int:
+		"""Rebuild every set from the shards' daily rollups plus entries newer than each rollup watermark.
+
+		Shards are loaded in parallel under a temporary prefix, which is
+		renamed over the live keys at the end; live keys with no rebuilt
+		counterpart are deleted. Writes landing while the rebuild runs can be
+		lost, so run it when the ledger is quiet (e.g. right after an import).
+		Returns the number of keys written.
+		"""
+		build = RankIndex(client=self.client, prefix=f"{self.prefix}-build-{uuid.uuid4().hex}")
+		shards.scatter(build._load)
+
+		written = 0
+		live = set(self.client.scan_iter(match=f"{self.prefix}:*", count=1000))
+		pipe = self.client.pipeline(transaction=False)
+		for key in self.client.scan_iter(match=f"{build.prefix}:*", count=1000):
+			target = self.prefix + key[len(build.prefix) :]
+			pipe.rename(key, target)
+			live.discard(target)
+			written += 1
+		if live:
+			pipe.delete(*live)
+		pipe.execute()
+		return written
+
+	def _window(self, domain: Optional[str], since_days: int) -> str:
+		if not 1 <= since_days <= MAX_WINDOW_DAYS:
+			raise ValueError(f"since_days must be between 1 and {MAX_WINDOW_DAYS}")
+		today = _today()
+		if since_days == 1:
+			return self.day_key(domain, today)
+		if since_days in ROLLING_WINDOWS:
+			return self._rolling(domain, since_days, today)
+		key = self.window_key(domain, since_days)
+		if self.client.exists(f"{key}:fresh"):
+			return key
+		# One process rebuilds the union, the others serve the stale one; with
+		# none yet (a cold start) they build their own
+		if not self.client.set(f"{key}:lock", 1, nx=True, ex=WINDOW_TTL_SECONDS) and self.client.exists(key):
+			return key
+		days = [self.day_key(domain, today - timedelta(days=i)) for i in range(since_days)]
+		# Built under a private name, then swapped in atomically
+		tmp = f"{key}:{uuid.uuid4().hex}"
+		pipe = self.client.pipeline(transaction=False)
+		pipe.zunionstore(tmp, days)
+		pipe.expire(tmp, WINDOW_STALE_SECONDS)
+		pipe.execute()
+		try:
+			self.client.rename(tmp, key)
+		except redis.ResponseError:
+			# Every daily set was empty, so the union was not created
+			self.client.delete(key)
+		pipe = self.client.pipeline(transaction=False)
+		pipe.set(f"{key}:fresh", 1, ex=WINDOW_TTL_SECONDS)
+		pipe.delete(f"{key}:lock")
+		pipe.execute()
+		return key
+
+	def _rolling(self, domain: Optional[str], since_days: int, today: date) -> str:
+		key = self.rolling_key(domain, since_days, today)
+		ready = f"{key}:ready"
+		if self.client.exists(ready):
+			return key
+		previous = self.rolling_key(domain, since_days, today - timedelta(days=1))
+		if not self.client.set(f"{key}:lock", 1, nx=True, ex=WINDOW_TTL_SECONDS):
+			# Another process is carrying the window over; yesterday's is close
+			return previous if self.client.exists(f"{previous}:ready") else key
+		if self.client.exists(f"{previous}:ready"):
+			# `key` holds what was written since midnight, `previous` the rest
+			# up to yesterday, including the day now leaving the window
+			sources = {key: 1, previous: 1, self.day_key(domain, today - timedelta(days=since_days)): -1}
+		else:
+			# First lookup after a gap or a rebuild: from the daily sets, which
+			# also hold everything written to `key` so far
+			sources = {self.day_key(domain, today - timedelta(days=i)): 1 for i in range(since_days)}
+		expires = _midnight(today + timedelta(days=2))
+		pipe = self.client.pipeline()
+		pipe.zunionstore(key, sources)
+		# Users whose points all left the window
+		pipe.zremrangebyscore(key, 0, 0)
+		pipe.expireat(key, expires)
+		pipe.set(ready, 1)
+		pipe.expireat(ready, expires)
+		pipe.delete(f"{key}:lock")
+		pipe.execute()
+		return key
+
+	def _load(self, session: Session) -> None:
+		watermark = RollupService(session=session).watermark()
+		if watermark is not None:
+			self._load_rollups(session)
+		tail = select(LedgerEntry.user_id, LedgerEntry.domain, LedgerEntry.points, LedgerEntry.created_at)
+		if watermark is not None:
+			tail = tail.where(LedgerEntry.created_at > watermark)
+		self.record_many(session.execute(tail.execution_options(yield_per=_BATCH)))
+
+	def _load_rollups(self, session: Session) -> None:
+		totals = select(KarmaRollupDaily.user_id, KarmaRollupDaily.domain, func.sum(KarmaRollupDaily.points)).group_by(
+			KarmaRollupDaily.user_id, KarmaRollupDaily.domain
+		)
+		pipe = self.client.pipeline(transaction=False)
+		for i, (user_id, domain, points) in enumerate(session.execute(totals.execution_options(yield_per=_BATCH)), 1):
+			pipe.zincrby(self.all_time_key(domain), int(points), user_id)
+			pipe.zincrby(self.all_time_key(None), int(points), user_id)
+			if i % _BATCH == 0:
+				pipe.execute()
+		pipe.execute()
+		oldest = _oldest_day()
+		days = select(KarmaRollupDaily.bucket, KarmaRollupDaily.user_id, KarmaRollupDaily.domain, KarmaRollupDaily.points).where(
+			KarmaRollupDaily.bucket >= _midnight(oldest + timedelta(days=1))
+		)
+		for i, (bucket, user_id, domain, points) in enumerate(session.execute(days.execution_options(yield_per=_BATCH)), 1):
+			day = _utc_day(bucket)
+			for d in (domain, None):
+				self._add_to_day(pipe, d, day, user_id, int(points))
+			if i % _BATCH == 0:
+				pipe.execute()
+		pipe.execute()
+
+	def _add_to_day(self, pipe: Any, domain: Optional[str], day: date, user_id: str, points: int) -> None:
+		key = self.day_key(domain, day)
+		pipe.zincrby(key, points, user_id)
+		# Kept until no window can reach the day any more
+		pipe.expireat(key, _midnight(day + timedelta(days=MAX_WINDOW_DAYS + 1)))
@@ -0,0 +1,203 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Type, TypeVar
+
+from sqlalchemy import delete, select, text, tuple_, union
+from sqlalchemy.orm import Session, sessionmaker
+
+from ..db import (
+	BalanceCheckpoint,
+	CurrentVerification,
+	EntryEvidenceStatus,
+	EvidenceFlag,
+	IdempotencyKey,
+	LedgerEntry,
+	TrustScore,
+	Verification,
+)
+from ..sharding import shard_for_user
+from .integrity import IntegrityService
+from .rollups import RollupService
+
+# Tables holding a user's rows, copied in this order; evidence flags carry no
+# user id and follow the user's entries. Rollups are rebuilt rather than
+# copied, since each shard folds entries from its own watermark.
+USER_TABLES: Tuple[Type[Any], ...] = (
+	LedgerEntry,
+	Verification,
+	CurrentVerification,
+	TrustScore,
+	IdempotencyKey,
+	BalanceCheckpoint,
+	EntryEvidenceStatus,
+)
+DEFAULT_BATCH_USERS = 100
+# Rows per INSERT and keys per IN list
+_CHUNK = 1000
+
+T = TypeVar("T")
+
+
+def _insert(session: Session, model: Type[Any]) -> Any:
+	if session.get_bind().dialect.name == "postgresql":
+		from sqlalchemy.dialects.postgresql import insert
+	else:
+		from sqlalchemy.dialects.sqlite import insert
+	return insert(model)
+
+
+@dataclass
+class Resharder:
+	sources: Sequence[str]
+	targets: Sequence[str]
+	factory_for: Callable[[str], sessionmaker[Session]]
+	batch_users: int = DEFAULT_BATCH_USERS
+	segment_size: int = 1024
+	# Lowest ledger id moved in or out, per database: its segments are resealed from there
+	_moved_from: Dict[str, int] = field(default_factory=dict, repr=False)
+
+	"""Move every user's rows to the database `targets[jump_hash(user_id)]`.
+
+	`sources` are the databases to scan: the current shards plus the home
+	database (where `credence import` loads rows). Each batch of users is
+	copied to its target and committed before the copied rows are deleted
+	from the source, by primary key, so a crash or a concurrent write never
+	loses a row: re-running the move finishes the job, and rows written to
+	a source during the move are picked up by the next run. Sealed ledger
+	segments are resealed on both sides once the moves are done.
+	"""
+
+	def target_for(self, user_id: str) -> str:
+		return self.targets[shard_for_user(user_id, len(self.targets))]
+
+	def misplaced(self, source: str) -> Iterator[Tuple[str, str]]:
+		"""`(user_id, target)` for every user with rows on `source` that belong elsewhere."""
+		users = union(*(select(model.user_id) for model in (LedgerEntry, Verification, CurrentVerification, TrustScore)))
+		session = self.factory_for(source)()
+		try:
+			for (user_id,) in session.execute(users.execution_options(yield_per=5000)):
+				target = self.target_for(user_id)
+				if target != source:
+					yield user_id, target
+		finally:
+			session.close()
+
+	def plan(self) -> Dict[Tuple[str, str], int]:
+		"""Number of users moving per `(source, target)`."""
+		moves: Dict[Tuple[str, str], int] = {}
+		for source in dict.fromkeys(self.sources):
+			for _, target in self.misplaced(source):
+				moves[(source, target)] = moves.get((source, target), 0) + 1
+		return moves
+
+	def run(self) -> Dict[Tuple[str, str], int]:
+		"""Move every misplaced user, then rebuild rollups and reseal segments where users moved.
+
+		Returns `plan()`-style counts.
+		"""
+		moved: Dict[Tuple[str, str], int] = {}
+		for source in dict.fromkeys(self.sources):
+			# Collected first: the scan must not see its own deletes
+			by_target: Dict[str, List[str]] = {}
+			for user_id, target in self.misplaced(source):
+				by_target.setdefault(target, []).append(user_id)
+			for target, user_ids in by_target.items():
+				for i in range(0, len(user_ids), self.batch_users):
+					self.move(source, target, user_ids[i : i + self.batch_users])
+				moved[(source, target)] = len(user_ids)
+		for url in dict.fromkeys(url for pair in moved for url in pair):
+			session = self.factory_for(url)()
+			try:
+				RollupService(session=session).rebuild()
+				if url in self._moved_from:
+					IntegrityService(session=session, segment_size=self.segment_size).reseal(self._moved_from.pop(url))
+			finally:
+				session.close()
+		return moved
+
+	def move(self, source: str, target: str, user_ids: Sequence[str]) -> int:
+		"""Copy the users' rows from `source` to `target`, then delete them from `source`.
+
+		Ledger entries keep their ids (flags, disputes and idempotency keys
+		refer to them); entries already on the target from an interrupted run
+		are skipped, and an id held there by another user's entry aborts the
+		batch. Other rows get new ids on the target, replacing whatever an
+		interrupted run left. Returns the number of rows moved.
+		"""
+		src = self.factory_for(source)()
+		dst = self.factory_for(target)()
+		try:
+			if dst.get_bind().dialect.name == "postgresql":
+				# Moved entries are not new: keep them off the live change feed
+				dst.execute(text("SET LOCAL credence.suppress_notify = 'on'"))
+			entries = src.execute(select(LedgerEntry.__table__).where(LedgerEntry.user_id.in_(user_ids))).mappings().all()
+			entry_ids = [row["id"] for row in entries]
+			present = {
+				entry_id: user_id
+				for chunk in _chunks(entry_ids)
+				for entry_id, user_id in dst.execute(select(LedgerEntry.id, LedgerEntry.user_id).where(LedgerEntry.id.in_(chunk)))
+			}
+			clashes = [entry_id for entry_id, user_id in present.items() if user_id not in user_ids]
+			if clashes:
+				raise ValueError(f"ledger ids {clashes[:10]} already belong to other users on the target (run configure-shard-sequences first)")
+			for chunk in _chunks([dict(row) for row in entries if row["id"] not in present]):
+				dst.execute(_insert(dst, LedgerEntry).values(chunk))
+
+			copied: Dict[Type[Any], List[Any]] = {LedgerEntry: entry_ids}
+			for model in (*USER_TABLES[1:], EvidenceFlag):
+				rows = [
+					dict(row)
+					for chunk in _chunks(entry_ids if model is EvidenceFlag else list(user_ids))
+					for row in src.execute(select(model.__table__).where(_owned_by(model, chunk))).mappings()
+				]
+				for chunk in _chunks(entry_ids if model is EvidenceFlag else list(user_ids)):
+					dst.execute(delete(model.__table__).where(_owned_by(model, chunk)))
+				surrogate = _surrogate_id(model)
+				for chunk in _chunks(rows):
+					dst.execute(
+						_insert(dst, model).values([{k: v for k, v in row.items() if k != surrogate} for row in chunk])
+					)
+				keys = [column.name for column in model.__table__.primary_key.columns]
+				copied[model] = [tuple(row[k] for k in keys) for row in rows]
+			dst.commit()
+
+			if src.get_bind().dialect.name == "postgresql":
+				# Opt in to deleting ledger rows (see migration 0017)
+				src.execute(text("SET LOCAL credence.reshard = 'on'"))
+			# Flags and dependents first, the ledger last
+			for model in (EvidenceFlag, *reversed(USER_TABLES[1:])):
+				columns = list(model.__table__.primary_key.columns)
+				key = columns[0] if len(columns) == 1 else tuple_(*columns)
+				values = [pk[0] for pk in copied[model]] if len(columns) == 1 else copied[model]
+				for chunk in _chunks(values):
+					src.execute(delete(model.__table__).where(key.in_(chunk)))
+			for chunk in _chunks(entry_ids):
+				src.execute(delete(LedgerEntry.__table__).where(LedgerEntry.id.in_(chunk)))
+			src.commit()
+			if entry_ids:
+				lowest = min(entry_ids)
+				for url in (source, target):
+					self._moved_from[url] = min(self._moved_from.get(url, lowest), lowest)
+			return sum(len(rows) for rows in copied.values())
+		finally:
+			src.close()
+			dst.close()
+
+
+def _owned_by(model: Type[Any], keys: Sequence[Any]) -> Any:
+	if model is EvidenceFlag:
+		return EvidenceFlag.ledger_entry_id.in_(keys)
+	return model.user_id.in_(keys)
+
+
+def _surrogate_id(model: Type[Any]) -> Optional[str]:
+	columns = list(model.__table__.primary_key.columns)
+	if len(columns) == 1 and columns[0].name == "id" and columns[0].autoincrement in (True, "auto"):
+		return "id"
+	return None
+
+
+def _chunks(items: Sequence[T], size: int = _CHUNK) -> Iterator[Sequence[T]]:
+	for i in range(0, len(items), size):
+		yield items[i : i + size]
@@ -0,0 +1,296 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+from sqlalchemy import and_, case, func, or_, select, text, union_all
+from sqlalchemy.orm import Session
+
+from ..db import KarmaRollupDaily, KarmaRollupHourly, LedgerEntry, RollupWatermark, sqlite_begin_immediate
+
+# Entries younger than this are left for the next run so that rows still being
+# committed are not skipped (same rule as balance checkpoints).
+ROLLUP_LAG = timedelta(minutes=1)
+# Each run recomputes the buckets back to this long before the watermark, so
+# rows committed after the run that covered their created_at still count
+ROLLUP_OVERLAP = timedelta(hours=1)
+WATERMARK_NAME = "karma"
+_HOUR = timedelta(hours=1)
+_DAY = timedelta(days=1)
+
+_GRANULARITIES: Dict[str, Type[Any]] = {"hour": KarmaRollupHourly, "day": KarmaRollupDaily}
+
+
+def floor_to(ts: datetime, granularity: str) -> datetime:
+	ts = ts.astimezone(timezone.utc)
+	if granularity == "day":
+		return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+	return ts.replace(minute=0, second=0, microsecond=0)
+
+
+def ceil_to(ts: datetime, granularity: str) -> datetime:
+	floored = floor_to(ts, granularity)
+	return floored if floored == ts.astimezone(timezone.utc) else floored + (_DAY if granularity == "day" else _HOUR)
+
+
+def bucket_expr(dialect: str, granularity: str, column: Any = LedgerEntry.created_at) -> Any:
+	"""SQL expression truncating the timestamp `column` to its UTC hour or day."""
+	if dialect == "postgresql":
+		return func.timezone("UTC", func.date_trunc(granularity, func.timezone("UTC", column)))
+	# SQLite and others store UTC datetimes as text, with microseconds: buckets
+	# must use the same format to compare correctly with bound datetimes
+	fmt = "%Y-%m-%d 00:00:00.000000" if granularity == "day" else "%Y-%m-%d %H:00:00.000000"
+	return func.strftime(fmt, column)
+
+
+def _upsert(dialect: str, model: Type[Any]) -> Any:
+	if dialect == "postgresql":
+		from sqlalchemy.dialects.postgresql import insert
+	else:
+		from sqlalchemy.dialects.sqlite import insert
+	return insert(model)
+
+
+@dataclass
+class RollupService:
+	session: Session
+
+	"""Maintain and read hourly/daily per-(user, domain) karma rollups.
+
+	Rollups cover every entry up to the `karma` watermark; readers combine
+	them with the raw ledger only for the partial hour at the start of a
+	window and for entries newer than the watermark.
+	"""
+
+	def watermark(self) -> Optional[datetime]:
+		row = self.session.get(RollupWatermark, WATERMARK_NAME)
+		return _utc(row.rolled_up_to) if row is not None else None
+
+	def advance(self, cutoff: Optional[datetime] = None) -> int:
+		"""Bring both rollups up to `cutoff`.
+
+		The hours from `ROLLUP_OVERLAP` before the watermark onwards are
+		recomputed from the ledger, not added to, so an entry committed up to
+		that long after its `created_at` is still rolled up, exactly once.
+		Back-dated writes older than that need `rebuild`. Returns the number of
+		hourly buckets written.
+		"""
+		cutoff = cutoff or datetime.now(timezone.utc) - ROLLUP_LAG
+		self._lock()
+		watermark = self.watermark()
+		if watermark is not None and watermark >= cutoff:
+			return 0
+		since = floor_to(watermark - ROLLUP_OVERLAP, "hour") if watermark is not None else None
+		written = self._fold_hours(since, cutoff)
+		self._fold_days(floor_to(since, "day") if since is not None else None)
+		self._set_watermark(cutoff)
+		self.session.commit()
+		return written
+
+	def rebuild(self, cutoff: Optional[datetime] = None) -> None:
+		"""Recompute both rollups from the whole ledger (after back-dated imports)."""
+		cutoff = cutoff or datetime.now(timezone.utc) - ROLLUP_LAG
+		self._lock()
+		for model in _GRANULARITIES.values():
+			self.session.query(model).delete(synchronize_session=False)
+		self._fold_hours(None, cutoff)
+		self._fold_days(None)
+		self._set_watermark(cutoff)
+		self.session.commit()
+
+	def window_points(self, start: Optional[datetime] = None, domain: Optional[str] = None) -> Dict[str, int]:
+		"""Points per user for entries created at or after `start` (all time if None).
+
+		Reads whole days from the daily rollup, the edges of the window from the
+		hourly rollup, and only the partial first hour and the entries newer
+		than the watermark from the ledger: a 30-day window reads about 30
+		daily buckets per user instead of every entry.
+		"""
+		rows = self.session.execute(self.window_points_stmt(start, domain)).all()
+		return {user_id: int(points or 0) for user_id, points in rows}
+
+	def top_points(
+		self,
+		limit: int,
+		start: Optional[datetime] = None,
+		domain: Optional[str] = None,
+		after: Optional[Tuple[int, str]] = None,
+	) -> List[Tuple[str, int]]:
+		"""The `limit` users with the most points in the window, ordered in SQL.
+
+		Ties are broken by user id. `after` is the `(points, user_id)` of the
+		last item of the previous page (keyset pagination).
+		"""
+		stmt = self.window_points_stmt(start, domain)
+		total = stmt.selected_columns[1]
+		user_id = stmt.selected_columns[0]
+		if after is not None:
+			stmt = stmt.having(or_(total < after[0], and_(total == after[0], user_id > after[1])))
+		rows = self.session.execute(stmt.order_by(total.desc(), user_id.asc()).limit(limit)).all()
+		return [(u, int(points or 0)) for u, points in rows]
+
+	def window_points_stmt(self, start: Optional[datetime] = None, domain: Optional[str] = None) -> Any:
+		"""`SELECT user_id, sum(points) ... GROUP BY user_id` over the window (see `window_points`)."""
+		watermark = self.watermark()
+		if watermark is None or (start is not None and start >= watermark):
+			return self._sum_by_user([self._raw_part(start, None, domain)])
+
+		parts = []
+		head_end = ceil_to(start, "hour") if start is not None else None
+		if start is not None and head_end is not None and head_end > start:
+			if head_end > watermark:
+				# The window starts inside the watermark's hour: raw rows up to it
+				parts.append(self._raw_part(start, watermark, domain))
+			else:
+				parts.append(self._raw_part(start, head_end, domain, inclusive_end=False))
+		day_start = ceil_to(start, "day") if start is not None else None
+		day_end = floor_to(watermark, "day")
+		if day_start is None or day_start < day_end:
+			# Whole days from the daily rollup, hours around them from the hourly one
+			parts.append(self._rollup_part(KarmaRollupDaily, day_start, day_end, domain))
+			if head_end is not None and day_start is not None and head_end < day_start:
+				parts.append(self._rollup_part(KarmaRollupHourly, head_end, day_start, domain))
+			parts.append(self._rollup_part(KarmaRollupHourly, day_end, None, domain))
+		elif head_end is not None and head_end <= watermark:
+			parts.append(self._rollup_part(KarmaRollupHourly, head_end, None, domain))
+		parts.append(self._raw_part(watermark, None, domain, inclusive_end=False, after=True))
+		return self._sum_by_user(parts)
+
+	def timeseries(
+		self,
+		granularity: str,
+		start: datetime,
+		end: datetime,
+		user_id: Optional[str] = None,
+		domain: Optional[str] = None,
+	) -> List[Dict[str, Any]]:
+		"""Rolled-up buckets in `[start, end)`, summed over the matching users/domains."""
+		model = _GRANULARITIES[granularity]
+		stmt = select(
+			model.bucket,
+			func.sum(model.points),
+			func.sum(model.positive_points),
+			func.sum(model.negative_points),
+			func.sum(model.entry_count),
+		).where(model.bucket >= floor_to(start, granularity), model.bucket < end)
+		if user_id is not None:
+			stmt = stmt.where(model.user_id == user_id)
+		if domain is not None:
+			stmt = stmt.where(model.domain == domain)
+		rows = self.session.execute(stmt.group_by(model.bucket).order_by(model.bucket.asc())).all()
+		return [
+			{
+				"bucket": bucket,
+				"points": int(points or 0),
+				"positive_points": int(positive or 0),
+				"negative_points": int(negative or 0),
+				"entry_count": int(count or 0),
+			}
+			for bucket, points, positive, negative, count in rows
+		]
+
+	def _fold_hours(self, since: Optional[datetime], until: datetime) -> int:
+		# `since` is on an hour boundary, so every bucket written is complete up to `until`
+		dialect = self.session.get_bind().dialect.name
+		bucket = bucket_expr(dialect, "hour").label("bucket")
+		source = select(
+			bucket,
+			LedgerEntry.user_id,
+			LedgerEntry.domain,
+			func.sum(LedgerEntry.points),
+			func.sum(case((LedgerEntry.points > 0, LedgerEntry.points), else_=0)),
+			func.sum(case((LedgerEntry.points < 0, LedgerEntry.points), else_=0)),
+			func.count(LedgerEntry.id),
+		).where(LedgerEntry.created_at <= until)
+		if since is not None:
+			source = source.where(LedgerEntry.created_at >= since)
+		source = source.group_by(bucket, LedgerEntry.user_id, LedgerEntry.domain)
+		return self._replace(KarmaRollupHourly, source)
+
+	def _fold_days(self, since: Optional[datetime]) -> int:
+		# Days are summed from their (at most 24) hourly buckets, not from the ledger
+		dialect = self.session.get_bind().dialect.name
+		hourly = KarmaRollupHourly
+		bucket = bucket_expr(dialect, "day", hourly.bucket).label("bucket")
+		source = select(
+			bucket,
+			hourly.user_id,
+			hourly.domain,
+			func.sum(hourly.points),
+			func.sum(hourly.positive_points),
+			func.sum(hourly.negative_points),
+			func.sum(hourly.entry_count),
+		)
+		if since is not None:
+			source = source.where(hourly.bucket >= since)
+		source = source.group_by(bucket, hourly.user_id, hourly.domain)
+		return self._replace(KarmaRollupDaily, source)
+
+	def _replace(self, model: Type[Any], source: Any) -> int:
+		stmt = _upsert(self.session.get_bind().dialect.name, model).from_select(
+			["bucket", "user_id", "domain", "points", "positive_points", "negative_points", "entry_count"], source
+		)
+		stmt = stmt.on_conflict_do_update(
+			index_elements=["bucket", "user_id", "domain"],
+			set_={
+				"points": stmt.excluded.points,
+				"positive_points": stmt.excluded.positive_points,
+				"negative_points": stmt.excluded.negative_points,
+				"entry_count": stmt.excluded.entry_count,
+			},
+		)
+		return int(self.session.execute(stmt).rowcount or 0)
+
+	def _lock(self) -> None:
+		# Runs are serialized until commit so that a slower run cannot move the
+		# watermark back over buckets a newer one already wrote
+		dialect = self.session.get_bind().dialect.name
+		if dialect == "postgresql":
+			self.session.execute(text("SELECT pg_advisory_xact_lock(hashtext('credence.rollups'))"))
+		elif dialect == "sqlite":
+			sqlite_begin_immediate(self.session)
+
+	def _set_watermark(self, cutoff: datetime) -> None:
+		row = self.session.get(RollupWatermark, WATERMARK_NAME)
+		if row is None:
+			self.session.add(RollupWatermark(name=WATERMARK_NAME, rolled_up_to=cutoff))
+		else:
+			row.rolled_up_to = cutoff
+
+	def _rollup_part(self, model: Type[Any], start: Optional[datetime], end: Optional[datetime], domain: Optional[str]) -> Any:
+		stmt = select(model.user_id.label("user_id"), model.points.label("points"))
+		if start is not None:
+			stmt = stmt.where(model.bucket >= start)
+		if end is not None:
+			stmt = stmt.where(model.bucket < end)
+		if domain is not None:
+			stmt = stmt.where(model.domain == domain)
+		return stmt
+
+	def _raw_part(
+		self,
+		start: Optional[datetime],
+		end: Optional[datetime],
+		domain: Optional[str],
+		inclusive_end: bool = True,
+		after: bool = False,
+	) -> Any:
+		stmt = select(LedgerEntry.user_id.label("user_id"), LedgerEntry.points.label("points"))
+		if start is not None:
+			stmt = stmt.where(LedgerEntry.created_at > start if after else LedgerEntry.created_at >= start)
+		if end is not None:
+			stmt = stmt.where(LedgerEntry.created_at <= end if inclusive_end else LedgerEntry.created_at < end)
+		if domain is not None:
+			stmt = stmt.where(LedgerEntry.domain == domain)
+		return stmt
+
+	def _sum_by_user(self, parts: List[Any]) -> Any:
+		combined = (union_all(*parts) if len(parts) > 1 else parts[0]).subquery()
+		total = func.sum(combined.c.points).label("points")
+		return select(combined.c.user_id, total).group_by(combined.c.user_id)
+
+
+def _utc(ts: datetime) -> datetime:
+	# SQLite hands back naive datetimes, stored as UTC
+	return ts if ts.tzinfo is not None else ts.replace(tzinfo=timezone.utc)
@@ -1,53 +1,112 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
+from datetime import datetime
 from typing import Optional
 
 from sqlalchemy import and_, func
 from sqlalchemy.orm import Session
 
 from ..config import Settings
-from ..db import LedgerEntry, Verification
-from ..plugins import load_symbol
+from ..cache import RedisCache, verification_cache_key
+from ..db import CurrentVerification, LedgerEntry, Verification
+from ..metrics import stage
+from ..plugins import PluginRegistry
+from .checkpoints import CheckpointService
+from .evidence_status import EvidenceStatusService
+from .verification import VERIFICATION_CACHE_TTL_SECONDS
 
 
 @dataclass
 class TrustService:
 	session: Session
 	settings: Settings
+	# Long-lived processes pass shared instances; otherwise built per service
+	plugins: Optional[PluginRegistry] = None
+	cache: Optional[RedisCache] = None
 
 	"""Compute trust using pluggable formulas and verification providers."""
 
-	def get_verification_level(self, user_id: str) -> int:
+	@property
+	def _plugins(self) -> PluginRegistry:
+		if self.plugins is None:
+			self.plugins = PluginRegistry(settings=self.settings)
+		return self.plugins
+
+	def get_verification_level(self, user_id: str, as_of: Optional[datetime] = None) -> int:
+		"""Effective verification level of a user.
+
+		Current levels come from the cache or the `current_verification`
+		projection; only historical (`as_of`) lookups read the history table.
+		"""
+		if as_of is not None:
+			return self._verification_level_as_of(user_id, as_of)
+		cache = self.cache or RedisCache.from_settings(self.settings)
+		ck = verification_cache_key(user_id)
+		cached = cache.get(ck)
+		if cached is not None:
+			try:
+				return int(cached)
+			except ValueError:
+				pass
+		with stage("trust.verification", "projection_read"):
+			current = self.session.get(CurrentVerification, user_id)
+		level = current.effective_level if current is not None else 0
+		cache.set(ck, str(level), ttl_seconds=VERIFICATION_CACHE_TTL_SECONDS)
+		return level
+
+	def _verification_level_as_of(self, user_id: str, as_of: datetime) -> int:
 		# Compute external vs internal maxima then combine via provider
 		external_level = int(
 			self.session.query(func.coalesce(func.max(Verification.level), 0))
-			.filter(Verification.user_id == user_id, Verification.source == "external")
-			.scalar_one()
+			.filter(
+				Verification.user_id == user_id,
+				Verification.source == "external",
+				Verification.created_at <= as_of,
+			)
+			.scalar()
 		)
 		internal_level = int(
 			self.session.query(func.coalesce(func.max(Verification.level), 0))
-			.filter(Verification.user_id == user_id, Verification.source == "internal")
-			.scalar_one()
+			.filter(
+				Verification.user_id == user_id,
+				Verification.source == "internal",
+				Verification.created_at <= as_of,
+			)
+			.scalar()
 		)
-		provider_cls = load_symbol(self.settings.plugins.verification_provider)
-		provider = provider_cls()  # type: ignore[call-arg]
-		return int(provider.effective_level(external_level, internal_level))
+		return int(self._plugins.verification_provider.effective_level(external_level, internal_level))
 
-	def compute_trust(self, user_id: str, domain: Optional[str] = None) -> tuple[float, int, int]:
-		"""Return (trust, karma_balance, verification_level) for the user."""
+	def compute_trust(
+		self, user_id: str, domain: Optional[str] = None, as_of: Optional[datetime] = None
+	) -> tuple[float, int, int]:
+		"""Return (trust, karma_balance, verification_level) for the user.
+
+		With `as_of`, the balance is read from the nearest balance checkpoint plus
+		the entries since, and verification only counts records up to that instant.
+		With `exclude_red_evidence`, points of entries currently flagged red are
+		left out of the balance.
+		"""
 		# balance
-		q = self.session.query(func.coalesce(func.sum(LedgerEntry.points), 0)).filter(
-			LedgerEntry.user_id == user_id
-		)
-		if domain is not None:
-			q = q.filter(LedgerEntry.domain == domain)
-		balance = int(q.scalar_one())
-
-		verification_level = self.get_verification_level(user_id)
-		formula_cls = load_symbol(self.settings.plugins.trust_formula)
-		formula = formula_cls()  # type: ignore[call-arg]
-		trust = float(formula.compute(balance, verification_level))
+		if as_of is not None:
+			with stage("trust.compute", "balance_as_of"):
+				balance = CheckpointService(session=self.session).balance_as_of(user_id, domain, as_of)
+		else:
+			q = self.session.query(func.coalesce(func.sum(LedgerEntry.points), 0)).filter(
+				LedgerEntry.user_id == user_id
+			)
+			if domain is not None:
+				q = q.filter(LedgerEntry.domain == domain)
+			with stage("trust.compute", "balance"):
+				balance = int(q.scalar())
+		if self.settings.exclude_red_evidence:
+			with stage("trust.compute", "red_points"):
+				balance -= EvidenceStatusService(session=self.session).red_points(user_id, domain, as_of)
+
+		with stage("trust.compute", "verification"):
+			verification_level = self.get_verification_level(user_id, as_of=as_of)
+		with stage("trust.compute", "formula"):
+			trust = float(self._plugins.trust_formula.compute(balance, verification_level))
 		return trust, balance, verification_level
 
 
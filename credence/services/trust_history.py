@@ -0,0 +1,222 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import Float, Integer, cast, delete, func, select
+from sqlalchemy.orm import Session
+
+from ..db import RollupWatermark, TrustScore
+from .rollups import bucket_expr, floor_to
+
+# Compaction stages, in order: snapshots older than the stage's age keep only
+# the last one per (user, domain, bucket)
+COMPACTION_STAGES = ("hour", "day")
+_STEP = timedelta(days=1)
+
+
+def _epoch_expr(dialect: str, column: Any) -> Any:
+	if dialect == "postgresql":
+		return func.date_part("epoch", column)
+	return cast(func.strftime("%s", column), Integer)
+
+
+@dataclass
+class TrustHistoryService:
+	session: Session
+
+	"""Write, compact and read `trust_scores` snapshots.
+
+	Snapshots are only written when trust, balance or verification changed;
+	old ones are thinned to one per hour and later one per day, so the table
+	grows with the number of changes rather than recomputes.
+	"""
+
+	def latest(self, user_id: str, domain: Optional[str], before: Optional[datetime] = None) -> Optional[TrustScore]:
+		"""The most recent snapshot, or the last one taken before `before`."""
+		domain_match = TrustScore.domain.is_(None) if domain is None else TrustScore.domain == domain
+		stmt = select(TrustScore).where(TrustScore.user_id == user_id, domain_match)
+		if before is not None:
+			stmt = stmt.where(TrustScore.computed_at < before)
+		return self.session.execute(
+			stmt.order_by(TrustScore.computed_at.desc(), TrustScore.id.desc()).limit(1)
+		).scalar_one_or_none()
+
+	def record(
+		self,
+		user_id: str,
+		domain: Optional[str],
+		trust: float,
+		karma_balance: int,
+		verification_level: int,
+		tolerance: float = 0.0,
+		previous: Optional[TrustScore] = None,
+	) -> bool:
+		"""Add a snapshot unless the latest one matches (trust within `tolerance`).
+
+		`previous` is the latest snapshot when the caller already read it.
+		Returns whether a row was written; the caller commits.
+		"""
+		if previous is None:
+			previous = self.latest(user_id, domain)
+		if (
+			previous is not None
+			and abs(previous.trust - trust) <= tolerance
+			and previous.karma_balance == karma_balance
+			and previous.verification_level == verification_level
+		):
+			return False
+		self.session.add(
+			TrustScore(
+				user_id=user_id,
+				domain=domain,
+				trust=trust,
+				karma_balance=karma_balance,
+				verification_level=verification_level,
+			)
+		)
+		return True
+
+	def compact(self, raw_days: int, hourly_days: int, now: Optional[datetime] = None) -> Dict[str, int]:
+		"""Keep the last snapshot per hour beyond `raw_days` and per day beyond `hourly_days`.
+
+		Works through one day per transaction from each stage's watermark, so
+		each run only touches snapshots that aged into a stage since the last.
+		Returns the rows deleted per stage.
+		"""
+		now = now or datetime.now(timezone.utc)
+		ages = {"hour": timedelta(days=raw_days), "day": timedelta(days=hourly_days)}
+		deleted: Dict[str, int] = {}
+		for granularity in COMPACTION_STAGES:
+			cutoff = floor_to(now - ages[granularity], "day")
+			name = f"trust_history_{granularity}"
+			watermark = self.session.get(RollupWatermark, name)
+			start = watermark.rolled_up_to if watermark is not None else self._oldest()
+			start = _utc(start) if start is not None else None
+			deleted[granularity] = 0
+			while start is not None and start < cutoff:
+				start = floor_to(start, "day")
+				end = min(start + _STEP, cutoff)
+				deleted[granularity] += self._thin(granularity, start, end)
+				if watermark is None:
+					watermark = RollupWatermark(name=name, rolled_up_to=end)
+					self.session.add(watermark)
+				else:
+					watermark.rolled_up_to = end
+				self.session.commit()
+				start = end
+		return deleted
+
+	def history(
+		self,
+		user_id: str,
+		domain: Optional[str],
+		start: datetime,
+		end: datetime,
+		max_points: int,
+	) -> List[Dict[str, Any]]:
+		"""Snapshots in `[start, end)` downsampled to at most `max_points` buckets.
+
+		Each bucket reports the last value in it plus the minimum and maximum
+		trust; the grouping happens in SQL, so the response size is bounded by
+		`max_points` whatever the number of snapshots. The last snapshot before
+		`start` is still in effect at `start`: it opens the series when the
+		first bucket is empty, and counts towards its min/max otherwise.
+		"""
+		dialect = self.session.get_bind().dialect.name
+		width = max(1.0, (end - start).total_seconds() / max_points)
+		epoch = _epoch_expr(dialect, TrustScore.computed_at)
+		bucket = func.floor((cast(epoch, Float) - start.timestamp()) / width).label("bucket")
+		domain_match = TrustScore.domain.is_(None) if domain is None else TrustScore.domain == domain
+		ranked = (
+			select(
+				bucket,
+				TrustScore.computed_at,
+				TrustScore.trust,
+				TrustScore.karma_balance,
+				TrustScore.verification_level,
+				func.min(TrustScore.trust).over(partition_by=bucket).label("min_trust"),
+				func.max(TrustScore.trust).over(partition_by=bucket).label("max_trust"),
+				func.row_number()
+				.over(partition_by=bucket, order_by=(TrustScore.computed_at.desc(), TrustScore.id.desc()))
+				.label("rn"),
+			)
+			.where(
+				TrustScore.user_id == user_id,
+				domain_match,
+				TrustScore.computed_at >= start,
+				TrustScore.computed_at < end,
+			)
+		).subquery()
+		rows = self.session.execute(
+			select(
+				ranked.c.bucket,
+				ranked.c.computed_at,
+				ranked.c.trust,
+				ranked.c.min_trust,
+				ranked.c.max_trust,
+				ranked.c.karma_balance,
+				ranked.c.verification_level,
+			)
+			.where(ranked.c.rn == 1)
+			.order_by(ranked.c.computed_at.asc())
+		).all()
+		items = [
+			{
+				"at": computed_at,
+				"trust": trust,
+				"min_trust": min_trust,
+				"max_trust": max_trust,
+				"karma_balance": balance,
+				"verification_level": level,
+			}
+			for _, computed_at, trust, min_trust, max_trust, balance, level in rows
+		]
+		carried = self.latest(user_id, domain, before=start)
+		if carried is None:
+			return items
+		if rows and int(rows[0][0]) == 0:
+			first = items[0]
+			first["min_trust"] = min(first["min_trust"], carried.trust)
+			first["max_trust"] = max(first["max_trust"], carried.trust)
+			return items
+		opening = {
+			"at": start,
+			"trust": carried.trust,
+			"min_trust": carried.trust,
+			"max_trust": carried.trust,
+			"karma_balance": carried.karma_balance,
+			"verification_level": carried.verification_level,
+		}
+		return [opening, *items]
+
+	def _oldest(self) -> Optional[datetime]:
+		return self.session.execute(select(func.min(TrustScore.computed_at))).scalar()
+
+	def _thin(self, granularity: str, start: datetime, end: datetime) -> int:
+		dialect = self.session.get_bind().dialect.name
+		bucket = bucket_expr(dialect, granularity, TrustScore.computed_at)
+		ranked = (
+			select(
+				TrustScore.id,
+				func.row_number()
+				.over(
+					partition_by=(TrustScore.user_id, TrustScore.domain, bucket),
+					order_by=(TrustScore.computed_at.desc(), TrustScore.id.desc()),
+				)
+				.label("rn"),
+			)
+			.where(TrustScore.computed_at >= start, TrustScore.computed_at < end)
+		).subquery()
+		result = self.session.execute(
+			delete(TrustScore)
+			.where(TrustScore.id.in_(select(ranked.c.id).where(ranked.c.rn > 1)))
+			.execution_options(synchronize_session=False)
+		)
+		return int(result.rowcount or 0)
+
+
+def _utc(ts: datetime) -> datetime:
+	# SQLite hands back naive datetimes, stored as UTC
+	return ts if ts.tzinfo is not None else ts.replace(tzinfo=timezone.utc)
@@ -1,26 +1,76 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Optional
 
+from sqlalchemy import func, update
 from sqlalchemy.orm import Session
 
-from ..db import Verification
+from ..cache import RedisCache, trust_cache_key, verification_cache_key
+from ..config import Settings
+from ..db import CurrentVerification, Verification
+from ..plugins import PluginRegistry
+
+VERIFICATION_CACHE_TTL_SECONDS = 300
 
 
 @dataclass
 class VerificationService:
 	session: Session
+	settings: Settings
+	plugins: Optional[PluginRegistry] = None
+	cache: Optional[RedisCache] = None
 
 	"""Manage verification level records for users."""
 
 	def set_level(self, user_id: str, source: str, level: int) -> Verification:
-		"""Insert a verification record with a source (external|internal)."""
+		"""Insert a verification record with a source (external|internal).
+
+		Also folds the level into the `current_verification` projection and
+		refreshes the cached effective level.
+		"""
 		if source not in {"external", "internal"}:
 			raise ValueError("source must be 'external' or 'internal'")
 		verification = Verification(user_id=user_id, source=source, level=level)
 		self.session.add(verification)
+
+		# Upsert so concurrent first verifications of a user cannot both insert;
+		# levels only ever rise: the projection mirrors MAX(level) per source
+		dialect = self.session.get_bind().dialect.name
+		column = CurrentVerification.external_level if source == "external" else CurrentVerification.internal_level
+		greatest = func.greatest if dialect == "postgresql" else func.max
+		stmt = _insert(dialect).values(
+			user_id=user_id,
+			external_level=level if source == "external" else 0,
+			internal_level=level if source == "internal" else 0,
+			effective_level=0,
+		)
+		stmt = stmt.on_conflict_do_update(
+			index_elements=[CurrentVerification.user_id],
+			set_={column.key: greatest(column, stmt.excluded[column.key]), "updated_at": datetime.now(timezone.utc)},
+		).returning(CurrentVerification.external_level, CurrentVerification.internal_level)
+		external_level, internal_level = self.session.execute(stmt).one()
+		plugins = self.plugins or PluginRegistry(settings=self.settings)
+		effective_level = int(plugins.verification_provider.effective_level(external_level, internal_level))
+		self.session.execute(
+			update(CurrentVerification)
+			.where(CurrentVerification.user_id == user_id)
+			.values(effective_level=effective_level)
+		)
+
 		self.session.commit()
 		self.session.refresh(verification)
+
+		cache = self.cache or RedisCache.from_settings(self.settings)
+		cache.set(verification_cache_key(user_id), str(effective_level), ttl_seconds=VERIFICATION_CACHE_TTL_SECONDS)
+		cache.delete(*[trust_cache_key(user_id, d) for d in (None, *self.settings.domains)])
 		return verification
 
 
+def _insert(dialect: str) -> Any:
+	if dialect == "postgresql":
+		from sqlalchemy.dialects.postgresql import insert
+	else:
+		from sqlalchemy.dialects.sqlite import insert
+	return insert(CurrentVerification)
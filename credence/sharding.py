@@ -0,0 +1,192 @@
+"""Hash sharding of user-scoped data across several databases.
+
+With `shard_database_urls` set, every row belonging to a user (ledger
+entries and everything derived from them, verifications, trust snapshots,
+idempotency keys, evidence status) lives on shard `jump_hash(user_id, N)`.
+`database_url` stays the home database for data that belongs to no single
+user (disputes, distribution sketches, import checkpoints). Without shards
+the home database is the only shard and nothing changes.
+
+Jump consistent hashing (Lamping & Veach 2014) moves only ~1/N of the users
+when a shard is added, which keeps `credence reshard` runs short.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence, TypeVar
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session, sessionmaker
+
+from .config import Settings
+from .db import LedgerEntry, create_session_factory
+
+T = TypeVar("T")
+
+# Parallel queries per scatter; beyond this shards are queried in turns
+MAX_SCATTER_THREADS = 16
+
+
+def user_hash(user_id: str) -> int:
+	"""Stable 64-bit hash of a user id (Python's `hash` is salted per process)."""
+	return int.from_bytes(hashlib.blake2b(user_id.encode(), digest_size=8).digest(), "big")
+
+
+def jump_hash(key: int, buckets: int) -> int:
+	"""Bucket in `[0, buckets)` for `key`; growing `buckets` only moves keys to the new bucket."""
+	if buckets < 1:
+		raise ValueError("buckets must be positive")
+	b, j = -1, 0
+	while j < buckets:
+		b = j
+		key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+		j = int((b + 1) * (float(1 << 31) / float((key >> 33) + 1)))
+	return b
+
+
+def shard_for_user(user_id: str, count: int) -> int:
+	return jump_hash(user_hash(user_id), count)
+
+
+def user_shard(settings: Settings, user_id: str) -> Optional[int]:
+	"""Shard index of `user_id`, or None when sharding is off."""
+	if not settings.shard_database_urls:
+		return None
+	return shard_for_user(user_id, len(settings.shard_database_urls))
+
+
+@dataclass
+class ShardRouter:
+	urls: List[str]
+	factory_for: Callable[[str], sessionmaker[Session]]
+	sharded: bool = True
+	_factories: Dict[str, sessionmaker[Session]] = field(default_factory=dict, repr=False)
+	_lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+	_pool: Optional[ThreadPoolExecutor] = field(default=None, repr=False)
+
+	"""Route user-scoped work to its shard and fan cross-shard reads out.
+
+	Ledger ids are striped across shards (shard `i` hands out ids `i + 1`,
+	`i + 1 + N`, ..., see `configure_sequences`), so they are unique across
+	shards and an entry id alone usually names its shard; `locate_entry`
+	falls back to probing the rest for entries resharding moved.
+	"""
+
+	@classmethod
+	def from_settings(
+		cls, settings: Settings, factory_for: Optional[Callable[[str], sessionmaker[Session]]] = None
+	) -> "ShardRouter":
+		urls = list(settings.shard_database_urls) or [settings.database_url]
+		return cls(
+			urls=urls,
+			factory_for=factory_for or (lambda url: create_session_factory(settings, url=url)),
+			sharded=bool(settings.shard_database_urls),
+		)
+
+	@property
+	def count(self) -> int:
+		return len(self.urls)
+
+	def factory(self, index: int) -> sessionmaker[Session]:
+		url = self.urls[index]
+		factory = self._factories.get(url)
+		if factory is None:
+			with self._lock:
+				factory = self._factories.get(url)
+				if factory is None:
+					factory = self._factories[url] = self.factory_for(url)
+		return factory
+
+	def shard_for_user(self, user_id: str) -> int:
+		return shard_for_user(user_id, self.count)
+
+	def factory_for_user(self, user_id: str) -> sessionmaker[Session]:
+		return self.factory(self.shard_for_user(user_id))
+
+	def entry_shard_guess(self, entry_id: int) -> int:
+		return (entry_id - 1) % self.count
+
+	def locate_entry(self, entry_id: int) -> Optional[int]:
+		"""Index of the shard holding ledger entry `entry_id`, or None if none does."""
+		guess = self.entry_shard_guess(entry_id)
+		for index in [guess, *(i for i in range(self.count) if i != guess)]:
+			session = self.factory(index)()
+			try:
+				if session.get(LedgerEntry, entry_id) is not None:
+					return index
+			finally:
+				session.close()
+		return None
+
+	def scatter(self, fn: Callable[[Session], T], shards: Optional[Sequence[int]] = None) -> List[T]:
+		"""`fn(session)` on every shard (or `shards`) in parallel, results in shard order."""
+		indexes = list(range(self.count)) if shards is None else list(shards)
+
+		def run(index: int) -> T:
+			session = self.factory(index)()
+			try:
+				return fn(session)
+			finally:
+				session.close()
+
+		if len(indexes) == 1:
+			return [run(indexes[0])]
+		if self._pool is None:
+			with self._lock:
+				if self._pool is None:
+					self._pool = ThreadPoolExecutor(
+						max_workers=min(self.count, MAX_SCATTER_THREADS), thread_name_prefix="credence-shard"
+					)
+		return list(self._pool.map(run, indexes))
+
+	def dispose(self) -> None:
+		for factory in self._factories.values():
+			engine = factory.kw.get("bind")
+			if engine is not None:
+				engine.dispose()
+		if self._pool is not None:
+			self._pool.shutdown(wait=False)
+
+
+def configure_sequences(shards: ShardRouter) -> List[int]:
+	"""Stripe ledger ids across PostgreSQL shards; returns the next id per shard.
+
+	Shard `i` of `N` continues at the first id past the global maximum that
+	is congruent to `i + 1` modulo `N`, incrementing by `N`. Run it after
+	adding shards (and before taking writes). SQLite shards stripe ids as
+	entries are inserted (`install_sqlite_id_stripe`); only their recorded
+	highest id is raised to the global maximum.
+	"""
+	highest = max(
+		shards.scatter(lambda s: int(s.execute(text("SELECT coalesce(max(id), 0) FROM ledger_entries")).scalar_one()))
+	)
+	starts: List[int] = []
+	for index in range(shards.count):
+		start = highest + 1 + ((index + 1 - (highest + 1)) % shards.count)
+		session = shards.factory(index)()
+		try:
+			if session.get_bind().dialect.name == "postgresql":
+				sequence = _sequence_name(session)
+				session.execute(text(f"ALTER SEQUENCE {sequence} INCREMENT BY {shards.count}"))
+				session.execute(text("SELECT setval(CAST(:seq AS regclass), :start, false)"), {"seq": sequence, "start": start})
+				session.commit()
+			elif session.execute(text("SELECT count(*) FROM sqlite_master WHERE name = 'sqlite_sequence'")).scalar_one():
+				params = {"highest": highest}
+				raised = session.execute(
+					text("UPDATE sqlite_sequence SET seq = max(seq, :highest) WHERE name = 'ledger_entries'"), params
+				)
+				if not raised.rowcount:
+					session.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES ('ledger_entries', :highest)"), params)
+				session.commit()
+		finally:
+			session.close()
+		starts.append(start)
+	return starts
+
+
+def _sequence_name(session: Session) -> str:
+	return str(session.execute(text("SELECT pg_get_serial_sequence('ledger_entries', 'id')")).scalar_one())
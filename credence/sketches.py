@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+import math
+import random
+import struct
+from bisect import bisect_right
+from dataclasses import dataclass, field
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+_HEADER = struct.Struct("<HQH")  # k, n, number of levels
+_LEVEL = struct.Struct("<I")
+_C = 2.0 / 3.0
+
+
+@dataclass
+class KLLSketch:
+	"""Mergeable streaming quantile sketch (Karnin, Lang, Liberty 2016).
+
+	Keeps O(k log(n/k)) floats whatever the number of values; rank error is
+	about 1.65 / k (k=200: under 1%). Level `h` holds items of weight 2**h.
+	Sketches built in different processes merge into one with the same
+	guarantee, which is how per-process buffers are folded into the stored
+	daily sketches.
+	"""
+
+	k: int = 200
+	n: int = 0
+	levels: List[List[float]] = field(default_factory=lambda: [[]])
+	_rng: random.Random = field(default_factory=random.Random, repr=False, compare=False)
+
+	def _capacity(self, level: int) -> int:
+		depth = len(self.levels) - level - 1
+		return max(2, int(math.ceil(self.k * _C**depth)))
+
+	def _size(self) -> int:
+		return sum(len(items) for items in self.levels)
+
+	def _max_size(self) -> int:
+		return sum(self._capacity(h) for h in range(len(self.levels)))
+
+	def update(self, value: float) -> None:
+		self.levels[0].append(float(value))
+		self.n += 1
+		if self._size() >= self._max_size():
+			self._compress()
+
+	def extend(self, values: Iterable[float]) -> None:
+		for value in values:
+			self.update(value)
+
+	def merge(self, other: "KLLSketch") -> None:
+		while len(self.levels) < len(other.levels):
+			self.levels.append([])
+		for h, items in enumerate(other.levels):
+			self.levels[h].extend(items)
+		self.n += other.n
+		self._compress()
+
+	def _compress(self) -> None:
+		while self._size() >= self._max_size():
+			for h, items in enumerate(self.levels):
+				if len(items) >= self._capacity(h):
+					if h + 1 == len(self.levels):
+						self.levels.append([])
+					items.sort()
+					# Keep every other item (random parity), each now counting double
+					self.levels[h + 1].extend(items[self._rng.randint(0, 1) :: 2])
+					self.levels[h] = []
+					break
+			else:
+				return
+
+	def _weighted(self) -> List[Tuple[float, int]]:
+		return sorted((value, 1 << h) for h, items in enumerate(self.levels) for value in items)
+
+	def rank(self, value: float) -> float:
+		"""Approximate fraction of values <= `value` (0.0 for an empty sketch)."""
+		if self.n == 0:
+			return 0.0
+		weight = sum((1 << h) * sum(1 for item in items if item <= value) for h, items in enumerate(self.levels))
+		return min(1.0, weight / self.n)
+
+	def quantiles(self, qs: Sequence[float]) -> List[Optional[float]]:
+		"""Approximate values at each fraction in `qs` (None for an empty sketch)."""
+		weighted = self._weighted()
+		if not weighted:
+			return [None for _ in qs]
+		cumulative: List[int] = []
+		total = 0
+		for _, weight in weighted:
+			total += weight
+			cumulative.append(total)
+		result: List[Optional[float]] = []
+		for q in qs:
+			target = min(max(q, 0.0), 1.0) * total
+			index = min(bisect_right(cumulative, target - 1e-9), len(weighted) - 1)
+			result.append(weighted[index][0])
+		return result
+
+	def to_bytes(self) -> bytes:
+		parts = [_HEADER.pack(self.k, self.n, len(self.levels))]
+		for items in self.levels:
+			parts.append(_LEVEL.pack(len(items)))
+			parts.append(struct.pack(f"<{len(items)}d", *items))
+		return b"".join(parts)
+
+	@classmethod
+	def from_bytes(cls, data: bytes) -> "KLLSketch":
+		k, n, count = _HEADER.unpack_from(data, 0)
+		offset = _HEADER.size
+		levels: List[List[float]] = []
+		for _ in range(count):
+			(length,) = _LEVEL.unpack_from(data, offset)
+			offset += _LEVEL.size
+			levels.append(list(struct.unpack_from(f"<{length}d", data, offset)))
+			offset += 8 * length
+		return cls(k=k, n=n, levels=levels or [[]])
+
+
+@dataclass
+class NetSketch:
+	"""Values added less values retracted, kept as two KLL sketches.
+
+	A value that changes is retracted at its old value and added at the new
+	one, so `n` stays exact; ranks and quantiles carry the error of both
+	sketches.
+	"""
+
+	added: KLLSketch = field(default_factory=KLLSketch)
+	retracted: KLLSketch = field(default_factory=KLLSketch)
+
+	@property
+	def n(self) -> int:
+		return max(0, self.added.n - self.retracted.n)
+
+	def update(self, value: float, previous: Optional[float] = None) -> None:
+		"""Add `value`, replacing `previous` when the value was counted before."""
+		self.added.update(value)
+		if previous is not None:
+			self.retracted.update(previous)
+
+	def merge(self, other: "NetSketch") -> None:
+		self.added.merge(other.added)
+		self.retracted.merge(other.retracted)
+
+	def rank(self, value: float) -> float:
+		"""Approximate fraction of values <= `value` (0.0 for an empty sketch)."""
+		if self.n == 0:
+			return 0.0
+		weight = self.added.rank(value) * self.added.n - self.retracted.rank(value) * self.retracted.n
+		return min(1.0, max(0.0, weight / self.n))
+
+	def quantiles(self, qs: Sequence[float]) -> List[Optional[float]]:
+		"""Approximate values at each fraction in `qs` (None for an empty sketch)."""
+		weighted = sorted(self.added._weighted() + [(value, -weight) for value, weight in self.retracted._weighted()])
+		cumulative: List[int] = []
+		total = peak = 0
+		for _, weight in weighted:
+			total += weight
+			# Retractions can dip the running sum; keep it monotonic for the search
+			peak = max(peak, total)
+			cumulative.append(peak)
+		if total <= 0:
+			return [None for _ in qs]
+		result: List[Optional[float]] = []
+		for q in qs:
+			target = min(max(q, 0.0), 1.0) * total
+			# First value past which more than `target` values are counted
+			index = min(bisect_right(cumulative, max(target - 1e-9, 0.0)), len(weighted) - 1)
+			result.append(weighted[index][0])
+		return result
@@ -0,0 +1,28 @@
+from __future__ import annotations
+
+import time
+from typing import Any, Dict, Optional
+
+
+def enqueue(name: str, *args: Any, profile: Optional[str] = None) -> None:
+	"""Publish a background task by its registered name.
+
+	The Celery app (and Celery itself) is imported on the first call rather
+	than when the API modules are imported. The `enqueued_at` header lets the
+	worker report queue latency (`credence_task_queue_seconds`). With `profile`
+	("collapsed" or "speedscope") the worker samples this run and writes the
+	profile to `profile_output_dir`. In embedded mode the task runs on this
+	process's thread pool instead (see `credence.embedded`).
+	"""
+	from .embedded import task_runner
+
+	headers: Dict[str, Any] = {"enqueued_at": time.time()}
+	if profile:
+		headers["credence_profile"] = profile
+	runner = task_runner()
+	if runner is not None:
+		runner.submit(name, args, headers)
+		return
+	from .worker import celery_app
+
+	celery_app.send_task(name, args=args, headers=headers)
@@ -0,0 +1,148 @@
+"""Pytest helpers, registered as a plugin through the `pytest11` entry point.
+
+`query_budget` fails a test when the code under it runs more SQL statements
+than budgeted, or repeats one statement shape (an N+1). With an endpoint, the
+requests to it that finish inside the block are counted (whichever thread
+served them); without one, the statements run in the block's own context:
+
+	def test_leaderboard(client, query_budget):
+		with query_budget("GET /v1/leaderboard/"):
+			client.get("/v1/leaderboard/?domain=curation")
+
+Budgets for known endpoints live in `ENDPOINT_QUERY_BUDGETS`; pass
+`max_queries`/`max_repeats` to override or for ad-hoc blocks.
+
+`sharded_settings` builds `Settings` over N fresh SQLite shards (plus a home
+database) for tests of routing, scatter-gather reads and resharding:
+
+	def test_balance_routed(sharded_settings):
+		settings = sharded_settings(4)
+
+`embedded_settings` runs Credence embedded on a fresh SQLite file: cache and
+tasks in-process, settings exported to the environment for the app and the
+task runner.
+"""
+
+from __future__ import annotations
+
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, ContextManager, Dict, Iterator, List, Optional, Tuple
+
+import pytest
+
+from .query_stats import QueryStats, listen_query_stats, track_queries
+
+# "METHOD route" -> (max statements, max runs of one statement shape)
+ENDPOINT_QUERY_BUDGETS: Dict[str, Tuple[int, int]] = {
+	"POST /v1/karma/award": (8, 2),
+	"POST /v1/karma/reverse": (7, 2),
+	"GET /v1/trust/{user_id}": (4, 1),
+	"GET /v1/trust/{user_id}/history": (2, 1),
+	"GET /v1/balances/{user_id}": (2, 1),
+	"GET /v1/leaderboard/": (3, 1),
+	"GET /v1/leaderboard/rank/{user_id}": (0, 0),
+	"GET /v1/ledger/{user_id}": (2, 1),
+	"GET /v1/stats/": (6, 1),
+	"POST /v1/disputes/open": (3, 1),
+	"POST /v1/disputes/resolve": (3, 1),
+	"POST /v1/disputes/claim": (2, 1),
+	"POST /v1/disputes/release": (2, 1),
+	"GET /v1/disputes/": (1, 1),
+	"GET /v1/evidence/flagged": (1, 1),
+	"GET /v1/evidence/{entry_id}": (1, 1),
+}
+
+
+class QueryBudgetExceeded(AssertionError):
+	pass
+
+
+def check_budget(stats: QueryStats, label: str, max_queries: Optional[int], max_repeats: Optional[int]) -> None:
+	problems = []
+	if max_queries is not None and stats.count > max_queries:
+		problems.append(f"{stats.count} statements (budget {max_queries})")
+	if max_repeats is not None and stats.max_repeats > max_repeats:
+		problems.append(f"a statement shape ran {stats.max_repeats} times (budget {max_repeats})")
+	if problems:
+		shapes = "\n".join(f"  {n}x {shape}" for shape, n in stats.shapes.most_common(10))
+		raise QueryBudgetExceeded(f"{label}: " + "; ".join(problems) + f"\n{shapes}")
+
+
+@contextmanager
+def _budget(
+	endpoint: Optional[str] = None,
+	*,
+	max_queries: Optional[int] = None,
+	max_repeats: Optional[int] = None,
+) -> Iterator[QueryStats]:
+	if endpoint is None:
+		with track_queries() as stats:
+			yield stats
+		check_budget(stats, "block", max_queries, max_repeats)
+		return
+	if endpoint not in ENDPOINT_QUERY_BUDGETS and max_queries is None:
+		raise KeyError(f"No query budget for {endpoint!r}; add it to ENDPOINT_QUERY_BUDGETS")
+	default_queries, default_repeats = ENDPOINT_QUERY_BUDGETS.get(endpoint, (None, None))  # type: ignore[arg-type]
+	max_queries = default_queries if max_queries is None else max_queries
+	max_repeats = default_repeats if max_repeats is None else max_repeats
+	# Requests are served on the test client's thread, so their statements are
+	# taken from the API's per-request stats rather than this context
+	stats = QueryStats()
+	requests: List[QueryStats] = []
+
+	def collect(scope: str, request_stats: QueryStats) -> None:
+		if scope == endpoint:
+			requests.append(request_stats)
+
+	with listen_query_stats(collect):
+		yield stats
+	if not requests:
+		raise AssertionError(f"No {endpoint} request finished inside the query budget block")
+	for request_stats in requests:
+		stats.merge(request_stats)
+	check_budget(stats, endpoint, max_queries, max_repeats)
+
+
+@pytest.fixture
+def query_budget() -> Callable[..., ContextManager[QueryStats]]:
+	"""Context manager factory asserting SQL statement budgets (see module docstring)."""
+	return _budget
+
+
+@pytest.fixture
+def sharded_settings(tmp_path: Path) -> Callable[..., Any]:
+	"""Factory of `Settings` with `count` SQLite shards, schema created on each."""
+	from sqlalchemy import create_engine
+
+	from .config import Settings
+	from .db import Base
+
+	def build(count: int, **overrides: Any) -> Settings:
+		urls = [f"sqlite:///{tmp_path / f'shard{i}.db'}" for i in range(count)]
+		home = f"sqlite:///{tmp_path / 'home.db'}"
+		for url in [home, *urls]:
+			engine = create_engine(url, future=True)
+			Base.metadata.create_all(engine)
+			engine.dispose()
+		return Settings(database_url=home, shard_database_urls=urls, **overrides)
+
+	return build
+
+
+@pytest.fixture
+def embedded_settings(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Iterator[Any]:
+	"""`Settings` in embedded mode on a SQLite file, started and torn down around the test."""
+	from . import embedded
+	from .config import Settings
+
+	monkeypatch.setenv("CREDENCE_EMBEDDED", "true")
+	monkeypatch.setenv("CREDENCE_DATABASE_URL", f"sqlite:///{tmp_path / 'credence.db'}")
+	settings = Settings.from_env_and_file()
+	embedded.local_redis().flushall()
+	embedded.start(settings)
+	try:
+		yield settings
+	finally:
+		embedded.stop()
+		embedded.local_redis().flushall()
@@ -1,96 +1,364 @@
 from __future__ import annotations
 
 import os
+import threading
+import time
+from contextvars import Token
 from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
 
 from celery import Celery
+from celery.signals import (
+	task_postrun,
+	task_prerun,
+	worker_init,
+	worker_process_init,
+	worker_process_shutdown,
+)
 
 from .config import Settings
-from .cache import RedisCache, trust_cache_key
-from .db import LedgerEntry, Verification, TrustScore
-from .plugins import load_symbol
-from sqlalchemy import func, and_
+from .cache import RedisCache, balance_cache_key, trust_cache_key
+from .db import EvidenceStatusEnum, LedgerEntry, create_session_factory, ensure_ledger_partitions
+from .metrics import TASK_QUEUE_SECONDS, TASK_SECONDS, StageAccumulator, stage, unwrap_plugin
+from .plugins import PluginRegistry
+from .query_stats import QueryStats, observe_query_stats, start_query_stats, stop_query_stats
+from .profiling import PROFILE_FORMATS, SamplingProfiler, write_profile
+from .services.checkpoints import CheckpointService
+from .services.distributions import DistributionService, SketchBuffer
+from .services.evidence import EvidenceValidationService
+from .services.evidence_status import EvidenceStatusService
+from .services.integrity import IntegrityService
+from .services.rank_index import RankIndex
+from .services.rollups import RollupService
+from .services.trust import TrustService
+from .services.trust_history import TrustHistoryService
+from .sharding import ShardRouter
+from .tasks import enqueue
+from sqlalchemy import and_
 from sqlalchemy.orm import Session, sessionmaker
 
 
+EVIDENCE_QUEUE = "evidence"
+
+
+def celery_config(settings: Settings) -> Dict[str, Any]:
+	return {
+		"broker_url": os.getenv("CELERY_BROKER_URL", settings.redis_url),
+		"result_backend": os.getenv("CELERY_RESULT_BACKEND", settings.redis_url),
+		# Slow evidence checks run on their own bounded pool (see docker/entrypoint.py)
+		"task_routes": {"credence.tasks.validate_evidence": {"queue": EVIDENCE_QUEUE}},
+		"beat_schedule": {
+			"ensure-ledger-partitions": {
+				"task": "credence.tasks.ensure_ledger_partitions",
+				"schedule": 24 * 60 * 60.0,
+			},
+			"checkpoint-balances": {
+				"task": "credence.tasks.checkpoint_balances",
+				"schedule": float(settings.balance_checkpoint_interval_seconds),
+			},
+			"seal-ledger-segments": {
+				"task": "credence.tasks.seal_ledger_segments",
+				"schedule": 5 * 60.0,
+			},
+			"advance-rollups": {
+				"task": "credence.tasks.advance_rollups",
+				"schedule": 60.0,
+			},
+			"compact-trust-history": {
+				"task": "credence.tasks.compact_trust_history",
+				"schedule": 60 * 60.0,
+			},
+			"sweep-pending-evidence": {
+				"task": "credence.tasks.sweep_pending_evidence",
+				"schedule": 5 * 60.0,
+			},
+			"rebuild-distributions": {
+				"task": "credence.tasks.rebuild_distributions",
+				"schedule": 24 * 60 * 60.0,
+			},
+		},
+	}
+
+
 def make_celery(settings: Settings | None = None) -> Celery:
-	settings = settings or Settings.from_env_and_file()
-	celery_app = Celery(
-		"credence",
-		broker=os.getenv("CELERY_BROKER_URL", settings.redis_url),
-		backend=os.getenv("CELERY_RESULT_BACKEND", settings.redis_url),
-	)
+	celery_app = Celery("credence")
+	if settings is not None:
+		celery_app.conf.update(celery_config(settings))
+	else:
+		# Loaded on first access to celery_app.conf, so importing this module
+		# neither reads settings nor touches the broker
+		celery_app.config_from_object("credence.celeryconfig")
 	return celery_app
 
 
 celery_app = make_celery()
 
 
+@dataclass
+class WorkerResources:
+	"""Per-process state shared by every task run in a worker process.
+
+	One settings object, one SQLAlchemy engine (and its pool), one Redis
+	connection pool, one plugin registry and one buffer of distribution
+	sketch values, created after the worker forks.
+	"""
+
+	settings: Settings
+	session_factory: sessionmaker[Session]
+	cache: RedisCache
+	plugins: PluginRegistry
+	sketches: SketchBuffer
+	# User-scoped tasks run on the user's shard; `session_factory` is the home database
+	shards: ShardRouter
+
+	@classmethod
+	def create(cls) -> "WorkerResources":
+		settings = Settings.from_env_and_file()
+		session_factory = create_session_factory(settings)
+		return cls(
+			settings=settings,
+			session_factory=session_factory,
+			cache=RedisCache.from_settings(settings),
+			plugins=PluginRegistry(settings=settings),
+			sketches=SketchBuffer(),
+			shards=ShardRouter.from_settings(
+				settings,
+				factory_for=lambda url: session_factory if url == settings.database_url else create_session_factory(settings, url=url),
+			),
+		)
+
+	def flush_sketches(self) -> int:
+		"""Merge buffered trust/karma values into today's stored sketches."""
+		sketches = self.sketches.drain()
+		if not sketches:
+			return 0
+		session = self.session_factory()
+		try:
+			return DistributionService(session=session).merge(sketches)
+		finally:
+			session.close()
+
+	def close(self) -> None:
+		try:
+			self.flush_sketches()
+		except Exception:
+			# Losing a few buffered values only skews today's sketch slightly
+			pass
+		engine = self.session_factory.kw.get("bind")
+		if engine is not None:
+			engine.dispose()
+		self.shards.dispose()
+		self.cache.client.close()
+
+
+_resources: Optional[WorkerResources] = None
+
+
+@worker_process_init.connect
+def _init_worker_process(**_: Any) -> None:
+	global _resources
+	# Never reuse connections inherited from the parent across fork
+	_resources = WorkerResources.create()
+
+
+@worker_process_shutdown.connect
+def _shutdown_worker_process(**_: Any) -> None:
+	global _resources
+	if _resources is not None:
+		_resources.close()
+		_resources = None
+	if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+		from prometheus_client import multiprocess
+
+		multiprocess.mark_process_dead(os.getpid())
+
+
+@worker_init.connect
+def _start_metrics_server(**_: Any) -> None:
+	# Runs once in the main worker process. With the prefork pool, set
+	# PROMETHEUS_MULTIPROC_DIR so samples from every child are aggregated.
+	port = Settings.from_env_and_file().worker_metrics_port
+	if port is None:
+		return
+	from prometheus_client import CollectorRegistry, start_http_server
+
+	if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+		from prometheus_client import multiprocess
+
+		registry = CollectorRegistry()
+		multiprocess.MultiProcessCollector(registry)
+		start_http_server(port, registry=registry)
+	else:
+		start_http_server(port)
+
+
+_task_started: Dict[str, float] = {}
+_task_queries: Dict[str, Tuple[QueryStats, Token[Optional[QueryStats]]]] = {}
+_task_profiles: Dict[str, Tuple[SamplingProfiler, str]] = {}
+
+
+def _request_header(task: Any, name: str) -> Any:
+	# Custom message headers show up as request attributes or under `headers`
+	value = getattr(task.request, name, None)
+	if value is None:
+		value = (getattr(task.request, "headers", None) or {}).get(name)
+	return value
+
+
+@task_prerun.connect
+def _observe_task_start(task_id: str | None = None, task: Any = None, **_: Any) -> None:
+	if task is None or task_id is None:
+		return
+	now = time.time()
+	_task_started[task_id] = time.perf_counter()
+	enqueued_at = _request_header(task, "enqueued_at")
+	if enqueued_at is not None:
+		TASK_QUEUE_SECONDS.labels(task.name).observe(max(0.0, now - float(enqueued_at)))
+
+
+@task_postrun.connect
+def _observe_task_end(task_id: str | None = None, task: Any = None, state: str | None = None, **_: Any) -> None:
+	started = _task_started.pop(task_id, None) if task_id is not None else None
+	if task is None or started is None:
+		return
+	TASK_SECONDS.labels(task.name, state or "UNKNOWN").observe(time.perf_counter() - started)
+
+
+@task_prerun.connect
+def _start_query_stats(task_id: str | None = None, **_: Any) -> None:
+	if task_id is not None:
+		_task_queries[task_id] = start_query_stats()
+
+
+@task_postrun.connect
+def _finish_query_stats(task_id: str | None = None, task: Any = None, **_: Any) -> None:
+	found = _task_queries.pop(task_id, None) if task_id is not None else None
+	if found is None:
+		return
+	stats, token = found
+	stop_query_stats(token)
+	if task is not None:
+		observe_query_stats(task.name, stats)
+
+
+@task_prerun.connect
+def _start_task_profile(task_id: str | None = None, task: Any = None, **_: Any) -> None:
+	# Requested per message (`enqueue(..., profile=...)`) or for every run of
+	# the names in `profile_tasks`; otherwise nothing is sampled
+	if task is None or task_id is None:
+		return
+	fmt = _request_header(task, "credence_profile")
+	if fmt is None and task.name in get_resources().settings.profile_tasks:
+		fmt = "collapsed"
+	if fmt not in PROFILE_FORMATS:
+		return
+	# Tasks run on the thread that fires task_prerun; sample only that thread
+	profiler = SamplingProfiler(thread_ids=[threading.get_ident()]).start()
+	_task_profiles[task_id] = (profiler, fmt)
+
+
+@task_postrun.connect
+def _finish_task_profile(task_id: str | None = None, task: Any = None, **_: Any) -> None:
+	found = _task_profiles.pop(task_id, None) if task_id is not None else None
+	if found is None or task is None:
+		return
+	profiler, fmt = found
+	profiler.stop()
+	write_profile(profiler, get_resources().settings.profile_output_dir, f"{task.name}-{task_id}", fmt)
+
+
+def get_resources() -> WorkerResources:
+	"""Process resources; created on first use when no worker hook ran (solo/eager)."""
+	global _resources
+	if _resources is None:
+		_resources = WorkerResources.create()
+	return _resources
+
+
+def _fan_out(name: str, shard: Optional[int], *args: Any) -> Optional[str]:
+	"""Queue one run of task `name` per shard when sharded and no shard was given.
+
+	Returns the task result in that case, None when the caller should run.
+	Shard runs are independent tasks, so N shards are maintained in parallel.
+	"""
+	shards = get_resources().shards
+	if shard is not None or not shards.sharded:
+		return None
+	for index in range(shards.count):
+		enqueue(name, *args, index)
+	return f"{name.rsplit('.', 1)[-1]}:shards={shards.count}"
+
+
+def _shard_session(shard: Optional[int]) -> Session:
+	res = get_resources()
+	return res.session_factory() if shard is None else res.shards.factory(shard)()
+
+
 @celery_app.task(name="credence.tasks.recompute_trust")
 def recompute_trust_task(user_id: str, domain: str | None = None) -> str:
-	"""Compute trust, persist a snapshot, and cache the current value."""
-	settings = Settings.from_env_and_file()
-	# Build a session factory locally to avoid global coupling
-	from .db import create_session_factory
-	session_factory: sessionmaker[Session] = create_session_factory(settings)
-	session = session_factory()
+	"""Compute trust, persist a snapshot if it changed, and cache the current value."""
+	res = get_resources()
+	session = res.shards.factory_for_user(user_id)()
 	try:
-		# Compute balance
-		q = session.query(func.coalesce(func.sum(LedgerEntry.points), 0)).filter(LedgerEntry.user_id == user_id)
-		if domain is not None:
-			q = q.filter(LedgerEntry.domain == domain)
-		balance = int(q.scalar_one())
-
-		# Verification level (max of external/internal via provider)
-		external_level = int(
-			session.query(func.coalesce(func.max(Verification.level), 0))
-			.filter(Verification.user_id == user_id, Verification.source == "external")
-			.scalar_one()
-		)
-		internal_level = int(
-			session.query(func.coalesce(func.max(Verification.level), 0))
-			.filter(Verification.user_id == user_id, Verification.source == "internal")
-			.scalar_one()
-		)
-		provider_cls = load_symbol(settings.plugins.verification_provider)
-		provider = provider_cls()  # type: ignore[call-arg]
-		verif_level = int(provider.effective_level(external_level, internal_level))
-
-		# Trust formula
-		formula_cls = load_symbol(settings.plugins.trust_formula)
-		formula = formula_cls()  # type: ignore[call-arg]
-		trust_value = float(formula.compute(balance, verif_level))
-
-		# Persist snapshot
-		rec = TrustScore(
-			user_id=user_id,
-			domain=domain,
-			trust=trust_value,
-			karma_balance=balance,
-			verification_level=verif_level,
-		)
-		session.add(rec)
-		session.commit()
+		# Balance, verification level (from the current_verification projection) and trust formula
+		service = TrustService(session=session, settings=res.settings, plugins=res.plugins, cache=res.cache)
+		with stage("tasks.recompute_trust", "compute"):
+			trust_value, balance, verif_level = service.compute_trust(user_id, domain)
+
+		# Persist a snapshot only when something changed
+		with stage("tasks.recompute_trust", "persist"):
+			history = TrustHistoryService(session=session)
+			previous = history.latest(user_id, domain)
+			changed = history.record(
+				user_id,
+				domain,
+				trust_value,
+				balance,
+				verif_level,
+				tolerance=res.settings.trust_snapshot_tolerance,
+				previous=previous,
+			)
+			session.commit()
 
 		# Cache current trust
-		cache = RedisCache.from_settings(settings)
-		cache.set(trust_cache_key(user_id, domain), str(trust_value), ttl_seconds=60)
+		with stage("tasks.recompute_trust", "cache_set"):
+			res.cache.set(trust_cache_key(user_id, domain), str(trust_value), ttl_seconds=60)
+
+		# Feed the distribution sketches, which count the latest snapshot of each
+		# user: a change replaces the previous snapshot's values. Stored rows are
+		# updated in batches
+		if changed:
+			res.sketches.add("trust", domain, user_id, trust_value, previous.trust if previous is not None else None)
+			res.sketches.add("karma", domain, user_id, balance, previous.karma_balance if previous is not None else None)
+		if res.sketches.due():
+			with stage("tasks.recompute_trust", "sketch_flush"):
+				res.flush_sketches()
 		return f"trust:{user_id}:{domain or '_all'}={trust_value}"
 	finally:
 		session.close()
 
 
+@celery_app.task(name="credence.tasks.recompute_trust_batch")
+def recompute_trust_batch_task(user_ids: list[str]) -> str:
+	"""Recompute and cache overall trust for many users in one task (after imports)."""
+	for user_id in user_ids:
+		recompute_trust_task(user_id)
+	return f"trust:recomputed={len(user_ids)}"
+
+
 @celery_app.task(name="credence.tasks.apply_decay")
-def apply_decay_task() -> str:
+def apply_decay_task(shard: int | None = None) -> str:
 	"""Apply decay policies and write compensating ledger entries for old items."""
-	settings = Settings.from_env_and_file()
-	from .db import create_session_factory
-	session_factory: sessionmaker[Session] = create_session_factory(settings)
-	session = session_factory()
+	fanned = _fan_out("credence.tasks.apply_decay", shard)
+	if fanned is not None:
+		return fanned
+	res = get_resources()
+	session = _shard_session(shard)
+	# Hot loop: time stages with an accumulator (one observation per stage per
+	# run) and call the plugin without its per-call timing proxy
+	timings = StageAccumulator("tasks.apply_decay")
 	try:
-		# Load decay policy plugin
-		policy_cls = load_symbol(settings.plugins.decay_policy)
-		policy = policy_cls()  # type: ignore[call-arg]
+		policy = unwrap_plugin(res.plugins.decay_policy)
 		# Iterate a limited batch of old entries and apply decay once per original
 		from datetime import datetime, timezone, timedelta
 		import math
@@ -107,20 +375,25 @@ def apply_decay_task() -> str:
 		applied = 0
 		for orig in old_entries:
 			# check if a decay entry already exists for this original
-			exists = (
-				session.query(LedgerEntry.id)
-				.filter(
-					and_(
-						LedgerEntry.related_entry_id == orig.id,
-						LedgerEntry.action == "decay",
+			# decay entries are always newer than their original; bounding on
+			# created_at lets the planner skip older ledger partitions
+			with timings.time("exists_check"):
+				exists = (
+					session.query(LedgerEntry.id)
+					.filter(
+						and_(
+							LedgerEntry.related_entry_id == orig.id,
+							LedgerEntry.action == "decay",
+							LedgerEntry.created_at >= orig.created_at,
+						)
 					)
+					.first()
 				)
-				.first()
-			)
 			if exists:
 				continue
 			age_days = (now - orig.created_at).total_seconds() / 86400.0
-			decayed_points = int(policy.apply(orig.points, age_days))
+			with timings.time("policy"):
+				decayed_points = int(policy.apply(orig.points, age_days))
 			if decayed_points < orig.points:
 				delta = decayed_points - orig.points
 				entry = LedgerEntry(
@@ -132,11 +405,155 @@ def apply_decay_task() -> str:
 					evidence_ref=orig.evidence_ref,
 					evidence_status=orig.evidence_status,
 				)
-				session.add(entry)
-				session.commit()
+				with timings.time("insert"):
+					IntegrityService(session=session).chain(entry)
+					session.add(entry)
+					session.flush()
+					EvidenceStatusService(session=session).record_derived(entry)
+					session.commit()
+				with timings.time("rank_index"):
+					RankIndex(client=res.cache.client).record(entry.user_id, entry.domain, entry.points, entry.created_at)
 				applied += 1
 		return f"decay:applied={applied}"
 	finally:
+		timings.flush()
+		session.close()
+
+
+@celery_app.task(name="credence.tasks.validate_evidence")
+def validate_evidence_task(entry_ids: list[int], shard: int | None = None) -> str:
+	"""Validate pending entries' evidence and record the outcomes as evidence flags.
+
+	`shard` is the shard holding the entries (None when unsharded).
+	"""
+	res = get_resources()
+	session = _shard_session(shard)
+	try:
+		service = EvidenceValidationService(settings=res.settings, cache=res.cache, validator=res.plugins.evidence_validator)
+		outcomes = service.complete(session, entry_ids)
+	finally:
+		session.close()
+	# Red outcomes change balances and trust when red entries are excluded
+	red = {(user_id, domain) for user_id, domain, status in outcomes if status == EvidenceStatusEnum.RED.value}
+	if red:
+		res.cache.delete(
+			*[balance_cache_key(u, d) for u, domain in red for d in (None, domain)],
+			*[trust_cache_key(u, d) for u, domain in red for d in (None, domain)],
+		)
+		for user_id in sorted({u for u, _ in red}):
+			enqueue("credence.tasks.recompute_trust", user_id)
+	return f"evidence:validated={len(outcomes)}"
+
+
+@celery_app.task(name="credence.tasks.sweep_pending_evidence")
+def sweep_pending_evidence_task(shard: int | None = None) -> str:
+	"""Re-queue pending entries whose validation task was lost, in batches."""
+	fanned = _fan_out("credence.tasks.sweep_pending_evidence", shard)
+	if fanned is not None:
+		return fanned
+	res = get_resources()
+	session = _shard_session(shard)
+	try:
+		service = EvidenceValidationService(settings=res.settings, cache=res.cache, validator=res.plugins.evidence_validator)
+		stale = service.stale_pending(session, limit=res.settings.evidence_batch_size * 10)
+	finally:
+		session.close()
+	batch = res.settings.evidence_batch_size
+	for i in range(0, len(stale), batch):
+		enqueue("credence.tasks.validate_evidence", stale[i : i + batch], shard)
+	return f"evidence:requeued={len(stale)}"
+
+
+@celery_app.task(name="credence.tasks.ensure_ledger_partitions")
+def ensure_ledger_partitions_task(months_ahead: int = 3, shard: int | None = None) -> str:
+	"""Pre-create upcoming monthly ledger partitions so inserts never miss one."""
+	fanned = _fan_out("credence.tasks.ensure_ledger_partitions", shard, months_ahead)
+	if fanned is not None:
+		return fanned
+	session = _shard_session(shard)
+	try:
+		created = ensure_ledger_partitions(session, months_ahead=months_ahead)
+		return f"partitions:created={created}"
+	finally:
+		session.close()
+
+
+@celery_app.task(name="credence.tasks.checkpoint_balances")
+def checkpoint_balances_task(shard: int | None = None) -> str:
+	"""Write balance checkpoints for every (user, domain) active since the last run."""
+	fanned = _fan_out("credence.tasks.checkpoint_balances", shard)
+	if fanned is not None:
+		return fanned
+	session = _shard_session(shard)
+	try:
+		written = CheckpointService(session=session).write_checkpoints()
+		return f"checkpoints:written={written}"
+	finally:
+		session.close()
+
+
+@celery_app.task(name="credence.tasks.seal_ledger_segments")
+def seal_ledger_segments_task(shard: int | None = None) -> str:
+	"""Seal settled ledger id ranges into chained Merkle segment roots (one chain per shard)."""
+	fanned = _fan_out("credence.tasks.seal_ledger_segments", shard)
+	if fanned is not None:
+		return fanned
+	res = get_resources()
+	session = _shard_session(shard)
+	try:
+		sealed = IntegrityService(session=session, segment_size=res.settings.ledger_segment_size).seal_segments()
+		return f"segments:sealed={sealed}"
+	finally:
+		session.close()
+
+
+@celery_app.task(name="credence.tasks.advance_rollups")
+def advance_rollups_task(shard: int | None = None) -> str:
+	"""Fold ledger entries since the watermark into the hourly/daily rollups."""
+	fanned = _fan_out("credence.tasks.advance_rollups", shard)
+	if fanned is not None:
+		return fanned
+	session = _shard_session(shard)
+	try:
+		touched = RollupService(session=session).advance()
+		return f"rollups:hourly_buckets={touched}"
+	finally:
+		session.close()
+
+
+@celery_app.task(name="credence.tasks.rebuild_distributions")
+def rebuild_distributions_task(keep_days: int = 90) -> str:
+	"""Rebuild today's trust/karma sketches from the latest snapshots and drop old days.
+
+	Snapshots are read from every shard; the sketches live on the home database.
+	"""
+	res = get_resources()
+	res.flush_sketches()
+	session = res.session_factory()
+	sources = [res.shards.factory(i)() for i in range(res.shards.count)] if res.shards.sharded else None
+	try:
+		service = DistributionService(session=session)
+		snapshots = service.rebuild(sources=sources)
+		pruned = service.prune(keep_days)
+		return f"distributions:snapshots={snapshots},pruned={pruned}"
+	finally:
+		for source in sources or []:
+			source.close()
 		session.close()
 
 
+@celery_app.task(name="credence.tasks.compact_trust_history")
+def compact_trust_history_task(shard: int | None = None) -> str:
+	"""Thin aged trust snapshots to one per hour, then one per day."""
+	fanned = _fan_out("credence.tasks.compact_trust_history", shard)
+	if fanned is not None:
+		return fanned
+	res = get_resources()
+	session = _shard_session(shard)
+	try:
+		deleted = TrustHistoryService(session=session).compact(
+			res.settings.trust_history_raw_days, res.settings.trust_history_hourly_days
+		)
+		return f"trust_history:deleted_hourly={deleted['hour']},deleted_daily={deleted['day']}"
+	finally:
+		session.close()
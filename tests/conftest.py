@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+import os
+from pathlib import Path
+from typing import Iterator
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+
+from credence.config import Settings
+from credence.db import Base, create_session_factory
+
+# The plugin is registered through the `pytest11` entry point once the package
+# is installed; importing the fixtures keeps a source checkout working too.
+from credence.testing import embedded_settings, query_budget, sharded_settings  # noqa: F401
+
+
+@pytest.fixture
+def settings(tmp_path: Path) -> Settings:
+	"""`Settings` over a fresh SQLite file with the schema created."""
+	settings = Settings(database_url=f"sqlite:///{tmp_path / 'credence.db'}")
+	factory = create_session_factory(settings)
+	Base.metadata.create_all(factory.kw["bind"])
+	return settings
+
+
+@pytest.fixture
+def session(settings: Settings) -> Iterator[Session]:
+	session = create_session_factory(settings)()
+	try:
+		yield session
+	finally:
+		session.close()
+
+
+@pytest.fixture
+def postgres_url() -> str:
+	"""URL of a migrated, disposable PostgreSQL database, from CREDENCE_TEST_POSTGRES_URL."""
+	url = os.environ.get("CREDENCE_TEST_POSTGRES_URL")
+	if not url:
+		pytest.skip("CREDENCE_TEST_POSTGRES_URL is not set")
+	return url
+
+
+@pytest.fixture
+def api_env(monkeypatch: pytest.MonkeyPatch) -> None:
+	"""Domains and admins for API tests; requested before the app settings are read."""
+	monkeypatch.setenv(
+		"CREDENCE_DOMAINS",
+		'{"posts": {"upvote": {"points": 1}}, "curation": {"feature": {"points": 10, "requires_evidence": true}}}',
+	)
+	monkeypatch.setenv("CREDENCE_ADMIN_USER_IDS", '["admin"]')
+
+
+@pytest.fixture
+def client(api_env: None, embedded_settings: Settings) -> Iterator[TestClient]:
+	"""API client over an embedded (SQLite, in-process cache and tasks) deployment."""
+	from credence.api.main import make_app
+
+	with TestClient(make_app()) as client:
+		yield client
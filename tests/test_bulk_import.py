@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import io
+from datetime import datetime, timedelta, timezone
+
+from credence.config import DomainActionConfig, Settings
+from credence.db import BalanceCheckpoint, LedgerEntry
+from credence.services.bulk_import import BulkImporter, ImportRecordError, ImportResult, iter_records
+from credence.services.checkpoints import CheckpointService
+
+T0 = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+def test_malformed_ndjson_line_is_rejected_and_skipped():
+	stream = io.StringIO('{"user_id": "a"}\n{not json\n\n[1]\n{"user_id": "b"}\n')
+	records = list(iter_records(stream, "ndjson"))
+	assert [r if isinstance(r, dict) else str(r) for r in records] == [
+		{"user_id": "a"},
+		"line 2: invalid JSON",
+		"line 4: not a JSON object",
+		{"user_id": "b"},
+	]
+
+	settings = Settings(domains={"posts": {"upvote": DomainActionConfig(points=1)}})
+	importer = BulkImporter(settings=settings, import_id="test", rejects=io.StringIO())
+	result = ImportResult()
+	chunk = [
+		{"user_id": "a", "domain": "posts", "action": "upvote", "created_at": "2026-01-01T00:00:00Z"},
+		ImportRecordError("line 2: invalid JSON"),
+	]
+	rows = importer._validate(0, chunk, result)
+	assert [row[0] for row in rows] == ["a"]
+	assert result.rejected == 1
+	assert result.errors == ["line 2: invalid JSON"]
+
+
+def test_rebuild_keeps_other_users_and_cadence(session):
+	service = CheckpointService(session=session)
+	for user_id, minutes in (("alice", 10), ("bob", 20), ("bob", 80)):
+		session.add(
+			LedgerEntry(
+				user_id=user_id, domain="posts", action="upvote", points=1, created_at=T0 + timedelta(minutes=minutes)
+			)
+		)
+	session.commit()
+	service.write_checkpoints(T0 + timedelta(hours=1))
+	service.write_checkpoints(T0 + timedelta(hours=2))
+	alice_before = [
+		(cp.balance, cp.checkpoint_at) for cp in session.query(BalanceCheckpoint).filter_by(user_id="alice")
+	]
+
+	# Back-dated rows for bob, before the first run and after the last one
+	for minutes, points in ((5, 10), (150, 100)):
+		session.add(
+			LedgerEntry(
+				user_id="bob", domain="posts", action="upvote", points=points, created_at=T0 + timedelta(minutes=minutes)
+			)
+		)
+	session.commit()
+	assert service.rebuild(["bob"]) == 2
+
+	alice_after = [
+		(cp.balance, cp.checkpoint_at) for cp in session.query(BalanceCheckpoint).filter_by(user_id="alice")
+	]
+	assert alice_after == alice_before
+	bob = session.query(BalanceCheckpoint).filter_by(user_id="bob").order_by(BalanceCheckpoint.checkpoint_at).all()
+	assert [(cp.balance, cp.entry_count) for cp in bob] == [(11, 2), (12, 3)]
+	assert service.balance_as_of("bob", "posts", T0 + timedelta(minutes=30)) == 11
+	assert service.balance_as_of("bob", "posts", T0 + timedelta(hours=3)) == 112
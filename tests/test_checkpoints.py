@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+
+from credence.db import BalanceCheckpoint, LedgerEntry
+from credence.services.checkpoints import CheckpointService
+
+T0 = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+def _entry(session, points, created_at, user_id="alice", domain="curation"):
+	session.add(LedgerEntry(user_id=user_id, domain=domain, action="award", points=points, created_at=created_at))
+	session.commit()
+
+
+def test_balance_as_of_uses_checkpoints(session):
+	_entry(session, 5, T0 + timedelta(minutes=10))
+	_entry(session, 7, T0 + timedelta(minutes=70))
+	service = CheckpointService(session=session)
+	assert service.write_checkpoints(T0 + timedelta(hours=1)) == 1
+	assert service.write_checkpoints(T0 + timedelta(hours=2)) == 1
+
+	assert service.balance_as_of("alice", "curation", T0 + timedelta(minutes=30)) == 5
+	assert service.balance_as_of("alice", None, T0 + timedelta(hours=3)) == 12
+
+
+def test_late_commit_corrects_checkpoints(session):
+	service = CheckpointService(session=session)
+	_entry(session, 5, T0 + timedelta(minutes=10))
+	service.write_checkpoints(T0 + timedelta(hours=1))
+	# Committed after the run whose cutoff already covered its created_at
+	_entry(session, 3, T0 + timedelta(minutes=50))
+	_entry(session, 1, T0 + timedelta(minutes=80))
+	service.write_checkpoints(T0 + timedelta(hours=2))
+
+	balances = [
+		cp.balance for cp in session.query(BalanceCheckpoint).order_by(BalanceCheckpoint.checkpoint_at)
+	]
+	assert balances == [8, 9]
+	assert service.balance_as_of("alice", "curation", T0 + timedelta(minutes=55)) == 8
+	assert service.balance_as_of("alice", "curation", T0 + timedelta(hours=3)) == 9
+
+
+def test_late_commit_without_new_entries_is_checkpointed(session):
+	service = CheckpointService(session=session)
+	_entry(session, 5, T0 + timedelta(minutes=10), user_id="alice")
+	_entry(session, 2, T0 + timedelta(minutes=20), user_id="bob")
+	service.write_checkpoints(T0 + timedelta(hours=1))
+	_entry(session, 4, T0 + timedelta(minutes=40), user_id="bob", domain="review")
+	assert service.write_checkpoints(T0 + timedelta(hours=2)) == 1
+	assert service.balance_as_of("bob", None, T0 + timedelta(hours=3)) == 6
+	assert service.write_checkpoints(T0 + timedelta(hours=3)) == 0
@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+from datetime import date, timedelta
+
+from credence.db import DistributionSketch, TrustScore
+from credence.services import distributions
+from credence.services.distributions import DistributionService, SketchBuffer, cached_sketch
+
+DAY = date(2026, 1, 2)
+
+
+def test_buffer_keeps_one_value_per_user():
+	buffer = SketchBuffer()
+	for value in (1.0, 2.0, 3.0):
+		buffer.add("trust", None, "alice", value)
+	buffer.add("trust", None, "bob", 0.5)
+	sketches = buffer.drain()
+	assert sketches[("trust", "_all")].n == 2
+	assert sketches[("trust", "_all")].rank(2.9) == 0.5
+	assert buffer.drain() == {}
+
+
+def test_new_day_starts_from_previous_sketch(session):
+	service = DistributionService(session=session)
+	yesterday = SketchBuffer()
+	for i in range(100):
+		yesterday.add("trust", None, f"user-{i}", float(i))
+	service.merge(yesterday.drain(), DAY - timedelta(days=1))
+
+	# user-0 changes in two flushes: still counted once
+	for previous, value in ((0.0, 99.0), (99.0, 150.0)):
+		today = SketchBuffer()
+		today.add("trust", None, "user-0", value, previous)
+		service.merge(today.drain(), DAY)
+	sketch = service.latest("trust", None, DAY)
+	assert sketch.n == 100
+	assert sketch.rank(0.5) == 0.0
+	assert sketch.rank(99.0) == 0.99
+	assert sketch.quantiles([0.0, 1.0]) == [1.0, 150.0]
+	assert service.latest("trust", None, DAY - timedelta(days=1)).n == 100
+
+
+def test_buffer_retracts_the_value_counted_before_the_first_change():
+	buffer = SketchBuffer()
+	buffer.add("trust", None, "alice", 2.0, 1.0)
+	buffer.add("trust", None, "alice", 3.0, 2.0)
+	sketch = buffer.drain()[("trust", "_all")]
+	assert (sketch.added.n, sketch.retracted.n) == (1, 1)
+	assert sketch.retracted.quantiles([0.5]) == [1.0]
+
+
+def test_rebuild_replaces_the_day_unseeded(session):
+	service = DistributionService(session=session)
+	for day, user_id in ((DAY - timedelta(days=1), "alice"), (DAY, "carol")):
+		buffer = SketchBuffer()
+		buffer.add("trust", None, user_id, 1.0)
+		buffer.add("trust", "posts", user_id, 1.0)
+		service.merge(buffer.drain(), day)
+	session.add(TrustScore(user_id="bob", domain=None, trust=2.0, karma_balance=3, verification_level=0))
+	session.commit()
+
+	assert service.rebuild(DAY) == 1
+	assert service.latest("trust", None, DAY).n == 1
+	assert service.latest("karma", None, DAY).n == 1
+	# Rows of the day with no snapshots left are dropped
+	assert session.query(DistributionSketch).filter_by(day=DAY, domain="posts").count() == 0
+
+
+def test_read_cache_is_bounded(session, monkeypatch):
+	monkeypatch.setattr(distributions, "READ_CACHE_MAX_ENTRIES", 3)
+	monkeypatch.setattr(distributions, "_read_cache", distributions.OrderedDict())
+	for i in range(10):
+		cached_sketch(session, "trust", None, DAY - timedelta(days=i))
+	assert len(distributions._read_cache) == 3
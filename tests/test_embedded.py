@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from credence.db import KarmaRollupHourly, LedgerEntry, create_session_factory
+from credence.integrity import entry_digest
+from credence.services.rollups import RollupService
+
+
+def _award(client, user):
+	response = client.post("/v1/karma/award", json={"domain": "posts", "action": "upvote"}, headers={"X-User-Id": user})
+	assert response.status_code == 200, response.text
+	return response.json()
+
+
+def test_concurrent_awards_keep_one_chain(client, embedded_settings):
+	with ThreadPoolExecutor(max_workers=8) as pool:
+		entries = list(pool.map(lambda _: _award(client, "alice"), range(24)))
+	assert len({entry["id"] for entry in entries}) == 24
+	assert client.get("/v1/balances/alice").json()["balance"] == 24
+
+	session = create_session_factory(embedded_settings)()
+	try:
+		chain = session.query(LedgerEntry).filter_by(user_id="alice").order_by(LedgerEntry.id).all()
+		assert chain[0].prev_hash is None
+		assert all(entry.prev_hash == previous.entry_hash for previous, entry in zip(chain, chain[1:]))
+		assert all(entry.entry_hash == entry_digest(entry.prev_hash, entry) for entry in chain)
+	finally:
+		session.close()
+
+
+def test_rollups_fold_each_entry_once(client, embedded_settings):
+	for user in ("alice", "alice", "bob"):
+		_award(client, user)
+	session = create_session_factory(embedded_settings)()
+	try:
+		service = RollupService(session=session)
+		later = datetime.now(timezone.utc) + timedelta(hours=2)
+		service.advance(later - timedelta(hours=1))
+		service.advance(later)
+		hourly = {(row.user_id, row.points) for row in session.query(KarmaRollupHourly).filter_by(domain="posts")}
+	finally:
+		session.close()
+	assert hourly == {("alice", 2), ("bob", 1)}
+	items = client.get("/v1/leaderboard/?domain=posts").json()["items"]
+	assert items == [{"user_id": "alice", "points": 2}, {"user_id": "bob", "points": 1}]
+
+
+def test_ledger_is_append_only(client, embedded_settings):
+	_award(client, "alice")
+	session = create_session_factory(embedded_settings)()
+	try:
+		with pytest.raises((IntegrityError, OperationalError), match="append-only"):
+			session.execute(text("DELETE FROM ledger_entries"))
+	finally:
+		session.close()
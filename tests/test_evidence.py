@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import text
+
+from credence.cache import RedisCache
+from credence.config import Settings
+from credence.db import EntryEvidenceStatus, EvidenceFlag, EvidenceStatusEnum, LedgerEntry, create_session_factory
+from credence.embedded import LocalRedis
+from credence.services.evidence import EvidenceValidationService
+from credence.services.evidence_status import EvidenceStatusService
+
+
+class PerRefValidator:
+	def __init__(self, on_validate=None):
+		self.calls = []
+		self.on_validate = on_validate
+
+	def validate(self, evidence_ref):
+		self.calls.append(evidence_ref)
+		if self.on_validate is not None:
+			self.on_validate()
+		return "red"
+
+
+def _service(validator):
+	return EvidenceValidationService(settings=Settings(), cache=RedisCache(client=LocalRedis()), validator=validator)
+
+
+def _pending(session, created_at=None):
+	entry = LedgerEntry(
+		user_id="alice",
+		domain="posts",
+		action="feature",
+		points=10,
+		evidence_ref="https://example.com/a",
+		evidence_status=EvidenceStatusEnum.PENDING,
+		created_at=created_at or datetime.now(timezone.utc),
+	)
+	session.add(entry)
+	session.flush()
+	EvidenceStatusService(session=session).record(entry)
+	session.commit()
+	return entry.id
+
+
+def test_validator_without_batch_method():
+	validator = PerRefValidator()
+	assert _service(validator).validate_many(["a", "b", "a"]) == {"a": "red", "b": "red"}
+	assert validator.calls == ["a", "b"]
+
+
+def test_entry_validated_twice_gets_one_flag(settings, session):
+	entry_id = _pending(session)
+	other = create_session_factory(settings)()
+	# A re-queued task settles the entry while this one is still validating
+	validator = PerRefValidator(on_validate=lambda: _service(PerRefValidator()).complete(other, [entry_id]))
+	try:
+		assert _service(validator).complete(session, [entry_id]) == []
+	finally:
+		other.close()
+	assert session.query(EvidenceFlag).filter_by(ledger_entry_id=entry_id).count() == 1
+	assert session.get(EntryEvidenceStatus, entry_id).status is EvidenceStatusEnum.RED
+
+
+def test_sweep_claims_stale_entries_once(session):
+	old = datetime.now(timezone.utc) - timedelta(minutes=10)
+	entry_id = _pending(session, created_at=old)
+	session.get(EntryEvidenceStatus, entry_id).updated_at = old
+	_pending(session)
+	session.commit()
+
+	service = _service(PerRefValidator())
+	assert service.stale_pending(session, limit=10) == [entry_id]
+	assert service.stale_pending(session, limit=10) == []
+
+
+def test_outcome_follows_to_derived_entries(session):
+	entry_id = _pending(session)
+	reversal = LedgerEntry(
+		user_id="alice", domain="posts", action="reverse", points=-10, related_entry_id=entry_id, evidence_status=EvidenceStatusEnum.PENDING
+	)
+	session.add(reversal)
+	session.flush()
+	EvidenceStatusService(session=session).record_derived(reversal)
+	session.commit()
+
+	assert _service(PerRefValidator()).complete(session, [entry_id]) == [("alice", "posts", "red")]
+	assert session.get(EntryEvidenceStatus, reversal.id).status is EvidenceStatusEnum.RED
+
+
+def test_statuses_are_stored_as_values(session):
+	entry_id = _pending(session)
+	stored = session.execute(text("SELECT evidence_status FROM ledger_entries WHERE id = :id"), {"id": entry_id}).scalar()
+	assert stored == "pending"
@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import event
+
+from credence.api import feed as feed_module
+from credence.api.feed import LedgerFeed, fetch_late_entries
+from credence.db import LedgerEntry, create_session_factory
+
+
+def _add(session, **fields):
+	fields.setdefault("created_at", datetime.now(timezone.utc))
+	entry = LedgerEntry(domain="posts", action="upvote", points=1, **fields)
+	session.add(entry)
+	session.commit()
+	return entry.id
+
+
+async def _drain(sub, count, timeout=5.0):
+	return [(await asyncio.wait_for(sub.queue.get(), timeout))["id"] for _ in range(count)]
+
+
+def test_poll_publishes_late_commits_once(settings, session, monkeypatch):
+	monkeypatch.setattr(feed_module, "POLL_INTERVAL_SECONDS", 0.02)
+	feed = LedgerFeed(settings=settings, session_factory=create_session_factory(settings))
+
+	async def run():
+		_add(session, user_id="alice")
+		sub = feed.subscribe(None, None)
+		await asyncio.sleep(0.1)
+		newer = _add(session, id=10, user_id="alice")
+		assert await _drain(sub, 1) == [newer]
+		# Committed after id 10 was published, with a lower id
+		late = _add(session, id=5, user_id="bob")
+		assert await _drain(sub, 1) == [late]
+		await asyncio.sleep(0.1)
+		assert sub.queue.empty()
+		feed.unsubscribe(sub)
+
+	try:
+		asyncio.run(run())
+	finally:
+		feed.stop()
+	assert feed._thread is None
+
+
+def test_poll_reads_nothing_without_subscribers(settings, session, monkeypatch):
+	monkeypatch.setattr(feed_module, "POLL_INTERVAL_SECONDS", 0.02)
+	factory = create_session_factory(settings)
+	statements = []
+	event.listen(factory.kw["bind"], "before_cursor_execute", lambda *args: statements.append(args[2]))
+	feed = LedgerFeed(settings=settings, session_factory=factory)
+
+	async def run():
+		sub = feed.subscribe(None, None)
+		await asyncio.sleep(0.1)
+		feed.unsubscribe(sub)
+		await asyncio.sleep(0.05)
+		seen = len(statements)
+		await asyncio.sleep(0.2)
+		assert len(statements) == seen
+
+	try:
+		asyncio.run(run())
+	finally:
+		feed.stop()
+
+
+def test_fetch_late_entries_looks_back_from_the_resume_point(session):
+	now = datetime.now(timezone.utc)
+	_add(session, id=1, user_id="alice", created_at=now - timedelta(minutes=5))
+	resume = _add(session, id=20, user_id="alice", created_at=now)
+	late = _add(session, id=15, user_id="alice", created_at=now - timedelta(seconds=2))
+	_add(session, id=16, user_id="bob", created_at=now - timedelta(seconds=1))
+	assert [e["id"] for e in fetch_late_entries(session, resume, user_id="alice")] == [late]
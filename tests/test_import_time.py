@@ -0,0 +1,14 @@
+from __future__ import annotations
+
+import pytest
+
+from credence.cli import IMPORT_TIME_BUDGETS_MS, measure_import_time
+
+# Best of a few runs: import time is noisy, the minimum is the stable signal
+REPEATS = 3
+
+
+@pytest.mark.parametrize("module", sorted(IMPORT_TIME_BUDGETS_MS))
+def test_import_time_within_budget(module):
+	elapsed = min(measure_import_time(module) for _ in range(REPEATS))
+	assert elapsed <= IMPORT_TIME_BUDGETS_MS[module], f"{module} imports in {elapsed:.1f} ms"
@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+
+from credence.db import EvidenceStatusEnum, LedgerEntry, LedgerSegment
+from credence.integrity import entry_digest, verify_proof
+from credence.services.integrity import IntegrityService
+
+T0 = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+def _ledger(session, count=8):
+	service = IntegrityService(session=session, segment_size=4)
+	for i in range(count):
+		entry = LedgerEntry(
+			user_id=["alice", "bob"][i % 2],
+			domain="curation",
+			action="award",
+			points=i + 1,
+			evidence_status=EvidenceStatusEnum.GREEN,
+			created_at=T0 + timedelta(minutes=i),
+		)
+		service.chain(entry)
+		session.add(entry)
+		session.commit()
+	# One more entry so the last full range is below the settled maximum
+	session.add(LedgerEntry(user_id="carol", domain="curation", action="award", points=1, created_at=T0))
+	session.commit()
+	assert service.seal_segments() == 2
+	return service
+
+
+def test_sealed_segments_verify(session):
+	service = _ledger(session)
+	assert service.verify_segment(0, None) == []
+	assert service.verify_segment(1, session.get(LedgerSegment, 0).chain_hash) == []
+
+
+def test_broken_prev_hash_link_is_reported(session):
+	service = _ledger(session)
+	entry = session.get(LedgerEntry, 6)
+	# Re-chain the entry onto the wrong predecessor: its own hash still checks out
+	entry.prev_hash = session.get(LedgerEntry, 2).entry_hash
+	entry.entry_hash = entry_digest(entry.prev_hash, entry)
+	session.commit()
+	problems = service.verify_segment(1, session.get(LedgerSegment, 0).chain_hash)
+	assert "segment 1: entry 6 prev_hash does not link to its chain" in problems
+
+
+def test_inclusion_proof_matches_root(session):
+	service = _ledger(session)
+	proof = service.inclusion_proof(7)
+	assert proof.segment_index == 1 and proof.leaf_index == 2 and proof.leaf_count == 4
+	assert verify_proof(proof.entry_hash, proof.path, proof.segment_root)
+
+
+def test_entry_from_a_lagging_clock_links_in_insert_order(session):
+	service = IntegrityService(session=session, segment_size=4)
+	for minutes in (10, 20, 5, 30):
+		# The third writer's clock runs behind the others'
+		entry = LedgerEntry(
+			user_id="alice",
+			domain="curation",
+			action="award",
+			points=1,
+			evidence_status=EvidenceStatusEnum.GREEN,
+			created_at=T0 + timedelta(minutes=minutes),
+		)
+		service.chain(entry)
+		session.add(entry)
+		session.commit()
+	session.add(LedgerEntry(user_id="carol", domain="curation", action="award", points=1, created_at=T0))
+	session.commit()
+	assert service.seal_segments() == 1
+	assert service.verify_segment(0, None) == []
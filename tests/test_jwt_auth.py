@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import base64
+import threading
+import time
+
+import pytest
+from fastapi import HTTPException
+from jose import jwt
+
+from credence.auth_providers.jwt_auth import JWKSCache, JwtAuthProvider, VerifiedTokenCache
+from credence.config import Settings
+
+SECRET = "test-signing-secret"
+
+
+def _jwks(kid="k1"):
+	k = base64.urlsafe_b64encode(SECRET.encode()).rstrip(b"=").decode()
+	return {"keys": [{"kty": "oct", "kid": kid, "alg": "HS256", "k": k}]}
+
+
+def _token(sub="alice", kid="k1", exp_in=300):
+	return jwt.encode({"sub": sub, "exp": int(time.time()) + exp_in}, SECRET, algorithm="HS256", headers={"kid": kid})
+
+
+class Fetcher:
+	def __init__(self, document):
+		self.document = document
+		self.calls = 0
+		self.release = threading.Event()
+		self.release.set()
+
+	def __call__(self, url):
+		self.calls += 1
+		self.release.wait(5)
+		return self.document
+
+
+def _wait_for(predicate, timeout=5.0):
+	deadline = time.monotonic() + timeout
+	while not predicate():
+		assert time.monotonic() < deadline, "timed out"
+		time.sleep(0.01)
+
+
+def _provider(fetch):
+	cache = JWKSCache(url="https://idp.example/jwks", fetch=fetch)
+	return JwtAuthProvider(settings=Settings(), jwks_cache=cache)
+
+
+def test_verified_token_is_cached(monkeypatch):
+	provider = _provider(Fetcher(_jwks()))
+	token = _token()
+	assert provider.get_user_id(f"Bearer {token}") == "alice"
+
+	def fail(*args, **kwargs):
+		raise AssertionError("signature verified twice")
+
+	monkeypatch.setattr(jwt, "decode", fail)
+	assert provider.get_user_id(f"Bearer {token}") == "alice"
+
+
+def test_bad_signature_is_rejected_and_not_cached():
+	provider = _provider(Fetcher(_jwks()))
+	token = jwt.encode({"sub": "mallory", "exp": int(time.time()) + 300}, "wrong", algorithm="HS256", headers={"kid": "k1"})
+	for _ in range(2):
+		with pytest.raises(HTTPException) as exc:
+			provider.get_user_id(f"Bearer {token}")
+		assert exc.value.status_code == 401
+
+
+def test_token_cache_expires_and_is_bounded():
+	cache = VerifiedTokenCache(max_size=2)
+	cache.put("expired", "alice", time.time() - 1)
+	assert cache.get("expired") is None
+	for token in ("a", "b", "c"):
+		cache.put(token, token, time.time() + 60)
+	assert [cache.get(t) for t in ("a", "b", "c")] == [None, "b", "c"]
+
+
+def test_stale_jwks_refreshes_in_background():
+	fetch = Fetcher(_jwks())
+	cache = JWKSCache(url="https://idp.example/jwks", fetch=fetch, _ttl_seconds=10)
+	cache.get_key("k1")
+	assert fetch.calls == 1
+
+	# Stale but within max staleness: served at once, refreshed off-thread once
+	cache._cached_at -= 20
+	fetch.release.clear()
+	fetch.document = _jwks(kid="k2")
+	for _ in range(3):
+		assert cache.get_key("k1") is not None
+	_wait_for(lambda: fetch.calls == 2)
+	fetch.release.set()
+	_wait_for(lambda: not cache._refreshing)
+	assert fetch.calls == 2
+	assert cache.get_key("k2") is not None
+
+
+def test_unknown_kid_refetches_inline():
+	fetch = Fetcher(_jwks())
+	cache = JWKSCache(url="https://idp.example/jwks", fetch=fetch, _min_refetch_seconds=0)
+	cache.get_key("k1")
+	fetch.document = _jwks(kid="rotated")
+	assert cache.get_key("rotated") is not None
+	assert fetch.calls == 2
+
+
+def test_token_without_kid_tries_every_key_for_its_algorithm():
+	other = base64.urlsafe_b64encode(b"another-secret").rstrip(b"=").decode()
+	document = _jwks()
+	document["keys"].insert(0, {"kty": "oct", "kid": "k0", "alg": "HS256", "k": other})
+	fetch = Fetcher(document)
+	provider = _provider(fetch)
+	token = jwt.encode({"sub": "alice", "exp": int(time.time()) + 300}, SECRET, algorithm="HS256")
+	assert provider.get_user_id(f"Bearer {token}") == "alice"
+
+	expired = jwt.encode({"sub": "alice", "exp": int(time.time()) - 10}, SECRET, algorithm="HS256")
+	with pytest.raises(HTTPException) as exc:
+		provider.get_user_id(f"Bearer {expired}")
+	assert exc.value.status_code == 401 and "expired" in exc.value.detail.lower()
+	# Keys for the token's algorithm were cached: no refetch
+	assert fetch.calls == 1
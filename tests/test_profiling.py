@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import threading
+import time
+
+from fastapi import APIRouter, FastAPI
+from fastapi.testclient import TestClient
+
+from credence.api.routers import debug
+
+
+def slow_endpoint() -> dict:
+	time.sleep(0.1)
+	return {"ok": True}
+
+
+def busy_elsewhere(stop: threading.Event) -> None:
+	while not stop.is_set():
+		sum(range(1000))
+
+
+def test_request_profile_samples_only_the_request(monkeypatch):
+	monkeypatch.setenv("CREDENCE_ADMIN_USER_IDS", '["admin"]')
+	router = APIRouter(prefix="/things")
+	router.get("/slow")(slow_endpoint)
+	app = FastAPI()
+	app.include_router(router, prefix="/v1")
+	app.middleware("http")(debug.profile_request_middleware)
+	debug.profile_sync_endpoints(app)
+
+	stop = threading.Event()
+	other = threading.Thread(target=busy_elsewhere, args=(stop,), daemon=True)
+	other.start()
+	try:
+		response = TestClient(app).get(
+			"/v1/things/slow", headers={"X-User-Id": "admin", "X-Credence-Profile": "collapsed"}
+		)
+	finally:
+		stop.set()
+		other.join()
+
+	assert response.headers["X-Credence-Profiled-Status"] == "200"
+	assert "slow_endpoint" in response.text
+	assert "busy_elsewhere" not in response.text
+
+
+def test_profile_header_ignored_for_non_admins(monkeypatch):
+	monkeypatch.setenv("CREDENCE_ADMIN_USER_IDS", '["admin"]')
+	app = FastAPI()
+	app.get("/slow")(slow_endpoint)
+	app.middleware("http")(debug.profile_request_middleware)
+	response = TestClient(app).get("/slow", headers={"X-User-Id": "bob", "X-Credence-Profile": "collapsed"})
+	assert response.json() == {"ok": True}
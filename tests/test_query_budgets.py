@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+from typing import Any, Callable, Dict, Tuple
+
+import pytest
+
+from credence.testing import ENDPOINT_QUERY_BUDGETS
+
+ALICE = {"X-User-Id": "alice"}
+ADMIN = {"X-User-Id": "admin"}
+
+Request = Tuple[str, str, Dict[str, Any]]
+
+
+def _call(client, method, path, **kwargs):
+	response = client.request(method, path, **kwargs)
+	assert response.status_code < 400, f"{method} {path}: {response.status_code} {response.text}"
+	return response
+
+
+def _award(client, user="alice"):
+	return _call(client, "POST", "/v1/karma/award", json={"domain": "posts", "action": "upvote"}, headers={"X-User-Id": user}).json()
+
+
+@pytest.fixture
+def ledger(client):
+	entries = [_award(client), _award(client), _award(client, user="bob")]
+	_call(client, "POST", "/v1/verification/set", json={"user_id": "alice", "source": "external", "level": 1}, headers=ADMIN)
+	return entries
+
+
+def _open_dispute(client, ledger) -> int:
+	body = {"ledger_entry_id": ledger[2]["id"], "reason": "spam"}
+	return _call(client, "POST", "/v1/disputes/open", json=body, headers=ALICE).json()["id"]
+
+
+def _claimed_dispute(client, ledger) -> int:
+	dispute_id = _open_dispute(client, ledger)
+	_call(client, "POST", "/v1/disputes/claim", json={}, headers=ADMIN)
+	return dispute_id
+
+
+def _claim_request(client, ledger) -> Request:
+	_open_dispute(client, ledger)
+	return "POST", "/v1/disputes/claim", {"json": {}, "headers": ADMIN}
+
+
+# endpoint -> builder of the request to run under its budget (after any setup)
+CASES: Dict[str, Callable[[Any, Any], Request]] = {
+	"POST /v1/karma/award": lambda c, l: (
+		"POST", "/v1/karma/award", {"json": {"domain": "posts", "action": "upvote"}, "headers": ALICE}
+	),
+	"POST /v1/karma/reverse": lambda c, l: ("POST", "/v1/karma/reverse", {"json": {"entry_id": l[0]["id"]}, "headers": ALICE}),
+	"GET /v1/trust/{user_id}": lambda c, l: ("GET", "/v1/trust/alice", {}),
+	"GET /v1/trust/{user_id}/history": lambda c, l: ("GET", "/v1/trust/alice/history", {}),
+	"GET /v1/balances/{user_id}": lambda c, l: ("GET", "/v1/balances/alice", {}),
+	"GET /v1/leaderboard/": lambda c, l: ("GET", "/v1/leaderboard/?domain=posts", {}),
+	"GET /v1/leaderboard/rank/{user_id}": lambda c, l: ("GET", "/v1/leaderboard/rank/alice?domain=posts", {}),
+	"GET /v1/ledger/{user_id}": lambda c, l: ("GET", "/v1/ledger/alice", {}),
+	"GET /v1/stats/": lambda c, l: ("GET", "/v1/stats/", {}),
+	"POST /v1/disputes/open": lambda c, l: (
+		"POST", "/v1/disputes/open", {"json": {"ledger_entry_id": l[2]["id"], "reason": "spam"}, "headers": ALICE}
+	),
+	"POST /v1/disputes/resolve": lambda c, l: (
+		"POST", "/v1/disputes/resolve", {"json": {"dispute_id": _open_dispute(c, l), "resolution": "rejected"}, "headers": ADMIN}
+	),
+	"POST /v1/disputes/claim": lambda c, l: _claim_request(c, l),
+	"POST /v1/disputes/release": lambda c, l: (
+		"POST", "/v1/disputes/release", {"json": {"dispute_id": _claimed_dispute(c, l)}, "headers": ADMIN}
+	),
+	"GET /v1/disputes/": lambda c, l: ("GET", "/v1/disputes/", {"headers": ADMIN}),
+	"GET /v1/evidence/flagged": lambda c, l: ("GET", "/v1/evidence/flagged", {"headers": ADMIN}),
+	"GET /v1/evidence/{entry_id}": lambda c, l: ("GET", f"/v1/evidence/{l[0]['id']}", {"headers": ALICE}),
+}
+
+
+def test_every_budgeted_endpoint_is_covered():
+	assert set(CASES) == set(ENDPOINT_QUERY_BUDGETS)
+
+
+@pytest.mark.parametrize("endpoint", sorted(CASES))
+def test_endpoint_within_query_budget(client, ledger, query_budget, endpoint):
+	method, path, kwargs = CASES[endpoint](client, ledger)
+	with query_budget(endpoint) as stats:
+		_call(client, method, path, **kwargs)
+	assert stats.count > 0 or ENDPOINT_QUERY_BUDGETS[endpoint][0] == 0
+
+
+def test_budget_catches_requests_over_budget(client, ledger, query_budget):
+	with pytest.raises(AssertionError, match="budget 1"):
+		with query_budget("GET /v1/balances/{user_id}", max_queries=1):
+			_call(client, "GET", "/v1/balances/alice?domain=posts")
+			_call(client, "GET", "/v1/balances/alice")
@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+from datetime import datetime, time, timedelta, timezone
+
+import redis
+
+from credence.metrics import RANK_INDEX_ERRORS
+from credence.services import rank_index
+from credence.services.rank_index import RankIndex
+
+
+def test_redis_error_does_not_fail_a_committed_award(client, monkeypatch):
+	def unavailable(self, entries):
+		raise redis.ConnectionError("redis is down")
+
+	monkeypatch.setattr(RankIndex, "record_many", unavailable)
+	errors = RANK_INDEX_ERRORS._value.get()
+	response = client.post("/v1/karma/award", json={"domain": "posts", "action": "upvote"}, headers={"X-User-Id": "alice"})
+	assert response.status_code == 200, response.text
+	assert RANK_INDEX_ERRORS._value.get() == errors + 1
+	assert client.get("/v1/balances/alice").json()["balance"] == 1
+
+
+def _index(monkeypatch, today):
+	from credence.embedded import LocalRedis
+
+	monkeypatch.setattr(rank_index, "_today", lambda: today)
+	return RankIndex(client=LocalRedis())  # type: ignore[arg-type]
+
+
+def _spy(method, calls):
+	def spy(dest, keys):
+		calls.append(keys)
+		return method(dest, keys)
+
+	return spy
+
+
+def _at(day):
+	return datetime.combine(day, time(12), timezone.utc)
+
+
+def test_rolling_window_carries_over_to_the_next_day(monkeypatch):
+	today = datetime.now(timezone.utc).date()
+	index = _index(monkeypatch, today)
+	index.record("alice", "posts", 5, _at(today - timedelta(days=6)))
+	index.record("bob", "posts", 1, _at(today))
+	assert index.lookup("alice", since_days=7)["points"] == 5
+
+	index.record("bob", "posts", 2, _at(today))
+	monkeypatch.setattr(rank_index, "_today", lambda: today + timedelta(days=1))
+	index.record("carol", "posts", 3, _at(today + timedelta(days=1)))
+	unions = []
+	monkeypatch.setattr(index.client, "zunionstore", _spy(index.client.zunionstore, unions))
+	found = index.lookup("bob", since_days=7)
+	assert (found["points"], found["total"]) == (3, 2)
+	assert index.lookup("alice", since_days=7) is None
+	assert index.lookup("carol", since_days=7)["points"] == 3
+	# Carried over once, from yesterday's window rather than the seven daily sets
+	assert len(unions) == 1 and len(unions[0]) == 3
+
+
+def test_union_window_is_rebuilt_by_one_process(monkeypatch):
+	today = datetime.now(timezone.utc).date()
+	index = _index(monkeypatch, today)
+	index.record("alice", "posts", 5, _at(today - timedelta(days=2)))
+	assert index.lookup("alice", since_days=5)["points"] == 5
+
+	index.record("alice", "posts", 1, _at(today))
+	key = index.window_key(None, 5)
+	index.client.delete(f"{key}:fresh")
+	index.client.set(f"{key}:lock", 1)
+	# Another process holds the rebuild: the previous union is served
+	assert index.lookup("alice", since_days=5)["points"] == 5
+	index.client.delete(f"{key}:lock")
+	assert index.lookup("alice", since_days=5)["points"] == 6
@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+
+from credence.db import LedgerEntry
+from credence.services.rollups import RollupService
+
+T0 = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+def _entry(session, points, created_at, user_id="alice"):
+	session.add(LedgerEntry(user_id=user_id, domain="posts", action="upvote", points=points, created_at=created_at))
+	session.commit()
+
+
+def test_entries_on_bucket_boundaries(session):
+	_entry(session, 1, T0 + timedelta(hours=1))
+	_entry(session, 2, T0 + timedelta(days=1))
+	service = RollupService(session=session)
+	service.advance(T0 + timedelta(days=2))
+
+	hours = service.timeseries("hour", T0 + timedelta(hours=1), T0 + timedelta(hours=2))
+	assert [(b["bucket"].replace(tzinfo=timezone.utc), b["points"]) for b in hours] == [(T0 + timedelta(hours=1), 1)]
+	days = service.timeseries("day", T0 + timedelta(days=1), T0 + timedelta(days=2))
+	assert [b["points"] for b in days] == [2]
+	assert service.window_points(T0 + timedelta(hours=1)) == {"alice": 3}
+	assert service.window_points(T0 + timedelta(days=1)) == {"alice": 2}
+
+
+def test_late_commit_is_rolled_up_once(session):
+	service = RollupService(session=session)
+	_entry(session, 5, T0 + timedelta(minutes=10))
+	service.advance(T0 + timedelta(hours=1))
+	# Committed after the run whose cutoff already covered its created_at
+	_entry(session, 3, T0 + timedelta(minutes=50))
+	service.advance(T0 + timedelta(hours=1, minutes=10))
+	service.advance(T0 + timedelta(hours=1, minutes=20))
+
+	hours = service.timeseries("hour", T0, T0 + timedelta(hours=2))
+	assert [(b["points"], b["entry_count"]) for b in hours] == [(8, 2)]
+	days = service.timeseries("day", T0, T0 + timedelta(days=1))
+	assert [(b["points"], b["entry_count"]) for b in days] == [(8, 2)]
+	assert service.window_points() == {"alice": 8}
@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import json
+from datetime import datetime, timedelta, timezone
+
+from credence.db import EvidenceStatusEnum, LedgerEntry, LedgerSegment, create_session_factory
+from credence.embedded import LocalRedis
+from credence.services.integrity import IntegrityService
+from credence.services.rank_index import RankIndex
+from credence.services.resharding import Resharder
+from credence.sharding import ShardRouter, configure_sequences, shard_for_user
+
+T0 = datetime(2026, 1, 1, tzinfo=timezone.utc)
+USERS = [f"user{i}" for i in range(12)]
+
+
+def _add_entries(shards: ShardRouter, points: dict) -> None:
+	for user_id, user_points in points.items():
+		session = shards.factory_for_user(user_id)()
+		try:
+			for minutes, value in enumerate(user_points):
+				entry = LedgerEntry(
+					user_id=user_id,
+					domain="posts",
+					action="upvote",
+					points=value,
+					evidence_status=EvidenceStatusEnum.GREEN,
+					created_at=T0 + timedelta(minutes=minutes),
+				)
+				IntegrityService(session=session).chain(entry)
+				session.add(entry)
+				session.commit()
+		finally:
+			session.close()
+
+
+def test_users_route_to_their_shard_and_ids_are_unique(sharded_settings):
+	settings = sharded_settings(3)
+	shards = ShardRouter.from_settings(settings)
+	_add_entries(shards, {user_id: [1, 1] for user_id in USERS})
+
+	seen = {}
+	for index in range(shards.count):
+		session = shards.factory(index)()
+		try:
+			for entry in session.query(LedgerEntry):
+				assert shard_for_user(entry.user_id, 3) == index
+				assert (entry.id - 1) % 3 == index
+				seen[entry.id] = index
+		finally:
+			session.close()
+	assert len(seen) == 2 * len(USERS)
+	assert all(shards.locate_entry(entry_id) == index for entry_id, index in seen.items())
+	assert shards.locate_entry(max(seen) + 1) is None
+	shards.dispose()
+
+
+def test_leaderboard_merges_shards(sharded_settings, monkeypatch):
+	from credence.api.routers.leaderboard import leaderboard
+
+	settings = sharded_settings(3)
+	monkeypatch.setenv("CREDENCE_DATABASE_URL", settings.database_url)
+	monkeypatch.setenv("CREDENCE_SHARD_DATABASE_URLS", json.dumps(settings.shard_database_urls))
+	shards = ShardRouter.from_settings(settings)
+	points = {user_id: [i + 1] for i, user_id in enumerate(USERS)}
+	_add_entries(shards, points)
+	assert len({shards.shard_for_user(user_id) for user_id in USERS}) > 1
+
+	session = create_session_factory(settings)()
+	try:
+		first = json.loads(leaderboard(limit=5, session=session).body)
+		second = json.loads(leaderboard(limit=5, cursor=first["next_cursor"], session=session).body)
+	finally:
+		session.close()
+	ranked = [(item["user_id"], item["points"]) for item in first["items"] + second["items"]]
+	assert ranked == [(f"user{i}", i + 1) for i in range(11, 1, -1)]
+	shards.dispose()
+
+
+def test_rank_index_rebuilds_from_every_shard(sharded_settings):
+	settings = sharded_settings(3)
+	shards = ShardRouter.from_settings(settings)
+	_add_entries(shards, {user_id: [i + 1] for i, user_id in enumerate(USERS)})
+	index = RankIndex(client=LocalRedis())  # type: ignore[arg-type]
+	index.record("gone", "posts", 1000, T0)
+
+	index.rebuild(shards)
+	shards.dispose()
+	assert index.lookup("gone") is None
+	found = index.lookup("user11", domain="posts", neighbors=1)
+	assert found is not None
+	assert (found["rank"], found["points"], found["total"]) == (1, 12, len(USERS))
+	assert found["below"] == [{"rank": 2, "user_id": "user10", "points": 11}]
+
+
+def test_reshard_moves_users_and_reseals(sharded_settings):
+	settings = sharded_settings(3)
+	old = ShardRouter.from_settings(settings.model_copy(update={"shard_database_urls": settings.shard_database_urls[:2]}))
+	_add_entries(old, {user_id: [1] * 3 for user_id in USERS})
+	for index in range(old.count):
+		session = old.factory(index)()
+		try:
+			IntegrityService(session=session, segment_size=4).seal_segments()
+			assert session.query(LedgerSegment).count() > 0
+		finally:
+			session.close()
+
+	new = ShardRouter.from_settings(settings)
+	resharder = Resharder(
+		sources=old.urls,
+		targets=new.urls,
+		factory_for=lambda url: create_session_factory(settings, url=url),
+		segment_size=4,
+	)
+	moved = resharder.run()
+	assert moved and all(target == new.urls[2] for _, target in moved)
+
+	entry_ids = set()
+	for index in range(new.count):
+		session = new.factory(index)()
+		try:
+			users = {user_id for (user_id,) in session.query(LedgerEntry.user_id)}
+			assert users == {user_id for user_id in USERS if new.shard_for_user(user_id) == index}
+			entry_ids.update(entry_id for (entry_id,) in session.query(LedgerEntry.id))
+			integrity = IntegrityService(session=session, segment_size=4)
+			prev = None
+			for segment in session.query(LedgerSegment).order_by(LedgerSegment.segment_index):
+				assert integrity.verify_segment(segment.segment_index, prev) == []
+				prev = segment.chain_hash
+		finally:
+			session.close()
+	assert len(entry_ids) == 3 * len(USERS)
+	assert all(new.locate_entry(entry_id) is not None for entry_id in entry_ids)
+
+	# As `credence reshard` does: new ids start past every moved one
+	configure_sequences(new)
+	_add_entries(new, {user_id: [1] for user_id in USERS})
+	ids = []
+	for index in range(new.count):
+		session = new.factory(index)()
+		try:
+			ids.extend(entry_id for (entry_id,) in session.query(LedgerEntry.id))
+		finally:
+			session.close()
+	assert len(set(ids)) == len(ids) == 4 * len(USERS)
+	old.dispose()
+	new.dispose()
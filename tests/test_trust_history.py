@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+
+from credence.db import TrustScore
+from credence.services.trust_history import TrustHistoryService
+
+T0 = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+def _snapshot(session, trust, computed_at):
+	session.add(
+		TrustScore(user_id="alice", domain=None, trust=trust, karma_balance=0, verification_level=0, computed_at=computed_at)
+	)
+	session.commit()
+
+
+def test_history_carries_forward_the_snapshot_before_start(session):
+	_snapshot(session, 0.2, T0 - timedelta(days=3))
+	_snapshot(session, 0.5, T0 + timedelta(hours=12))
+	service = TrustHistoryService(session=session)
+
+	items = service.history("alice", None, T0, T0 + timedelta(days=1), 4)
+	assert [(item["at"].replace(tzinfo=timezone.utc), item["trust"]) for item in items] == [
+		(T0, 0.2),
+		(T0 + timedelta(hours=12), 0.5),
+	]
+	# A first bucket with snapshots of its own keeps the carried value in its range
+	items = service.history("alice", None, T0, T0 + timedelta(days=1), 1)
+	assert [(item["trust"], item["min_trust"], item["max_trust"]) for item in items] == [(0.5, 0.2, 0.5)]
+	# A quiet window still reports the value in effect
+	items = service.history("alice", None, T0 - timedelta(days=2), T0 - timedelta(days=1), 10)
+	assert [item["trust"] for item in items] == [0.2]
+
+
+def test_compact_keeps_last_snapshot_per_hour(session):
+	for minutes, trust in ((5, 0.1), (30, 0.2), (75, 0.3)):
+		_snapshot(session, trust, T0 + timedelta(minutes=minutes))
+	service = TrustHistoryService(session=session)
+	assert service.compact(raw_days=1, hourly_days=30, now=T0 + timedelta(days=3)) == {"hour": 1, "day": 0}
+	assert service.compact(raw_days=1, hourly_days=30, now=T0 + timedelta(days=4)) == {"hour": 0, "day": 0}
+	assert sorted(t for t, in session.query(TrustScore.trust)) == [0.2, 0.3]
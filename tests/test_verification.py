@@ -0,0 +1,30 @@
+from __future__ import annotations
+
+from credence.cache import RedisCache, trust_cache_key, verification_cache_key
+from credence.config import DomainActionConfig
+from credence.db import CurrentVerification
+from credence.embedded import LocalRedis
+from credence.services.verification import VerificationService
+
+
+def test_set_level_keeps_highest_level_per_source(settings, session):
+	cache = RedisCache(client=LocalRedis())
+	service = VerificationService(session=session, settings=settings, cache=cache)
+	service.set_level("alice", "external", 2)
+	service.set_level("alice", "internal", 3)
+	service.set_level("alice", "external", 1)
+
+	current = session.get(CurrentVerification, "alice")
+	session.refresh(current)
+	assert (current.external_level, current.internal_level, current.effective_level) == (2, 3, 3)
+	assert cache.get(verification_cache_key("alice")) == "3"
+
+
+def test_set_level_invalidates_every_domain_trust_key(settings, session):
+	settings.domains = {"curation": {"award": DomainActionConfig(points=1)}, "review": {}}
+	cache = RedisCache(client=LocalRedis())
+	keys = [trust_cache_key("alice", d) for d in (None, "curation", "review")]
+	for key in keys:
+		cache.set(key, "0.5")
+	VerificationService(session=session, settings=settings, cache=cache).set_level("alice", "external", 1)
+	assert [cache.get(key) for key in keys] == [None, None, None]